@@ -0,0 +1,26 @@
+"""
+ASGI config for mysite project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server instead of mysite.wsgi, e.g.::
+
+    uvicorn mysite.asgi:application --workers 4
+    gunicorn mysite.asgi:application -k uvicorn.workers.UvicornWorker --workers 4
+
+The async views (JSON lookups, autocomplete, dashboard data and stream) then
+wait on the database and cache without holding a worker, and an open
+dashboard stream costs a coroutine instead of a thread. Sync views keep
+working, each run in a thread of its own. Compare both modes with
+``manage.py benchmark_asgi``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+
+application = get_asgi_application()
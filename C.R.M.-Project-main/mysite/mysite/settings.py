@@ -44,11 +44,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'newapp.metrics.MetricsMiddleware',
+    'newapp.querybudget.QueryShapeMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'newapp.sessions.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'newapp.scope.RequestScopeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -57,7 +60,8 @@ ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for newapp.metrics
+        'BACKEND': 'newapp.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -72,6 +76,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'mysite.wsgi.application'
+# Async deployment mode (uvicorn / gunicorn -k uvicorn.workers.UvicornWorker), see mysite/asgi.py
+ASGI_APPLICATION = 'mysite.asgi.application'
 
 
 # Database
@@ -189,6 +195,10 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Quotation / sales order forms post ~10 fields per line item; the default of
+# 1000 rejects documents above ~100 lines
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 5000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -207,8 +217,245 @@ LOGOUT_REDIRECT_URL = 'newapp:index'
 # Logout user after 10 minutes (600 seconds) of inactivity
 SESSION_COOKIE_AGE = 600  # 10 minutes
 
-# Reset session timer on every request
-SESSION_SAVE_EVERY_REQUEST = True
+# Reset the session timer on activity, but write the session at most once per
+# SESSION_REFRESH_INTERVAL seconds (newapp.sessions.SessionMiddleware) instead
+# of on every request. 0 saves on every request again.
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_INTERVAL = config('SESSION_REFRESH_INTERVAL', default=60, cast=int)
+
+# Where sessions live:
+#   - db (default)    -> the django_session table; `manage.py purge_sessions` deletes expired rows
+#   - cache           -> the shared cache above only (a cache flush logs everyone out)
+#   - cached_db       -> read from the cache, written through to the table
+#   - signed_cookies  -> in the browser cookie; nothing stored, but logout cannot revoke a copied cookie
+SESSION_STORE = config('SESSION_STORE', default='db')
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_STORE}'
 
 # Expire session when browser is closed (optional but professional)
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
+
+
+# ==============================
+# DOCUMENT NUMBERING
+# ==============================
+
+# Numbers each worker process reserves per round trip to the counter table
+# (newapp.sequences). Larger blocks mean fewer locks but bigger gaps on restart.
+DOCUMENT_SEQUENCE_BLOCK_SIZE = 20
+
+# First month of the financial year for sequences that reset per FY (April)
+FINANCIAL_YEAR_START_MONTH = 4
+
+
+# ==============================
+# CACHING
+# ==============================
+
+# One cache shared by every worker process, so cached dashboards and version
+# bumps (newapp.caching) are seen by all of them:
+#   - REDIS_URL set   -> Redis (pip install redis), shared across servers
+#   - otherwise       -> files under CACHE_DIR, shared by workers on this machine
+# Both backends count hits/misses per process (newapp.cache_backends.cache_stats).
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'newapp.cache_backends.RedisStatsCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'crm',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'newapp.cache_backends.FileBasedStatsCache',
+            'LOCATION': config('CACHE_DIR', default=str(BASE_DIR / 'cache')),
+            'KEY_PREFIX': 'crm',
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+            },
+        }
+    }
+
+# Dashboard metrics are cached per scope and invalidated on change (newapp.caching),
+# so this only bounds how long an idle scope's entry lingers.
+DASHBOARD_CACHE_TIMEOUT = 3600
+
+# When served by mysite.asgi, open dashboards receive changes over server-sent events
+# (/api/dashboard-stream/, newapp.dashboard.DashboardStream). Each stream checks its
+# scope's cache version every DASHBOARD_STREAM_INTERVAL seconds, touching the database
+# only after a change, and closes after DASHBOARD_STREAM_MAX_AGE seconds for the browser
+# to reconnect. Under WSGI a stream would hold a worker thread, so the stream URL answers
+# 204 and dashboards poll /api/dashboard-data/; DASHBOARD_STREAM=False does the same
+# under ASGI.
+DASHBOARD_STREAM = config('DASHBOARD_STREAM', default=True, cast=bool)
+DASHBOARD_STREAM_INTERVAL = config('DASHBOARD_STREAM_INTERVAL', default=2, cast=float)
+DASHBOARD_STREAM_MAX_AGE = config('DASHBOARD_STREAM_MAX_AGE', default=300, cast=int)
+
+
+# ==============================
+# SEARCH
+# ==============================
+
+# List views and admin search go through newapp.search: SQLite FTS5 or SQL Server
+# full-text when the database has it, otherwise an in-process inverted index.
+# Set SEARCH_BACKEND=memory to always use the in-process index.
+SEARCH_BACKEND = config('SEARCH_BACKEND', default='auto')
+
+# Most rows a search returns, best match first
+SEARCH_MAX_RESULTS = 300
+
+
+# ==============================
+# PAGINATION
+# ==============================
+
+# List views page by cursor (newapp.pagination). How "Page N of M" gets its total:
+#   exact       -> COUNT(*) on the first page, carried in the page links after that
+#   cached      -> the same, but first-page counts are cached per query
+#   approximate -> table statistics for unfiltered lists, cached count otherwise
+#   none        -> no total and no Last link
+PAGINATION_COUNT = config('PAGINATION_COUNT', default='cached')
+
+# Seconds a cached first-page count is reused
+PAGINATION_COUNT_TIMEOUT = 300
+
+# Admin changelists of the big tables take their totals the same way. Set this to
+# also count the unfiltered table on filtered pages ("5 results (1,000,000 total)").
+ADMIN_SHOW_FULL_RESULT_COUNT = config('ADMIN_SHOW_FULL_RESULT_COUNT', default=False, cast=bool)
+
+# Seconds the admin sidebar filters (city, state, brand, departments...) cache their choices
+ADMIN_FILTER_CACHE_TIMEOUT = 600
+
+
+# ==============================
+# EXPORTS
+# ==============================
+
+# CSV/XLSX exports (newapp.exports) read this many rows per database round trip
+EXPORT_CHUNK_SIZE = 2000
+
+# Exports up to this many rows stream straight to the browser; larger ones are
+# written to MEDIA_ROOT/exports by a background job and downloaded from their page
+EXPORT_SYNC_ROWS = config('EXPORT_SYNC_ROWS', default=20000, cast=int)
+
+
+# ==============================
+# DOCUMENT PDFS
+# ==============================
+
+# Letterhead of the quotation and sales order PDFs (newapp.documents). Copies are
+# stored under MEDIA_ROOT/documents by content hash and rendered again only when
+# the document (or this letterhead) changes. Write line breaks in the address as \n.
+DOCUMENT_COMPANY_NAME = config('DOCUMENT_COMPANY_NAME', default='CRM')
+DOCUMENT_COMPANY_ADDRESS = config('DOCUMENT_COMPANY_ADDRESS', default='').replace('\\n', '\n')
+
+# Documents per documents.render_batch job, the unit the worker processes share out
+DOCUMENT_RENDER_BATCH_SIZE = 50
+
+
+# ==============================
+# BACKGROUND JOBS
+# ==============================
+
+# Exports, imports, conversions, document PDFs and notification mails are
+# queued in the database (newapp.jobs) and run by `python manage.py run_workers`.
+# JOBS_EAGER=True runs them in the web process instead, for development
+# without a worker.
+JOBS_EAGER = config('JOBS_EAGER', default=False, cast=bool)
+
+# Worker processes run_workers starts by default
+JOBS_WORKERS = config('JOBS_WORKERS', default=2, cast=int)
+
+# Seconds an idle worker waits before polling the queue again
+JOBS_POLL_INTERVAL = 1.0
+
+# Seconds before the first retry of a failed job; doubled for every further attempt
+JOBS_RETRY_BACKOFF = 30
+
+# A job still RUNNING after this many seconds lost its worker and is queued again
+JOBS_TIMEOUT = 3600
+
+# Finished jobs are deleted after this many days
+JOBS_KEEP_DAYS = 30
+
+# Notification mails (newapp.notifications). The console backend only prints them;
+# set EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend and EMAIL_HOST to send.
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='crm@localhost')
+
+
+# ==============================
+# METRICS
+# ==============================
+
+# newapp.metrics times every request per URL name; this fraction of requests is
+# also instrumented in detail (SQL, templates, cache) and written to the JSON log.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=0.1, cast=float)
+
+# Seconds between each worker publishing its counters to the shared cache for /metrics
+METRICS_PUBLISH_INTERVAL = 10
+
+# /metrics is open to staff users; Prometheus can scrape it with
+# "Authorization: Bearer <METRICS_TOKEN>" instead of a session
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# One JSON line per sampled request. Each worker process writes its own file
+# (logs/metrics.<pid>.log), rotated at 10 MB with 5 files kept: rotating a file
+# that several processes write to loses lines, and fails outright on Windows.
+# Files of workers that have exited are not removed automatically.
+METRICS_LOG_FILE = config('METRICS_LOG_FILE', default=str(BASE_DIR / 'logs' / 'metrics.log'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json_line': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'metrics_file': {
+            'class': 'newapp.metrics.JsonLogHandler',
+            'filename': METRICS_LOG_FILE,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'formatter': 'json_line',
+        },
+    },
+    'loggers': {
+        'newapp.metrics': {
+            'handlers': ['metrics_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # What run_workers prints: jobs started, finished, retried, failed
+        'newapp.jobs': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
+# ==============================
+# QUERY BUDGETS
+# ==============================
+
+# newapp.querybudget flags a request that runs the same query shape this many
+# times (an N+1 pattern) and reports where it came from:
+#   off   -> not checked (production default)
+#   log   -> warning on the newapp.querybudget logger (default with DEBUG)
+#   raise -> the request fails
+QUERY_SHAPE_DETECTION = config('QUERY_SHAPE_DETECTION', default='log' if DEBUG else 'off')
+QUERY_SHAPE_THRESHOLD = 5
@@ -1,8 +1,13 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from django.db.models import Count
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from .models import (
     SpareUsage, ServiceInvoice, FaultCategory, SymptomMaster, SLAConfig,
     UserProfile, SalesEmployee, ProspectCustomer, VisitLog,
@@ -12,8 +17,13 @@ from .models import (
     ItemMaster, TaxMaster, PaymentTermsMaster, DeliveryTermsMaster,
     VisitPurposeMaster, ApprovalMatrix,
     Technician, ServiceContract, WarrantyRecord, ServiceCall, ServiceCallItem,
-    ServiceActivity, ServiceCallAttachment
+    ServiceActivity, ServiceCallAttachment, DocumentSequence, DailyRollup, Export, Job
 )
+from . import caching, rollups
+from .directory import get_directory
+from .exports import export_or_start
+from .pagination import count_mode, total_count
+from .search import search_queryset
 
 # Register your models here.
 
@@ -23,6 +33,133 @@ admin.site.site_title = "CRM Admin"
 admin.site.index_title = "Welcome to CRM Administration"
 
 
+# Every changelist can export its selected rows (newapp.exports); large
+# selections are written in the background and open the export's page.
+@admin.action(description="⬇ Export selected to CSV")
+def export_csv(modeladmin, request, queryset):
+    return export_or_start(request, queryset, 'csv')
+
+
+@admin.action(description="⬇ Export selected to Excel")
+def export_xlsx(modeladmin, request, queryset):
+    return export_or_start(request, queryset, 'xlsx')
+
+
+admin.site.add_action(export_csv)
+admin.site.add_action(export_xlsx)
+
+
+# Quotations and sales orders: store the selected documents' PDFs (newapp.documents)
+# from background jobs, so later downloads and customer mails need no rendering.
+@admin.action(description="📄 Render PDFs")
+def render_pdfs(modeladmin, request, queryset):
+    from django.urls import reverse
+    from .documents import queue_batch
+    queued = queue_batch(queryset, request.user)
+    if not queued:
+        return
+    modeladmin.message_user(request, format_html(
+        '{} document(s) queued for rendering in {} job(s). <a href="{}">Follow the first one</a>',
+        sum(len(job.kwargs['pks']) for job in queued), len(queued),
+        reverse('newapp:job_detail', args=[queued[0].pk]),
+    ))
+
+
+class IndexedSearchMixin:
+    """Admin search through the full-text index (newapp.search) instead of LIKE scans.
+
+    ``search_fields`` stays set so the search box is shown; ``search_kind`` names
+    the index entries that are actually queried.
+    """
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search_queryset(queryset, self.search_kind, search_term), False
+
+
+def related_count(model, field, **filters):
+    """``COUNT(*)`` of the ``model`` rows whose ``field`` points at the outer row, 0 when there are none.
+
+    Changelist count columns are annotated with this rather than ``Count()``:
+    an aggregate groups the whole table before the page is cut, while a
+    correlated subquery is only evaluated for the rows actually shown.
+    """
+    rows = (model._default_manager.filter(**{field: OuterRef('pk')}, **filters).order_by()
+            .values(field).annotate(count=Count('pk')).values('count'))
+    return Coalesce(Subquery(rows), 0)
+
+
+def filter_cache_timeout():
+    return getattr(settings, 'ADMIN_FILTER_CACHE_TIMEOUT', 600)
+
+
+def cached_filter_choices(model_admin, field_path, compute):
+    key = f"admin:filter:{model_admin.opts.label_lower}:{field_path}"
+    return cache.get_or_set(key, compute, filter_cache_timeout())
+
+
+class CachedValuesFilter(admin.AllValuesFieldListFilter):
+    """``list_filter`` entry for a text column with repeating values (city, state, brand).
+
+    Django lists the choices with a ``SELECT DISTINCT`` over the whole table on
+    every changelist load; here they are cached for ``ADMIN_FILTER_CACHE_TIMEOUT``
+    seconds, so a new value shows up in the sidebar that much later.
+    """
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        values = self.lookup_choices
+        self.lookup_choices = cached_filter_choices(model_admin, field_path, lambda: list(values))
+
+
+class CachedRelatedFilter(admin.RelatedFieldListFilter):
+    """``list_filter`` entry for a foreign key, with the choices cached like ``CachedValuesFilter``."""
+
+    def field_choices(self, field, request, model_admin):
+        def compute():
+            return super(CachedRelatedFilter, self).field_choices(field, request, model_admin)
+        return cached_filter_choices(model_admin, self.field_path, compute)
+
+
+class EmployeeFilter(admin.RelatedFieldListFilter):
+    """``list_filter`` entry for a sales employee, listed from the cached directory.
+
+    The stock filter loads every employee and then their user, one query each,
+    to render the names.
+    """
+
+    def field_choices(self, field, request, model_admin):
+        return [(employee.id, f"{employee.name} ({employee.employee_id})") for employee in get_directory()]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Admin paginator taking the total from ``newapp.pagination`` (cached or estimated per PAGINATION_COUNT)."""
+
+    @cached_property
+    def count(self):
+        # The changelist cannot page without a total, so "none" falls back to the cached count
+        return total_count(self.object_list, 'cached' if count_mode() == 'none' else None)[0]
+
+
+class LargeTableAdminMixin:
+    """Changelist settings for tables that grow without bound (documents, their lines and logs).
+
+    The page's total comes from ``EstimatedCountPaginator`` instead of a
+    ``COUNT(*)`` on every load, and the second count behind "5 results (1,000,000
+    total)" on a filtered list is skipped unless ``ADMIN_SHOW_FULL_RESULT_COUNT``
+    is set. These admins filter by date through ``list_filter`` rather than
+    ``date_hierarchy``, whose year links need a ``SELECT DISTINCT`` over the
+    whole table, and their ordering must be served by an index.
+    """
+    paginator = EstimatedCountPaginator
+
+    @property
+    def show_full_result_count(self):
+        return getattr(settings, 'ADMIN_SHOW_FULL_RESULT_COUNT', False)
+
+
 # ==========================
 # MASTER DATA ADMIN PANELS
 # ==========================
@@ -49,12 +186,16 @@ class DepartmentAdmin(admin.ModelAdmin):
     )
     
     def employee_count(self, obj):
-        count = obj.employees.count()
+        count = obj.employee_count
         return format_html(
             '<span style="background-color: #007bff; color: white; padding: 2px 8px; border-radius: 3px;">{}</span>',
             count
         )
     employee_count.short_description = 'Employees'
+    employee_count.admin_order_field = 'employee_count'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(employee_count=related_count(SalesEmployee, 'department'))
     
     actions = ['activate_departments', 'deactivate_departments']
     
@@ -72,7 +213,8 @@ class DepartmentAdmin(admin.ModelAdmin):
 @admin.register(Designation)
 class DesignationAdmin(admin.ModelAdmin):
     list_display = ('code', 'title', 'department', 'level', 'employee_count', 'is_active', 'created_at')
-    list_filter = ('department', 'level', 'is_active', 'created_at')
+    list_filter = (('department', CachedRelatedFilter), 'level', 'is_active', 'created_at')
+    list_select_related = ('department',)
     search_fields = ('title', 'code', 'description')
     list_editable = ('is_active',)
     readonly_fields = ('created_at', 'updated_at')
@@ -91,12 +233,16 @@ class DesignationAdmin(admin.ModelAdmin):
     )
     
     def employee_count(self, obj):
-        count = obj.employees.count()
+        count = obj.employee_count
         return format_html(
             '<span style="background-color: #28a745; color: white; padding: 2px 8px; border-radius: 3px;">{}</span>',
             count
         )
     employee_count.short_description = 'Employees'
+    employee_count.admin_order_field = 'employee_count'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(employee_count=related_count(SalesEmployee, 'designation'))
     
     actions = ['activate_designations', 'deactivate_designations']
     
@@ -115,6 +261,7 @@ class DesignationAdmin(admin.ModelAdmin):
 class TerritoryAdmin(admin.ModelAdmin):
     list_display = ('code', 'name', 'zone_type', 'parent', 'employee_count', 'is_active', 'created_at')
     list_filter = ('zone_type', 'is_active', 'created_at')
+    list_select_related = ('parent',)
     search_fields = ('name', 'code', 'description')
     list_editable = ('is_active',)
     readonly_fields = ('created_at', 'updated_at')
@@ -133,12 +280,16 @@ class TerritoryAdmin(admin.ModelAdmin):
     )
     
     def employee_count(self, obj):
-        count = obj.employees.count()
+        count = obj.employee_count
         return format_html(
             '<span style="background-color: #6f42c1; color: white; padding: 2px 8px; border-radius: 3px;">{}</span>',
             count
         )
     employee_count.short_description = 'Employees'
+    employee_count.admin_order_field = 'employee_count'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(employee_count=related_count(SalesEmployee, 'territory'))
     
     actions = ['activate_territories', 'deactivate_territories']
     
@@ -165,6 +316,7 @@ class SalesEmployeeInline(admin.StackedInline):
     fk_name = 'user'
     fields = ('employee_id', 'role', 'department', 'designation', 'territory', 
               'region', 'reporting_to', 'mobile', 'is_active', 'joined_date')
+    autocomplete_fields = ('reporting_to',)
 
 
 # Inline for UserProfile in User Admin
@@ -182,6 +334,7 @@ class CustomUserAdmin(BaseUserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'get_role', 
                    'is_staff', 'is_active', 'date_joined')
     list_filter = ('is_staff', 'is_active', 'date_joined', 'groups')
+    list_select_related = ('sales_profile',)
     search_fields = ('username', 'first_name', 'last_name', 'email')
     ordering = ('-date_joined',)
     
@@ -251,6 +404,8 @@ admin.site.register(User, CustomUserAdmin)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'phone_number', 'created_at', 'updated_at')
     list_filter = ('created_at', 'updated_at')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
     search_fields = ('user__username', 'user__email', 'phone_number')
     readonly_fields = ('created_at', 'updated_at')
     
@@ -272,7 +427,10 @@ class UserProfileAdmin(admin.ModelAdmin):
 class SalesEmployeeAdmin(admin.ModelAdmin):
     list_display = ('employee_id', 'get_full_name', 'role_badge', 'department', 'designation', 
                    'territory', 'region', 'reporting_to', 'mobile', 'status_badge', 'joined_date')
-    list_filter = ('role', 'department', 'designation', 'territory', 'region', 'is_active', 'joined_date')
+    list_filter = ('role', ('department', CachedRelatedFilter), ('designation', CachedRelatedFilter),
+                   ('territory', CachedRelatedFilter), ('region', CachedValuesFilter), 'is_active', 'joined_date')
+    list_select_related = ('user', 'department', 'designation', 'territory', 'reporting_to__user')
+    autocomplete_fields = ('user', 'reporting_to')
     search_fields = ('employee_id', 'user__username', 'user__first_name', 'user__last_name', 
                     'user__email', 'mobile')
     readonly_fields = ('created_at', 'updated_at')
@@ -337,7 +495,7 @@ class SalesEmployeeAdmin(admin.ModelAdmin):
         )
     status_badge.short_description = 'Status'
     
-    actions = ['activate_employees', 'deactivate_employees', 'assign_to_territory', 'export_employee_list']
+    actions = ['activate_employees', 'deactivate_employees', 'assign_to_territory']
     
     def activate_employees(self, request, queryset):
         updated = queryset.update(is_active=True)
@@ -348,22 +506,19 @@ class SalesEmployeeAdmin(admin.ModelAdmin):
         updated = queryset.update(is_active=False)
         self.message_user(request, f"{updated} employee(s) deactivated successfully.")
     deactivate_employees.short_description = "✗ Deactivate selected employees"
-    
-    def export_employee_list(self, request, queryset):
-        # Simple export action placeholder
-        count = queryset.count()
-        self.message_user(request, f"{count} employee(s) ready for export (implement CSV/Excel export).")
-    export_employee_list.short_description = "📊 Export selected employees"
 
 
 @admin.register(ProspectCustomer)
-class ProspectCustomerAdmin(admin.ModelAdmin):
+class ProspectCustomerAdmin(IndexedSearchMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('customer_id', 'name', 'company_name', 'type_badge', 'status_badge', 'phone', 
                    'city', 'assigned_to', 'visit_count', 'created_at')
-    list_filter = ('type', 'status', 'city', 'state', 'assigned_to', 'created_at')
+    list_filter = ('type', 'status', ('city', CachedValuesFilter), ('state', CachedValuesFilter),
+                   ('assigned_to', EmployeeFilter), 'created_at')
+    list_select_related = ('assigned_to__user',)
+    autocomplete_fields = ('assigned_to',)
     search_fields = ('customer_id', 'name', 'company_name', 'phone', 'email', 'city', 'industry')
+    search_kind = 'prospects'
     readonly_fields = ('customer_id', 'created_at', 'updated_at', 'created_by')
-    date_hierarchy = 'created_at'
     list_per_page = 25
     
     fieldsets = (
@@ -425,7 +580,7 @@ class ProspectCustomerAdmin(admin.ModelAdmin):
     status_badge.short_description = 'Status'
     
     def visit_count(self, obj):
-        count = obj.visits.count()
+        count = obj.visit_count
         if count > 0:
             return format_html(
                 '<span style="background-color: #007bff; color: white; padding: 2px 8px; border-radius: 3px;">{}</span>',
@@ -433,35 +588,87 @@ class ProspectCustomerAdmin(admin.ModelAdmin):
             )
         return '-'
     visit_count.short_description = 'Visits'
+    visit_count.admin_order_field = 'visit_count'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(visit_count=related_count(VisitLog, 'prospect'))
     
     actions = ['mark_as_customer', 'mark_as_won', 'mark_as_lost', 'assign_to_employee']
     
     def mark_as_customer(self, request, queryset):
-        updated = queryset.update(type='CUSTOMER', status='WON')
+        caching.invalidate_rows(queryset)
+        updated = rollups.update(queryset, type='CUSTOMER', status='WON')
         self.message_user(request, f"{updated} prospect(s) marked as customers.")
     mark_as_customer.short_description = "✓ Convert to Customer"
     
     def mark_as_won(self, request, queryset):
-        updated = queryset.update(status='WON')
+        caching.invalidate_rows(queryset)
+        updated = rollups.update(queryset, status='WON')
         self.message_user(request, f"{updated} prospect(s) marked as won.")
     mark_as_won.short_description = "✓ Mark as Won"
     
     def mark_as_lost(self, request, queryset):
-        updated = queryset.update(status='LOST')
+        caching.invalidate_rows(queryset)
+        updated = rollups.update(queryset, status='LOST')
         self.message_user(request, f"{updated} prospect(s) marked as lost.")
     mark_as_lost.short_description = "✗ Mark as Lost"
 
+    change_list_template = 'admin/newapp/prospectcustomer/change_list.html'
+
+    def get_urls(self):
+        from django.urls import path
+
+        custom_urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='newapp_prospectcustomer_import'),
+        ]
+        return custom_urls + super().get_urls()
+
+    def import_view(self, request):
+        """Upload a CSV/XLSX file and queue its bulk import (see newapp.importers)."""
+        from django import forms
+        from django.shortcuts import redirect
+        from django.template.response import TemplateResponse
+        from django.urls import reverse
+        from .importers import queue_import
+
+        class UploadForm(forms.Form):
+            file = forms.FileField(help_text='CSV or XLSX with a header row (name, phone, email, city, ...)')
+            dry_run = forms.BooleanField(required=False, help_text='Validate only, do not insert')
+
+        if not self.has_add_permission(request):
+            from django.core.exceptions import PermissionDenied
+            raise PermissionDenied
+
+        form = UploadForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            job = queue_import(form.cleaned_data['file'], request.user, dry_run=form.cleaned_data['dry_run'])
+            self.message_user(request, format_html(
+                'Import of {} queued; it runs in the background. <a href="{}">Follow its progress</a>',
+                form.cleaned_data['file'].name, reverse('newapp:job_detail', args=[job.pk])
+            ))
+            return redirect('admin:newapp_prospectcustomer_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import prospects',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/newapp/prospectcustomer/import.html', context)
+
 
 @admin.register(VisitLog)
-class VisitLogAdmin(admin.ModelAdmin):
+class VisitLogAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('visit_id', 'get_employee_info', 'get_prospect_info', 'visit_date', 
                    'visit_time', 'outcome_badge', 'status_badge', 'approval_badge')
     list_filter = ('status', 'approval_status', 'outcome_type', 'visit_date', 
-                   'sales_employee__department', 'sales_employee__region', 'created_at')
+                   ('sales_employee__department', CachedRelatedFilter),
+                   ('sales_employee__region', CachedValuesFilter), 'created_at')
+    list_select_related = ('sales_employee__user', 'prospect')
+    autocomplete_fields = ('sales_employee', 'prospect')
     search_fields = ('visit_id', 'sales_employee__employee_id', 'sales_employee__user__username',
                     'prospect__name', 'prospect__company_name', 'meeting_agenda', 'meeting_outcome')
     readonly_fields = ('visit_id', 'created_at', 'updated_at', 'approved_at', 'approved_by')
-    date_hierarchy = 'visit_date'
     list_per_page = 30
     
     fieldsets = (
@@ -560,7 +767,10 @@ class VisitLogAdmin(admin.ModelAdmin):
     
     def approve_visits(self, request, queryset):
         from django.utils import timezone
-        updated = queryset.filter(approval_status='PENDING').update(
+        pending = queryset.filter(approval_status='PENDING')
+        caching.invalidate_rows(pending)
+        updated = rollups.update(
+            pending,
             approval_status='APPROVED',
             approved_by=request.user,
             approved_at=timezone.now()
@@ -570,7 +780,10 @@ class VisitLogAdmin(admin.ModelAdmin):
     
     def reject_visits(self, request, queryset):
         from django.utils import timezone
-        updated = queryset.filter(approval_status='PENDING').update(
+        pending = queryset.filter(approval_status='PENDING')
+        caching.invalidate_rows(pending)
+        updated = rollups.update(
+            pending,
             approval_status='REJECTED',
             approved_by=request.user,
             approved_at=timezone.now()
@@ -579,7 +792,8 @@ class VisitLogAdmin(admin.ModelAdmin):
     reject_visits.short_description = "✗ Reject selected visits"
     
     def mark_as_completed(self, request, queryset):
-        updated = queryset.update(status='COMPLETED')
+        caching.invalidate_rows(queryset)
+        updated = rollups.update(queryset, status='COMPLETED')
         self.message_user(request, f"{updated} visit(s) marked as completed.")
     mark_as_completed.short_description = "✓ Mark as Completed"
 
@@ -599,16 +813,18 @@ class LeadHistoryInline(admin.TabularInline):
 
 
 @admin.register(Lead)
-class LeadAdmin(admin.ModelAdmin):
+class LeadAdmin(IndexedSearchMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('lead_id', 'get_prospect_info', 'source_badge', 'assigned_to', 
                    'status_badge', 'priority_badge', 'progress_bar', 'expected_closure_date',
                    'next_action_date', 'estimated_value', 'created_at')
-    list_filter = ('lead_source', 'status', 'priority', 'assigned_to__department', 
+    list_filter = ('lead_source', 'status', 'priority', ('assigned_to__department', CachedRelatedFilter), 
                   'expected_closure_date', 'next_action_date', 'created_at')
+    list_select_related = ('prospect', 'assigned_to__user')
+    autocomplete_fields = ('prospect', 'assigned_to', 'originating_visit')
     search_fields = ('lead_id', 'prospect__name', 'prospect__company_name', 'contact_person',
                     'mobile', 'email', 'requirement_description')
+    search_kind = 'leads'
     readonly_fields = ('lead_id', 'created_at', 'updated_at', 'created_by')
-    date_hierarchy = 'created_at'
     list_per_page = 30
     inlines = [LeadHistoryInline]
     
@@ -717,28 +933,33 @@ class LeadAdmin(admin.ModelAdmin):
     actions = ['mark_as_won', 'mark_as_lost', 'mark_as_contacted', 'assign_to_employee']
     
     def mark_as_won(self, request, queryset):
+        caching.invalidate_rows(queryset)
         updated = queryset.update(status='WON', progress_percentage=100)
         self.message_user(request, f"{updated} lead(s) marked as won.")
     mark_as_won.short_description = "✓ Mark as Won"
     
     def mark_as_lost(self, request, queryset):
+        caching.invalidate_rows(queryset)
         updated = queryset.update(status='LOST')
         self.message_user(request, f"{updated} lead(s) marked as lost.")
     mark_as_lost.short_description = "✗ Mark as Lost"
     
     def mark_as_contacted(self, request, queryset):
-        updated = queryset.filter(status='NEW').update(status='CONTACTED', progress_percentage=10)
+        new = queryset.filter(status='NEW')
+        caching.invalidate_rows(new)
+        updated = new.update(status='CONTACTED', progress_percentage=10)
         self.message_user(request, f"{updated} lead(s) marked as contacted.")
     mark_as_contacted.short_description = "📞 Mark as Contacted"
 
 
 @admin.register(LeadHistory)
-class LeadHistoryAdmin(admin.ModelAdmin):
+class LeadHistoryAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('lead', 'field_name', 'old_value_short', 'new_value_short', 'changed_by', 'changed_at')
-    list_filter = ('field_name', 'changed_at', 'changed_by')
+    list_filter = ('field_name', 'changed_at', ('changed_by', CachedRelatedFilter))
+    list_select_related = ('lead__prospect', 'changed_by')
+    ordering = ('-id',)
     search_fields = ('lead__lead_id', 'lead__prospect__name', 'field_name', 'old_value', 'new_value', 'notes')
     readonly_fields = ('lead', 'changed_by', 'field_name', 'old_value', 'new_value', 'notes', 'changed_at')
-    date_hierarchy = 'changed_at'
     
     def has_add_permission(self, request):
         return False  # Prevent manual creation
@@ -764,15 +985,16 @@ class LeadHistoryAdmin(admin.ModelAdmin):
 # ==========================
 
 @admin.register(LeadActivity)
-class LeadActivityAdmin(admin.ModelAdmin):
+class LeadActivityAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('activity_id', 'get_lead_info', 'activity_type_badge', 'activity_date', 
                    'activity_time', 'status_badge', 'next_followup_date', 'created_by', 'created_at')
     list_filter = ('activity_type', 'status', 'activity_date', 'lead__status', 
-                   'lead__assigned_to', 'created_at')
+                   ('lead__assigned_to', EmployeeFilter), 'created_at')
+    list_select_related = ('lead__prospect', 'created_by')
+    autocomplete_fields = ('lead',)
     search_fields = ('activity_id', 'lead__lead_id', 'lead__prospect__name', 
                     'discussion_summary', 'outcome', 'contact_person')
     readonly_fields = ('activity_id', 'created_at', 'updated_at', 'created_by')
-    date_hierarchy = 'activity_date'
     list_per_page = 30
     
     fieldsets = (
@@ -896,15 +1118,17 @@ class QuotationActivityInline(admin.TabularInline):
 
 
 @admin.register(Quotation)
-class QuotationAdmin(admin.ModelAdmin):
+class QuotationAdmin(IndexedSearchMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('quote_number', 'get_prospect_info', 'quote_date', 'valid_till_badge', 
                    'net_amount_display', 'status_badge', 'assigned_to_display', 'created_at')
-    list_filter = ('status', 'currency', 'quote_date', 'valid_till', 'assigned_to', 'created_at')
+    list_filter = ('status', 'currency', 'quote_date', 'valid_till', ('assigned_to', EmployeeFilter), 'created_at')
+    list_select_related = ('prospect', 'assigned_to__user')
+    autocomplete_fields = ('prospect', 'assigned_to', 'reference_lead', 'reference_visit')
     search_fields = ('quote_number', 'prospect__name', 'prospect__company_name', 
                     'contact_person', 'reference_number')
+    search_kind = 'quotations'
     readonly_fields = ('quote_number', 'created_by', 'created_at', 'updated_at', 
                       'approved_by', 'approved_at', 'sent_at')
-    date_hierarchy = 'quote_date'
     list_per_page = 25
     
     fieldsets = (
@@ -968,9 +1192,9 @@ class QuotationAdmin(admin.ModelAdmin):
     
     def net_amount_display(self, obj):
         return format_html(
-            '<strong>{} {:,.2f}</strong>',
+            '<strong>{} {}</strong>',
             obj.currency,
-            obj.net_amount
+            f'{obj.net_amount:,.2f}'
         )
     net_amount_display.short_description = 'Net Amount'
     
@@ -1000,8 +1224,18 @@ class QuotationAdmin(admin.ModelAdmin):
         return '-'
     assigned_to_display.short_description = 'Assigned To'
     
-    actions = ['mark_as_sent', 'mark_as_approved', 'mark_as_rejected']
-    
+    actions = ['mark_as_sent', 'mark_as_approved', 'mark_as_rejected', 'convert_to_orders', render_pdfs]
+
+    def convert_to_orders(self, request, queryset):
+        from django.urls import reverse
+        from .conversion import queue_conversion
+        job = queue_conversion(queryset, request.user)
+        self.message_user(request, format_html(
+            '{} quotation(s) queued for conversion to sales orders. <a href="{}">Follow its progress</a>',
+            job.kwargs['total'], reverse('newapp:job_detail', args=[job.pk])
+        ))
+    convert_to_orders.short_description = "🔄 Convert to Sales Orders"
+
     def mark_as_sent(self, request, queryset):
         from django.utils import timezone
         updated = queryset.update(status='SENT', sent_at=timezone.now())
@@ -1021,10 +1255,13 @@ class QuotationAdmin(admin.ModelAdmin):
 
 
 @admin.register(QuotationItem)
-class QuotationItemAdmin(admin.ModelAdmin):
+class QuotationItemAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('quotation', 'line_number', 'item_code', 'description_short', 
                    'quantity', 'uom', 'unit_price', 'line_total')
     list_filter = ('quotation__status', 'uom')
+    list_select_related = ('quotation__prospect',)
+    ordering = ('-id',)
+    autocomplete_fields = ('quotation', 'item_master')
     search_fields = ('quotation__quote_number', 'item_code', 'description')
     list_per_page = 50
     
@@ -1037,16 +1274,21 @@ class QuotationItemAdmin(admin.ModelAdmin):
 class QuotationAttachmentAdmin(admin.ModelAdmin):
     list_display = ('quotation', 'attachment_type', 'file_name', 'uploaded_by', 'uploaded_at')
     list_filter = ('attachment_type', 'uploaded_at')
+    list_select_related = ('quotation__prospect', 'uploaded_by')
+    autocomplete_fields = ('quotation',)
     search_fields = ('quotation__quote_number', 'file_name', 'description')
     readonly_fields = ('uploaded_by', 'uploaded_at')
     list_per_page = 30
 
 
 @admin.register(QuotationActivity)
-class QuotationActivityAdmin(admin.ModelAdmin):
+class QuotationActivityAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('quotation', 'activity_type', 'description_short', 'is_internal', 
                    'created_by', 'created_at')
     list_filter = ('activity_type', 'is_internal', 'created_at')
+    list_select_related = ('quotation__prospect', 'created_by')
+    ordering = ('-id',)
+    autocomplete_fields = ('quotation',)
     search_fields = ('quotation__quote_number', 'description')
     readonly_fields = ('created_by', 'created_at')
     list_per_page = 50
@@ -1083,15 +1325,16 @@ class SalesOrderActivityInline(admin.TabularInline):
 
 
 @admin.register(SalesOrder)
-class SalesOrderAdmin(admin.ModelAdmin):
+class SalesOrderAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('order_number', 'get_prospect_info', 'order_date', 'valid_till_badge', 
                    'net_amount_display', 'status_badge', 'assigned_to_display', 'created_at')
-    list_filter = ('status', 'currency', 'order_date', 'valid_till', 'assigned_to', 'created_at')
+    list_filter = ('status', 'currency', 'order_date', 'valid_till', ('assigned_to', EmployeeFilter), 'created_at')
+    list_select_related = ('prospect', 'assigned_to__user')
+    autocomplete_fields = ('prospect', 'assigned_to', 'reference_lead', 'reference_visit', 'reference_quotation')
     search_fields = ('order_number', 'prospect__name', 'prospect__company_name', 
                     'contact_person', 'reference_number')
     readonly_fields = ('order_number', 'created_by', 'created_at', 'updated_at', 
                       'approved_by', 'approved_at', 'confirmed_at', 'shipped_at', 'delivered_at')
-    date_hierarchy = 'order_date'
     list_per_page = 25
     
     fieldsets = (
@@ -1154,9 +1397,9 @@ class SalesOrderAdmin(admin.ModelAdmin):
     
     def net_amount_display(self, obj):
         return format_html(
-            '<strong>{} {:,.2f}</strong>',
+            '<strong>{} {}</strong>',
             obj.currency,
-            obj.net_amount
+            f'{obj.net_amount:,.2f}'
         )
     net_amount_display.short_description = 'Net Amount'
     
@@ -1185,31 +1428,34 @@ class SalesOrderAdmin(admin.ModelAdmin):
         return '-'
     assigned_to_display.short_description = 'Assigned To'
     
-    actions = ['mark_as_confirmed', 'mark_as_approved', 'mark_as_cancelled']
+    actions = ['mark_as_confirmed', 'mark_as_approved', 'mark_as_cancelled', render_pdfs]
     
     def mark_as_confirmed(self, request, queryset):
         from django.utils import timezone
-        updated = queryset.update(status='CONFIRMED', confirmed_at=timezone.now())
+        updated = rollups.update(queryset, status='CONFIRMED', confirmed_at=timezone.now())
         self.message_user(request, f"{updated} order(s) marked as confirmed.")
     mark_as_confirmed.short_description = "✓ Mark as Confirmed"
     
     def mark_as_approved(self, request, queryset):
         from django.utils import timezone
-        updated = queryset.update(status='APPROVED', approved_by=request.user, approved_at=timezone.now())
+        updated = rollups.update(queryset, status='APPROVED', approved_by=request.user, approved_at=timezone.now())
         self.message_user(request, f"{updated} order(s) approved.")
     mark_as_approved.short_description = "✅ Approve Orders"
     
     def mark_as_cancelled(self, request, queryset):
-        updated = queryset.update(status='CANCELLED')
+        updated = rollups.update(queryset, status='CANCELLED')
         self.message_user(request, f"{updated} order(s) cancelled.")
     mark_as_cancelled.short_description = "❌ Cancel Orders"
 
 
 @admin.register(SalesOrderItem)
-class SalesOrderItemAdmin(admin.ModelAdmin):
+class SalesOrderItemAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('order', 'line_number', 'item_code', 'description_short', 
                    'quantity', 'uom', 'unit_price', 'line_total')
     list_filter = ('order__status', 'uom')
+    list_select_related = ('order__prospect',)
+    ordering = ('-id',)
+    autocomplete_fields = ('order', 'item_master')
     search_fields = ('order__order_number', 'item_code', 'description')
     list_per_page = 50
     
@@ -1222,16 +1468,21 @@ class SalesOrderItemAdmin(admin.ModelAdmin):
 class SalesOrderAttachmentAdmin(admin.ModelAdmin):
     list_display = ('order', 'attachment_type', 'file_name', 'uploaded_by', 'uploaded_at')
     list_filter = ('attachment_type', 'uploaded_at')
+    list_select_related = ('order__prospect', 'uploaded_by')
+    autocomplete_fields = ('order',)
     search_fields = ('order__order_number', 'file_name', 'description')
     readonly_fields = ('uploaded_by', 'uploaded_at')
     list_per_page = 30
 
 
 @admin.register(SalesOrderActivity)
-class SalesOrderActivityAdmin(admin.ModelAdmin):
+class SalesOrderActivityAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('order', 'activity_type', 'description_short', 'is_internal', 
                    'created_by', 'created_at')
     list_filter = ('activity_type', 'is_internal', 'created_at')
+    list_select_related = ('order__prospect', 'created_by')
+    ordering = ('-id',)
+    autocomplete_fields = ('order',)
     search_fields = ('order__order_number', 'description')
     readonly_fields = ('created_by', 'created_at')
     list_per_page = 50
@@ -1249,7 +1500,8 @@ class SalesOrderActivityAdmin(admin.ModelAdmin):
 class ItemMasterAdmin(admin.ModelAdmin):
     list_display = ('item_code', 'description_short', 'item_type', 'unit_of_measurement', 
                    'standard_price', 'default_tax_percentage', 'is_active_badge', 'created_at')
-    list_filter = ('item_type', 'is_active', 'category', 'brand', 'created_at')
+    list_filter = ('item_type', 'is_active', ('category', CachedValuesFilter), ('brand', CachedValuesFilter),
+                   'created_at')
     search_fields = ('item_code', 'description', 'short_name', 'hsn_sac_code', 'manufacturer', 'brand')
     readonly_fields = ('created_by', 'created_at', 'updated_at')
     list_per_page = 50
@@ -1413,6 +1665,8 @@ class ApprovalMatrixAdmin(admin.ModelAdmin):
     list_display = ('document_type', 'min_amount', 'max_amount', 'approver_role', 
                    'approver', 'is_active_badge', 'created_at')
     list_filter = ('document_type', 'is_active', 'created_at')
+    list_select_related = ('approver',)
+    autocomplete_fields = ('approver',)
     search_fields = ('approver_role', 'remarks')
     readonly_fields = ('created_at', 'updated_at')
     list_per_page = 50
@@ -1449,8 +1703,9 @@ class TechnicianAdmin(admin.ModelAdmin):
     """Comprehensive admin panel for Technician Master"""
     list_display = ('employee_code', 'full_name_display', 'mobile', 'email', 'skill_level', 
                    'region', 'active_calls', 'is_active', 'is_available', 'joining_date')
-    list_filter = ('skill_level', 'is_active', 'is_available', 'region', 'territory', 
-                  'department', 'joining_date', 'created_at')
+    list_filter = ('skill_level', 'is_active', 'is_available', ('region', CachedValuesFilter),
+                   ('territory', CachedRelatedFilter), ('department', CachedRelatedFilter), 'joining_date', 'created_at')
+    autocomplete_fields = ('user', 'reporting_to')
     search_fields = ('employee_code', 'user__first_name', 'user__last_name', 'user__username',
                     'mobile', 'alternate_mobile', 'email', 'alternate_email', 'specialization',
                     'city', 'state', 'aadhar_number', 'pan_number')
@@ -1495,9 +1750,15 @@ class TechnicianAdmin(admin.ModelAdmin):
     full_name_display.short_description = 'Name'
     full_name_display.admin_order_field = 'user__first_name'
     
+    @staticmethod
+    def _active_calls(obj):
+        # Annotated on the changelist; the add form's unsaved instance has no count
+        count = getattr(obj, 'active_call_count', None)
+        return obj.active_service_calls_count if count is None else count
+
     def active_calls(self, obj):
         """Display count of active service calls"""
-        count = obj.active_service_calls_count
+        count = self._active_calls(obj)
         if count > 0:
             return format_html(
                 '<span style="background-color: #ffc107; color: black; padding: 2px 8px; border-radius: 3px; font-weight: bold;">{}</span>',
@@ -1505,11 +1766,11 @@ class TechnicianAdmin(admin.ModelAdmin):
             )
         return format_html('<span style="color: #28a745;">0</span>', count)
     active_calls.short_description = 'Active Calls'
-    active_calls.admin_order_field = 'assigned_calls'
+    active_calls.admin_order_field = 'active_call_count'
     
     def active_calls_count_display(self, obj):
         """Read-only field showing active service calls count"""
-        count = obj.active_service_calls_count
+        count = self._active_calls(obj)
         if count > 0:
             return format_html(
                 '<strong style="color: #ffc107;">{} active service call(s)</strong>',
@@ -1545,15 +1806,20 @@ class TechnicianAdmin(admin.ModelAdmin):
     make_unavailable.short_description = "Mark as unavailable"
     
     def get_queryset(self, request):
-        """Optimize queryset with select_related"""
+        """Optimize queryset with select_related and the active call count"""
         qs = super().get_queryset(request)
-        return qs.select_related('user', 'territory', 'department', 'designation', 'reporting_to')
+        return qs.select_related('user', 'territory', 'department', 'designation', 'reporting_to').annotate(
+            active_call_count=related_count(ServiceCall, 'assigned_technician',
+                                            status__in=Technician.ACTIVE_CALL_STATUSES)
+        )
 
 
 @admin.register(ServiceContract)
 class ServiceContractAdmin(admin.ModelAdmin):
     list_display = ('contract_number', 'customer', 'contract_type', 'start_date', 'end_date', 'status')
     list_filter = ('contract_type', 'status', 'start_date')
+    list_select_related = ('customer',)
+    autocomplete_fields = ('customer', 'related_order')
     search_fields = ('contract_number', 'customer__name')
     readonly_fields = ('contract_number',)
     
@@ -1567,6 +1833,8 @@ class ServiceContractAdmin(admin.ModelAdmin):
 class WarrantyRecordAdmin(admin.ModelAdmin):
     list_display = ('warranty_number', 'customer', 'product_description', 'warranty_type', 'start_date', 'end_date', 'status')
     list_filter = ('warranty_type', 'status')
+    list_select_related = ('customer',)
+    autocomplete_fields = ('customer', 'related_order')
     search_fields = ('warranty_number', 'customer__name', 'product_serial_number')
 
 
@@ -1583,14 +1851,19 @@ class ServiceActivityInline(admin.TabularInline):
     model = ServiceActivity
     extra = 1
     fields = ('activity_type', 'activity_date', 'performed_by', 'duration_minutes')
+    autocomplete_fields = ('performed_by',)
 
 
 @admin.register(ServiceCall)
-class ServiceCallAdmin(admin.ModelAdmin):
+class ServiceCallAdmin(IndexedSearchMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('service_number', 'customer', 'service_type', 'priority', 'status', 
                    'assigned_technician', 'service_request_date', 'billable', 'actual_cost')
     list_filter = ('service_type', 'priority', 'status', 'billable', 'warranty_status')
+    list_select_related = ('customer', 'assigned_technician__user')
+    autocomplete_fields = ('related_order', 'related_quotation', 'customer', 'assigned_technician', 'warranty_record',
+                           'service_contract', 'call_closed_by', 'created_by', 'updated_by')
     search_fields = ('service_number', 'customer__name', 'contact_person', 'problem_description')
+    search_kind = 'service_calls'
     readonly_fields = ('service_number',)
     
     inlines = [ServiceCallItemInline, ServiceActivityInline]
@@ -1603,10 +1876,13 @@ class ServiceCallAdmin(admin.ModelAdmin):
 
 
 @admin.register(ServiceCallItem)
-class ServiceCallItemAdmin(admin.ModelAdmin):
+class ServiceCallItemAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('service_call', 'line_number', 'item_type', 'item_code', 'product_serial_no', 
                    'quantity', 'unit_price', 'labour_hours', 'warranty_covered', 'line_total')
     list_filter = ('item_type', 'warranty_covered')
+    list_select_related = ('service_call',)
+    ordering = ('-id',)
+    autocomplete_fields = ('service_call', 'item_master')
     search_fields = ('service_call__service_number', 'item_code', 'product_serial_no', 
                     'description', 'batch_no', 'serial_number')
     readonly_fields = ('line_total',)
@@ -1637,9 +1913,12 @@ class ServiceCallItemAdmin(admin.ModelAdmin):
 
 
 @admin.register(ServiceActivity)
-class ServiceActivityAdmin(admin.ModelAdmin):
+class ServiceActivityAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('service_call', 'activity_type', 'activity_date', 'performed_by', 'duration_minutes', 'is_billable')
     list_filter = ('activity_type', 'is_billable', 'activity_date')
+    list_select_related = ('service_call', 'performed_by__user')
+    ordering = ('-id',)
+    autocomplete_fields = ('service_call', 'performed_by')
     search_fields = ('service_call__service_number', 'description')
 
 
@@ -1647,6 +1926,8 @@ class ServiceActivityAdmin(admin.ModelAdmin):
 class ServiceCallAttachmentAdmin(admin.ModelAdmin):
     list_display = ('service_call', 'file_name', 'file_type', 'uploaded_by', 'uploaded_at')
     list_filter = ('file_type', 'uploaded_at')
+    list_select_related = ('service_call', 'uploaded_by')
+    autocomplete_fields = ('service_call', 'uploaded_by')
     search_fields = ('service_call__service_number', 'file_name')
 
 
@@ -1658,6 +1939,8 @@ class ServiceCallAttachmentAdmin(admin.ModelAdmin):
 class SpareUsageAdmin(admin.ModelAdmin):
     list_display = ('service_call', 'part', 'qty_used', 'cost_price', 'sell_price', 'warehouse_id', 'replacement_reason', 'verified_at')
     list_filter = ('replacement_reason', 'verified_at')
+    list_select_related = ('service_call', 'part')
+    autocomplete_fields = ('service_call', 'part', 'verified_by')
     search_fields = ('service_call__service_number', 'part__item_code', 'part__description')
     readonly_fields = ('created_at',)
     date_hierarchy = 'created_at'
@@ -1667,6 +1950,8 @@ class SpareUsageAdmin(admin.ModelAdmin):
 class ServiceInvoiceAdmin(admin.ModelAdmin):
     list_display = ('service_invoice_id', 'service_call', 'invoice_date', 'total_amount', 'payment_status', 'due_date')
     list_filter = ('payment_status', 'invoice_date', 'due_date')
+    list_select_related = ('service_call',)
+    autocomplete_fields = ('service_call', 'created_by')
     search_fields = ('service_invoice_id', 'service_call__service_number', 'invoice_number')
     readonly_fields = ('service_invoice_id', 'invoice_number',)
     date_hierarchy = 'invoice_date'
@@ -1698,3 +1983,68 @@ class SLAConfigAdmin(admin.ModelAdmin):
     list_filter = ('service_type', 'priority', 'is_active')
     search_fields = ('service_type', 'priority')
     readonly_fields = ('created_at', 'updated_at')
+
+
+# =====================================================
+# DOCUMENT NUMBERING & REPORTING
+# =====================================================
+
+@admin.register(DocumentSequence)
+class DocumentSequenceAdmin(admin.ModelAdmin):
+    list_display = ('key', 'period', 'last_value', 'updated_at')
+    list_filter = ('key',)
+    search_fields = ('key', 'period')
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(DailyRollup)
+class DailyRollupAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('day', 'metric', 'sales_employee', 'region', 'status', 'count', 'amount')
+    list_filter = ('metric', 'region', 'day')
+    list_select_related = ('sales_employee__user',)
+
+    def has_add_permission(self, request):
+        # Rollups are maintained by signals, rollups.update() and rebuild_rollups only
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Export)
+class ExportAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'format', 'status', 'rows_written', 'total_rows', 'requested_by', 'created_at',
+                    'finished_at')
+    list_filter = ('status', 'format', 'name')
+    list_select_related = ('requested_by',)
+    readonly_fields = ('name', 'format', 'status', 'total_rows', 'rows_written', 'file', 'error', 'requested_by',
+                       'created_at', 'finished_at')
+
+    def has_add_permission(self, request):
+        # Exports are started from the list views and the changelist actions
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'task', 'status', 'priority', 'progress', 'attempts', 'max_attempts', 'run_at',
+                    'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'task', 'priority')
+    list_select_related = ('created_by',)
+    ordering = ('-id',)
+    readonly_fields = ('task', 'kwargs', 'status', 'attempts', 'progress', 'progress_message', 'result', 'error',
+                       'worker', 'created_by', 'created_at', 'started_at', 'finished_at')
+    fields = ('task', 'status', 'priority', 'run_at', 'max_attempts', 'attempts', 'progress', 'progress_message',
+              'kwargs', 'result', 'error', 'worker', 'created_by', 'created_at', 'started_at', 'finished_at')
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        # Jobs are queued by the code that needs them (newapp.jobs.enqueue)
+        return False
+
+    def retry_jobs(self, request, queryset):
+        from django.utils import timezone
+        updated = queryset.filter(status='FAILED').update(status='QUEUED', attempts=0, error='',
+                                                          run_at=timezone.now(), finished_at=None)
+        self.message_user(request, f"{updated} failed job(s) queued again.")
+    retry_jobs.short_description = "🔁 Retry failed jobs"
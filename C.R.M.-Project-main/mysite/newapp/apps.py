@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class NewappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'newapp'
+
+    def ready(self):
+        from . import autocomplete, caching, directory, rollups, search
+        # Modules registering background job tasks (newapp.jobs)
+        from . import conversion, documents, exports, importers, notifications  # noqa: F401
+        rollups.connect_signals()
+        caching.connect_signals()
+        search.connect_signals()
+        autocomplete.connect_signals()
+        directory.connect_signals()
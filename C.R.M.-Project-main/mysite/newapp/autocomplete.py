@@ -0,0 +1,423 @@
+"""
+In-memory autocomplete for the item and prospect pickers.
+
+``search_items`` and ``search_prospects`` are called on every keystroke, so
+instead of a three-way ``icontains`` scan per call each worker process keeps
+an index of the active item master / prospect list in memory:
+
+- a sorted array of whole codes and names (``abc-0045``, ``acme traders``):
+  a prefix lookup is one bisect, and the first matches in the array are
+  already in display order;
+- a sorted array of every word of the codes, names, descriptions and
+  e-mails, for word-prefix matches (``trad`` -> "Acme Traders");
+- a trigram -> ids map over the codes and names, used when the prefix
+  matches do not fill the list, so a fragment from the middle of a code
+  (``0045``) still matches like the old ``icontains`` did (queries of 3+
+  characters). Descriptions and e-mails match by word prefix only; a
+  trigram map over every description would cost more memory than the
+  whole rest of the index.
+
+Matches are ranked: exact code/name, code/name prefix, word prefix in the
+code/name, word prefix elsewhere, then substring; ties sort by code/name.
+Short prefixes can match tens of thousands of rows, so each stage looks at
+no more than ``SCAN_LIMIT`` candidates: a lookup costs about the same at 100k
+rows as at 1k. Rows outside the caller's scope are skipped before they count
+against the limit, so an employee still finds their own rows when other
+people's fill the first thousand matches.
+
+The index is built on the first request. Committed saves and deletes in this
+process update it directly (change signals) and bump a shared version in the
+cache; other processes see the new version on their next lookup and reload
+only the rows updated since their last sync. Bulk writers call ``changed()``.
+"""
+
+import bisect
+import datetime
+import heapq
+import re
+import sys
+import threading
+from dataclasses import dataclass
+
+from django.apps import apps as django_apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from . import caching
+
+WORD_RE = re.compile(r"[^\W_]+")
+
+# Match ranks, best first
+EXACT, KEY_PREFIX, KEY_WORD, WORD, SUBSTRING = range(5)
+
+# Candidates looked at per stage of a lookup
+SCAN_LIMIT = 1000
+
+# Sorts after every string that starts with the prefix it is appended to
+HIGHEST = "\U0010ffff"
+
+
+def _norm(value):
+    return " ".join(str(value).lower().split()) if value else ""
+
+
+def _trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _range(array, prefix):
+    """Slice bounds of the entries of a sorted array that start with ``prefix``."""
+    return bisect.bisect_left(array, prefix), bisect.bisect_left(array, prefix + HIGHEST)
+
+
+@dataclass(frozen=True)
+class Source:
+    """A model offered for autocomplete."""
+
+    model: str
+    key_fields: tuple  # codes and names: matched whole and ranked first
+    text_fields: tuple  # other text, matched by word prefix
+    columns: tuple  # columns returned to the caller
+    active: dict  # filter for the rows offered at all
+    scope_fields: tuple = ()
+
+    def get_model(self, apps=django_apps):
+        return apps.get_model("newapp", self.model)
+
+
+SOURCES = {
+    "items": Source(
+        "ItemMaster",
+        key_fields=("item_code", "short_name"),
+        text_fields=("description",),
+        columns=(
+            "id",
+            "item_code",
+            "short_name",
+            "description",
+            "standard_price",
+            "unit_of_measurement",
+            "default_tax_percentage",
+        ),
+        active={"is_active": True},
+    ),
+    "prospects": Source(
+        "ProspectCustomer",
+        key_fields=("name", "company_name"),
+        text_fields=("email",),
+        columns=("id", "customer_id", "name", "company_name", "email", "phone", "address"),
+        active={},
+        scope_fields=("assigned_to_id", "created_by_id"),
+    ),
+}
+
+
+class Doc:
+    __slots__ = ("keys", "text", "words", "sort_key", "scope", "row")
+
+
+class AutocompleteIndex:
+    """
+    Prefix arrays + trigram index over one Source, kept in this process.
+
+    Each sorted array is kept as parallel lists (term, pk[, is-key flag])
+    rather than a list of tuples, and trigram postings are plain lists: at
+    100k rows that is a fraction of the memory of tuples and sets.
+    """
+
+    def __init__(self, source, version_scope=None):
+        self.source = source
+        self.version_scope = version_scope
+        self._lock = threading.RLock()
+        self.docs = {}  # pk -> Doc
+        self.keys, self.key_pks = [], []
+        self.words, self.word_pks, self.word_is_key = [], [], []
+        self.trigrams = {}  # trigram of the keys -> [pk, ...]
+        self.version = None
+        self.synced_at = None
+
+    def __len__(self):
+        return len(self.docs)
+
+    # ---- building ----
+
+    def _doc(self, row):
+        """The Doc for ``row`` and its words as {word: is_key}."""
+        doc = Doc()
+        doc.keys = tuple(_norm(row[name]) for name in self.source.key_fields if row[name])
+        words = {}
+        for name in self.source.text_fields:
+            for word in WORD_RE.findall(_norm(row[name])):
+                words[word] = False
+        for key in doc.keys:
+            # A word in both a key and the other text ranks as a key word
+            words.update((word, True) for word in WORD_RE.findall(key))
+        # ' word word ...': checks the other words of a multi-word query with one `in`
+        doc.words = " " + " ".join(words)
+        doc.text = "\x00".join(doc.keys)
+        doc.sort_key = doc.keys[0] if doc.keys else ""
+        doc.scope = tuple(row[name] for name in self.source.scope_fields)
+        doc.row = row
+        return doc, words
+
+    def load(self, rows):
+        """Replace the whole index with ``rows`` (dicts with the source's columns)."""
+        docs, keys, words, trigrams = {}, [], [], {}
+        for row in rows:
+            pk = row["id"]
+            doc, doc_words = self._doc(row)
+            docs[pk] = doc
+            keys.extend((key, pk) for key in doc.keys)
+            # Interned: the same words recur across thousands of rows
+            words.extend((sys.intern(word), pk, is_key) for word, is_key in doc_words.items())
+            for trigram in _trigrams(doc.text):
+                trigrams.setdefault(trigram, []).append(pk)
+        keys.sort()
+        words.sort()
+
+        with self._lock:
+            self.docs, self.trigrams = docs, trigrams
+            self.keys, self.key_pks = [key for key, _ in keys], [pk for _, pk in keys]
+            self.words = [word for word, _, _ in words]
+            self.word_pks = [pk for _, pk, _ in words]
+            self.word_is_key = [is_key for _, _, is_key in words]
+
+    def upsert(self, row):
+        with self._lock:
+            pk = row["id"]
+            self.remove(pk)
+            doc, words = self._doc(row)
+            self.docs[pk] = doc
+            for key in doc.keys:
+                position = bisect.bisect_left(self.keys, key)
+                self.keys.insert(position, key)
+                self.key_pks.insert(position, pk)
+            for word, is_key in words.items():
+                position = bisect.bisect_left(self.words, word)
+                self.words.insert(position, sys.intern(word))
+                self.word_pks.insert(position, pk)
+                self.word_is_key.insert(position, is_key)
+            for trigram in _trigrams(doc.text):
+                self.trigrams.setdefault(trigram, []).append(pk)
+
+    def remove(self, pk):
+        with self._lock:
+            doc = self.docs.pop(pk, None)
+            if doc is None:
+                return
+            for array, pks, extra, terms in (
+                (self.keys, self.key_pks, (), doc.keys),
+                (self.words, self.word_pks, (self.word_is_key,), doc.words.split()),
+            ):
+                for term in terms:
+                    position, end = _range(array, term)
+                    while position < end and array[position] == term:
+                        if pks[position] == pk:
+                            del array[position], pks[position]
+                            for other in extra:
+                                del other[position]
+                            break
+                        position += 1
+            for trigram in _trigrams(doc.text):
+                pks = self.trigrams.get(trigram)
+                if pks is not None and pk in pks:
+                    pks.remove(pk)
+                    if not pks:
+                        del self.trigrams[trigram]
+
+    # ---- syncing with the database ----
+
+    def _rows(self, queryset):
+        fields = (
+            set(self.source.columns) | set(self.source.key_fields) | set(self.source.text_fields)
+        )
+        fields |= set(self.source.scope_fields)
+        return queryset.values(*sorted(fields)).iterator(chunk_size=2000)
+
+    def refresh(self):
+        """Build on first use; afterwards reload what changed when the shared version moved."""
+        version = caching.get_version(self.version_scope)
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            started = timezone.now()
+            active = self.source.get_model().objects.filter(**self.source.active)
+            if self.synced_at is None:
+                self.load(self._rows(active))
+            else:
+                since = self.synced_at - datetime.timedelta(seconds=5)
+                changed = self.source.get_model().objects.filter(updated_at__gte=since)
+                live = set(active.filter(updated_at__gte=since).values_list("id", flat=True))
+                for row in self._rows(changed):
+                    if row["id"] in live:
+                        self.upsert(row)
+                    else:
+                        self.remove(row["id"])
+                # Deleted rows, or rows deactivated without touching updated_at
+                if active.count() != len(self.docs):
+                    for pk in set(self.docs) - set(active.values_list("id", flat=True)):
+                        self.remove(pk)
+            self.version = version
+            self.synced_at = started
+
+    # ---- querying ----
+
+    def search(self, query, limit=20, scope=None):
+        """
+        Top ``limit`` rows for ``query``.
+
+        Args:
+            query (str): What the user typed
+            limit (int): Most results
+            scope (callable): Optional ``scope(doc.scope) -> bool`` row filter
+
+        Returns:
+            list: Row dicts (the source's columns), best match first
+        """
+        query = _norm(query)
+        if not query:
+            return []
+        with self._lock:
+            docs = self.docs
+            ranks = {}
+
+            def offer(pk, rank):
+                if rank < ranks.get(pk, SUBSTRING + 1):
+                    ranks[pk] = rank
+
+            def candidates(pks, start, end):
+                """(position, pk) of the in-scope rows of ``pks[start:end]``, at most SCAN_LIMIT."""
+                taken = 0
+                for position in range(start, end):
+                    pk = pks[position]
+                    if scope is not None and not scope(docs[pk].scope):
+                        continue
+                    yield position, pk
+                    taken += 1
+                    if taken >= SCAN_LIMIT:
+                        return
+
+            # 1. Whole code/name prefix: the array is in key order, so the first hits are the best
+            start, end = _range(self.keys, query)
+            for position, pk in candidates(self.key_pks, start, end):
+                offer(pk, EXACT if self.keys[position] == query else KEY_PREFIX)
+                if len(ranks) >= limit:
+                    break
+
+            # 2. Word prefixes; with several words, walk the rarest word's matches
+            # and check the rest
+            words = WORD_RE.findall(query)
+            if len(ranks) < limit and words:
+                ranges = sorted(
+                    (_range(self.words, word) + (word,) for word in words),
+                    key=lambda bounds: bounds[1] - bounds[0],
+                )
+                start, end, rarest = ranges[0]
+                others = [" " + word for word in words if word != rarest]
+                for position, pk in candidates(self.word_pks, start, end):
+                    if others and not all(other in docs[pk].words for other in others):
+                        continue
+                    offer(pk, KEY_WORD if self.word_is_key[position] and not others else WORD)
+
+            # 3. Fragments from the middle of a code or name: check the rows of the rarest trigram
+            if len(ranks) < limit and len(query) >= 3:
+                rarest = min(
+                    (self.trigrams.get(trigram, ()) for trigram in _trigrams(query)), key=len
+                )
+                for _, pk in candidates(rarest, 0, len(rarest)):
+                    if pk not in ranks and query in docs[pk].text:
+                        offer(pk, SUBSTRING)
+
+            best = heapq.nsmallest(
+                limit, ranks.items(), key=lambda item: (item[1], docs[item[0]].sort_key, item[0])
+            )
+            return [docs[pk].row for pk, _ in best]
+
+
+# ==========================
+# PER-PROCESS INDEXES
+# ==========================
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(name):
+    """The (lazily built, up to date) index for ``name`` in this process."""
+    index = _indexes.get(name)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(name)
+            if index is None:
+                index = _indexes[name] = AutocompleteIndex(
+                    SOURCES[name], version_scope=f"autocomplete:{name}"
+                )
+    index.refresh()
+    return index
+
+
+def changed(name):
+    """Make every process re-sync ``name`` once the transaction commits (for bulk writes)."""
+    transaction.on_commit(lambda: caching.bump(f"autocomplete:{name}"))
+
+
+def prospect_scope(sales_employee, user):
+    """Row filter for a non-admin user: prospects assigned to them or created by them."""
+    employee_id = getattr(sales_employee, "pk", None)
+    return (
+        lambda scope: (employee_id is not None and scope[0] == employee_id) or scope[1] == user.pk
+    )
+
+
+# ==========================
+# SIGNALS
+# ==========================
+
+
+def _name_for(sender):
+    for name, source in SOURCES.items():
+        if source.model == sender.__name__:
+            return name
+    return None
+
+
+def _on_save(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    name, pk = _name_for(sender), instance.pk
+
+    def _apply():
+        index = _indexes.get(name)
+        if index is not None:
+            rows = list(index._rows(sender.objects.filter(pk=pk, **index.source.active)))
+            if rows:
+                index.upsert(rows[0])
+            else:
+                index.remove(pk)
+        caching.bump(f"autocomplete:{name}")
+
+    transaction.on_commit(_apply)
+
+
+def _on_delete(sender, instance, **kwargs):
+    name, pk = _name_for(sender), instance.pk
+
+    def _apply():
+        index = _indexes.get(name)
+        if index is not None:
+            index.remove(pk)
+        caching.bump(f"autocomplete:{name}")
+
+    transaction.on_commit(_apply)
+
+
+def connect_signals():
+    for name, source in SOURCES.items():
+        model = source.get_model()
+        post_save.connect(_on_save, sender=model, dispatch_uid=f"autocomplete_{name}_post_save")
+        post_delete.connect(
+            _on_delete, sender=model, dispatch_uid=f"autocomplete_{name}_post_delete"
+        )
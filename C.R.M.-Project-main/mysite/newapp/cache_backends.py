@@ -0,0 +1,87 @@
+"""
+Cache backends that count hits and misses.
+
+Drop-in subclasses of Django's file, Redis and local-memory backends, selected
+in settings.CACHES (Redis needs the optional ``redis`` package). Counters are
+kept per worker process, grouped by key namespace (the part before the first
+``:``, e.g. ``dashboard_metrics``), and read with ``cache_stats()``; lookups
+made by a request that ``newapp.metrics`` samples are also added to its
+metrics.
+"""
+
+import threading
+from collections import defaultdict
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+from . import metrics
+
+_MISSING = object()
+_lock = threading.Lock()
+_counters = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+
+def _namespace(key):
+    return str(key).split(":", 1)[0]
+
+
+def _record(key, hits, misses):
+    with _lock:
+        counter = _counters[_namespace(key)]
+        counter["hits"] += hits
+        counter["misses"] += misses
+    metrics.record_cache(hits, misses)
+
+
+def cache_stats():
+    """Hit/miss counters for this process: {'total': {...}, 'namespaces': {name: {...}}}."""
+    with _lock:
+        namespaces = {name: dict(counter) for name, counter in _counters.items()}
+    hits = sum(counter["hits"] for counter in namespaces.values())
+    misses = sum(counter["misses"] for counter in namespaces.values())
+    return {
+        "total": {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+        },
+        "namespaces": namespaces,
+    }
+
+
+def reset_cache_stats():
+    with _lock:
+        _counters.clear()
+
+
+class CacheStatsMixin:
+    """Counts every get() as a hit or a miss (the base get_many() goes through get())."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            _record(key, 0, 1)
+            return default
+        _record(key, 1, 0)
+        return value
+
+
+class FileBasedStatsCache(CacheStatsMixin, FileBasedCache):
+    pass
+
+
+class RedisStatsCache(CacheStatsMixin, RedisCache):
+    """Redis fetches get_many() in one round trip, so it is counted separately."""
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version=version)
+        for key in keys:
+            _record(key, int(key in found), int(key not in found))
+        return found
+
+
+class LocMemStatsCache(CacheStatsMixin, LocMemCache):
+    pass
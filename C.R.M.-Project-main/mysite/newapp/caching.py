@@ -0,0 +1,122 @@
+"""
+Versioned cache keys for per-scope data (dashboards and similar).
+
+Every cached value lives under ``<name>:<scope>:v<version>``. A scope is either
+the global admin view (``all``) or one sales employee (``emp:<id>``). Saving or
+deleting a visit, prospect or lead (or a bulk update through
+``invalidate_rows()``) bumps the version of the global scope and of every
+employee it belongs to, so the next read misses and recomputes while
+untouched scopes keep their cached values. Old entries are never deleted; they
+simply expire.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+GLOBAL_SCOPE = "all"
+VERSION_KEY = "crm:version:{scope}"
+
+
+def default_timeout():
+    return getattr(settings, "DASHBOARD_CACHE_TIMEOUT", 3600)
+
+
+def scope_for(sales_employee=None):
+    """Cache scope for an employee (or the admin/global view when None)."""
+    if sales_employee is None:
+        return GLOBAL_SCOPE
+    return f"emp:{getattr(sales_employee, 'pk', sales_employee)}"
+
+
+def _new_version():
+    # Millisecond clock rather than 1, so a version key evicted by the cache
+    # can never come back with a number an older entry was stored under.
+    return int(time.time() * 1000)
+
+
+def get_version(scope):
+    key = VERSION_KEY.format(scope=scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump(scope):
+    # A fresh clock value rather than cache.incr(): on the file and database
+    # backends incr() is a get-then-set, so two processes bumping at once could
+    # both write the same v+1 and keep serving an entry cached in between.
+    key = VERSION_KEY.format(scope=scope)
+    cache.set(key, max(_new_version(), (cache.get(key) or 0) + 1), None)
+
+
+def cache_key(name, sales_employee=None):
+    scope = scope_for(sales_employee)
+    return f"{name}:{scope}:v{get_version(scope)}"
+
+
+def get_or_set(name, compute, sales_employee=None, timeout=None):
+    """Return the cached value for ``name`` in this scope, computing and storing it on a miss."""
+    key = cache_key(name, sales_employee)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, default_timeout() if timeout is None else timeout)
+    return value
+
+
+def invalidate(*employee_ids):
+    """Bump the global scope and the given employees' scopes once the transaction commits."""
+    scopes = {GLOBAL_SCOPE} | {scope_for(pk) for pk in employee_ids if pk}
+
+    def _bump():
+        for scope in scopes:
+            bump(scope)
+
+    transaction.on_commit(_bump)
+
+
+def invalidate_rows(queryset):
+    """
+    invalidate() for the employees owning the rows of ``queryset``, for bulk writes that
+    send no signals. Call it before the write, while the filter still matches the rows.
+    """
+    attname = INVALIDATING_MODELS[queryset.model.__name__]
+    invalidate(*set(queryset.order_by().values_list(attname, flat=True).distinct()))
+
+
+# ==========================
+# SIGNALS
+# ==========================
+
+# Model name -> employee FK attname whose scope the row belongs to
+INVALIDATING_MODELS = {
+    "VisitLog": "sales_employee_id",
+    "ProspectCustomer": "assigned_to_id",
+    "Lead": "assigned_to_id",
+}
+
+
+def _on_change(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    employee_ids = [getattr(instance, INVALIDATING_MODELS[sender.__name__])]
+    # Set by the rollup pre_save snapshot when the row was reassigned
+    employee_ids.append(getattr(instance, "_rollup_old_employee_id", None))
+    invalidate(*employee_ids)
+
+
+def connect_signals():
+    from django.apps import apps
+
+    for model_name in INVALIDATING_MODELS:
+        model = apps.get_model("newapp", model_name)
+        post_save.connect(_on_change, sender=model, dispatch_uid=f"caching_{model_name}_post_save")
+        post_delete.connect(
+            _on_change, sender=model, dispatch_uid=f"caching_{model_name}_post_delete"
+        )
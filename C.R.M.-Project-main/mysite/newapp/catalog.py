@@ -0,0 +1,356 @@
+"""
+Catalog sync for ItemMaster and TaxMaster.
+
+An incoming price list / tax table (CSV or XLSX) is diffed against the current
+table on its business key (``item_code`` / ``tax_code``) and only the
+differences are written: new rows with bulk_create, changed rows with
+bulk_update and rows missing from the file are deactivated, never deleted.
+The current table is read once up front and every write batch runs in its own
+short transaction, so locks are held per batch rather than for the whole sync.
+
+Items without a GST rate in the file take it from the active TaxMaster row
+with the same HSN/SAC code. Used by ``manage.py sync_catalog``.
+"""
+
+import csv
+import os
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from . import autocomplete
+from .importers import iter_rows
+from .models import ItemMaster, TaxMaster
+
+
+@dataclass(frozen=True)
+class CatalogSpec:
+    model: type
+    key: str
+    fields: tuple
+    aliases: dict
+
+
+CATALOGS = {
+    "items": CatalogSpec(
+        model=ItemMaster,
+        key="item_code",
+        fields=(
+            "description",
+            "short_name",
+            "item_type",
+            "unit_of_measurement",
+            "standard_price",
+            "minimum_price",
+            "purchase_price",
+            "hsn_sac_code",
+            "default_tax_percentage",
+            "manufacturer",
+            "brand",
+            "category",
+            "remarks",
+        ),
+        aliases={
+            "code": "item_code",
+            "sku": "item_code",
+            "item": "item_code",
+            "name": "short_name",
+            "type": "item_type",
+            "uom": "unit_of_measurement",
+            "unit": "unit_of_measurement",
+            "price": "standard_price",
+            "mrp": "standard_price",
+            "min_price": "minimum_price",
+            "cost": "purchase_price",
+            "hsn": "hsn_sac_code",
+            "sac": "hsn_sac_code",
+            "hsn_code": "hsn_sac_code",
+            "gst": "default_tax_percentage",
+            "tax": "default_tax_percentage",
+            "tax_percentage": "default_tax_percentage",
+        },
+    ),
+    "taxes": CatalogSpec(
+        model=TaxMaster,
+        key="tax_code",
+        fields=("tax_name", "tax_type", "tax_percentage", "hsn_sac_code", "description"),
+        aliases={
+            "code": "tax_code",
+            "name": "tax_name",
+            "type": "tax_type",
+            "rate": "tax_percentage",
+            "percentage": "tax_percentage",
+            "hsn": "hsn_sac_code",
+            "sac": "hsn_sac_code",
+        },
+    ),
+}
+
+
+@dataclass
+class SyncResult:
+    rows_read: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deactivated: int = 0
+    invalid: int = 0
+    elapsed: float = 0.0
+    field_changes: Counter = field(default_factory=Counter)
+    changes: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+    @property
+    def rows_per_second(self):
+        return self.rows_read / self.elapsed if self.elapsed else 0.0
+
+
+def _same(old, new):
+    # '' and NULL are the same "no value" for text columns
+    return (old or None) == (new or None) if isinstance(old or new, str) else old == new
+
+
+class CatalogSync:
+    """
+    Diff a catalog file against the database and apply the changes in batches.
+
+    Args:
+        catalog (str): Key of CATALOGS ('items' or 'taxes')
+        created_by (User): Recorded on newly created items
+        batch_size (int): Rows per bulk write / transaction
+        deactivate_missing (bool): Deactivate active rows absent from the file
+        dry_run (bool): Compute the diff without writing anything
+    """
+
+    def __init__(
+        self, catalog, created_by=None, batch_size=1000, deactivate_missing=True, dry_run=False
+    ):
+        self.spec = CATALOGS[catalog]
+        self.created_by = created_by
+        self.batch_size = batch_size
+        self.deactivate_missing = deactivate_missing
+        self.dry_run = dry_run
+        self.model_fields = {
+            name: self.spec.model._meta.get_field(name) for name in self.spec.fields
+        }
+
+    def run(self, source, filename):
+        result = SyncResult()
+        started = time.perf_counter()
+
+        incoming = self._read(source, filename, result)
+        current = self._load_current()
+        to_create, to_update, to_deactivate = self._diff(incoming, current, result)
+
+        if not self.dry_run:
+            self._apply(to_create, to_update, to_deactivate)
+            if self.spec.model is ItemMaster:
+                autocomplete.changed("items")
+
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    # --------------------------------------------------------------
+    # Reading and validation
+    # --------------------------------------------------------------
+
+    def _read(self, source, filename, result):
+        """Validated rows from the file: {key: {field: value}}, only for the columns it has."""
+        spec = self.spec
+        hsn_rates = self._hsn_rates() if spec.model is ItemMaster else {}
+        incoming = {}
+
+        for row in iter_rows(source, filename, aliases=spec.aliases):
+            result.rows_read += 1
+            line = result.rows_read + 1  # header is line 1
+            key = (row.get(spec.key) or "").strip()
+            if not key:
+                result.invalid += 1
+                result.errors.append((line, f"{spec.key} is required"))
+                continue
+            if key in incoming:
+                result.invalid += 1
+                result.errors.append((line, f"{key}: duplicate {spec.key} in file"))
+                continue
+
+            values, errors = {}, []
+            for name, model_field in self.model_fields.items():
+                if name not in row:
+                    continue
+                try:
+                    values[name] = self._clean(model_field, row[name])
+                except ValidationError as exc:
+                    errors.append(f"{name}: {' '.join(exc.messages)}")
+            if errors:
+                result.invalid += 1
+                result.errors.append((line, f"{key}: {'; '.join(errors)}"))
+                continue
+
+            if (
+                hsn_rates
+                and values.get("hsn_sac_code")
+                and row.get("default_tax_percentage", "") == ""
+            ):
+                rate = hsn_rates.get(values["hsn_sac_code"])
+                if rate is not None:
+                    values["default_tax_percentage"] = rate
+            incoming[key] = values
+        return incoming
+
+    def _clean(self, model_field, raw):
+        value = raw.strip() if isinstance(raw, str) else raw
+        if value in ("", None):
+            if model_field.null:
+                return None
+            if model_field.has_default():
+                return model_field.get_default()
+        if value and getattr(model_field, "choices", None):
+            value = value.upper()
+        if isinstance(model_field, models.DecimalField) and value not in ("", None):
+            # Spreadsheets hand over floats such as 94.50000000000001
+            try:
+                value = Decimal(str(value)).quantize(
+                    Decimal(1).scaleb(-model_field.decimal_places), rounding=ROUND_HALF_UP
+                )
+            except InvalidOperation:
+                pass  # left for clean() to reject with the field's own message
+        return model_field.clean(value, None)
+
+    def _hsn_rates(self):
+        """HSN/SAC code -> GST % from active tax master rows (GST rows win over other types)."""
+        rates = {}
+        rows = (
+            TaxMaster.objects.filter(is_active=True)
+            .exclude(hsn_sac_code__isnull=True)
+            .exclude(hsn_sac_code="")
+        )
+        for code, tax_type, percentage in rows.values_list(
+            "hsn_sac_code", "tax_type", "tax_percentage"
+        ):
+            if code not in rates or tax_type == "GST":
+                rates[code] = percentage
+        return rates
+
+    # --------------------------------------------------------------
+    # Diff
+    # --------------------------------------------------------------
+
+    def _load_current(self):
+        """One read of the whole table: {key: {'pk', 'is_active', field...}}."""
+        columns = ("pk", self.spec.key, "is_active") + self.spec.fields
+        return {
+            row[self.spec.key]: row
+            for row in self.spec.model.objects.values(*columns).iterator(chunk_size=5000)
+        }
+
+    def _diff(self, incoming, current, result):
+        """Split the file into rows to create, per-column-set updates and pks to deactivate."""
+        spec = self.spec
+        to_create, to_deactivate = [], []
+        to_update = defaultdict(list)  # (field, ...) -> [(pk, {field: value}), ...]
+
+        for key, values in incoming.items():
+            existing = current.get(key)
+            if existing is None:
+                obj = spec.model(**{spec.key: key, **values})
+                if spec.model is ItemMaster:
+                    obj.created_by = self.created_by
+                to_create.append(obj)
+                result.created += 1
+                result.changes.append(("created", key, "", "", ""))
+                continue
+
+            changed = {
+                name: value for name, value in values.items() if not _same(existing[name], value)
+            }
+            if not existing["is_active"]:
+                changed["is_active"] = True
+            if not changed:
+                result.unchanged += 1
+                continue
+
+            to_update[tuple(sorted(changed))].append((existing["pk"], changed))
+            result.updated += 1
+            for name, value in changed.items():
+                result.field_changes[name] += 1
+                result.changes.append(("updated", key, name, existing[name], value))
+
+        if self.deactivate_missing:
+            for key, existing in current.items():
+                if existing["is_active"] and key not in incoming:
+                    to_deactivate.append(existing["pk"])
+                    result.deactivated += 1
+                    result.changes.append(("deactivated", key, "is_active", True, False))
+
+        return to_create, to_update, to_deactivate
+
+    # --------------------------------------------------------------
+    # Apply
+    # --------------------------------------------------------------
+
+    def _batches(self, items):
+        for start in range(0, len(items), self.batch_size):
+            yield items[start : start + self.batch_size]
+
+    def _apply(self, to_create, to_update, to_deactivate):
+        manager = self.spec.model.objects
+
+        for batch in self._batches(to_create):
+            with transaction.atomic():
+                manager.bulk_create(batch)
+
+        now = timezone.now()
+        for names, rows in to_update.items():
+            for batch in self._batches(rows):
+                with transaction.atomic():
+                    self._update_rows(names, batch, now)
+
+        for batch in self._batches(to_deactivate):
+            with transaction.atomic():
+                manager.filter(pk__in=batch).update(is_active=False, updated_at=now)
+
+    def _update_rows(self, names, rows, now):
+        """
+        One parameterised UPDATE per row, sent with executemany.
+
+        bulk_update() would build a CASE WHEN per row and column in Python,
+        which costs more than the writes themselves at catalog sizes; rows
+        are grouped by the set of columns that changed so each statement
+        only touches those columns.
+        """
+        meta = self.spec.model._meta
+        fields = [meta.get_field(name) for name in names] + [meta.get_field("updated_at")]
+        quote = connection.ops.quote_name
+        sql = "UPDATE {} SET {} WHERE {} = %s".format(
+            quote(meta.db_table),
+            ", ".join(f"{quote(model_field.column)} = %s" for model_field in fields),
+            quote(meta.pk.column),
+        )
+        params = [
+            [
+                model_field.get_db_prep_save(changed.get(model_field.name, now), connection)
+                for model_field in fields
+            ]
+            + [pk]
+            for pk, changed in rows
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+def write_change_report(result, path):
+    """Write every change (created / updated field / deactivated) to a CSV file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["action", "key", "field", "old_value", "new_value"])
+        writer.writerows(result.changes)
+        for line, message in result.errors:
+            writer.writerow(["rejected", f"line {line}", "", "", message])
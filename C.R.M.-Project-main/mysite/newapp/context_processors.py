@@ -1,36 +1,35 @@
 """
 Context processors for making data available to all templates
 """
-from .models import SalesEmployee
+from django.utils.functional import SimpleLazyObject
+
+from .directory import get_directory
+from .scope import get_scope
 
 
 def admin_context(request):
     """
     Add admin-related context to all templates
+
+    Everything here is lazy: a template that never shows the employee
+    dropdown or the "viewing as" banner costs no query and no cache read.
     """
     context = {}
-    
+
     # Only for staff/admin users
     if request.user.is_authenticated and (request.user.is_staff or request.user.is_superuser):
-        # Get all employees for the dropdown
-        context['all_employees'] = SalesEmployee.objects.select_related('user').order_by('user__first_name', 'user__last_name')
-        
+        # All employees for the dropdown (newapp.directory: cached, rebuilt when employees change)
+        context['all_employees'] = SimpleLazyObject(get_directory)
+
         # Check if admin is viewing as another user
         view_as_user_id = request.GET.get('view_as_user')
-        if view_as_user_id and view_as_user_id != 'self':
-            try:
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                viewed_user = User.objects.get(id=view_as_user_id)
-                context['viewing_as_user'] = viewed_user
-                context['is_admin_view'] = True
-                
-                # Try to get sales employee profile
-                try:
-                    context['viewed_employee'] = viewed_user.sales_profile
-                except SalesEmployee.DoesNotExist:
-                    context['viewed_employee'] = None
-            except (ValueError, User.DoesNotExist):
-                pass
-    
+        if view_as_user_id and view_as_user_id.isdigit():
+            user_id = int(view_as_user_id)
+            # Shared with the views through request.scope: looked up once per request
+            viewed_user = SimpleLazyObject(lambda: get_scope(request).viewed_user)
+            context['viewing_as_user'] = viewed_user
+            context['is_admin_view'] = SimpleLazyObject(lambda: bool(viewed_user))
+            # Directory entry of the viewed user's sales profile, None if they have none
+            context['viewed_employee'] = SimpleLazyObject(lambda: get_directory().for_user(user_id))
+
     return context
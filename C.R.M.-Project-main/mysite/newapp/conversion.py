@@ -0,0 +1,326 @@
+"""
+Quotation -> sales order conversion.
+
+``convert_quotation()`` turns one quotation into an order: the header and all
+lines are built and priced in memory, the order is inserted once with its
+final totals, the lines go in with one bulk_create and the quotation is marked
+converted, all in one transaction with the quotation row locked so it cannot
+be converted twice.
+
+``convert_quotations()`` is the batch mode (month-end runs, admin action):
+per batch of quotations it reserves a block of SO numbers and inserts all
+orders, all lines and all activity entries with one bulk_create each. Used by
+``manage.py convert_quotations`` and, as the ``quotations.convert`` background
+job (newapp.jobs), by the admin action.
+"""
+
+import datetime
+import time
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from . import jobs, rollups
+from .models import (
+    Quotation,
+    QuotationActivity,
+    QuotationItem,
+    SalesOrder,
+    SalesOrderActivity,
+    SalesOrderItem,
+)
+from .pricing import apply_line, apply_totals
+from .sequences import allocate_numbers
+
+# Quotation fields copied onto the order header
+HEADER_FIELDS = (
+    "prospect_id",
+    "contact_person",
+    "contact_email",
+    "contact_phone",
+    "assigned_to_id",
+    "currency",
+    "exchange_rate",
+    "payment_terms_master_id",
+    "payment_terms",
+    "delivery_terms_master_id",
+    "delivery_terms",
+    "reference_lead_id",
+    "reference_visit_id",
+    "reference_number",
+    "customer_remarks",
+    "internal_notes",
+    "discount_percentage",
+    "freight_charges",
+)
+
+# Quotation line fields copied onto each order line
+LINE_FIELDS = (
+    "item_master_id",
+    "item_code",
+    "description",
+    "quantity",
+    "uom",
+    "unit_price",
+    "discount_percentage",
+    "tax_percentage",
+    "line_number",
+    "remarks",
+)
+
+ORDER_VALIDITY_DAYS = 30
+
+
+class ConversionError(Exception):
+    """The quotation was already converted."""
+
+
+@dataclass
+class ConversionResult:
+    converted: int = 0
+    lines: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+    order_numbers: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+    @property
+    def quotations_per_second(self):
+        return self.converted / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def lines_per_second(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
+
+
+def build_order(quotation, created_by=None, order_date=None):
+    """Unsaved SalesOrder header copied from ``quotation``."""
+    order_date = order_date or timezone.localdate()
+    order = SalesOrder(**{name: getattr(quotation, name) for name in HEADER_FIELDS})
+    order.order_date = order_date
+    order.valid_till = order_date + datetime.timedelta(days=ORDER_VALIDITY_DAYS)
+    order.reference_quotation = quotation
+    order.created_by = created_by
+    order.status = "DRAFT"
+    return order
+
+
+def build_lines(quotation_items, order=None):
+    """Unsaved, priced SalesOrderItem copies of the quotation lines."""
+    lines = []
+    for q_item in quotation_items:
+        line = SalesOrderItem(order=order, **{name: getattr(q_item, name) for name in LINE_FIELDS})
+        apply_line(line)
+        lines.append(line)
+    return lines
+
+
+def _mark_converted(quotations):
+    """Flag quotations as converted and copy the new order's number/date back (one UPDATE)."""
+    latest_order = SalesOrder.objects.filter(reference_quotation=OuterRef("pk")).order_by("-pk")
+    Quotation.objects.filter(pk__in=[quotation.pk for quotation in quotations]).update(
+        converted_to_order=True,
+        status="CONVERTED",
+        order_number=Subquery(latest_order.values("order_number")[:1]),
+        order_date=Subquery(latest_order.values("order_date")[:1]),
+        updated_at=timezone.now(),
+    )
+    for quotation in quotations:
+        quotation.converted_to_order = True
+        quotation.status = "CONVERTED"
+
+
+def convert_quotation(quotation, order=None, created_by=None):
+    """
+    Convert one quotation into a sales order.
+
+    Args:
+        quotation (Quotation): The quotation to convert
+        order (SalesOrder): Unsaved header to use (e.g. from the order form);
+            built from the quotation when omitted
+        created_by (User): Recorded on the order and the activity entries
+
+    Returns:
+        SalesOrder: The saved order
+
+    Raises:
+        ConversionError: The quotation was already converted
+    """
+    with transaction.atomic():
+        quotation = Quotation.objects.select_for_update().get(pk=quotation.pk)
+        if quotation.converted_to_order:
+            raise ConversionError(
+                f"{quotation.quote_number} was already converted to {quotation.order_number}"
+            )
+
+        if order is None:
+            order = build_order(quotation, created_by=created_by)
+        order.reference_quotation = quotation
+        order.created_by = order.created_by or created_by
+
+        lines = build_lines(quotation.items.order_by("line_number", "pk"))
+        apply_totals(order, lines, save=False)
+        order.save()
+        for line in lines:
+            line.order = order
+        SalesOrderItem.objects.bulk_create(lines)
+
+        quotation.order_number = order.order_number
+        quotation.order_date = order.order_date
+        _mark_converted([quotation])
+        QuotationActivity.objects.create(
+            quotation=quotation,
+            activity_type="CONVERTED",
+            created_by=created_by,
+            description=f"Converted to Sales Order {order.order_number}",
+        )
+    return order
+
+
+def convert_quotations(queryset, created_by=None, batch_size=100, progress=None):
+    """
+    Convert many quotations, one transaction per batch.
+
+    Already-converted quotations and quotations without lines are skipped
+    (the latter are listed in ``result.errors``). Each batch costs
+    a handful of queries regardless of its size: lock and load the quotations,
+    load their lines, then one bulk insert each for orders, lines and
+    activities and one bulk update of the quotations.
+
+    Args:
+        queryset (QuerySet): Quotations to convert
+        created_by (User): Recorded on the orders and activity entries
+        batch_size (int): Quotations per transaction
+        progress (callable): Called with the running ConversionResult after each batch
+
+    Returns:
+        ConversionResult
+    """
+    result = ConversionResult()
+    started = time.perf_counter()
+    pks = list(queryset.order_by("pk").values_list("pk", flat=True))
+
+    for start in range(0, len(pks), batch_size):
+        with transaction.atomic():
+            _convert_batch(pks[start : start + batch_size], created_by, result)
+        result.elapsed = time.perf_counter() - started
+        if progress:
+            progress(result)
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def _convert_batch(pks, created_by, result):
+    quotations = list(
+        Quotation.objects.select_for_update()
+        .filter(pk__in=pks, converted_to_order=False)
+        .order_by("pk")
+    )
+    result.skipped += len(pks) - len(quotations)
+    if not quotations:
+        return
+
+    items_by_quotation = {quotation.pk: [] for quotation in quotations}
+    q_items = QuotationItem.objects.filter(quotation_id__in=items_by_quotation)
+    for q_item in q_items.order_by("quotation_id", "line_number", "pk"):
+        items_by_quotation[q_item.quotation_id].append(q_item)
+
+    # An order without lines is never what a batch run wants; leave those for review
+    empty = [quotation for quotation in quotations if not items_by_quotation[quotation.pk]]
+    for quotation in empty:
+        result.skipped += 1
+        result.errors.append(f"{quotation.quote_number}: no line items")
+    quotations = [quotation for quotation in quotations if items_by_quotation[quotation.pk]]
+    if not quotations:
+        return
+
+    today = timezone.localdate()
+    numbers = allocate_numbers("SO", len(quotations))
+    orders, lines_by_order = [], []
+    for quotation, number in zip(quotations, numbers):
+        order = build_order(quotation, created_by=created_by, order_date=today)
+        order.order_number = number
+        lines = build_lines(items_by_quotation[quotation.pk])
+        apply_totals(order, lines, save=False)
+        orders.append(order)
+        lines_by_order.append(lines)
+        quotation.order_number = number
+        quotation.order_date = order.order_date
+
+    SalesOrder.objects.bulk_create(orders)
+    if any(order.pk is None for order in orders):
+        # Backends that cannot return ids from a bulk insert
+        ids = dict(
+            SalesOrder.objects.filter(order_number__in=numbers).values_list("order_number", "pk")
+        )
+        for order in orders:
+            order.pk = ids[order.order_number]
+
+    all_lines = []
+    for order, lines in zip(orders, lines_by_order):
+        for line in lines:
+            line.order = order
+        all_lines.extend(lines)
+    SalesOrderItem.objects.bulk_create(all_lines, batch_size=500)
+    rollups.apply_created("orders", orders)
+
+    _mark_converted(quotations)
+    SalesOrderActivity.objects.bulk_create(
+        [
+            SalesOrderActivity(
+                order=order,
+                activity_type="COMMENT",
+                created_by=created_by,
+                description=f"Sales Order created from Quotation {quotation.quote_number}",
+            )
+            for order, quotation in zip(orders, quotations)
+        ]
+    )
+    QuotationActivity.objects.bulk_create(
+        [
+            QuotationActivity(
+                quotation=quotation,
+                activity_type="CONVERTED",
+                created_by=created_by,
+                description=f"Converted to Sales Order {quotation.order_number}",
+            )
+            for quotation in quotations
+        ]
+    )
+
+    result.converted += len(orders)
+    result.lines += len(all_lines)
+    result.order_numbers.extend(numbers)
+
+
+def queue_conversion(queryset, user):
+    """Queue the job converting the quotations of ``queryset``; returns the Job."""
+    return jobs.enqueue(
+        "quotations.convert",
+        user=user,
+        quotations=jobs.dump_queryset(queryset),
+        total=queryset.count(),
+    )
+
+
+@jobs.task("quotations.convert")
+def convert_task(job, quotations, total):
+    # Converted quotations are skipped, so a retry picks up where a failed attempt stopped
+    def progress(result):
+        done = result.converted + result.skipped
+        job.set_progress(done, total, f"{done} of {total} quotations processed")
+
+    result = convert_quotations(
+        jobs.load_queryset(quotations), created_by=job.created_by, progress=progress
+    )
+    return {
+        "message": (
+            f"{result.converted} quotation(s) converted to sales orders ({result.lines} lines) "
+            f"in {result.elapsed:.1f}s; {result.skipped} skipped."
+        ),
+        "order_numbers": result.order_numbers[:100],
+        "errors": [str(error) for error in result.errors[:100]],
+    }
@@ -0,0 +1,256 @@
+"""
+Dashboard KPIs shared by DashboardView and dashboard_data_api.
+
+Counters come from the daily rollups (newapp.rollups) rather than the fact
+tables: visits with a single conditional aggregate and prospects with a single
+GROUP BY status, from which totals, active leads, conversion and the stage
+breakdown are all derived in Python.
+
+Under ASGI, open dashboards get updates pushed by ``DashboardStream``
+(server-sent events) rather than polling the JSON API. The stream watches its scope's cache version
+(newapp.caching), which the visit/prospect/lead change signals bump, and only
+then reads the metrics and sends the keys that changed. Watching is a cache
+read, so an idle dashboard puts no load on the database.
+"""
+
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .caching import get_or_set, get_version, scope_for
+from .models import VisitLog
+from .rollups import rollup_rows
+
+ACTIVE_LEAD_STATUSES = ["NEW", "CONTACTED", "QUALIFIED", "PROPOSAL", "NEGOTIATION"]
+CONVERTED_STATUS = "WON"
+FOLLOWUP_WINDOW_DAYS = 7
+
+
+def visit_metrics(sales_employee=None, today=None):
+    """Visit counters (today, month, total, pending approvals) in one aggregate query."""
+    today = today or timezone.now().date()
+    by_status = Q(metric="visit_status")
+    totals = rollup_rows(
+        ["visit_status", "visit_approval"], sales_employee=sales_employee
+    ).aggregate(
+        visits_today=Sum("count", filter=by_status & Q(day=today)),
+        visits_month=Sum("count", filter=by_status & Q(day__gte=today.replace(day=1))),
+        total_visits=Sum("count", filter=by_status),
+        pending_approvals=Sum("count", filter=Q(metric="visit_approval", status="PENDING")),
+    )
+    return {key: value or 0 for key, value in totals.items()}
+
+
+def lead_metrics(sales_employee=None):
+    """Lead totals, active leads, conversion and stage breakdown from one GROUP BY query."""
+    stages = rollup_rows(["prospect_status"], sales_employee=sales_employee)
+    leads_by_stage = [
+        row
+        for row in stages.values("status").annotate(count=Sum("count")).order_by("status")
+        if row["count"]
+    ]
+    counts = {row["status"]: row["count"] for row in leads_by_stage}
+    total_leads = sum(counts.values())
+    converted = counts.get(CONVERTED_STATUS, 0)
+
+    return {
+        "total_leads": total_leads,
+        "active_leads": sum(counts.get(status, 0) for status in ACTIVE_LEAD_STATUSES),
+        "converted_count": converted,
+        "conversion_rate": round((converted / total_leads * 100), 1) if total_leads > 0 else 0,
+        "leads_by_stage": leads_by_stage,
+    }
+
+
+def upcoming_followups(sales_employee=None, today=None, limit=10):
+    """Visits with a follow-up due in the next week, soonest first."""
+    today = today or timezone.now().date()
+    followups = (
+        VisitLog.objects.filter(
+            next_follow_up_date__gte=today,
+            next_follow_up_date__lte=today + timedelta(days=FOLLOWUP_WINDOW_DAYS),
+        )
+        .select_related("prospect", "sales_employee__user")
+        .order_by("next_follow_up_date")
+    )
+    if sales_employee is not None:
+        followups = followups.filter(sales_employee=sales_employee)
+    return list(followups[:limit])
+
+
+def serialize_followups(followups):
+    """JSON-safe follow-up rows in the shape dashboard.js expects."""
+    return [
+        {
+            "prospect__name": visit.prospect.name,
+            "prospect__company_name": visit.prospect.company_name,
+            "next_follow_up_date": (
+                visit.next_follow_up_date.strftime("%Y-%m-%d")
+                if visit.next_follow_up_date
+                else None
+            ),
+            "visit_date": visit.visit_date.strftime("%Y-%m-%d") if visit.visit_date else None,
+            "sales_employee__user__first_name": visit.sales_employee.user.first_name or "",
+            "sales_employee__user__last_name": visit.sales_employee.user.last_name or "",
+        }
+        for visit in followups
+    ]
+
+
+def empty_metrics():
+    """Zeroed metrics for users without a sales employee profile."""
+    return {
+        "visits_today": 0,
+        "visits_month": 0,
+        "total_visits": 0,
+        "pending_approvals": 0,
+        "total_leads": 0,
+        "active_leads": 0,
+        "converted_count": 0,
+        "conversion_rate": 0,
+        "leads_by_stage": [],
+        "upcoming_followups": [],
+    }
+
+
+def get_dashboard_metrics(sales_employee=None, today=None):
+    """
+    Compute every dashboard KPI for one scope.
+
+    Args:
+        sales_employee: Restrict to this employee's visits and prospects; None for the admin view
+        today (date): Reference date, defaults to today
+
+    Returns:
+        dict: visit counters, lead metrics and ``upcoming_followups`` (VisitLog objects)
+    """
+    today = today or timezone.now().date()
+    metrics = visit_metrics(sales_employee, today)
+    metrics.update(lead_metrics(sales_employee))
+    metrics["upcoming_followups"] = upcoming_followups(sales_employee, today)
+    return metrics
+
+
+def get_cached_dashboard_metrics(sales_employee=None):
+    """get_dashboard_metrics() cached per scope until a visit, prospect or lead in it changes."""
+    today = timezone.now().date()
+    return get_or_set(
+        f"dashboard_metrics:{today.isoformat()}",
+        lambda: get_dashboard_metrics(sales_employee, today),
+        sales_employee=sales_employee,
+    )
+
+
+def dashboard_payload(metrics):
+    """Subset of the metrics sent to the browser as JSON."""
+    return {
+        "visits_today": metrics["visits_today"],
+        "visits_month": metrics["visits_month"],
+        "total_leads": metrics["total_leads"],
+        "active_leads": metrics["active_leads"],
+        "conversion_rate": metrics["conversion_rate"],
+        "converted_count": metrics["converted_count"],
+        "pending_approvals": metrics["pending_approvals"],
+        "leads_by_stage": metrics["leads_by_stage"],
+        "upcoming_followups": serialize_followups(metrics["upcoming_followups"]),
+    }
+
+
+# ==========================
+# PUSH UPDATES
+# ==========================
+
+# Milliseconds the browser waits before reconnecting a closed stream
+STREAM_RETRY_MS = 3000
+
+# Seconds of silence after which a comment is sent, so proxies keep the connection open
+STREAM_KEEPALIVE = 20
+
+
+def stream_interval():
+    return getattr(settings, "DASHBOARD_STREAM_INTERVAL", 2)
+
+
+def stream_max_age():
+    return getattr(settings, "DASHBOARD_STREAM_MAX_AGE", 300)
+
+
+class DashboardStream:
+    """
+    Server-sent events for one dashboard scope, as an async iterator (served under ASGI only).
+
+    The first event is the whole payload (``snapshot``), unless the browser
+    reconnects with the ``Last-Event-ID`` of the data it already shows. After
+    that a ``delta`` event carries only the payload keys that changed. The event
+    id is the scope's cache version and date, so a change, or midnight, is
+    noticed without touching the database. The stream ends after
+    DASHBOARD_STREAM_MAX_AGE seconds and the browser reconnects, which checks
+    the login again.
+    """
+
+    def __init__(self, sales_employee=None, last_event_id=""):
+        self.sales_employee = sales_employee
+        self.scope = scope_for(sales_employee)
+        self.event_id = last_event_id
+        self.sent = None
+        self.started = self.last_write = time.monotonic()
+
+    def current_id(self):
+        return f"{get_version(self.scope)}-{timezone.now().date().isoformat()}"
+
+    def payload(self):
+        try:
+            return dashboard_payload(get_cached_dashboard_metrics(self.sales_employee))
+        finally:
+            # Idle streams hold no database connection (inside a test's transaction it must stay)
+            if not connection.in_atomic_block:
+                connection.close()
+
+    def poll(self):
+        """The chunks to send now (possibly none), or None once the stream is over."""
+        now = time.monotonic()
+        if now - self.started >= stream_max_age():
+            return None
+        chunks = []
+        if self.started == self.last_write:
+            chunks.append(f"retry: {STREAM_RETRY_MS}\n\n")
+
+        current = self.current_id()
+        if current != self.event_id:
+            payload = self.payload()
+            if self.sent is None:
+                # Nothing to diff against: the data the browser holds is unknown here
+                chunks.append(self._event("snapshot", current, payload))
+            else:
+                delta = {
+                    key: value for key, value in payload.items() if self.sent.get(key) != value
+                }
+                # A change that moved no number only advances the id
+                chunks.append(
+                    self._event("delta", current, delta) if delta else f"id: {current}\n\n"
+                )
+            self.sent, self.event_id = payload, current
+        elif now - self.last_write >= STREAM_KEEPALIVE:
+            chunks.append(": keepalive\n\n")
+
+        if chunks:
+            self.last_write = now
+        return chunks
+
+    @staticmethod
+    def _event(name, event_id, data):
+        return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+    async def __aiter__(self):
+        while (chunks := await sync_to_async(self.poll)()) is not None:
+            for chunk in chunks:
+                yield chunk
+            await asyncio.sleep(stream_interval())
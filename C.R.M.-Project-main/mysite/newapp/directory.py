@@ -0,0 +1,132 @@
+"""
+Cached employee directory.
+
+The admin "view as" picker and similar dropdowns need every sales employee's
+id, name and role, on every page a staff user opens. ``get_directory()``
+keeps that list as compact tuples in the shared cache under a version that is
+bumped whenever a ``SalesEmployee`` or ``User`` row changes, and memoizes it
+in the process for as long as the version stands; a read costs one cache get
+of the version key and no queries.
+"""
+
+import threading
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from . import caching
+
+VERSION_SCOPE = "directory"
+CACHE_KEY = "employee_directory:v{version}"
+
+Employee = namedtuple(
+    "Employee", "id user_id username name role role_display employee_id is_active"
+)
+
+
+class Directory:
+    """Employees ordered by name, with lookups by employee and user id."""
+
+    def __init__(self, employees):
+        self.employees = employees
+        self._by_id = {employee.id: employee for employee in employees}
+        self._by_user_id = {employee.user_id: employee for employee in employees}
+
+    def __iter__(self):
+        return iter(self.employees)
+
+    def __len__(self):
+        return len(self.employees)
+
+    def get(self, employee_id):
+        return self._by_id.get(employee_id)
+
+    def for_user(self, user_id):
+        return self._by_user_id.get(user_id)
+
+    def active(self):
+        return [employee for employee in self.employees if employee.is_active]
+
+
+_lock = threading.Lock()
+_memo = {"version": None, "directory": None}
+
+
+def _build():
+    from .models import SalesEmployee
+
+    roles = dict(SalesEmployee.ROLE_CHOICES)
+    rows = SalesEmployee.objects.order_by(
+        "user__first_name", "user__last_name", "user__username"
+    ).values_list(
+        "id",
+        "user_id",
+        "user__username",
+        "user__first_name",
+        "user__last_name",
+        "role",
+        "employee_id",
+        "is_active",
+    )
+    return [
+        Employee(
+            pk,
+            user_id,
+            username,
+            f"{first} {last}".strip() or username,
+            role,
+            roles.get(role, role),
+            employee_id,
+            is_active,
+        )
+        for pk, user_id, username, first, last, role, employee_id, is_active in rows
+    ]
+
+
+def get_directory():
+    """The current directory, rebuilt only after an employee or user changed."""
+    version = caching.get_version(VERSION_SCOPE)
+    with _lock:
+        if _memo["version"] == version:
+            return _memo["directory"]
+
+    key = CACHE_KEY.format(version=version)
+    employees = cache.get(key)
+    if employees is None:
+        employees = _build()
+        cache.set(key, employees, caching.default_timeout())
+    directory = Directory(employees)
+    with _lock:
+        _memo["version"] = version
+        _memo["directory"] = directory
+    return directory
+
+
+def invalidate():
+    transaction.on_commit(lambda: caching.bump(VERSION_SCOPE))
+
+
+# ==========================
+# SIGNALS
+# ==========================
+
+
+def _on_change(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    # Every login saves last_login; names and roles are untouched
+    if kwargs.get("update_fields") == frozenset({"last_login"}):
+        return
+    invalidate()
+
+
+def connect_signals():
+    from .models import SalesEmployee
+
+    for model in (SalesEmployee, get_user_model()):
+        name = model.__name__
+        post_save.connect(_on_change, sender=model, dispatch_uid=f"directory_{name}_post_save")
+        post_delete.connect(_on_change, sender=model, dispatch_uid=f"directory_{name}_post_delete")
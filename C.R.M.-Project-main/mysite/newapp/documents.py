@@ -0,0 +1,497 @@
+"""
+PDF copies of quotations and sales orders.
+
+A document is rendered in three steps:
+
+1. ``document_data()`` reduces the header and lines to the strings printed on
+   the page. Only what the customer sees goes in: no status, internal notes or
+   timestamps, so the same document always gives the same data.
+2. ``content_hash()`` hashes that data (with the layout version and the
+   company letterhead). The PDF is stored as
+   ``documents/<kind>/<number>-<hash>.pdf``, so a file that exists is the
+   current copy and an unchanged document is never rendered twice; editing a
+   line or the header changes the hash, and the next request renders afresh.
+3. ``render_pdf()`` lays the data out with newapp.pdf.
+
+``get_pdf()`` does all three for one document. Views only serve a stored copy
+and otherwise queue the ``documents.render`` job (newapp.jobs); batches go
+through ``queue_batch()``, which splits the documents into
+``documents.render_batch`` jobs that the ``run_workers`` processes render in
+parallel. ``manage.py render_documents`` renders a whole table that way and
+``manage.py benchmark_documents`` measures documents per second.
+
+Superseded copies are left in storage; they are a few KB each.
+"""
+
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.urls import reverse
+
+from . import jobs
+from .models import Job, Quotation, QuotationItem, SalesOrder, SalesOrderItem
+from .pdf import A4, Canvas, wrap
+
+# Bump whenever render_pdf() changes, so every stored copy is rendered again
+LAYOUT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Kind:
+    model: object
+    item_model: object
+    title: str
+    number_field: str
+    date_field: str
+    url_name: str
+
+
+KINDS = {
+    "quotation": Kind(
+        Quotation, QuotationItem, "QUOTATION", "quote_number", "quote_date", "newapp:quotation_pdf"
+    ),
+    "salesorder": Kind(
+        SalesOrder,
+        SalesOrderItem,
+        "SALES ORDER",
+        "order_number",
+        "order_date",
+        "newapp:salesorder_pdf",
+    ),
+}
+
+
+def kind_of(document):
+    """KINDS key of a quotation or sales order, or of either model class."""
+    model = document if isinstance(document, type) else type(document)
+    return "quotation" if issubclass(model, Quotation) else "salesorder"
+
+
+def batch_size():
+    return getattr(settings, "DOCUMENT_RENDER_BATCH_SIZE", 50)
+
+
+def letterhead():
+    return {
+        "name": getattr(settings, "DOCUMENT_COMPANY_NAME", ""),
+        "address": getattr(settings, "DOCUMENT_COMPANY_ADDRESS", ""),
+    }
+
+
+# ==========================
+# DATA AND HASH
+# ==========================
+
+
+def _money(value):
+    return f"{value or 0:,.2f}"
+
+
+def _quantity(value):
+    value = Decimal(value or 0)
+    return f"{value:,.0f}" if value == value.to_integral_value() else f"{value:,.2f}"
+
+
+def _percent(value):
+    return f"{Decimal(value or 0).normalize():f}" if value else ""
+
+
+def document_data(document, items):
+    """
+    The printed content of ``document`` and its ``items``, as plain strings.
+
+    Args:
+        document (Quotation | SalesOrder): With ``prospect`` loaded
+        items (iterable): Its line items, in print order
+
+    Returns:
+        dict: JSON-serialisable; the input of content_hash() and render_pdf()
+    """
+    kind = KINDS[kind_of(document)]
+    prospect = document.prospect
+    date = getattr(document, kind.date_field)
+    lines = [
+        [
+            str(item.line_number),
+            item.item_code or "",
+            item.description or "",
+            _quantity(item.quantity),
+            item.uom or "",
+            _money(item.unit_price),
+            _percent(item.discount_percentage),
+            _percent(item.tax_percentage),
+            _money(item.line_total),
+        ]
+        for item in items
+    ]
+    totals = [("Subtotal", _money(document.subtotal))]
+    if document.discount_amount:
+        totals.append(
+            (
+                f"Discount ({_percent(document.discount_percentage)}%)",
+                f"-{_money(document.discount_amount)}",
+            )
+        )
+    if document.tax_amount:
+        totals.append(("Tax", _money(document.tax_amount)))
+    if document.freight_charges:
+        totals.append(("Freight", _money(document.freight_charges)))
+    totals.append((f"Total ({document.currency})", _money(document.net_amount)))
+
+    return {
+        "kind": kind_of(document),
+        "title": kind.title,
+        "number": getattr(document, kind.number_field),
+        "meta": [
+            ("Number", getattr(document, kind.number_field)),
+            ("Date", date.strftime("%d %b %Y") if date else ""),
+            ("Valid till", document.valid_till.strftime("%d %b %Y") if document.valid_till else ""),
+            ("Reference", document.reference_number or ""),
+            ("Currency", document.currency),
+        ],
+        "customer": [
+            line
+            for line in (
+                prospect.company_name or prospect.name,
+                prospect.name if prospect.company_name else "",
+                prospect.address,
+                ", ".join(
+                    part for part in (prospect.city, prospect.state, prospect.pincode) if part
+                ),
+                f"Attn: {document.contact_person}" if document.contact_person else "",
+                " | ".join(
+                    part for part in (document.contact_phone, document.contact_email) if part
+                ),
+            )
+            if line
+        ],
+        "lines": lines,
+        "totals": totals,
+        "terms": [
+            (label, text)
+            for label, text in (
+                ("Payment terms", document.payment_terms),
+                ("Delivery terms", document.delivery_terms),
+                ("Remarks", document.customer_remarks),
+            )
+            if text
+        ],
+    }
+
+
+def content_hash(data):
+    """SHA-256 of the printed content, the letterhead and the layout version."""
+    payload = json.dumps(
+        [LAYOUT_VERSION, letterhead(), data], sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def pdf_path(data):
+    """Storage name of the copy of ``data``; it exists once that exact content was rendered."""
+    number = "".join(char if char.isalnum() or char in "-_" else "-" for char in data["number"])
+    return f"documents/{data['kind']}/{number}-{content_hash(data)[:24]}.pdf"
+
+
+def file_name(data):
+    return f"{data['number']}.pdf"
+
+
+# ==========================
+# LAYOUT
+# ==========================
+
+MARGIN = 40
+FOOTER = 40
+BODY_SIZE = 8
+ROW = 11
+
+# (header, width, align); Description takes what is left of the page width
+COLUMNS = [
+    ("#", 20, "right"),
+    ("Code", 62, "left"),
+    ("Description", None, "left"),
+    ("Qty", 40, "right"),
+    ("UOM", 32, "left"),
+    ("Rate", 62, "right"),
+    ("Disc %", 34, "right"),
+    ("Tax %", 34, "right"),
+    ("Amount", 68, "right"),
+]
+WRAPPED = {"Code", "Description"}
+
+
+def _columns(page_width):
+    fixed = sum(width for _header, width, _align in COLUMNS if width)
+    x = MARGIN
+    columns = []
+    for header, width, align in COLUMNS:
+        width = width or page_width - 2 * MARGIN - fixed
+        columns.append((header, x, width, align))
+        x += width
+    return columns
+
+
+def _cell_x(x, width, align):
+    return x + width - 3 if align == "right" else x + 3
+
+
+def _table_header(canvas, columns, y):
+    canvas.box(MARGIN, y, canvas.width - 2 * MARGIN, ROW + 4, gray=0.88)
+    for header, x, width, align in columns:
+        canvas.text(
+            _cell_x(x, width, align), y + ROW, header, size=BODY_SIZE, bold=True, align=align
+        )
+    return y + ROW + 6
+
+
+def render_pdf(data):
+    """Lay ``data`` (from document_data()) out on A4 pages; returns the PDF bytes."""
+    canvas = Canvas(A4, title=f"{data['title'].title()} {data['number']}")
+    right = canvas.width - MARGIN
+    bottom = canvas.height - FOOTER
+    company = letterhead()
+
+    # Letterhead and title
+    y = MARGIN + 14
+    canvas.text(MARGIN, y, company["name"], size=16, bold=True)
+    canvas.text(right, y, data["title"], size=16, bold=True, align="right", gray=0.3)
+    for line in company["address"].splitlines():
+        y += 11
+        canvas.text(MARGIN, y, line, size=BODY_SIZE, gray=0.3)
+    y += 10
+    canvas.line(MARGIN, y, right, y, width=1)
+
+    # Customer on the left, document details on the right
+    top = y + 16
+    canvas.text(MARGIN, top, "Bill to", size=BODY_SIZE, bold=True, gray=0.4)
+    y = top
+    for line in data["customer"]:
+        for part in wrap(line, 280, 9):
+            y += 12
+            canvas.text(MARGIN, y, part, size=9)
+    meta_y = top
+    for label, value in data["meta"]:
+        if value:
+            meta_y += 12
+            canvas.text(right - 130, meta_y, label, size=9, gray=0.4)
+            canvas.text(right, meta_y, value, size=9, bold=label == "Number", align="right")
+    y = max(y, meta_y) + 22
+
+    # Lines, with the column headers repeated on every page
+    columns = _columns(canvas.width)
+    y = _table_header(canvas, columns, y)
+    for line in data["lines"]:
+        # Code and description wrap; the other cells are one line
+        cells = [
+            wrap(text, width - 6, BODY_SIZE) if header in WRAPPED else [text]
+            for text, (header, _x, width, _align) in zip(line, columns)
+        ]
+        height = max(len(cell) for cell in cells)
+        if y + ROW * height > bottom:
+            canvas.new_page()
+            y = _table_header(canvas, columns, MARGIN)
+        for cell, (_header, x, width, align) in zip(cells, columns):
+            for offset, text in enumerate(cell):
+                canvas.text(
+                    _cell_x(x, width, align),
+                    y + ROW * offset + 8,
+                    text,
+                    size=BODY_SIZE,
+                    align=align,
+                )
+        y += ROW * height + 3
+        canvas.line(MARGIN, y, right, y, width=0.3, gray=0.8)
+
+    # Totals
+    if y + 16 * len(data["totals"]) + 10 > bottom:
+        canvas.new_page()
+        y = MARGIN
+    y += 8
+    for index, (label, value) in enumerate(data["totals"]):
+        last = index == len(data["totals"]) - 1
+        y += 14
+        if last:
+            canvas.box(right - 200, y - 11, 200, 16, gray=0.88)
+        canvas.text(right - 194, y, label, size=9, bold=last)
+        canvas.text(right - 6, y, value, size=9, bold=last, align="right")
+
+    # Terms and remarks
+    y += 14
+    for label, text in data["terms"]:
+        lines = wrap(text, canvas.width - 2 * MARGIN, BODY_SIZE)
+        if y + 26 > bottom:
+            canvas.new_page()
+            y = MARGIN
+        y += 20
+        canvas.text(MARGIN, y, label, size=9, bold=True)
+        for line in lines:
+            if y + ROW > bottom:
+                canvas.new_page()
+                y = MARGIN
+            y += ROW
+            canvas.text(MARGIN, y, line, size=BODY_SIZE)
+
+    # Footers, now the page count is known
+    pages = len(canvas.pages)
+    for page in range(pages):
+        footer_y = canvas.height - FOOTER / 2
+        canvas.line(MARGIN, footer_y - 12, right, footer_y - 12, width=0.3, page=page)
+        canvas.text(
+            MARGIN,
+            footer_y,
+            f"{data['title'].title()} {data['number']}",
+            size=7,
+            gray=0.4,
+            page=page,
+        )
+        canvas.text(
+            right,
+            footer_y,
+            f"Page {page + 1} of {pages}",
+            size=7,
+            gray=0.4,
+            align="right",
+            page=page,
+        )
+    return canvas.output()
+
+
+# ==========================
+# STORAGE
+# ==========================
+
+
+def with_items(queryset):
+    """``queryset`` with everything document_data() reads loaded in two queries."""
+    item_model = KINDS[kind_of(queryset.model)].item_model
+    return queryset.select_related("prospect").prefetch_related(
+        Prefetch("items", queryset=item_model.objects.order_by("line_number", "pk"))
+    )
+
+
+def _items(document):
+    if "items" in getattr(document, "_prefetched_objects_cache", {}):
+        return document.items.all()
+    return document.items.order_by("line_number", "pk")
+
+
+def cached_pdf(document):
+    """``(data, storage name)`` of ``document``'s PDF; the name is None until it is rendered."""
+    data = document_data(document, _items(document))
+    path = pdf_path(data)
+    return data, path if default_storage.exists(path) else None
+
+
+def store(data, force=False):
+    """Render ``data`` unless stored already (or ``force``); returns ``(name, rendered?)``."""
+    path = pdf_path(data)
+    if default_storage.exists(path):
+        if not force:
+            return path, False
+        default_storage.delete(path)
+    saved = default_storage.save(path, ContentFile(render_pdf(data)))
+    if saved != path:
+        # Another worker stored the same content first; keep its copy
+        default_storage.delete(saved)
+    return path, True
+
+
+def get_pdf(document, force=False):
+    """``(storage name, rendered?)`` of ``document``'s current PDF, rendering it when needed."""
+    return store(document_data(document, _items(document)), force)
+
+
+# ==========================
+# JOBS
+# ==========================
+
+
+def queue_render(document, user=None):
+    """Queue the job rendering ``document``; returns the Job."""
+    return jobs.enqueue(
+        "documents.render",
+        user=user,
+        priority=Job.PRIORITY_HIGH,
+        kind=kind_of(document),
+        pk=document.pk,
+    )
+
+
+def queue_batch(queryset, user=None, size=None, force=False, limit=None):
+    """
+    Queue ``documents.render_batch`` jobs for every document in ``queryset``.
+
+    Args:
+        queryset (QuerySet): Quotations or sales orders
+        size (int): Documents per job; DOCUMENT_RENDER_BATCH_SIZE by default
+        force (bool): Render again even when the copy is stored
+        limit (int): Only the first ``limit`` documents by id
+
+    Returns:
+        list[Job]
+    """
+    size = size or batch_size()
+    pks = list(queryset.order_by("pk").values_list("pk", flat=True)[:limit])
+    kind = kind_of(queryset.model)
+    return [
+        jobs.enqueue(
+            "documents.render_batch",
+            user=user,
+            priority=Job.PRIORITY_LOW,
+            kind=kind,
+            pks=pks[start : start + size],
+            force=force,
+        )
+        for start in range(0, len(pks), size)
+    ]
+
+
+def render_batch(kind, pks, force=False, job=None):
+    """
+    Make sure every document in ``pks`` has its PDF stored.
+
+    Returns:
+        dict: Counts of ``rendered`` and ``cached`` documents and the ``seconds`` taken
+    """
+    started = time.perf_counter()
+    documents = with_items(KINDS[kind].model._default_manager.filter(pk__in=pks)).order_by("pk")
+    counts = {"rendered": 0, "cached": 0}
+    for done, document in enumerate(documents, start=1):
+        _path, rendered = get_pdf(document, force)
+        counts["rendered" if rendered else "cached"] += 1
+        if job is not None and done % 10 == 0:
+            job.set_progress(done, len(pks), f"{done} of {len(pks)} documents")
+    counts["seconds"] = round(time.perf_counter() - started, 3)
+    return counts
+
+
+@jobs.task("documents.render")
+def render_task(job, kind, pk):
+    spec = KINDS[kind]
+    try:
+        document = with_items(spec.model._default_manager.all()).get(pk=pk)
+    except spec.model.DoesNotExist:
+        raise jobs.PermanentError(f"{kind} {pk} was deleted")
+    _path, rendered = get_pdf(document)
+    number = getattr(document, spec.number_field)
+    return {
+        "message": f"PDF of {number} {'rendered' if rendered else 'was up to date'}",
+        "url": reverse(spec.url_name, args=[pk]),
+    }
+
+
+@jobs.task("documents.render_batch")
+def render_batch_task(job, kind, pks, force=False):
+    counts = render_batch(kind, pks, force, job)
+    return {
+        "message": f"{counts['rendered']} PDFs rendered, {counts['cached']} up to date",
+        **counts,
+    }
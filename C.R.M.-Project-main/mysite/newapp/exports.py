@@ -0,0 +1,603 @@
+"""
+Streaming CSV/XLSX exports of any queryset.
+
+An export takes a filtered queryset (a list view's ``get_queryset()``, the
+visit report's visits, an admin selection) and a list of columns, each a
+``values_list`` path such as ``prospect__name``. Rows are read with
+``values_list(...).iterator(chunk_size=EXPORT_CHUNK_SIZE)``, so no model
+instances are built and the result is never held in memory, and each row is
+encoded as it arrives:
+
+- ``export_response()`` streams the file to the browser as it is written.
+- Exports of more than ``EXPORT_SYNC_ROWS`` rows are written to a file by a
+  background job instead (``start_export()``, task ``exports.write`` in
+  newapp.jobs). An ``Export`` row tracks the progress, and its page
+  (``newapp:export_detail``) links the download.
+
+XLSX is produced by ``XlsxWriter`` below, a minimal streaming writer: one
+sheet, inline strings, the zip written on the fly. It needs no extra package
+and its memory use does not grow with the row count either.
+"""
+
+import csv
+import datetime
+import decimal
+import io
+import re
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files import File
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from . import jobs
+from .models import (
+    Export,
+    Job,
+    Lead,
+    LeadActivity,
+    ProspectCustomer,
+    Quotation,
+    SalesEmployee,
+    SalesOrder,
+    ServiceCall,
+    VisitLog,
+)
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# Bytes collected before a chunk is handed to the response or file
+FLUSH_BYTES = 64 * 1024
+
+
+def chunk_size():
+    return getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+
+
+def sync_rows():
+    return getattr(settings, "EXPORT_SYNC_ROWS", 20000)
+
+
+# ==========================
+# COLUMNS
+# ==========================
+
+# Export name -> (model, [(header, values_list path), ...])
+EXPORTS = {
+    "prospects": (
+        ProspectCustomer,
+        [
+            ("Customer ID", "customer_id"),
+            ("Name", "name"),
+            ("Company", "company_name"),
+            ("Type", "type"),
+            ("Status", "status"),
+            ("Industry", "industry"),
+            ("Phone", "phone"),
+            ("Email", "email"),
+            ("Address", "address"),
+            ("City", "city"),
+            ("State", "state"),
+            ("Pincode", "pincode"),
+            ("Assigned To", "assigned_to__employee_id"),
+            ("Created", "created_at"),
+        ],
+    ),
+    "visits": (
+        VisitLog,
+        [
+            ("Visit ID", "visit_id"),
+            ("Date", "visit_date"),
+            ("Time", "visit_time"),
+            ("Employee", "sales_employee__employee_id"),
+            ("Employee Name", "sales_employee__user__username"),
+            ("Region", "sales_employee__region"),
+            ("Customer ID", "prospect__customer_id"),
+            ("Customer", "prospect__name"),
+            ("City", "prospect__city"),
+            ("Agenda", "meeting_agenda"),
+            ("Outcome", "outcome_type"),
+            ("Meeting Outcome", "meeting_outcome"),
+            ("Status", "status"),
+            ("Approval", "approval_status"),
+            ("Next Follow-up", "next_follow_up_date"),
+        ],
+    ),
+    "leads": (
+        Lead,
+        [
+            ("Lead ID", "lead_id"),
+            ("Source", "lead_source"),
+            ("Customer ID", "prospect__customer_id"),
+            ("Customer", "prospect__name"),
+            ("Contact", "contact_person"),
+            ("Mobile", "mobile"),
+            ("Email", "email"),
+            ("Requirement", "requirement_description"),
+            ("Estimated Value", "estimated_value"),
+            ("Priority", "priority"),
+            ("Status", "status"),
+            ("Progress %", "progress_percentage"),
+            ("Assigned To", "assigned_to__employee_id"),
+            ("Expected Closure", "expected_closure_date"),
+            ("Next Action", "next_action_date"),
+            ("Created", "created_at"),
+        ],
+    ),
+    "activities": (
+        LeadActivity,
+        [
+            ("Activity ID", "activity_id"),
+            ("Lead ID", "lead__lead_id"),
+            ("Customer", "lead__prospect__name"),
+            ("Type", "activity_type"),
+            ("Date", "activity_date"),
+            ("Time", "activity_time"),
+            ("Summary", "discussion_summary"),
+            ("Outcome", "outcome"),
+            ("Status", "status"),
+            ("Next Follow-up", "next_followup_date"),
+            ("Created By", "created_by__username"),
+        ],
+    ),
+    "quotations": (
+        Quotation,
+        [
+            ("Quote Number", "quote_number"),
+            ("Date", "quote_date"),
+            ("Valid Till", "valid_till"),
+            ("Status", "status"),
+            ("Customer ID", "prospect__customer_id"),
+            ("Customer", "prospect__name"),
+            ("Contact", "contact_person"),
+            ("Assigned To", "assigned_to__employee_id"),
+            ("Currency", "currency"),
+            ("Subtotal", "subtotal"),
+            ("Discount", "discount_amount"),
+            ("Tax", "tax_amount"),
+            ("Freight", "freight_charges"),
+            ("Net Amount", "net_amount"),
+        ],
+    ),
+    "salesorders": (
+        SalesOrder,
+        [
+            ("Order Number", "order_number"),
+            ("Date", "order_date"),
+            ("Status", "status"),
+            ("Customer ID", "prospect__customer_id"),
+            ("Customer", "prospect__name"),
+            ("Contact", "contact_person"),
+            ("Quotation", "reference_quotation__quote_number"),
+            ("Assigned To", "assigned_to__employee_id"),
+            ("Currency", "currency"),
+            ("Subtotal", "subtotal"),
+            ("Discount", "discount_amount"),
+            ("Tax", "tax_amount"),
+            ("Freight", "freight_charges"),
+            ("Net Amount", "net_amount"),
+        ],
+    ),
+    "servicecalls": (
+        ServiceCall,
+        [
+            ("Service Number", "service_number"),
+            ("Requested", "service_request_date"),
+            ("Customer ID", "customer__customer_id"),
+            ("Customer", "customer__name"),
+            ("Contact", "contact_person"),
+            ("Phone", "contact_phone"),
+            ("Type", "service_type"),
+            ("Priority", "priority"),
+            ("Status", "status"),
+            ("Technician", "assigned_technician__employee_code"),
+            ("Problem", "problem_description"),
+            ("Billable", "billable"),
+            ("Actual Cost", "actual_cost"),
+        ],
+    ),
+    "employees": (
+        SalesEmployee,
+        [
+            ("Employee ID", "employee_id"),
+            ("Username", "user__username"),
+            ("First Name", "user__first_name"),
+            ("Last Name", "user__last_name"),
+            ("Email", "user__email"),
+            ("Mobile", "mobile"),
+            ("Role", "role"),
+            ("Department", "department__name"),
+            ("Designation", "designation__title"),
+            ("Territory", "territory__name"),
+            ("Region", "region"),
+            ("Reports To", "reporting_to__employee_id"),
+            ("Active", "is_active"),
+            ("Joined", "joined_date"),
+        ],
+    ),
+}
+
+
+def export_name(model):
+    """The EXPORTS entry for ``model``, or its model name when it has none."""
+    for name, (exported, _columns) in EXPORTS.items():
+        if exported is model:
+            return name
+    return model._meta.model_name
+
+
+def default_columns(model):
+    """Every concrete field, foreign keys as their id."""
+    return [(str(field.verbose_name).title(), field.name) for field in model._meta.concrete_fields]
+
+
+def columns_for(model, name=None):
+    exported, columns = EXPORTS.get(name or export_name(model), (None, None))
+    return columns if exported is model else default_columns(model)
+
+
+def _field(model, path):
+    field = None
+    for part in path.split("__"):
+        field = model._meta.get_field(part)
+        if field.is_relation:
+            model = field.related_model
+    return field
+
+
+def _converter(model, path):
+    """Function turning one ``values_list`` value of ``path`` into what the file shows."""
+    try:
+        field = _field(model, path)
+    except FieldDoesNotExist:
+        field = None
+    labels = dict(field.flatchoices) if field is not None and field.choices else None
+
+    def convert(value):
+        if value is None:
+            return ""
+        if labels is not None:
+            return str(labels.get(value, value))
+        if isinstance(value, datetime.datetime):
+            value = timezone.localtime(value) if timezone.is_aware(value) else value
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, bool):
+            return "Yes" if value else "No"
+        return value
+
+    return convert
+
+
+def iter_rows(queryset, columns):
+    """The queryset's rows as lists of display values, read ``EXPORT_CHUNK_SIZE`` rows at a time."""
+    paths = [path for _header, path in columns]
+    converters = [_converter(queryset.model, path) for path in paths]
+    for values in queryset.values_list(*paths).iterator(chunk_size=chunk_size()):
+        yield [convert(value) for convert, value in zip(converters, values)]
+
+
+# ==========================
+# WRITERS
+# ==========================
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable buffer the writers empty after every chunk."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return data
+
+
+def csv_chunks(header, rows):
+    """CSV bytes, UTF-8 with a BOM so Excel reads it as such."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("﻿")
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+# Characters XML 1.0 does not allow, even escaped
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f￾￿]")
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Types '
+        'xmlns="http://schemas.openxmlformats.org/package/2006/content-types"><Default '
+        'Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/><Override '
+        'PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships '
+        'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"><Relationship '
+        'Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+        'officeDocument"/>'
+        "</Relationships>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '<Relationship Id="rId2" Target="styles.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+        "</Relationships>"
+    ),
+    # Style 0 is the default, 1 the bold header row
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?><styleSheet '
+        'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><fonts '
+        'count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name '
+        'val="Calibri"/></font></fonts><fills count="1"><fill><patternFill '
+        'patternType="none"/></fill></fills><borders '
+        'count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" '
+        'borderId="0"/></cellStyleXfs><cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" '
+        'borderId="0" xfId="0"/><xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" '
+        'applyFont="1"/></cellXfs><cellStyles count="1"><cellStyle name="Normal" xfId="0" '
+        'builtinId="0"/></cellStyles>'
+        "</styleSheet>"
+    ),
+}
+
+
+class XlsxWriter:
+    """One-sheet XLSX written row by row; see the module docstring."""
+
+    def __init__(self, sheet_name="Export"):
+        self.sheet_name = escape(sheet_name[:31])
+        self.sink = _Sink()
+        self.zip = zipfile.ZipFile(self.sink, "w", compression=zipfile.ZIP_DEFLATED)
+        self.sheet = None
+
+    def _cell(self, value, style=""):
+        if isinstance(value, (int, float, decimal.Decimal)) and not isinstance(value, bool):
+            return f"<c{style}><v>{value}</v></c>"
+        text = escape(_INVALID_XML.sub("", str(value)))
+        return f'<c t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+
+    def _write(self, text):
+        self.sheet.write(text.encode("utf-8"))
+
+    def begin(self, header):
+        for name, content in _XLSX_PARTS.items():
+            self.zip.writestr(name, content)
+        self.zip.writestr(
+            "xl/workbook.xml",
+            (
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?><workbook '
+                'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                f'<sheets><sheet name="{self.sheet_name}" sheetId="1" '
+                'r:id="rId1"/></sheets></workbook>'
+            ),
+        )
+        self.sheet = self.zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._write(
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" '
+            'state="frozen"/></sheetView></sheetViews><sheetData>'
+        )
+        self._write("<row>" + "".join(self._cell(value, ' s="1"') for value in header) + "</row>")
+
+    def row(self, values):
+        self._write("<row>" + "".join(self._cell(value) for value in values) + "</row>")
+
+    def end(self):
+        self._write("</sheetData></worksheet>")
+        self.sheet.close()
+        self.zip.close()
+
+
+def xlsx_chunks(header, rows, sheet_name="Export"):
+    writer = XlsxWriter(sheet_name)
+    writer.begin(header)
+    for row in rows:
+        writer.row(row)
+        if writer.sink.size >= FLUSH_BYTES:
+            yield writer.sink.drain()
+    writer.end()
+    yield writer.sink.drain()
+
+
+def file_chunks(queryset, columns, file_format, sheet_name="Export"):
+    """The whole file for ``queryset`` as an iterator of byte chunks."""
+    header = [header for header, _path in columns]
+    rows = iter_rows(queryset, columns)
+    if file_format == "xlsx":
+        return xlsx_chunks(header, rows, sheet_name)
+    return csv_chunks(header, rows)
+
+
+def file_name(name, file_format):
+    return f"{name}-{timezone.localtime():%Y%m%d-%H%M%S}.{file_format}"
+
+
+# ==========================
+# RESPONSES & BACKGROUND EXPORTS
+# ==========================
+
+
+def export_response(queryset, file_format, name=None, columns=None):
+    """StreamingHttpResponse downloading ``queryset`` as CSV or XLSX."""
+    name = name or export_name(queryset.model)
+    columns = columns or columns_for(queryset.model, name)
+    response = StreamingHttpResponse(
+        file_chunks(queryset, columns, file_format, name), content_type=FORMATS[file_format]
+    )
+    response["Content-Disposition"] = f'attachment; filename="{file_name(name, file_format)}"'
+    return response
+
+
+def run_export(export_id, queryset, columns, job=None):
+    """Write ``queryset`` to Export ``export_id``'s file, updating its and ``job``'s progress."""
+    export = Export.objects.get(pk=export_id)
+    Export.objects.filter(pk=export_id).update(status="RUNNING", rows_written=0, error="")
+    written = 0
+
+    def counted(rows):
+        nonlocal written
+        for row in rows:
+            yield row
+            written += 1
+            if written % chunk_size() == 0:
+                Export.objects.filter(pk=export_id).update(rows_written=written)
+                if job is not None:
+                    job.set_progress(written, export.total_rows, f"{written} rows written")
+
+    header = [header for header, _path in columns]
+    rows = counted(iter_rows(queryset, columns))
+    chunks = (
+        xlsx_chunks(header, rows, export.name)
+        if export.format == "xlsx"
+        else csv_chunks(header, rows)
+    )
+    try:
+        with tempfile.TemporaryFile() as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+            handle.seek(0)
+            stored_name = f"{get_random_string(12)}-{file_name(export.name, export.format)}"
+            export.file.save(stored_name, File(handle), save=False)
+    except Exception as exc:
+        # PENDING while the job still has attempts left, so the export page keeps waiting
+        final = job is None or job.attempts >= job.max_attempts
+        Export.objects.filter(pk=export_id).update(
+            status="FAILED" if final else "PENDING",
+            error=str(exc)[:1000],
+            rows_written=written,
+            finished_at=timezone.now() if final else None,
+        )
+        raise
+    Export.objects.filter(pk=export_id).update(
+        status="DONE", file=export.file.name, rows_written=written, finished_at=timezone.now()
+    )
+    return written
+
+
+@jobs.task("exports.write", priority=Job.PRIORITY_HIGH)
+def export_task(job, export_id, queryset, columns):
+    try:
+        Export.objects.get(pk=export_id)
+    except Export.DoesNotExist:
+        raise jobs.PermanentError(f"Export {export_id} was deleted")
+    written = run_export(
+        export_id, jobs.load_queryset(queryset), [tuple(column) for column in columns], job
+    )
+    return {
+        "message": f"{written} rows exported",
+        "url": reverse("newapp:export_download", args=[export_id]),
+    }
+
+
+def start_export(queryset, file_format, user, name=None, columns=None, total_rows=0):
+    """Create an Export for ``queryset`` and queue the job writing it (newapp.jobs)."""
+    name = name or export_name(queryset.model)
+    columns = columns or columns_for(queryset.model, name)
+    export = Export.objects.create(
+        name=name, format=file_format, requested_by=user, total_rows=total_rows
+    )
+    jobs.enqueue(
+        "exports.write",
+        user=user,
+        export_id=export.pk,
+        queryset=jobs.dump_queryset(queryset),
+        columns=[list(column) for column in columns],
+    )
+    return export
+
+
+def export_or_start(request, queryset, file_format, name=None, columns=None):
+    """Stream small exports straight away; run large ones in the background and show their page."""
+    total = queryset.count()
+    if total <= sync_rows():
+        return export_response(queryset, file_format, name, columns)
+    export = start_export(queryset, file_format, request.user, name, columns, total_rows=total)
+    return redirect("newapp:export_detail", pk=export.pk)
+
+
+# ==========================
+# VIEW MIXIN
+# ==========================
+
+
+def export_urls(request, kwarg="export"):
+    """Format -> the current URL with ``kwarg`` set to that format, without the page cursor."""
+    query = request.GET.copy()
+    query.pop("cursor", None)
+    urls = {}
+    for file_format in FORMATS:
+        query[kwarg] = file_format
+        urls[file_format] = f"?{query.urlencode()}"
+    return urls
+
+
+class ExportMixin:
+    """
+    View mixin: ``?export=csv`` or ``?export=xlsx`` downloads the view's rows instead of the page.
+
+    The rows are ``get_export_queryset()``, by default ``get_queryset()`` with
+    every filter of the page applied. ``export_urls`` in the context holds
+    the current URL with ``export`` set, for the template's links.
+    """
+
+    export_name = None
+    export_kwarg = "export"
+
+    def get_export_queryset(self):
+        return self.get_queryset()
+
+    def get(self, request, *args, **kwargs):
+        file_format = request.GET.get(self.export_kwarg)
+        if file_format in FORMATS:
+            return export_or_start(
+                request, self.get_export_queryset(), file_format, self.export_name
+            )
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["export_urls"] = export_urls(self.request, self.export_kwarg)
+        return context
@@ -1,12 +1,14 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
-from django.forms import inlineformset_factory
+from django.core.exceptions import ValidationError
+from django.forms import BaseInlineFormSet, inlineformset_factory
 from .models import (ProspectCustomer, VisitLog, SalesEmployee, Lead, LeadActivity,
                      Quotation, QuotationItem, QuotationAttachment, QuotationActivity,
                      SalesOrder, SalesOrderItem, SalesOrderAttachment, SalesOrderActivity,
                      ServiceCall, ServiceCallItem, ServiceCallAttachment, ServiceActivity,
                      Technician, WarrantyRecord, ServiceContract)
+from .widgets import RemoteSelect, item_select, prospect_select
 
 
 class CustomSignUpForm(UserCreationForm):
@@ -318,6 +320,10 @@ class LeadForm(forms.ModelForm):
                 'rows': 3
             }),
         }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        select_related_references(self)
 
 
 class LeadActivityForm(forms.ModelForm):
@@ -408,6 +414,27 @@ class LeadActivityForm(forms.ModelForm):
                 'placeholder': 'contact@example.com'
             }),
         }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        select_related_references(self)
+
+
+# Labels of these choices read related rows; load them with the choices instead of one query per option
+REFERENCE_SELECT_RELATED = {
+    'assigned_to': ('user',),
+    'lead': ('prospect',),
+    'originating_visit': ('prospect', 'sales_employee__user'),
+    'reference_lead': ('prospect',),
+    'reference_visit': ('prospect', 'sales_employee__user'),
+    'reference_quotation': ('prospect',),
+}
+
+
+def select_related_references(form):
+    for name, related in REFERENCE_SELECT_RELATED.items():
+        if name in form.fields:
+            form.fields[name].queryset = form.fields[name].queryset.select_related(*related)
 
 
 class QuotationForm(forms.ModelForm):
@@ -426,10 +453,7 @@ class QuotationForm(forms.ModelForm):
             'discount_percentage', 'freight_charges'
         ]
         widgets = {
-            'prospect': forms.Select(attrs={
-                'class': 'form-input',
-                'required': True
-            }),
+            'prospect': prospect_select(required=True),
             'contact_person': forms.TextInput(attrs={
                 'class': 'form-input',
                 'placeholder': 'Contact person name'
@@ -502,6 +526,65 @@ class QuotationForm(forms.ModelForm):
             }),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        select_related_references(self)
+
+
+class ExistingLineField(forms.ModelChoiceField):
+    """Hidden id field of a line-item form, resolved from the rows the formset already loaded."""
+
+    def __init__(self, formset, *args, **kwargs):
+        self.formset = formset
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        obj = self.formset._existing_object(self.formset.model._meta.pk.to_python(value))
+        if obj is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return obj
+
+
+class BaseLineItemFormSet(BaseInlineFormSet):
+    """
+    Inline formset for document line items.
+
+    Django validates each form's hidden id with its own SELECT; here ids are
+    looked up in the formset's single queryset instead, so validating a
+    200-line document costs one query rather than 201. Rows shown by typeahead
+    widgets (RemoteSelect) are loaded with the lines, not one query per line.
+    """
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            related = [name for name, field in self.form.base_fields.items()
+                       if isinstance(field.widget, RemoteSelect)]
+            queryset = super().get_queryset()
+            self._queryset = queryset.select_related(*related) if related else queryset
+        return self._queryset
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        name = self.model._meta.pk.name
+        field = form.fields.get(name)
+        if isinstance(field, forms.ModelChoiceField):
+            form.fields[name] = ExistingLineField(
+                self, field.queryset, initial=field.initial, required=False, widget=field.widget
+            )
+        if form.instance.pk is None:
+            return
+        for field_name, field in form.fields.items():
+            if not isinstance(field.widget, RemoteSelect):
+                continue
+            if not form.instance._meta.get_field(field_name).is_cached(form.instance):
+                continue
+            obj = getattr(form.instance, field_name)
+            if obj is not None:
+                key = getattr(obj, field.to_field_name or 'pk')
+                field.widget.known_rows = {str(key): obj}
+
 
 class QuotationItemForm(forms.ModelForm):
     """Form for quotation line items"""
@@ -561,6 +644,7 @@ QuotationItemFormSet = inlineformset_factory(
     Quotation,
     QuotationItem,
     form=QuotationItemForm,
+    formset=BaseLineItemFormSet,
     extra=1,
     can_delete=True,
     min_num=1,
@@ -617,10 +701,7 @@ class SalesOrderForm(forms.ModelForm):
             'discount_percentage', 'freight_charges'
         ]
         widgets = {
-            'prospect': forms.Select(attrs={
-                'class': 'form-input',
-                'required': True
-            }),
+            'prospect': prospect_select(required=True),
             'contact_person': forms.TextInput(attrs={
                 'class': 'form-input',
                 'placeholder': 'Contact person name'
@@ -694,6 +775,10 @@ class SalesOrderForm(forms.ModelForm):
             }),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        select_related_references(self)
+
 
 class SalesOrderItemForm(forms.ModelForm):
     """Form for sales order line items"""
@@ -753,6 +838,7 @@ SalesOrderItemFormSet = inlineformset_factory(
     SalesOrder,
     SalesOrderItem,
     form=SalesOrderItemForm,
+    formset=BaseLineItemFormSet,
     extra=1,
     can_delete=True,
     min_num=1,
@@ -852,7 +938,7 @@ class ServiceCallForm(forms.ModelForm):
         widgets = {
             'service_type': forms.Select(attrs={'class': 'form-input'}),
             'priority': forms.Select(attrs={'class': 'form-input'}),
-            'customer': forms.Select(attrs={'class': 'form-input'}),
+            'customer': prospect_select(),
             'contact_person': forms.TextInput(attrs={'class': 'form-input'}),
             'contact_phone': forms.TextInput(attrs={'class': 'form-input'}),
             'contact_email': forms.EmailInput(attrs={'class': 'form-input'}),
@@ -916,7 +1002,7 @@ class ServiceCallItemForm(forms.ModelForm):
         ]
 
         widgets = {
-            'item_master': forms.Select(attrs={'class': 'form-input'}),
+            'item_master': item_select(),
             'item_code': forms.TextInput(attrs={'class': 'form-input'}),
             'product_serial_no': forms.TextInput(attrs={'class': 'form-input'}),
             'description': forms.Textarea(attrs={'class': 'form-input', 'rows': 2}),
@@ -987,6 +1073,6 @@ class ServiceCallActivityForm(forms.ModelForm):
 
 # Formsets for service call items - configured for single item only
 ServiceCallItemFormSet = inlineformset_factory(
-    ServiceCall, ServiceCallItem, form=ServiceCallItemForm,
+    ServiceCall, ServiceCallItem, form=ServiceCallItemForm, formset=BaseLineItemFormSet,
     extra=1, can_delete=False, min_num=0, validate_min=False
 )
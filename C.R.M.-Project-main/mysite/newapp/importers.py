@@ -0,0 +1,397 @@
+"""
+Bulk import of prospects/customers from CSV or XLSX.
+
+Rows are streamed in chunks. Each row is validated with the ProspectCustomerForm
+field rules, de-duplicated on phone (by its digits) and email against the file
+and the database, numbered from one pre-allocated block of CUST- IDs per chunk
+and inserted with bulk_create. Rejected rows are written to an error CSV with the
+reasons appended. Used by ``manage.py import_prospects`` and, through the
+``prospects.import`` background job (newapp.jobs), by the admin upload.
+"""
+
+import csv
+import io
+import os
+import time
+from dataclasses import dataclass, field
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.crypto import get_random_string
+
+from . import autocomplete, caching, jobs, rollups, search
+from .forms import ProspectCustomerForm
+from .models import ProspectCustomer, SalesEmployee
+from .sequences import allocate_numbers
+
+IMPORT_FIELDS = ProspectCustomerForm._meta.fields
+
+# Alternative spellings accepted in the header row
+HEADER_ALIASES = {
+    "customer_name": "name",
+    "contact_name": "name",
+    "company": "company_name",
+    "mobile": "phone",
+    "phone_number": "phone",
+    "email_address": "email",
+    "pin": "pincode",
+    "pin_code": "pincode",
+    "employee": "assigned_to",
+    "employee_id": "assigned_to",
+}
+
+
+class ProspectImportForm(ProspectCustomerForm):
+    """ProspectCustomerForm rules without the per-row database lookups.
+
+    ``assigned_to`` is resolved from a prefetched employee map and uniqueness is
+    checked per chunk, so validating a row costs no queries. One instance is
+    re-bound for every row because building a form deep-copies all its fields,
+    which otherwise dominates the import time.
+    """
+
+    class Meta(ProspectCustomerForm.Meta):
+        fields = [name for name in ProspectCustomerForm.Meta.fields if name != "assigned_to"]
+
+    def rebind(self, data):
+        self.data = data
+        self.is_bound = True
+        self.instance = ProspectCustomer()
+        self._errors = None
+        self._bound_fields_cache = {}
+        return self
+
+    def validate_unique(self):
+        pass
+
+
+@dataclass
+class ImportResult:
+    rows_read: int = 0
+    imported: int = 0
+    invalid: int = 0
+    duplicates: int = 0
+    elapsed: float = 0.0
+    error_file: str = None
+    errors: list = field(default_factory=list)
+
+    @property
+    def rejected(self):
+        return self.invalid + self.duplicates
+
+    @property
+    def rows_per_second(self):
+        return self.rows_read / self.elapsed if self.elapsed else 0.0
+
+
+def _normalize_header(value, aliases):
+    key = str(value or "").strip().lower().replace(" ", "_").replace("-", "_")
+    return aliases.get(key, key)
+
+
+def iter_rows(source, filename, aliases=HEADER_ALIASES):
+    """Yield one dict per data row from a CSV or XLSX file (path or binary file object).
+
+    Header cells are lower-cased, spaces/dashes become underscores and
+    ``aliases`` maps alternative spellings onto field names.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension in (".xlsx", ".xlsm"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("XLSX import needs the openpyxl package (pip install openpyxl)")
+        workbook = load_workbook(source, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [_normalize_header(cell, aliases) for cell in next(rows, [])]
+            for values in rows:
+                if not any(value not in (None, "") for value in values):
+                    continue
+                yield {
+                    key: ("" if value is None else str(value).strip())
+                    for key, value in zip(header, values)
+                    if key
+                }
+        finally:
+            workbook.close()
+
+    elif extension in (".csv", ".txt"):
+        stream = source
+        if isinstance(source, (str, os.PathLike)):
+            stream = open(source, "rb")
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        try:
+            reader = csv.reader(text)
+            header = [_normalize_header(cell, aliases) for cell in next(reader, [])]
+            for values in reader:
+                if not any(value.strip() for value in values):
+                    continue
+                yield {key: value.strip() for key, value in zip(header, values) if key}
+        finally:
+            text.detach()
+            if stream is not source:
+                stream.close()
+
+    else:
+        raise ValueError(f"Unsupported file type '{extension}'; use .csv or .xlsx")
+
+
+class ProspectImporter:
+    """
+    Stream rows into ProspectCustomer.
+
+    Args:
+        created_by (User): Recorded as ``created_by`` on every imported row
+        chunk_size (int): Rows validated, de-duplicated and inserted together
+        dry_run (bool): Validate and report without inserting anything
+    """
+
+    def __init__(self, created_by=None, chunk_size=1000, dry_run=False):
+        self.created_by = created_by
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.employees = self._employee_map()
+        self.form = ProspectImportForm()
+        self.seen = {"name": set(), "phone": set(), "email": set()}
+
+    def _employee_map(self):
+        """employee_id / username (lower-cased) -> SalesEmployee pk."""
+        mapping = {}
+        for pk, employee_id, username in SalesEmployee.objects.values_list(
+            "pk", "employee_id", "user__username"
+        ):
+            mapping[str(pk)] = pk
+            mapping[employee_id.lower()] = pk
+            mapping[username.lower()] = pk
+        return mapping
+
+    def run(self, source, filename, error_path=None, progress=None, storage=None):
+        """Import every row; ``progress(result)`` is called after each chunk.
+
+        Rejected rows go to ``error_path``, a local file or, with ``storage``, a name
+        in that storage (``result.error_file`` is the name it saved under).
+        """
+        result = ImportResult()
+        started = time.perf_counter()
+        rejected = []
+        chunk = []
+
+        for row in iter_rows(source, filename):
+            result.rows_read += 1
+            chunk.append((result.rows_read + 1, row))  # +1: header is line 1
+            if len(chunk) >= self.chunk_size:
+                rejected.extend(self._process_chunk(chunk, result))
+                chunk = []
+                result.elapsed = time.perf_counter() - started
+                if progress:
+                    progress(result)
+        if chunk:
+            rejected.extend(self._process_chunk(chunk, result))
+
+        result.elapsed = time.perf_counter() - started
+        if rejected and error_path:
+            result.error_file = self._write_errors(rejected, error_path, storage)
+        result.errors = rejected[:100]
+        return result
+
+    def _process_chunk(self, chunk, result):
+        rejected = []
+        candidates = []
+
+        # 1. Field validation with the form rules (no queries)
+        for line, row in chunk:
+            data = {name: row.get(name, "") for name in IMPORT_FIELDS}
+            data["type"] = (data["type"] or "PROSPECT").upper()
+            data["status"] = (data["status"] or "NEW").upper()
+            form = self.form.rebind(data)
+            errors = (
+                []
+                if form.is_valid()
+                else [f"{name}: {' '.join(messages)}" for name, messages in form.errors.items()]
+            )
+            assigned = (row.get("assigned_to") or "").strip().lower()
+            if assigned and assigned not in self.employees:
+                errors.append(f"assigned_to: unknown employee '{row.get('assigned_to')}'")
+            if errors:
+                result.invalid += 1
+                rejected.append((line, row, "; ".join(errors)))
+                continue
+            obj = form.save(commit=False)
+            obj.assigned_to_id = self.employees.get(assigned) if assigned else None
+            # bulk_create skips save(), which fills this in
+            obj.phone_digits = ProspectCustomer.normalize_phone(obj.phone)
+            obj.created_by = self.created_by
+            candidates.append((line, row, obj))
+
+        # 2. Duplicates within the file and against the database (one query). A row is a
+        #    duplicate when its phone or email is taken; a name alone only says that another
+        #    customer has the same name, which is invalid (names are unique) but not a duplicate.
+        existing = {"name": set(), "phone": set(), "email": set()}
+        if candidates:
+            lookup = Q(name__in={obj.name for _, _, obj in candidates})
+            phones = {obj.phone_digits for _, _, obj in candidates if obj.phone_digits}
+            if phones:
+                lookup |= Q(phone_digits__in=phones)
+            emails = {obj.email for _, _, obj in candidates if obj.email}
+            if emails:
+                lookup |= Q(email__in=emails)
+            rows = ProspectCustomer.objects.filter(lookup).values_list(
+                "name", "phone_digits", "email"
+            )
+            for name, phone, email in rows:
+                existing["name"].add(name.strip().lower())
+                existing["phone"].add(phone)
+                existing["email"].add((email or "").strip().lower())
+
+        new_objects = []
+        for line, row, obj in candidates:
+            row_keys = {
+                "name": obj.name.strip().lower(),
+                "phone": obj.phone_digits,
+                "email": (obj.email or "").strip().lower(),
+            }
+            clash = [
+                key
+                for key, value in row_keys.items()
+                if value and (value in existing[key] or value in self.seen[key])
+            ]
+            if clash == ["name"]:
+                result.invalid += 1
+                rejected.append((line, row, "name: another prospect already has this name"))
+                continue
+            if clash:
+                result.duplicates += 1
+                rejected.append((line, row, f"duplicate {', '.join(clash)}"))
+                continue
+            for key, value in row_keys.items():
+                if value:
+                    self.seen[key].add(value)
+            new_objects.append((line, row, obj))
+
+        # 3. Insert with one block of customer IDs
+        if new_objects and not self.dry_run:
+            rejected.extend(self._insert(new_objects, result))
+        elif self.dry_run:
+            result.imported += len(new_objects)
+        return rejected
+
+    def _insert(self, new_objects, result):
+        objs = [obj for _, _, obj in new_objects]
+        try:
+            with transaction.atomic():
+                for obj, customer_id in zip(objs, allocate_numbers("CUST", len(objs))):
+                    obj.customer_id = customer_id
+                ProspectCustomer.objects.bulk_create(objs, batch_size=500)
+                if any(obj.pk is None for obj in objs):
+                    # Backends that cannot return ids from a bulk insert
+                    ids = dict(
+                        ProspectCustomer.objects.filter(
+                            customer_id__in=[obj.customer_id for obj in objs]
+                        ).values_list("customer_id", "pk")
+                    )
+                    for obj in objs:
+                        obj.pk = ids[obj.customer_id]
+                rollups.apply_created("prospects", objs)
+                search.index_objects("prospects", objs)
+                autocomplete.changed("prospects")
+                caching.invalidate(*{obj.assigned_to_id for obj in objs})
+            result.imported += len(objs)
+            return []
+        except IntegrityError:
+            # A concurrent writer took one of the names; fall back to row-by-row
+            return self._insert_one_by_one(new_objects, result)
+
+    def _insert_one_by_one(self, new_objects, result):
+        rejected = []
+        for line, row, obj in new_objects:
+            obj.pk = None
+            obj.customer_id = None
+            try:
+                with transaction.atomic():
+                    obj.save()
+                result.imported += 1
+            except IntegrityError as exc:
+                result.duplicates += 1
+                rejected.append((line, row, f"duplicate: {exc}"))
+        return rejected
+
+    def _write_errors(self, rejected, error_path, storage=None):
+        columns = []
+        for _, row, _ in rejected:
+            columns.extend(key for key in row if key not in columns)
+        rejected.sort(key=lambda item: item[0])
+        handle = io.StringIO(newline="")
+        writer = csv.writer(handle)
+        writer.writerow(["line"] + columns + ["errors"])
+        for line, row, message in rejected:
+            writer.writerow([line] + [row.get(column, "") for column in columns] + [message])
+
+        if storage is not None:
+            return storage.save(error_path, ContentFile(handle.getvalue().encode("utf-8")))
+        directory = os.path.dirname(error_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(error_path, "w", newline="", encoding="utf-8") as output:
+            output.write(handle.getvalue())
+        return error_path
+
+
+# ==========================
+# BACKGROUND IMPORT
+# ==========================
+
+# Uploads wait here (in default_storage) until their job has imported them
+UPLOAD_DIR = "imports/uploads"
+# Rejected rows of background imports, linked from the finished job
+ERROR_DIR = "imports/errors"
+
+
+def queue_import(upload, user, dry_run=False):
+    """Store an uploaded file and queue the job importing it; returns the Job."""
+    path = default_storage.save(
+        f"{UPLOAD_DIR}/{get_random_string(12)}-{os.path.basename(upload.name)}", upload
+    )
+    return jobs.enqueue(
+        "prospects.import", user=user, path=path, filename=upload.name, dry_run=dry_run
+    )
+
+
+@jobs.task("prospects.import", max_attempts=1)
+def import_task(job, path, filename, dry_run=False):
+    error_path = f"{ERROR_DIR}/{os.path.splitext(os.path.basename(path))[0]}.errors.csv"
+    importer = ProspectImporter(created_by=job.created_by, dry_run=dry_run)
+    try:
+        size = default_storage.size(path) or 1
+        with default_storage.open(path, "rb") as handle:
+
+            def progress(result):
+                # Bytes read so far; close enough for CSV, coarse for XLSX
+                job.set_progress(
+                    handle.tell(), size, f"{result.rows_read} rows read, {result.imported} imported"
+                )
+
+            result = importer.run(
+                handle, filename, error_path=error_path, progress=progress, storage=default_storage
+            )
+    except ValueError as exc:
+        raise jobs.PermanentError(str(exc))
+    finally:
+        default_storage.delete(path)
+
+    message = (
+        f"{result.imported} prospect(s) {'validated' if dry_run else 'imported'} from "
+        f"{result.rows_read} rows in {result.elapsed:.1f}s; {result.rejected} rejected "
+        f"({result.invalid} invalid, {result.duplicates} duplicates)."
+    )
+    return {
+        "message": message,
+        "url": default_storage.url(result.error_file) if result.error_file else None,
+        "rows_read": result.rows_read,
+        "imported": result.imported,
+        "invalid": result.invalid,
+        "duplicates": result.duplicates,
+    }
@@ -0,0 +1,311 @@
+"""
+Background jobs in a database queue.
+
+Work that need not finish inside the request (large exports, bulk imports,
+quotation conversion, notification mails) is queued as a ``Job`` row and run
+by ``manage.py run_workers``, a pool of worker processes polling the table.
+There is no broker to run: the queue lives in the database the app already uses.
+
+- A task is a function registered with ``@task('name')`` in the module that
+  owns the work, loaded by ``NewappConfig.ready()``. It is called as
+  ``func(job, **kwargs)``. The kwargs are stored as JSON, so pass ids rather
+  than model instances; ``dump_queryset()`` turns a queryset into JSON by
+  pickling its ``query`` (as Django documents for exactly this), signed with
+  SECRET_KEY. ``job.set_progress()`` records how far it got, and the return
+  value (a JSON-serialisable dict, by convention with ``message`` and ``url``
+  keys for the job page) is stored as ``job.result``.
+- Workers take the runnable job with the highest priority, oldest first. A
+  job is claimed with a conditional ``UPDATE ... WHERE status = 'QUEUED'``,
+  which exactly one worker can win on every backend, SQLite included.
+- A task that raises is retried after ``JOBS_RETRY_BACKOFF`` seconds,
+  doubling per attempt, until ``max_attempts``. ``PermanentError`` fails the
+  job at once. Jobs left RUNNING by a worker that died are queued again after
+  ``JOBS_TIMEOUT``.
+- With ``JOBS_EAGER`` the job runs in the request process right after the
+  transaction commits, for development without a worker. SQLite lets one
+  process write at a time, so run a single worker (``--processes 1``) there.
+"""
+
+import base64
+import logging
+import os
+import pickle
+import random
+import socket
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core import signing
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between two attempts, whatever the backoff doubles to
+MAX_RETRY_DELAY = 3600
+
+# Runnable jobs read per claim; a worker that loses the race for one tries the next
+CLAIM_BATCH = 10
+
+# Seconds between a worker's checks for stale jobs and old finished ones
+MAINTENANCE_INTERVAL = 60
+
+
+class PermanentError(Exception):
+    """Raised by a task when retrying cannot help (bad input, missing row)."""
+
+
+def retry_backoff():
+    return getattr(settings, "JOBS_RETRY_BACKOFF", 30)
+
+
+def job_timeout():
+    return getattr(settings, "JOBS_TIMEOUT", 3600)
+
+
+def poll_interval():
+    return getattr(settings, "JOBS_POLL_INTERVAL", 1.0)
+
+
+# ==========================
+# TASKS
+# ==========================
+
+
+@dataclass(frozen=True)
+class Task:
+    name: str
+    func: object
+    max_attempts: int
+    priority: int
+
+
+TASKS = {}
+
+
+def task(name, max_attempts=3, priority=Job.PRIORITY_NORMAL):
+    """Register ``func(job, **kwargs)`` as the task ``name``."""
+
+    def register(func):
+        TASKS[name] = Task(name, func, max_attempts, priority)
+        return func
+
+    return register
+
+
+def enqueue(name, user=None, priority=None, delay=0, **kwargs):
+    """
+    Queue task ``name`` with ``kwargs``.
+
+    The row is inserted in the caller's transaction, so workers only see it
+    once the change that queued it is committed.
+
+    Args:
+        name (str): Registered task name
+        user (User): Who asked for it; they can follow the job on its page
+        priority (int): Job.PRIORITY_*; the task's default when omitted
+        delay (float): Seconds before the job may run
+
+    Returns:
+        Job
+    """
+    spec = TASKS[name]
+    job = Job.objects.create(
+        task=name,
+        kwargs=kwargs,
+        priority=spec.priority if priority is None else priority,
+        max_attempts=spec.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+    if getattr(settings, "JOBS_EAGER", False):
+        transaction.on_commit(lambda: run_job(job.pk, "eager"))
+    return job
+
+
+# Keeps signatures of pickled querysets apart from other uses of SECRET_KEY
+QUERYSET_SALT = "newapp.jobs.queryset"
+
+
+def dump_queryset(queryset):
+    """JSON-safe form of ``queryset`` for a job's kwargs."""
+    query = base64.b64encode(pickle.dumps(queryset.query)).decode("ascii")
+    return {
+        "model": queryset.model._meta.label_lower,
+        "query": signing.Signer(salt=QUERYSET_SALT).sign(query),
+    }
+
+
+def load_queryset(data):
+    """The queryset ``dump_queryset()`` stored; BadSignature if the row was altered."""
+    query = signing.Signer(salt=QUERYSET_SALT).unsign(data["query"])
+    queryset = apps.get_model(data["model"])._default_manager.all()
+    # Unpickles only what dump_queryset() pickled: the signature was checked above
+    queryset.query = pickle.loads(base64.b64decode(query))  # nosec B301
+    return queryset
+
+
+# ==========================
+# RUNNING
+# ==========================
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(worker):
+    """Mark the next runnable job RUNNING for ``worker`` and return it (None if there is none)."""
+    now = timezone.now()
+    candidates = (
+        Job.objects.filter(status="QUEUED", run_at__lte=now)
+        .order_by("-priority", "run_at", "pk")
+        .values_list("pk", flat=True)[:CLAIM_BATCH]
+    )
+    for pk in candidates:
+        if _take(pk, worker, now):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def _take(pk, worker, now):
+    return Job.objects.filter(pk=pk, status="QUEUED").update(
+        status="RUNNING",
+        worker=worker[:100],
+        started_at=now,
+        attempts=F("attempts") + 1,
+    )
+
+
+def run_job(pk, worker=None):
+    """Claim job ``pk`` if still queued and run it here; the eager mode and tests use this."""
+    if not _take(pk, worker or worker_name(), timezone.now()):
+        return None
+    job = Job.objects.get(pk=pk)
+    execute(job)
+    return job
+
+
+def execute(job):
+    """Run a claimed job and record its outcome: DONE, queued for a retry, or FAILED."""
+    spec = TASKS.get(job.task)
+    try:
+        if spec is None:
+            raise PermanentError(f"Unknown task '{job.task}'")
+        result = spec.func(job, **job.kwargs)
+    except Exception as exc:
+        _failed(job, exc)
+    else:
+        job.status, job.result = "DONE", result
+        Job.objects.filter(pk=job.pk).update(
+            status="DONE", progress=100, result=result, error="", finished_at=timezone.now()
+        )
+        logger.info("Job %s (%s) done", job.pk, job.task)
+
+
+def retry_delay(attempts):
+    """Seconds before attempt ``attempts + 1``: the backoff doubled per attempt, with 10% jitter."""
+    delay = min(retry_backoff() * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+    return delay * random.uniform(1.0, 1.1)
+
+
+def _failed(job, exc):
+    error = "".join(traceback.format_exception(exc))[-5000:]
+    if isinstance(exc, PermanentError) or job.attempts >= job.max_attempts:
+        job.status = "FAILED"
+        Job.objects.filter(pk=job.pk).update(
+            status="FAILED", error=error, finished_at=timezone.now()
+        )
+        logger.error(
+            "Job %s (%s) failed after %s attempt(s): %s", job.pk, job.task, job.attempts, exc
+        )
+    else:
+        delay = retry_delay(job.attempts)
+        job.status = "QUEUED"
+        Job.objects.filter(pk=job.pk).update(
+            status="QUEUED",
+            error=error,
+            worker="",
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )
+        logger.warning(
+            "Job %s (%s) attempt %s failed, retrying in %.0fs: %s",
+            job.pk,
+            job.task,
+            job.attempts,
+            delay,
+            exc,
+        )
+
+
+def requeue_stale():
+    """Requeue (or fail, when out of attempts) jobs RUNNING longer than JOBS_TIMEOUT."""
+    cutoff = timezone.now() - timedelta(seconds=job_timeout())
+    stale = Job.objects.filter(status="RUNNING", started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status="FAILED",
+        error="Worker stopped while running the job",
+        finished_at=timezone.now(),
+    )
+    queued = stale.update(status="QUEUED", worker="", run_at=timezone.now())
+    return queued + failed
+
+
+def purge_finished():
+    """Delete jobs finished more than JOBS_KEEP_DAYS ago."""
+    cutoff = timezone.now() - timedelta(days=getattr(settings, "JOBS_KEEP_DAYS", 30))
+    deleted, _ = Job.objects.filter(status__in=("DONE", "FAILED"), finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def work(worker=None, stop=None, burst=False, interval=None):
+    """
+    Run jobs until ``stop`` is set, or with ``burst`` until none is runnable.
+
+    Args:
+        worker (str): Recorded on the jobs it runs; host:pid by default
+        stop (Event): threading/multiprocessing Event ending the loop between jobs
+        burst (bool): Return once the queue has nothing runnable
+        interval (float): Seconds to wait when the queue is empty
+
+    Returns:
+        int: Jobs run
+    """
+    worker = worker or worker_name()
+    interval = poll_interval() if interval is None else interval
+    ran = 0
+    next_maintenance = 0
+    while stop is None or not stop.is_set():
+        close_old_connections()
+        now = timezone.now().timestamp()
+        if now >= next_maintenance:
+            requeue_stale()
+            purge_finished()
+            next_maintenance = now + MAINTENANCE_INTERVAL
+
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            if stop is not None:
+                stop.wait(interval)
+            else:
+                time.sleep(interval)
+            continue
+        logger.info("Job %s (%s) started by %s, attempt %s", job.pk, job.task, worker, job.attempts)
+        try:
+            execute(job)
+        except Exception:
+            # Recording the outcome failed (database gone, SQLite locked): the job
+            # stays RUNNING and requeue_stale() queues it again after JOBS_TIMEOUT
+            logger.exception("Job %s (%s): could not record the outcome", job.pk, job.task)
+        ran += 1
+    close_old_connections()
+    return ran
@@ -0,0 +1,312 @@
+import asyncio
+import io
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from newapp.management.commands import benchmark_views
+
+API_CASES = [case for case in benchmark_views.CASES if case[2] == "api"]
+
+
+def _delay(seconds):
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    return wrapper
+
+
+class Command(benchmark_views.Command):
+    help = (
+        "Compare the concurrent-request throughput of the WSGI (mysite.wsgi) and ASGI "
+        "(mysite.asgi) entry points on the JSON API views. Both handlers are driven in this "
+        "process, without an HTTP server, by a fixed number of clients sending requests back to "
+        "back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=300, help="Requests per run, spread over the views"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            default=[1, 8, 32],
+            help="Clients sending requests at the same time, one run each",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=4,
+            help="WSGI worker threads, as in gunicorn --threads (ASGI takes every client at once)",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Milliseconds added to every SQL query, standing in for a database across "
+            "the network (SQLite on this machine answers in microseconds)",
+        )
+        parser.add_argument(
+            "--case",
+            action="append",
+            choices=[case[0] for case in API_CASES],
+            help="Only these views (repeatable; default: every API view)",
+        )
+        parser.add_argument(
+            "--as",
+            dest="user",
+            choices=["admin", "employee"],
+            default="employee",
+            help="Whom the requests are signed in as",
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["threads"] < 1 or min(options["concurrency"]) < 1:
+            raise CommandError("--requests, --threads and --concurrency must be at least 1")
+        if settings.DEBUG:
+            self.stdout.write(
+                self.style.WARNING("DEBUG is on: timings include debug-only overhead")
+            )
+
+        users, employee = self._users()
+        if options["user"] not in users:
+            raise CommandError(f"No {options['user']} to sign in as; run seed_crm first")
+        samples = self._samples(employee)
+        self.host = next(
+            (
+                host
+                for host in settings.ALLOWED_HOSTS
+                if host not in ("*",) and not host.startswith(".")
+            ),
+            "localhost",
+        )
+        client = Client(HTTP_HOST=self.host)
+        client.force_login(users[options["user"]])
+        self.cookie = (
+            f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        )
+
+        self.targets = []
+        for case, url_name, kind, sample, query in API_CASES:
+            if (
+                options["case"]
+                and case not in options["case"]
+                or sample
+                and samples[sample] is None
+            ):
+                continue
+            self.targets.append(
+                (case, reverse(f"newapp:{url_name}"), urlencode(query(samples) if query else {}))
+            )
+        if not self.targets:
+            raise CommandError("No view to request; seed some data with `manage.py seed_crm`")
+
+        report = {
+            "created": timezone.now().isoformat(),
+            "environment": {
+                "database": connection.vendor,
+                "debug": settings.DEBUG,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "latency_ms": options["latency"],
+                "wsgi_threads": options["threads"],
+                "user": options["user"],
+                "views": [case for case, _, _ in self.targets],
+            },
+            "runs": [],
+        }
+        wsgi, asgi = get_wsgi_application(), get_asgi_application()
+
+        delay = _delay(options["latency"] / 1000) if options["latency"] else None
+        if delay:
+            # Every thread opens its own connection: hook each one as it is created
+            def add_latency(connection, **kwargs):
+                connection.execute_wrappers.append(delay)
+
+            connection_created.connect(
+                add_latency, weak=False, dispatch_uid="benchmark_asgi_latency"
+            )
+        try:
+            # Build the autocomplete indexes and fill the caches before timing anything
+            self._run_wsgi(wsgi, len(self.targets) * 2, 1, 1)
+            asyncio.run(self._run_asgi(asgi, len(self.targets) * 2, 1))
+
+            self.stdout.write(
+                f"{'mode':<6} {'clients':>7} {'requests':>8} {'seconds':>8} {'req/s':>8} "
+                f"{'p50 ms':>8} {'p95 ms':>8} {'errors':>6}"
+            )
+            for concurrency in options["concurrency"]:
+                for mode in ("wsgi", "asgi"):
+                    started = time.perf_counter()
+                    if mode == "wsgi":
+                        timings, errors = self._run_wsgi(
+                            wsgi, options["requests"], concurrency, options["threads"]
+                        )
+                    else:
+                        timings, errors = asyncio.run(
+                            self._run_asgi(asgi, options["requests"], concurrency)
+                        )
+                    self._record(
+                        report, mode, concurrency, timings, errors, time.perf_counter() - started
+                    )
+        finally:
+            if delay:
+                connection_created.disconnect(dispatch_uid="benchmark_asgi_latency")
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    # ------------------------------------------------------------------
+
+    def _run_wsgi(self, application, requests, concurrency, threads):
+        """``concurrency`` client threads, at most ``threads`` of them inside at once."""
+        workers = threading.BoundedSemaphore(threads)
+        counter = iter(range(requests))
+        lock = threading.Lock()
+        timings, errors = [], []
+
+        def client():
+            while True:
+                with lock:
+                    number = next(counter, None)
+                if number is None:
+                    return
+                case, path, query = self.targets[number % len(self.targets)]
+                started = time.perf_counter()
+                with workers:
+                    status = self._wsgi_get(application, path, query)
+                timings.append(time.perf_counter() - started)
+                if status != 200:
+                    errors.append((case, status))
+
+        clients = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        return timings, errors
+
+    def _wsgi_get(self, application, path, query):
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "SCRIPT_NAME": "",
+            "PATH_INFO": path,
+            "QUERY_STRING": query,
+            "SERVER_NAME": self.host,
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_HOST": self.host,
+            "HTTP_COOKIE": self.cookie,
+            "REMOTE_ADDR": "127.0.0.1",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(b""),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        status = []
+        response = application(
+            environ, lambda line, headers, exc_info=None: status.append(int(line[:3]))
+        )
+        try:
+            for _ in response:
+                pass
+        finally:
+            # Sends request_finished, which closes the thread's database connection
+            # like a server would
+            response.close()
+        return status[0]
+
+    async def _run_asgi(self, application, requests, concurrency):
+        """``concurrency`` client coroutines on one event loop, like one uvicorn worker."""
+        counter = iter(range(requests))
+        timings, errors = [], []
+
+        async def client():
+            for number in counter:
+                case, path, query = self.targets[number % len(self.targets)]
+                started = time.perf_counter()
+                status = await self._asgi_get(application, path, query)
+                timings.append(time.perf_counter() - started)
+                if status != 200:
+                    errors.append((case, status))
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return timings, errors
+
+    async def _asgi_get(self, application, path, query):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", self.host.encode()), (b"cookie", self.cookie.encode())],
+            "client": ("127.0.0.1", 0),
+            "server": (self.host, 80),
+        }
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # The client stays connected; Django cancels this wait once it has responded
+            await asyncio.Future()
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        await application(scope, receive, send)
+        return status[0]
+
+    def _record(self, report, mode, concurrency, timings, errors, seconds):
+        ordered = sorted(timings)
+        result = {
+            "mode": mode,
+            "clients": concurrency,
+            "requests": len(ordered),
+            "seconds": round(seconds, 3),
+            "requests_per_second": round(len(ordered) / seconds, 1) if seconds else 0,
+            "p50_ms": round(statistics.median(ordered) * 1000, 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+            "errors": len(errors),
+        }
+        report["runs"].append(result)
+        line = (
+            f"{mode:<6} {concurrency:>7} {result['requests']:>8} {seconds:>8.2f} "
+            f"{result['requests_per_second']:>8.0f} {result['p50_ms']:>8.1f} "
+            f"{result['p95_ms']:>8.1f} {len(errors):>6}"
+        )
+        self.stdout.write(self.style.ERROR(line) if errors else line)
+        if errors:
+            failed = sorted({f"{case} ({status})" for case, status in errors})
+            self.stdout.write(self.style.WARNING(f"  non-200 responses: {', '.join(failed)}"))
@@ -0,0 +1,220 @@
+import random
+import statistics
+import string
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from newapp.autocomplete import SOURCES, AutocompleteIndex
+
+TARGET_P99_MS = 5.0
+
+CATEGORIES = [
+    "PUMP",
+    "VALVE",
+    "MOTOR",
+    "CABLE",
+    "PIPE",
+    "FLANGE",
+    "BEARING",
+    "SEAL",
+    "FILTER",
+    "GEAR",
+    "SENSOR",
+    "SWITCH",
+    "PANEL",
+    "BOLT",
+    "GASKET",
+    "HOSE",
+]
+CITIES = [
+    "Mumbai",
+    "Pune",
+    "Delhi",
+    "Chennai",
+    "Kolkata",
+    "Bengaluru",
+    "Hyderabad",
+    "Ahmedabad",
+    "Surat",
+    "Jaipur",
+    "Lucknow",
+    "Nagpur",
+    "Indore",
+    "Bhopal",
+    "Vadodara",
+    "Nashik",
+]
+SUFFIXES = [
+    "Traders",
+    "Industries",
+    "Enterprises",
+    "Engineering",
+    "Pvt Ltd",
+    "Agencies",
+    "Systems",
+    "Solutions",
+    "Corporation",
+    "Works",
+]
+
+
+class Command(BaseCommand):
+    help = "Measure autocomplete lookup latency (p50/p95/p99) for the item and prospect indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", nargs="?", choices=sorted(SOURCES), default="items")
+        parser.add_argument("--rows", type=int, default=100000, help="Synthetic rows to index")
+        parser.add_argument("--queries", type=int, default=5000, help="Lookups to time")
+        parser.add_argument("--limit", type=int, default=20, help="Results per lookup")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--memory",
+            action="store_true",
+            help="Also measure the index size (tracing allocations makes the build slower)",
+        )
+        parser.add_argument(
+            "--from-db",
+            action="store_true",
+            help="Index the real table instead of synthetic rows, and time the old "
+            "icontains query on the same lookups",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        source = SOURCES[options["source"]]
+        index = AutocompleteIndex(source)
+
+        if options["memory"]:
+            tracemalloc.start()
+        started = time.perf_counter()
+        if options["from_db"]:
+            index.load(index._rows(source.get_model().objects.filter(**source.active)))
+        else:
+            index.load(self._synthetic_rows(options["source"], options["rows"], rng))
+        build = time.perf_counter() - started
+        self.stdout.write(f"Indexed:   {len(index)} {options['source']} in {build:.2f}s")
+        if options["memory"]:
+            self.stdout.write(
+                f"Memory:    {tracemalloc.get_traced_memory()[0] / 1024 / 1024:.0f} MB"
+            )
+            tracemalloc.stop()
+        if not len(index):
+            self.stdout.write(self.style.WARNING("Nothing to search"))
+            return
+
+        queries = self._queries(index, options["queries"], rng)
+        timings, hits = [], 0
+        for query in queries:
+            started = time.perf_counter()
+            results = index.search(query, limit=options["limit"])
+            timings.append((time.perf_counter() - started) * 1000)
+            hits += bool(results)
+        p99 = self._report("Index", timings)
+        self.stdout.write(f"           {hits}/{len(queries)} lookups returned results")
+
+        if options["from_db"]:
+            timings = []
+            for query in queries[:200]:
+                started = time.perf_counter()
+                list(self._legacy_query(options["source"], query, options["limit"]))
+                timings.append((time.perf_counter() - started) * 1000)
+            self._report("icontains", timings)
+
+        if p99 <= TARGET_P99_MS:
+            self.stdout.write(
+                self.style.SUCCESS(f"p99 {p99:.2f} ms is within the {TARGET_P99_MS:.0f} ms target")
+            )
+        else:
+            self.stdout.write(
+                self.style.WARNING(f"p99 {p99:.2f} ms is over the {TARGET_P99_MS:.0f} ms target")
+            )
+
+    # ------------------------------------------------------------------
+
+    def _report(self, label, timings):
+        """Print the latency percentiles; returns p99."""
+        ordered = sorted(timings)
+        self.stdout.write(
+            f"{label + ':':<10} p50 {self._percentile(ordered, 50):.3f} ms  p95 "
+            f"{self._percentile(ordered, 95):.3f} ms  p99 {self._percentile(ordered, 99):.3f} ms  "
+            f"max {ordered[-1]:.3f} ms  mean {statistics.mean(ordered):.3f} ms"
+        )
+        return self._percentile(ordered, 99)
+
+    @staticmethod
+    def _percentile(ordered, percent):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    @staticmethod
+    def _word(rng):
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+
+    def _synthetic_rows(self, source, count, rng):
+        vocabulary = [self._word(rng) for _ in range(3000)]
+        for pk in range(1, count + 1):
+            if source == "items":
+                category = rng.choice(CATEGORIES)
+                yield {
+                    "id": pk,
+                    "item_code": f"{category[:3]}-{pk:06d}",
+                    "short_name": f"{category.title()} {' '.join(rng.sample(vocabulary, 2))}",
+                    "description": " ".join(rng.sample(vocabulary, rng.randint(6, 14))),
+                    "standard_price": Decimal(rng.randint(10, 99999)),
+                    "unit_of_measurement": "PCS",
+                    "default_tax_percentage": Decimal("18.00"),
+                    "is_active": True,
+                }
+            else:
+                name = f"{rng.choice(vocabulary).title()} {rng.choice(SUFFIXES)} {pk}"
+                yield {
+                    "id": pk,
+                    "customer_id": f"CUST-{pk:05d}",
+                    "name": name,
+                    "company_name": f"{rng.choice(vocabulary).title()} {rng.choice(SUFFIXES)}",
+                    "email": f"{rng.choice(vocabulary)}{pk}@{rng.choice(vocabulary)}.com",
+                    "phone": f"9{rng.randint(100000000, 999999999)}",
+                    "address": f"{rng.randint(1, 500)} {rng.choice(CITIES)}",
+                    "assigned_to_id": rng.randint(1, 50),
+                    "created_by_id": rng.randint(1, 50),
+                }
+
+    def _queries(self, index, count, rng):
+        """What people type: code/name and word prefixes, two words, code fragments, misses."""
+        docs = list(index.docs.values())
+        queries = []
+        for _ in range(count):
+            doc = rng.choice(docs)
+            key = doc.keys[0]
+            words = doc.words.split()
+            kind = rng.random()
+            if kind < 0.35:
+                queries.append(key[: rng.randint(2, min(8, len(key)))])
+            elif kind < 0.6:
+                word = rng.choice(words)
+                queries.append(word[: rng.randint(2, len(word))] if len(word) > 2 else word)
+            elif kind < 0.75 and len(words) > 1:
+                first, second = rng.sample(words, 2)
+                queries.append(f"{first} {second[:3]}")
+            elif kind < 0.9 and len(key) > 5:
+                start = rng.randint(1, len(key) - 4)
+                queries.append(key[start : start + rng.randint(3, 4)])
+            else:
+                queries.append(self._word(rng))
+        return queries
+
+    def _legacy_query(self, source, query, limit):
+        model = SOURCES[source].get_model()
+        if source == "items":
+            return model.objects.filter(
+                Q(item_code__icontains=query)
+                | Q(description__icontains=query)
+                | Q(short_name__icontains=query),
+                is_active=True,
+            ).order_by("item_code")[:limit]
+        return model.objects.filter(
+            Q(name__icontains=query) | Q(company_name__icontains=query) | Q(email__icontains=query),
+        ).order_by("name")[:limit]
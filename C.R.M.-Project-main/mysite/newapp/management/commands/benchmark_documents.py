@@ -0,0 +1,95 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from newapp import documents
+from newapp.management.commands.render_documents import KIND_CHOICES, render_parallel
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure document PDF rendering (newapp.documents) in documents per second: layout alone, "
+        "cold batches in 1..N processes, and warm batches served from the stored copies"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--kind", choices=KIND_CHOICES, default="quotation", help="Document type"
+        )
+        parser.add_argument("--count", type=int, default=500, help="Documents rendered per run")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            nargs="+",
+            default=[1, 2, 4],
+            help="Process counts to compare for the cold batch",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Documents per batch (default: DOCUMENT_RENDER_BATCH_SIZE)",
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        kind = options["kind"]
+        model = documents.KINDS[kind].model
+        pks = list(
+            model._default_manager.order_by("pk").values_list("pk", flat=True)[: options["count"]]
+        )
+        if not pks:
+            raise CommandError(f"No {kind} to render; seed some with `manage.py seed_crm`")
+        report = {"kind": kind, "documents": len(pks), "runs": []}
+
+        # Data and layout in this process, nothing stored: the ceiling per process
+        loaded = list(documents.with_items(model._default_manager.filter(pk__in=pks[:200])))
+        started = time.perf_counter()
+        sizes = [
+            len(documents.render_pdf(documents.document_data(document, document.items.all())))
+            for document in loaded
+        ]
+        elapsed = time.perf_counter() - started
+        self._record(
+            report,
+            "layout only",
+            1,
+            len(loaded),
+            elapsed,
+            extra={"average_kb": round(sum(sizes) / len(sizes) / 1024, 1)},
+        )
+
+        for processes in options["processes"]:
+            totals = render_parallel(kind, pks, processes, options["batch_size"], force=True)
+            self._record(report, "cold (render + store)", processes, len(pks), totals["seconds"])
+
+        totals = render_parallel(kind, pks, 1, options["batch_size"])
+        if totals["rendered"]:
+            self.stdout.write(
+                self.style.WARNING(f"{totals['rendered']} document(s) changed during the run")
+            )
+        self._record(report, "warm (stored copy)", 1, len(pks), totals["seconds"])
+
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def _record(self, report, label, processes, count, seconds, extra=None):
+        rate = count / seconds if seconds else 0
+        report["runs"].append(
+            {
+                "run": label,
+                "processes": processes,
+                "documents": count,
+                "seconds": round(seconds, 3),
+                "documents_per_second": round(rate, 1),
+                **(extra or {}),
+            }
+        )
+        if len(report["runs"]) == 1:
+            self.stdout.write(
+                f"{'run':<24} {'processes':>9} {'documents':>9} {'seconds':>8} {'docs/s':>8}"
+            )
+        self.stdout.write(f"{label:<24} {processes:>9} {count:>9} {seconds:>8.2f} {rate:>8.0f}")
@@ -0,0 +1,107 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, connection
+
+from newapp import sequences
+from newapp.models import DocumentSequence, ProspectCustomer
+
+BENCH_KEY = "BENCH"
+BENCH_PREFIX = "BENCH-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer the document number allocator with parallel inserts and report "
+        "throughput/collisions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Parallel worker threads")
+        parser.add_argument("--per-worker", type=int, default=100, help="Inserts per worker")
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=None,
+            help="Numbers reserved per round trip (default: DOCUMENT_SEQUENCE_BLOCK_SIZE)",
+        )
+        parser.add_argument(
+            "--legacy",
+            action="store_true",
+            help='Use the old "latest row + 1" generator for comparison',
+        )
+        parser.add_argument("--keep", action="store_true", help="Keep benchmark rows afterwards")
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        per_worker = options["per_worker"]
+
+        sequences.SEQUENCES[BENCH_KEY] = sequences.Sequence(
+            BENCH_KEY,
+            BENCH_PREFIX + "{n:07d}",
+            "newapp.ProspectCustomer",
+            "customer_id",
+            block_size=options["block_size"],
+        )
+        allocate = self._legacy_number if options["legacy"] else self._sequence_number
+        run_id = uuid.uuid4().hex[:8]
+
+        def worker(index):
+            inserted, collisions = 0, 0
+            try:
+                for i in range(per_worker):
+                    try:
+                        ProspectCustomer.objects.create(
+                            customer_id=allocate(),
+                            name=f"Benchmark {run_id}-{index}-{i}",
+                            phone="0000000000",
+                            address="-",
+                            city="-",
+                            state="-",
+                            pincode="000000",
+                        )
+                        inserted += 1
+                    except IntegrityError:
+                        collisions += 1
+            finally:
+                connection.close()
+            return inserted, collisions
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(worker, range(workers)))
+        elapsed = time.perf_counter() - started
+
+        inserted = sum(r[0] for r in results)
+        collisions = sum(r[1] for r in results)
+        attempted = workers * per_worker
+
+        self.stdout.write(
+            f"Mode:        {'legacy latest-row' if options['legacy'] else 'block sequence'}"
+        )
+        self.stdout.write(f"Workers:     {workers} x {per_worker} inserts")
+        self.stdout.write(f"Elapsed:     {elapsed:.2f}s")
+        self.stdout.write(f"Throughput:  {inserted / elapsed if elapsed else 0:.1f} inserts/s")
+        style = self.style.SUCCESS if not collisions else self.style.ERROR
+        self.stdout.write(
+            style(f"Inserted:    {inserted}/{attempted} ({collisions} unique-key collisions)")
+        )
+
+        if not options["keep"]:
+            ProspectCustomer.objects.filter(customer_id__startswith=BENCH_PREFIX).delete()
+            DocumentSequence.objects.filter(key=BENCH_KEY).delete()
+            sequences.reset_cache()
+
+    def _sequence_number(self):
+        return sequences.next_number(BENCH_KEY)
+
+    def _legacy_number(self):
+        last = (
+            ProspectCustomer.objects.filter(customer_id__startswith=BENCH_PREFIX)
+            .order_by("-id")
+            .first()
+        )
+        last_num = int(last.customer_id.split("-")[-1]) if last else 0
+        return f"{BENCH_PREFIX}{last_num + 1:07d}"
@@ -0,0 +1,319 @@
+import json
+import platform
+import statistics
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from newapp import seeding
+from newapp.models import (
+    ItemMaster,
+    Lead,
+    LeadActivity,
+    ProspectCustomer,
+    Quotation,
+    SalesEmployee,
+    SalesOrder,
+    ServiceCall,
+    VisitLog,
+)
+from newapp.querybudget import track_query_shapes
+
+# (case, URL name, kind, sample the URL needs, query string built from the samples)
+CASES = [
+    ("prospect_list", "prospect_list", "list", None, None),
+    (
+        "prospect_list_search",
+        "prospect_list",
+        "list",
+        "prospect",
+        lambda s: {"search": s["prospect"].city},
+    ),
+    ("visit_management", "visit_management", "list", None, None),
+    ("visit_list", "visit_list", "list", None, None),
+    ("lead_list", "lead_list", "list", None, None),
+    (
+        "lead_list_search",
+        "lead_list",
+        "list",
+        "lead",
+        lambda s: {"search": s["lead"].contact_person.split()[-1]},
+    ),
+    ("activity_list", "activity_list", "list", None, None),
+    ("quotation_list", "quotation_list", "list", None, None),
+    (
+        "quotation_list_search",
+        "quotation_list",
+        "list",
+        "quotation",
+        lambda s: {"search": s["quotation"].contact_person.split()[0]},
+    ),
+    ("salesorder_list", "salesorder_list", "list", None, None),
+    ("servicecall_list", "servicecall_list", "list", None, None),
+    ("prospect_detail", "prospect_detail", "detail", "prospect", None),
+    ("visit_detail", "visit_detail", "detail", "visit", None),
+    ("lead_detail", "lead_detail", "detail", "lead", None),
+    ("activity_detail", "activity_detail", "detail", "activity", None),
+    ("quotation_detail", "quotation_detail", "detail", "quotation", None),
+    ("salesorder_detail", "salesorder_detail", "detail", "salesorder", None),
+    ("servicecall_detail", "servicecall_detail", "detail", "servicecall", None),
+    ("dashboard", "dashboard", "report", None, None),
+    ("visit_report", "visit_report", "report", None, None),
+    ("activity_dashboard", "activity_dashboard", "report", None, None),
+    ("dashboard_data_api", "dashboard_data_api", "api", None, None),
+    (
+        "search_items",
+        "search_items",
+        "api",
+        "item",
+        lambda s: {"q": s["item"].category.lower()[:4]},
+    ),
+    (
+        "search_prospects",
+        "search_prospects",
+        "api",
+        "prospect",
+        lambda s: {"q": s["prospect"].company_name[:5]},
+    ),
+    ("get_item_data", "get_item_data", "api", "item", lambda s: {"item_code": s["item"].item_code}),
+    (
+        "get_prospect_data",
+        "get_prospect_data",
+        "api",
+        "prospect",
+        lambda s: {"id": s["prospect"].pk},
+    ),
+    (
+        "get_quotation_data",
+        "get_quotation_data",
+        "api",
+        "quotation",
+        lambda s: {"quote_number": s["quotation"].quote_number},
+    ),
+]
+
+# Sample name -> (model, lookup from the model to its sales employee)
+SAMPLES = {
+    "prospect": (ProspectCustomer, "assigned_to"),
+    "visit": (VisitLog, "sales_employee"),
+    "lead": (Lead, "assigned_to"),
+    "activity": (LeadActivity, "lead__assigned_to"),
+    "quotation": (Quotation, "assigned_to"),
+    "salesorder": (SalesOrder, "assigned_to"),
+    "servicecall": (ServiceCall, "related_order__assigned_to"),
+    "item": (ItemMaster, None),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every list, detail, report and API view as an admin and as a sales employee, "
+        "optionally at several seeded scales, and write a JSON report"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scales",
+            type=int,
+            nargs="*",
+            default=[],
+            help="Seed up to each scale (seed_crm --scale) before timing it; "
+            "without this the current data is timed as is",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed passed to seed_crm")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Seeding batch size")
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Timed requests per view and user"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=1, help="Untimed requests per view and user first"
+        )
+        parser.add_argument(
+            "--kind",
+            action="append",
+            choices=["list", "detail", "report", "api"],
+            help="Only time these kinds of view (repeatable)",
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file")
+        parser.add_argument("--compare", help="Earlier JSON report to compare p50 latencies with")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=1.25,
+            help="Flag a view as slower when its p50 grew by more than this factor",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+        if settings.DEBUG:
+            self.stdout.write(
+                self.style.WARNING("DEBUG is on: timings include debug-only overhead")
+            )
+
+        report = {
+            "created": timezone.now().isoformat(),
+            "environment": {
+                "database": connection.vendor,
+                "debug": settings.DEBUG,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "repeat": options["repeat"],
+            },
+            "runs": [],
+        }
+        cases = [case for case in CASES if not options["kind"] or case[2] in options["kind"]]
+
+        for scale in options["scales"] or [None]:
+            run = {"scale": scale}
+            if scale is not None:
+                self.stdout.write(f"Seeding up to ~{scale} rows...")
+                started = time.perf_counter()
+                seeding.seed(scale, seed=options["seed"], batch_size=options["batch_size"])
+                run["seed_seconds"] = round(time.perf_counter() - started, 2)
+            run["rows"] = seeding.row_counts()
+            run["results"] = self._run(cases, options)
+            report["runs"].append(run)
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        if options["compare"]:
+            self._compare(report, options["compare"], options["threshold"])
+
+    # ------------------------------------------------------------------
+
+    def _users(self):
+        admin = (
+            User.objects.filter(username=seeding.ADMIN_USERNAME).first()
+            or User.objects.filter(is_superuser=True).order_by("pk").first()
+        )
+        employee = seeding.busiest_employee()
+        if employee is None:
+            employee = SalesEmployee.objects.select_related("user").order_by("pk").first()
+        users = {}
+        if admin is not None:
+            users["admin"] = admin
+        if employee is not None:
+            users["employee"] = employee.user
+        if not users:
+            raise CommandError("No superuser or sales employee to sign in as; run seed_crm first")
+        return users, employee
+
+    def _samples(self, employee):
+        """One row of each kind from the middle of its table, owned by ``employee`` if possible."""
+        samples = {}
+        for name, (model, lookup) in SAMPLES.items():
+            queryset = model._default_manager.order_by("pk")
+            if lookup and employee is not None and queryset.filter(**{lookup: employee}).exists():
+                queryset = queryset.filter(**{lookup: employee})
+            count = queryset.count()
+            samples[name] = queryset[count // 2] if count else None
+        return samples
+
+    def _run(self, cases, options):
+        users, employee = self._users()
+        samples = self._samples(employee)
+        host = next(
+            (
+                host
+                for host in settings.ALLOWED_HOSTS
+                if host not in ("*",) and not host.startswith(".")
+            ),
+            "localhost",
+        )
+        results = {}
+        for label, user in users.items():
+            client = Client(HTTP_HOST=host)
+            client.force_login(user)
+            results[label] = {}
+            self.stdout.write(f"\n{label} ({user.username})")
+            self.stdout.write(
+                f"  {'view':<24} {'kind':<7} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} "
+                f"{'mean ms':>9} {'queries':>8}"
+            )
+            for case, url_name, kind, sample, query in cases:
+                if sample and samples[sample] is None:
+                    continue
+                kwargs = {"pk": samples[sample].pk} if kind == "detail" else {}
+                url = reverse(f"newapp:{url_name}", kwargs=kwargs)
+                data = query(samples) if query else {}
+                result = self._time(client, url, data, options["warmup"], options["repeat"])
+                result["kind"] = kind
+                results[label][case] = result
+                self.stdout.write(
+                    f"  {case:<24} {kind:<7} {result['status']:>6} {result['p50_ms']:>9.1f} "
+                    f"{result['p95_ms']:>9.1f} {result['mean_ms']:>9.1f} {result['queries']:>8}"
+                )
+        return results
+
+    @staticmethod
+    def _time(client, url, data, warmup, repeat):
+        for _ in range(warmup):
+            client.get(url, data)
+        timings, queries = [], []
+        for _ in range(repeat):
+            with track_query_shapes() as tracker:
+                started = time.perf_counter()
+                response = client.get(url, data)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(tracker.total)
+        ordered = sorted(timings)
+        return {
+            "url": url,
+            "params": {key: str(value) for key, value in data.items()},
+            "status": response.status_code,
+            "bytes": len(response.content) if not response.streaming else None,
+            "p50_ms": round(statistics.median(ordered), 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+            "mean_ms": round(statistics.mean(ordered), 2),
+            "min_ms": round(ordered[0], 2),
+            "max_ms": round(ordered[-1], 2),
+            "queries": max(queries),
+        }
+
+    def _compare(self, report, path, threshold):
+        with open(path, encoding="utf-8") as handle:
+            previous = json.load(handle)
+        old_runs = {run["scale"]: run for run in previous.get("runs", [])}
+        slower = compared = 0
+        for run in report["runs"]:
+            old = old_runs.get(run["scale"])
+            if old is None:
+                continue
+            compared += 1
+            self.stdout.write(f"\nCompared with {path} at scale {run['scale']}")
+            for label, cases in run["results"].items():
+                for case, result in cases.items():
+                    before = old["results"].get(label, {}).get(case)
+                    if not before or not before["p50_ms"]:
+                        continue
+                    ratio = result["p50_ms"] / before["p50_ms"]
+                    line = (
+                        f"  {label:<9} {case:<24} {before['p50_ms']:>9.1f} -> "
+                        f"{result['p50_ms']:>9.1f} ms x{ratio:.2f}  queries {before['queries']} -> "
+                        f"{result['queries']}"
+                    )
+                    if ratio > threshold or result["queries"] > before["queries"]:
+                        slower += 1
+                        self.stdout.write(self.style.ERROR(line))
+                    else:
+                        self.stdout.write(line)
+        if not compared:
+            self.stdout.write(
+                self.style.WARNING(f"{path} has no run at the same scale to compare with")
+            )
+        elif slower:
+            self.stdout.write(
+                self.style.WARNING(f"{slower} view(s) slower or running more queries")
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS("No view slower than the threshold"))
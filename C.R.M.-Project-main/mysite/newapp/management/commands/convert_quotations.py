@@ -0,0 +1,85 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from newapp.conversion import convert_quotations
+from newapp.models import Quotation
+
+
+class Command(BaseCommand):
+    help = "Convert approved quotations into sales orders in bulk (e.g. a month-end run)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--status",
+            nargs="+",
+            default=["APPROVED"],
+            help="Quotation statuses to convert (default: APPROVED)",
+        )
+        parser.add_argument("--month", help="Only quotations dated in this month (YYYY-MM)")
+        parser.add_argument("--limit", type=int, help="Convert at most this many quotations")
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Quotations per transaction"
+        )
+        parser.add_argument("--user", help="Username recorded as created_by")
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only count what would be converted"
+        )
+
+    def handle(self, *args, **options):
+        quotations = Quotation.objects.filter(
+            status__in=options["status"], converted_to_order=False
+        )
+
+        if options["month"]:
+            try:
+                first = datetime.datetime.strptime(options["month"], "%Y-%m").date()
+            except ValueError:
+                raise CommandError("--month must look like 2025-03")
+            next_month = (first + datetime.timedelta(days=32)).replace(day=1)
+            quotations = quotations.filter(quote_date__gte=first, quote_date__lt=next_month)
+
+        if options["limit"]:
+            quotations = quotations.filter(
+                pk__in=list(
+                    quotations.order_by("pk").values_list("pk", flat=True)[: options["limit"]]
+                )
+            )
+
+        created_by = None
+        if options["user"]:
+            try:
+                created_by = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        if options["dry_run"]:
+            self.stdout.write(f"{quotations.count()} quotation(s) would be converted")
+            return
+
+        def progress(result):
+            self.stdout.write(
+                f"  {result.converted} converted, {result.lines} lines "
+                f"({result.quotations_per_second:.0f} quotations/s)"
+            )
+
+        result = convert_quotations(
+            quotations, created_by=created_by, batch_size=options["batch_size"], progress=progress
+        )
+
+        self.stdout.write(f"Converted:    {result.converted} quotation(s) -> sales orders")
+        self.stdout.write(f"Lines copied: {result.lines}")
+        self.stdout.write(f"Skipped:      {result.skipped}")
+        for message in result.errors[:20]:
+            self.stdout.write(self.style.WARNING(f"  {message}"))
+        if result.order_numbers:
+            self.stdout.write(
+                f"Orders:       {result.order_numbers[0]} .. {result.order_numbers[-1]}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done in {result.elapsed:.2f}s ({result.quotations_per_second:.0f} quotations/s, "
+                f"{result.lines_per_second:.0f} lines/s)"
+            )
+        )
@@ -0,0 +1,63 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from newapp.importers import ProspectImporter
+
+
+class Command(BaseCommand):
+    help = "Bulk import prospects/customers from a CSV or XLSX file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="Path to a .csv or .xlsx file with a header row")
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000, help="Rows per validation/insert chunk"
+        )
+        parser.add_argument(
+            "--errors", help="Where to write rejected rows (default: <file>.errors.csv)"
+        )
+        parser.add_argument("--user", help="Username recorded as created_by")
+        parser.add_argument("--dry-run", action="store_true", help="Validate only, insert nothing")
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+
+        created_by = None
+        if options["user"]:
+            try:
+                created_by = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        error_path = options["errors"] or f"{os.path.splitext(path)[0]}.errors.csv"
+        importer = ProspectImporter(
+            created_by=created_by, chunk_size=options["chunk_size"], dry_run=options["dry_run"]
+        )
+
+        def progress(result):
+            self.stdout.write(
+                f"  {result.rows_read} rows read, {result.imported} imported "
+                f"({result.rows_per_second:.0f} rows/s)"
+            )
+
+        try:
+            result = importer.run(path, path, error_path=error_path, progress=progress)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(f"Rows read:    {result.rows_read}")
+        self.stdout.write(
+            f"Imported:     {result.imported}{' (dry run)' if options['dry_run'] else ''}"
+        )
+        self.stdout.write(f"Invalid:      {result.invalid}")
+        self.stdout.write(f"Duplicates:   {result.duplicates}")
+        self.stdout.write(
+            f"Elapsed:      {result.elapsed:.2f}s ({result.rows_per_second:.0f} rows/s)"
+        )
+        if result.error_file:
+            self.stdout.write(self.style.WARNING(f"Rejected rows written to {result.error_file}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("No rows rejected"))
@@ -0,0 +1,70 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+# Stores keeping rows in the django_session table
+DATABASE_STORES = (
+    "django.contrib.sessions.backends.db",
+    "django.contrib.sessions.backends.cached_db",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions in batches, so a large django_session table is cleaned without "
+        "one long locking DELETE (run it from cron, e.g. hourly)"
+    )
+
+    def add_arguments(self, parser):
+        # Keys are sent as parameters, and SQL Server takes at most 2100 per statement
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows deleted per statement (max 2000)"
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between batches, to leave room for live traffic",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only count the expired sessions"
+        )
+
+    def handle(self, *args, **options):
+        if not 1 <= options["batch_size"] <= 2000:
+            raise CommandError("--batch-size must be between 1 and 2000")
+
+        if settings.SESSION_ENGINE not in DATABASE_STORES:
+            # Cache entries and signed cookies expire by themselves; other stores
+            # clean up their own way
+            store = import_module(settings.SESSION_ENGINE).SessionStore
+            if not options["dry_run"]:
+                store.clear_expired()
+            self.stdout.write(
+                f"{settings.SESSION_ENGINE} keeps no session rows; nothing to purge here"
+            )
+            return
+
+        expired = Session.objects.filter(expire_date__lt=timezone.now())
+        if options["dry_run"]:
+            self.stdout.write(f"{expired.count()} expired session(s) would be deleted")
+            return
+
+        deleted = 0
+        started = time.perf_counter()
+        while True:
+            keys = list(expired.values_list("session_key", flat=True)[: options["batch_size"]])
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if options["pause"]:
+                time.sleep(options["pause"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {deleted} expired session(s) in {time.perf_counter() - started:.1f}s"
+            )
+        )
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from newapp import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily reporting rollups from the visit, prospect and sales order tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "facts",
+            nargs="*",
+            help=f"Facts to rebuild ({', '.join(rollups.FACTS)}); all when omitted",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per bulk insert")
+
+    def handle(self, *args, **options):
+        unknown = set(options["facts"]) - set(rollups.FACTS)
+        if unknown:
+            raise CommandError(f"Unknown facts: {', '.join(sorted(unknown))}")
+
+        started = time.perf_counter()
+        written = rollups.rebuild(options["facts"] or None, batch_size=options["batch_size"])
+        for metric, count in written.items():
+            self.stdout.write(f"{metric:<18} {count} rows")
+        self.stdout.write(
+            self.style.SUCCESS(f"Rollups rebuilt in {time.perf_counter() - started:.2f}s")
+        )
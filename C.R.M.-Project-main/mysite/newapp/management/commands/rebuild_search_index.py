@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from newapp import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for prospects, leads, quotations and service calls"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "kinds",
+            nargs="*",
+            help=f"What to reindex ({', '.join(search.SPECS)}); all when omitted",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per bulk insert")
+
+    def handle(self, *args, **options):
+        unknown = set(options["kinds"]) - set(search.SPECS)
+        if unknown:
+            raise CommandError(f"Unknown kinds: {', '.join(sorted(unknown))}")
+
+        started = time.perf_counter()
+        written = search.rebuild(options["kinds"] or None, batch_size=options["batch_size"])
+        for kind, count in written.items():
+            self.stdout.write(f"{kind:<14} {count} rows")
+        self.stdout.write(f"Backend:       {search.get_backend().name}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Search index rebuilt in {time.perf_counter() - started:.2f}s")
+        )
@@ -0,0 +1,143 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+KIND_CHOICES = ("quotation", "salesorder")
+
+
+def _setup():
+    # Spawned children (Windows, macOS) start without Django set up, and must
+    # not import newapp.documents before it is: hence the imports in here
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _render_chunk(args):
+    from newapp import documents
+
+    kind, pks, force = args
+    return documents.render_batch(kind, pks, force)
+
+
+def render_parallel(kind, pks, processes=1, size=None, force=False, progress=None):
+    """
+    Store the PDF of every document in ``pks``, ``size`` documents at a time spread
+    over ``processes``.
+
+    Returns:
+        dict: Counts of ``rendered`` and ``cached`` documents and the wall-clock ``seconds``
+    """
+    from newapp import documents
+
+    size = size or documents.batch_size()
+    chunks = [(kind, pks[start : start + size], force) for start in range(0, len(pks), size)]
+    totals = {"rendered": 0, "cached": 0}
+    started = time.perf_counter()
+    pool = None
+    if processes > 1:
+        # Children must not share the parent's database connections
+        connections.close_all()
+        pool = multiprocessing.get_context().Pool(processes, initializer=_setup)
+        results = pool.imap_unordered(_render_chunk, chunks)
+    else:
+        results = map(_render_chunk, chunks)
+    try:
+        for counts in results:
+            totals["rendered"] += counts["rendered"]
+            totals["cached"] += counts["cached"]
+            if progress:
+                progress(totals, time.perf_counter() - started)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    totals["seconds"] = time.perf_counter() - started
+    return totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the PDFs of quotations and sales orders (newapp.documents) in parallel processes, "
+        "or queue them for the run_workers pool; documents already stored are skipped"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--kind",
+            choices=KIND_CHOICES,
+            action="append",
+            help="Document type, repeatable (default: both)",
+        )
+        parser.add_argument("--status", nargs="+", help="Only documents with these statuses")
+        parser.add_argument("--limit", type=int, help="At most this many documents of each type")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=None,
+            help="Rendering processes (default: JOBS_WORKERS)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Documents per batch (default: DOCUMENT_RENDER_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Render again even when the PDF is stored"
+        )
+        parser.add_argument(
+            "--queue",
+            action="store_true",
+            help="Queue documents.render_batch jobs for run_workers instead of rendering here",
+        )
+
+    def handle(self, *args, **options):
+        from newapp import documents
+
+        processes = options["processes"] or getattr(settings, "JOBS_WORKERS", 2)
+        if processes < 1:
+            raise CommandError("--processes must be at least 1")
+
+        for kind in options["kind"] or KIND_CHOICES:
+            queryset = documents.KINDS[kind].model._default_manager.all()
+            if options["status"]:
+                queryset = queryset.filter(status__in=options["status"])
+
+            if options["queue"]:
+                queued = documents.queue_batch(
+                    queryset,
+                    size=options["batch_size"],
+                    force=options["force"],
+                    limit=options["limit"],
+                )
+                count = sum(len(job.kwargs["pks"]) for job in queued)
+                self.stdout.write(f"{kind}: {count} document(s) queued in {len(queued)} job(s)")
+                continue
+
+            pks = list(queryset.order_by("pk").values_list("pk", flat=True)[: options["limit"]])
+            last = [0.0]
+
+            def progress(totals, elapsed):
+                if elapsed - last[0] < 2:
+                    return
+                last[0] = elapsed
+                done = totals["rendered"] + totals["cached"]
+                self.stdout.write(f"  {done}/{len(pks)} ({done / elapsed:.0f} documents/s)")
+
+            self.stdout.write(f"{kind}: {len(pks)} document(s) in {processes} process(es)")
+            totals = render_parallel(
+                kind, pks, processes, options["batch_size"], options["force"], progress
+            )
+            rate = len(pks) / totals["seconds"] if totals["seconds"] else 0
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{kind}: {totals['rendered']} rendered, {totals['cached']} up to date "
+                    f"in {totals['seconds']:.1f}s ({rate:.0f} documents/s)"
+                )
+            )
@@ -0,0 +1,111 @@
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def _worker_main(name, stop, burst, interval):
+    # Spawned children (Windows, macOS) start without Django set up, and must
+    # not import newapp.jobs before it is: hence the imports in here
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    from newapp import jobs
+
+    # Ctrl+C reaches every process; only the parent acts on it, via ``stop``
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    jobs.work(f"{name}:{jobs.worker_name()}", stop=stop, burst=burst, interval=interval)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background job workers (newapp.jobs): a pool of processes taking jobs from the "
+        "database queue until stopped with Ctrl+C or SIGTERM"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=None, help="Worker processes (default: JOBS_WORKERS)"
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once the queue has nothing runnable (cron, deploy hooks, tests)",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=None,
+            help="Seconds an idle worker waits between polls (default: JOBS_POLL_INTERVAL)",
+        )
+
+    def handle(self, *args, **options):
+        from newapp import jobs
+
+        processes = options["processes"] or getattr(settings, "JOBS_WORKERS", 2)
+        if processes < 1:
+            raise CommandError("--processes must be at least 1")
+        interval = options["poll_interval"]
+        if interval is None:
+            interval = jobs.poll_interval()
+
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"{requeued} stale job(s) queued again"))
+
+        context = multiprocessing.get_context()
+        stop = context.Event()
+
+        def request_stop(signum, frame):
+            if not stop.is_set():
+                self.stdout.write("Stopping after the running jobs finish...")
+            stop.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        if processes == 1:
+            self.stdout.write("Running 1 worker in this process")
+            ran = jobs.work(stop=stop, burst=options["burst"], interval=interval)
+            self.stdout.write(self.style.SUCCESS(f"{ran} job(s) run"))
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+
+        def start(number):
+            process = context.Process(
+                target=_worker_main,
+                name=f"worker-{number}",
+                args=(f"worker-{number}", stop, options["burst"], interval),
+            )
+            process.start()
+            return process
+
+        pool = {number: start(number) for number in range(1, processes + 1)}
+        self.stdout.write(
+            f"Started {processes} workers: {', '.join(str(p.pid) for p in pool.values())}"
+        )
+
+        while pool:
+            for number, process in list(pool.items()):
+                process.join(timeout=0.5)
+                if process.is_alive():
+                    continue
+                del pool[number]
+                # A worker that crashed is replaced; one that finished (stop, burst) is not
+                if process.exitcode != 0 and not stop.is_set() and not options["burst"]:
+                    self.stdout.write(
+                        self.style.ERROR(
+                            f"Worker {number} exited with code {process.exitcode}; restarting it"
+                        )
+                    )
+                    time.sleep(1)
+                    pool[number] = start(number)
+
+        self.stdout.write(self.style.SUCCESS("All workers stopped"))
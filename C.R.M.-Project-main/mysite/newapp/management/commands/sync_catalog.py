@@ -0,0 +1,79 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from newapp.catalog import CATALOGS, CatalogSync, write_change_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Sync the item or tax master from a CSV/XLSX file (upsert on code, deactivate missing rows)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("catalog", choices=sorted(CATALOGS), help="Which master to sync")
+        parser.add_argument("file", help="Path to a .csv or .xlsx file with a header row")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows per bulk write / transaction"
+        )
+        parser.add_argument(
+            "--keep-missing",
+            action="store_true",
+            help="Do not deactivate rows missing from the file (partial update files)",
+        )
+        parser.add_argument(
+            "--report", help="Write every change to this CSV (default: <file>.changes.csv)"
+        )
+        parser.add_argument("--user", help="Username recorded as created_by on new items")
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Show the change summary without writing"
+        )
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+
+        created_by = None
+        if options["user"]:
+            try:
+                created_by = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        sync = CatalogSync(
+            options["catalog"],
+            created_by=created_by,
+            batch_size=options["batch_size"],
+            deactivate_missing=not options["keep_missing"],
+            dry_run=options["dry_run"],
+        )
+        try:
+            result = sync.run(path, path)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        title = (
+            "Change summary (dry run, nothing written)" if options["dry_run"] else "Change summary"
+        )
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write(f"  Rows read:    {result.rows_read}")
+        self.stdout.write(f"  Created:      {result.created}")
+        self.stdout.write(f"  Updated:      {result.updated}")
+        for name, count in result.field_changes.most_common():
+            self.stdout.write(f"    {name:<24} {count}")
+        self.stdout.write(f"  Unchanged:    {result.unchanged}")
+        self.stdout.write(f"  Deactivated:  {result.deactivated}")
+        self.stdout.write(f"  Rejected:     {result.invalid}")
+        for line, message in result.errors[:10]:
+            self.stdout.write(self.style.WARNING(f"    line {line}: {message}"))
+        self.stdout.write(
+            f"  Elapsed:      {result.elapsed:.2f}s ({result.rows_per_second:.0f} rows/s)"
+        )
+
+        if result.changes or result.errors:
+            report = options["report"] or f"{os.path.splitext(path)[0]}.changes.csv"
+            write_change_report(result, report)
+            self.stdout.write(f"Change report written to {report}")
+        self.stdout.write(self.style.SUCCESS("Catalog sync complete"))
@@ -0,0 +1,436 @@
+"""
+Per-view request metrics.
+
+``MetricsMiddleware`` records, for every request, its latency in a histogram
+and a request counter, keyed by the resolved URL name (``newapp:lead_list``,
+``newapp:dashboard_data_api``, ...). A sample of requests
+(``METRICS_SAMPLE_RATE``) is also instrumented in detail: SQL query count and
+time (a ``connection.execute_wrapper``), template render time
+(``InstrumentedDjangoTemplates``) and cache hits/misses
+(``newapp.cache_backends``). Each sampled request is written as one JSON line
+to the ``newapp.metrics`` logger (a rotating file per worker process, see
+settings.LOGGING). Unsampled requests only pay for two clock reads and a dict
+update, which keeps the overhead well under 1%.
+
+Counters live in each worker process and are published to the shared cache
+every ``METRICS_PUBLISH_INTERVAL`` seconds; ``render_prometheus()`` merges the
+live processes into the Prometheus text format served at ``/metrics``.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import ExitStack
+from logging.handlers import RotatingFileHandler
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger("newapp.metrics")
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROCESS_KEY = "metrics:process:{pid}"
+PROCESSES_KEY = "metrics:processes"
+
+UNRESOLVED = "<unresolved>"
+
+# Per sampled request: requests, queries, query seconds, template seconds, cache hits, cache misses
+SAMPLE_FIELDS = (
+    "requests",
+    "queries",
+    "query_seconds",
+    "template_seconds",
+    "cache_hits",
+    "cache_misses",
+)
+
+
+def sample_rate():
+    return getattr(settings, "METRICS_SAMPLE_RATE", 0.1)
+
+
+def publish_interval():
+    return getattr(settings, "METRICS_PUBLISH_INTERVAL", 10)
+
+
+# ==========================
+# CURRENT REQUEST
+# ==========================
+
+
+class Sample:
+    """What one sampled request spent on SQL, templates and the cache."""
+
+    __slots__ = ("queries", "query_seconds", "template_seconds", "cache_hits", "cache_misses")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - start
+
+
+_current = contextvars.ContextVar("newapp_metrics_sample", default=None)
+
+
+def record_cache(hits, misses):
+    """Called by the stats cache backends for every lookup."""
+    sample = _current.get()
+    if sample is not None:
+        sample.cache_hits += hits
+        sample.cache_misses += misses
+
+
+def record_template(seconds):
+    sample = _current.get()
+    if sample is not None:
+        sample.template_seconds += seconds
+
+
+# ==========================
+# PROCESS COUNTERS
+# ==========================
+
+_lock = threading.Lock()
+_requests = {}  # (view, method, status) -> count
+_latency = {}  # view -> [count per bucket..., count over the last bucket, sum of seconds]
+_sampled = {}  # view -> [value per SAMPLE_FIELDS]
+_published = {"at": 0.0}
+
+
+def _observe(view, method, status, seconds, sample):
+    with _lock:
+        key = (view, method, status)
+        _requests[key] = _requests.get(key, 0) + 1
+
+        buckets = _latency.get(view)
+        if buckets is None:
+            buckets = _latency[view] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            index = len(LATENCY_BUCKETS)
+        buckets[index] += 1
+        buckets[-1] += seconds
+
+        if sample is not None:
+            totals = _sampled.get(view)
+            if totals is None:
+                totals = _sampled[view] = [0, 0, 0.0, 0.0, 0, 0]
+            totals[0] += 1
+            totals[1] += sample.queries
+            totals[2] += sample.query_seconds
+            totals[3] += sample.template_seconds
+            totals[4] += sample.cache_hits
+            totals[5] += sample.cache_misses
+
+
+def snapshot():
+    """This process's counters as plain data (what gets published to the cache)."""
+    with _lock:
+        return {
+            "requests": dict(_requests),
+            "latency": {view: list(buckets) for view, buckets in _latency.items()},
+            "sampled": {view: list(totals) for view, totals in _sampled.items()},
+        }
+
+
+def reset():
+    with _lock:
+        _requests.clear()
+        _latency.clear()
+        _sampled.clear()
+
+
+def publish(force=False):
+    """Store this process's snapshot in the shared cache (once per interval unless forced)."""
+    now = time.monotonic()
+    interval = publish_interval()
+    with _lock:
+        if not force and now - _published["at"] < interval:
+            return
+        _published["at"] = now
+
+    pid = os.getpid()
+    # Outlives a few missed publishes; a dead worker's counters drop out after that
+    cache.set(PROCESS_KEY.format(pid=pid), snapshot(), interval * 6)
+    pids = cache.get(PROCESSES_KEY) or []
+    if pid not in pids:
+        cache.set(PROCESSES_KEY, [*pids, pid], None)
+
+
+def collect():
+    """Counters of every live worker process, summed."""
+    publish(force=True)
+    pids = cache.get(PROCESSES_KEY) or []
+    snapshots = cache.get_many([PROCESS_KEY.format(pid=pid) for pid in pids])
+    live = [pid for pid in pids if PROCESS_KEY.format(pid=pid) in snapshots]
+    if live != pids:
+        cache.set(PROCESSES_KEY, live, None)
+
+    merged = {"requests": {}, "latency": {}, "sampled": {}, "processes": len(live)}
+    for data in snapshots.values():
+        for key, count in data["requests"].items():
+            merged["requests"][key] = merged["requests"].get(key, 0) + count
+        for section in ("latency", "sampled"):
+            for view, values in data[section].items():
+                totals = merged[section].get(view)
+                if totals is None:
+                    merged[section][view] = list(values)
+                else:
+                    merged[section][view] = [a + b for a, b in zip(totals, values)]
+    return merged
+
+
+# ==========================
+# PROMETHEUS TEXT FORMAT
+# ==========================
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_label(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(data=None):
+    """Prometheus exposition text (version 0.0.4) for ``collect()``'s counters."""
+    data = collect() if data is None else data
+    lines = []
+
+    def metric(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    metric("crm_http_requests_total", "counter", "Requests by URL name, method and status.")
+    for (view, method, status), count in sorted(data["requests"].items()):
+        lines.append(
+            f"crm_http_requests_total{_labels(view=view, method=method, status=status)} {count}"
+        )
+
+    metric("crm_http_request_duration_seconds", "histogram", "Request latency by URL name.")
+    for view, buckets in sorted(data["latency"].items()):
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), buckets[:-1]):
+            cumulative += count
+            lines.append(
+                f"crm_http_request_duration_seconds_bucket{_labels(view=view, le=bound)} "
+                f"{cumulative}"
+            )
+        lines.append(
+            f"crm_http_request_duration_seconds_sum{_labels(view=view)} {_number(buckets[-1])}"
+        )
+        lines.append(f"crm_http_request_duration_seconds_count{_labels(view=view)} {cumulative}")
+
+    sampled = [
+        ("crm_sampled_requests_total", "Requests instrumented in detail (METRICS_SAMPLE_RATE)."),
+        ("crm_db_queries_total", "SQL queries run by sampled requests."),
+        ("crm_db_query_seconds_total", "Time sampled requests spent in SQL."),
+        ("crm_template_render_seconds_total", "Time sampled requests spent rendering templates."),
+        ("crm_cache_hits_total", "Cache hits of sampled requests."),
+        ("crm_cache_misses_total", "Cache misses of sampled requests."),
+    ]
+    for index, (name, help_text) in enumerate(sampled):
+        metric(name, "counter", help_text)
+        for view, totals in sorted(data["sampled"].items()):
+            lines.append(f"{name}{_labels(view=view)} {_number(totals[index])}")
+
+    metric("crm_metrics_processes", "gauge", "Worker processes whose counters are included.")
+    lines.append(f"crm_metrics_processes {data.get('processes', 1)}")
+    metric("crm_metrics_sample_rate", "gauge", "Fraction of requests instrumented in detail.")
+    lines.append(f"crm_metrics_sample_rate {_number(float(sample_rate()))}")
+    return "\n".join(lines) + "\n"
+
+
+# ==========================
+# MIDDLEWARE
+# ==========================
+
+
+class MetricsMiddleware:
+    """Time every request and instrument a sample; first in settings.MIDDLEWARE. Sync and async."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "METRICS_ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # A sync-only middleware first in the list would run every async view in a thread
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        rate = sample_rate()
+        sample = Sample() if rate and random.random() < rate else None
+        start = time.perf_counter()
+        if sample is None:
+            response = self.get_response(request)
+        else:
+            token = _current.set(sample)
+            try:
+                with ExitStack() as stack:
+                    self.wrap_connections(stack, sample)
+                    response = self.get_response(request)
+            finally:
+                _current.reset(token)
+        seconds = time.perf_counter() - start
+
+        view = self.observe(request, response, seconds, sample)
+        if sample is not None:
+            self.log(request, response, view, seconds, sample)
+        publish()
+        return response
+
+    async def __acall__(self, request):
+        rate = sample_rate()
+        sample = Sample() if rate and random.random() < rate else None
+        start = time.perf_counter()
+        if sample is None:
+            response = await self.get_response(request)
+        else:
+            token = _current.set(sample)
+            stack = ExitStack()
+            try:
+                # The ORM calls of an async request all run in one thread of their own
+                # (sync_to_async): wrap the connections of that thread
+                await sync_to_async(self.wrap_connections)(stack, sample)
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+                _current.reset(token)
+        seconds = time.perf_counter() - start
+
+        view = self.observe(request, response, seconds, sample)
+        if sample is not None:
+            # Reads request.user, which may still have to be loaded
+            await sync_to_async(self.log)(request, response, view, seconds, sample)
+        # At most one cache write per METRICS_PUBLISH_INTERVAL: not worth a thread per request
+        publish()
+        return response
+
+    @staticmethod
+    def wrap_connections(stack, sample):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(sample))
+
+    @staticmethod
+    def observe(request, response, seconds, sample):
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else None) or UNRESOLVED
+        _observe(view, request.method, response.status_code, seconds, sample)
+        return view
+
+    @staticmethod
+    def log(request, response, view, seconds, sample):
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        user = getattr(request, "user", None)
+        logger.info(
+            json.dumps(
+                {
+                    "ts": round(time.time(), 3),
+                    "view": view,
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "user_id": user.pk if user is not None and user.is_authenticated else None,
+                    "duration_ms": round(seconds * 1000, 2),
+                    "queries": sample.queries,
+                    "query_ms": round(sample.query_seconds * 1000, 2),
+                    "template_ms": round(sample.template_seconds * 1000, 2),
+                    "cache_hits": sample.cache_hits,
+                    "cache_misses": sample.cache_misses,
+                }
+            )
+        )
+
+
+# ==========================
+# TEMPLATES AND LOGGING
+# ==========================
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            record_template(time.perf_counter() - start)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing each top-level render for the sampled request.
+
+    Covers ``render()``, ``TemplateResponse`` and ``render_to_string()``; the
+    time includes queries that querysets run lazily from the template.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class JsonLogHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler writing one file per worker process: ``metrics.<pid>.log``.
+
+    Rotation renames the file, which only works with a single writer: workers
+    sharing one file lose lines at each rollover, and on Windows the rename
+    fails on every write after the first one. The pid is read when the file is
+    opened, so workers forked after logging was configured each get their own.
+    """
+
+    def __init__(self, filename, *args, **kwargs):
+        self.filename_template = os.path.abspath(filename)
+        self.pid = None
+        super().__init__(filename, *args, **kwargs)
+
+    def _open(self):
+        root, ext = os.path.splitext(self.filename_template)
+        self.pid = os.getpid()
+        self.baseFilename = f"{root}.{self.pid}{ext}"
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+    def emit(self, record):
+        if self.stream is not None and self.pid != os.getpid():
+            # Inherited from the parent process through fork(): open this worker's own file
+            self.stream.close()
+            self.stream = None
+        super().emit(record)
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0019_prospectcustomer_closed_at_servicecall_call_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='servicecall',
+            name='service_number',
+            field=models.CharField(blank=True, help_text='Leave blank to auto-generate', max_length=50, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='servicecall',
+            name='status',
+            field=models.CharField(choices=[('OPEN', 'Open'), ('CLOSED', 'Closed')], default='OPEN', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Sequence prefix, e.g. QUO or SVC', max_length=20)),
+                ('period', models.CharField(blank=True, default='', help_text='Reset period, e.g. 2025 or FY2025-26; blank if never reset', max_length=20)),
+                ('last_value', models.PositiveBigIntegerField(default=0, help_text='Highest number reserved so far')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Document Sequence',
+                'verbose_name_plural': 'Document Sequences',
+                'ordering': ['key', 'period'],
+                'constraints': [models.UniqueConstraint(fields=('key', 'period'), name='unique_document_sequence')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    from newapp.rollups import rebuild
+    rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0020_documentsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('visit_status', 'Visits by Status'), ('visit_approval', 'Visits by Approval'), ('visit_outcome', 'Visits by Outcome'), ('prospect_status', 'Prospects by Status'), ('order_status', 'Sales Orders by Status')], max_length=30)),
+                ('day', models.DateField()),
+                ('region', models.CharField(blank=True, default='', max_length=20)),
+                ('status', models.CharField(blank=True, default='', max_length=30)),
+                ('count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('sales_employee', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='daily_rollups', to='newapp.salesemployee')),
+            ],
+            options={
+                'verbose_name': 'Daily Rollup',
+                'verbose_name_plural': 'Daily Rollups',
+                'ordering': ['-day', 'metric'],
+                'indexes': [models.Index(fields=['metric', 'day'], name='rollup_metric_day_idx'), models.Index(fields=['sales_employee', 'metric', 'day'], name='rollup_employee_idx')],
+                'constraints': [models.UniqueConstraint(fields=('metric', 'day', 'sales_employee', 'region', 'status'), name='unique_daily_rollup')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:37
+
+from django.db import DatabaseError, migrations, models
+
+
+def install_fulltext(apps, schema_editor):
+    """Create the FTS5 table (SQLite) or full-text index (SQL Server) when the database supports it."""
+    from newapp.search import MssqlBackend, SqliteBackend
+
+    connection = schema_editor.connection
+    table = apps.get_model('newapp', 'SearchEntry')._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+                cursor.execute("DROP TABLE temp.fts5_probe")
+            except DatabaseError:
+                return  # SQLite built without FTS5: the in-memory index is used
+            statements = SqliteBackend.install_sql(table)
+        elif connection.vendor == 'microsoft':
+            cursor.execute("SELECT FULLTEXTSERVICEPROPERTY('IsFullTextInstalled')")
+            if not cursor.fetchone()[0]:
+                return  # Full-Text Search feature not installed: the in-memory index is used
+            cursor.execute("SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID(%s) AND is_primary_key = 1",
+                           [table])
+            statements = MssqlBackend.install_sql(table, cursor.fetchone()[0])
+        else:
+            return
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def uninstall_fulltext(apps, schema_editor):
+    from newapp.search import MssqlBackend, SqliteBackend
+
+    connection = schema_editor.connection
+    table = apps.get_model('newapp', 'SearchEntry')._meta.db_table
+    backend = {'sqlite': SqliteBackend, 'microsoft': MssqlBackend}.get(connection.vendor)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            for statement in backend.uninstall_sql(table):
+                cursor.execute(statement)
+
+
+def build_index(apps, schema_editor):
+    from newapp.search import rebuild
+    rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+    # SQL Server does not allow full-text DDL inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('newapp', '0021_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('prospects', 'Prospect'), ('leads', 'Lead'), ('quotations', 'Quotation'), ('service_calls', 'Service Call')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(blank=True, default='', help_text='Numbers and names; ranked above the body', max_length=500)),
+                ('body', models.TextField(blank=True, default='', help_text='All searchable text, title included')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Search Entry',
+                'verbose_name_plural': 'Search Entries',
+                'indexes': [models.Index(fields=['updated_at'], name='search_entry_updated_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_entry')],
+            },
+        ),
+        migrations.RunPython(install_fulltext, uninstall_fulltext),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
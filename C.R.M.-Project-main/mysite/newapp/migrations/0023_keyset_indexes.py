@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0022_searchentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['-created_at', '-id'], name='lead_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leadactivity',
+            index=models.Index(fields=['-activity_date', '-activity_time', '-id'], name='lead_activity_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prospectcustomer',
+            index=models.Index(fields=['-created_at', '-id'], name='prospect_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quotation',
+            index=models.Index(fields=['-quote_date', '-created_at', '-id'], name='quotation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['-order_date', '-created_at', '-id'], name='sales_order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicecall',
+            index=models.Index(fields=['-created_at', '-id'], name='service_call_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitlog',
+            index=models.Index(fields=['sales_employee', '-visit_date', '-visit_time', '-id'], name='visit_employee_date_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0023_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visitlog',
+            index=models.Index(fields=['-visit_date', '-visit_time', '-id'], name='visit_date_idx'),
+        ),
+    ]
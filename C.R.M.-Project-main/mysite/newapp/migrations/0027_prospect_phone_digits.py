@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:36
+
+from django.db import migrations, models
+
+
+def fill_phone_digits(apps, schema_editor):
+    """Normalise the phones already stored, as ProspectCustomer.save() does for new ones."""
+    ProspectCustomer = apps.get_model('newapp', 'ProspectCustomer')
+    prospects = ProspectCustomer.objects.only('pk', 'phone').order_by('pk')
+    batch = []
+    for prospect in prospects.iterator(chunk_size=2000):
+        prospect.phone_digits = ''.join(ch for ch in prospect.phone or '' if ch.isdigit() or ch == '+')
+        batch.append(prospect)
+        if len(batch) >= 2000:
+            ProspectCustomer.objects.bulk_update(batch, ['phone_digits'])
+            batch = []
+    if batch:
+        ProspectCustomer.objects.bulk_update(batch, ['phone_digits'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0026_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prospectcustomer',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=15),
+        ),
+        migrations.RunPython(fill_phone_digits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0027_prospect_phone_digits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchentry',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, help_text='Set when the row was deleted; the entry is then empty', null=True),
+        ),
+    ]
@@ -4,6 +4,10 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils import timezone
 
+from .pricing import apply_line, apply_totals
+from .scope import ScopedQuerySet
+from .sequences import next_number
+
 # Create your models here.
 
 class Department(models.Model):
@@ -184,6 +188,8 @@ class ProspectCustomer(models.Model):
     email = models.EmailField(blank=True, null=True)
     phone = models.CharField(max_length=15)
     alternate_phone = models.CharField(max_length=15, blank=True, null=True)
+    # ``phone`` without spaces and punctuation, compared by the importer's duplicate check
+    phone_digits = models.CharField(max_length=15, blank=True, default='', editable=False, db_index=True)
 
     address = models.TextField()
     city = models.CharField(max_length=100)
@@ -215,19 +221,19 @@ class ProspectCustomer(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     closed_at = models.DateTimeField(blank=True, null=True)
 
+    @staticmethod
+    def normalize_phone(value):
+        """Digits (and a leading '+') only, so '98200 12345' and '9820012345' compare equal."""
+        return ''.join(ch for ch in str(value or '') if ch.isdigit() or ch == '+')
+
     def save(self, *args, **kwargs):
         """Auto-generate customer ID if not exists"""
         if not self.customer_id:
-            last_customer = ProspectCustomer.objects.order_by('-id').first()
-
-            if last_customer and last_customer.customer_id:
-                try:
-                    last_id = int(last_customer.customer_id.split('-')[-1])
-                    self.customer_id = f"CUST-{last_id + 1:05d}"
-                except (ValueError, IndexError):
-                    self.customer_id = "CUST-00001"
-            else:
-                self.customer_id = "CUST-00001"
+            self.customer_id = next_number('CUST')
+        self.phone_digits = self.normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_digits'}
 
         super().save(*args, **kwargs)
 
@@ -238,6 +244,9 @@ class ProspectCustomer(models.Model):
         verbose_name = "Prospect/Customer"
         verbose_name_plural = "Prospects/Customers"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='prospect_created_idx'),
+        ]
 
 class Lead(models.Model):
     """Lead management model for tracking business opportunities"""
@@ -297,21 +306,21 @@ class Lead(models.Model):
     def save(self, *args, **kwargs):
         if not self.lead_id:
             # Generate unique lead ID
-            last_lead = Lead.objects.order_by('-id').first()
-            if last_lead:
-                last_id = int(last_lead.lead_id.split('-')[-1])
-                self.lead_id = f"LEAD-{last_id + 1:06d}"
-            else:
-                self.lead_id = "LEAD-000001"
+            self.lead_id = next_number('LEAD')
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.lead_id} - {self.prospect.name}"
     
+    objects = ScopedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Lead"
         verbose_name_plural = "Leads"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='lead_created_idx'),
+        ]
 
 
 class LeadHistory(models.Model):
@@ -396,12 +405,7 @@ class LeadActivity(models.Model):
     def save(self, *args, **kwargs):
         if not self.activity_id:
             # Generate unique activity ID
-            last_activity = LeadActivity.objects.order_by('-id').first()
-            if last_activity:
-                last_id = int(last_activity.activity_id.split('-')[-1])
-                self.activity_id = f"ACT-{last_id + 1:06d}"
-            else:
-                self.activity_id = "ACT-000001"
+            self.activity_id = next_number('ACT')
         super().save(*args, **kwargs)
         
         # Update lead's next action date if this is a future follow-up
@@ -425,10 +429,15 @@ class LeadActivity(models.Model):
         """Check if this activity is scheduled for today"""
         return self.activity_date == timezone.now().date()
     
+    objects = ScopedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Lead Activity"
         verbose_name_plural = "Lead Activities"
         ordering = ['-activity_date', '-activity_time']
+        indexes = [
+            models.Index(fields=['-activity_date', '-activity_time', '-id'], name='lead_activity_date_idx'),
+        ]
 
 
 class VisitLog(models.Model):
@@ -483,21 +492,22 @@ class VisitLog(models.Model):
     def save(self, *args, **kwargs):
         if not self.visit_id:
             # Generate unique visit ID
-            last_visit = VisitLog.objects.order_by('-id').first()
-            if last_visit:
-                last_id = int(last_visit.visit_id.split('-')[-1])
-                self.visit_id = f"VST-{last_id + 1:06d}"
-            else:
-                self.visit_id = "VST-000001"
+            self.visit_id = next_number('VST')
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.visit_id} - {self.prospect.name} by {self.sales_employee.user.username}"
     
+    objects = ScopedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Visit Log"
         verbose_name_plural = "Visit Logs"
         ordering = ['-visit_date', '-visit_time']
+        indexes = [
+            models.Index(fields=['sales_employee', '-visit_date', '-visit_time', '-id'], name='visit_employee_date_idx'),
+            models.Index(fields=['-visit_date', '-visit_time', '-id'], name='visit_date_idx'),
+        ]
 
 
 # ==========================
@@ -595,23 +605,12 @@ class Quotation(models.Model):
     def save(self, *args, **kwargs):
         if not self.quote_number:
             # Generate unique quote number
-            last_quote = Quotation.objects.order_by('-id').first()
-            if last_quote:
-                last_id = int(last_quote.quote_number.split('-')[-1])
-                self.quote_number = f"QUO-{last_id + 1:06d}"
-            else:
-                self.quote_number = "QUO-000001"
+            self.quote_number = next_number('QUO')
         super().save(*args, **kwargs)
     
     def calculate_totals(self):
         """Calculate quotation totals from line items"""
-        items = self.items.all()
-        self.subtotal = sum(item.line_total for item in items)
-        self.discount_amount = self.subtotal * (self.discount_percentage / 100)
-        taxable_amount = self.subtotal - self.discount_amount
-        self.tax_amount = sum(item.tax_amount for item in items)
-        self.net_amount = taxable_amount + self.tax_amount + self.freight_charges
-        self.save()
+        apply_totals(self, self.items.all())
     
     @property
     def is_expired(self):
@@ -629,10 +628,15 @@ class Quotation(models.Model):
     def __str__(self):
         return f"{self.quote_number} - {self.prospect.name} - ₹{self.net_amount}"
     
+    objects = ScopedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Quotation"
         verbose_name_plural = "Quotations"
         ordering = ['-quote_date', '-created_at']
+        indexes = [
+            models.Index(fields=['-quote_date', '-created_at', '-id'], name='quotation_date_idx'),
+        ]
 
 
 class QuotationItem(models.Model):
@@ -668,11 +672,7 @@ class QuotationItem(models.Model):
     
     def save(self, *args, **kwargs):
         # Calculate line total
-        amount = self.quantity * self.unit_price
-        discount = amount * (self.discount_percentage / 100)
-        taxable = amount - discount
-        self.tax_amount = taxable * (self.tax_percentage / 100)
-        self.line_total = taxable + self.tax_amount
+        apply_line(self)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -845,23 +845,12 @@ class SalesOrder(models.Model):
     def save(self, *args, **kwargs):
         if not self.order_number:
             # Generate unique order number
-            last_order = SalesOrder.objects.order_by('-id').first()
-            if last_order:
-                last_id = int(last_order.order_number.split('-')[-1])
-                self.order_number = f"SO-{last_id + 1:06d}"
-            else:
-                self.order_number = "SO-000001"
+            self.order_number = next_number('SO')
         super().save(*args, **kwargs)
     
     def calculate_totals(self):
         """Calculate order totals from line items"""
-        items = self.items.all()
-        self.subtotal = sum(item.line_total for item in items)
-        self.discount_amount = self.subtotal * (self.discount_percentage / 100)
-        taxable_amount = self.subtotal - self.discount_amount
-        self.tax_amount = sum(item.tax_amount for item in items)
-        self.net_amount = taxable_amount + self.tax_amount + self.freight_charges
-        self.save()
+        apply_totals(self, self.items.all())
     
     @property
     def is_expired(self):
@@ -879,10 +868,15 @@ class SalesOrder(models.Model):
     def __str__(self):
         return f"{self.order_number} - {self.prospect.name} - ₹{self.net_amount}"
     
+    objects = ScopedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Sales Order"
         verbose_name_plural = "Sales Orders"
         ordering = ['-order_date', '-created_at']
+        indexes = [
+            models.Index(fields=['-order_date', '-created_at', '-id'], name='sales_order_date_idx'),
+        ]
 
 
 class SalesOrderItem(models.Model):
@@ -918,11 +912,7 @@ class SalesOrderItem(models.Model):
     
     def save(self, *args, **kwargs):
         # Calculate line total
-        amount = self.quantity * self.unit_price
-        discount = amount * (self.discount_percentage / 100)
-        taxable = amount - discount
-        self.tax_amount = taxable * (self.tax_percentage / 100)
-        self.line_total = taxable + self.tax_amount
+        apply_line(self)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -1198,6 +1188,9 @@ class Technician(models.Model):
         ('SPECIALIST', 'Specialist'),
         ('LEAD', 'Lead Engineer'),
     ]
+
+    # Service call statuses counted as the technician's open workload
+    ACTIVE_CALL_STATUSES = ['NEW', 'ASSIGNED', 'SCHEDULED', 'IN_PROGRESS']
     
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='technician_profile')
     employee_code = models.CharField(max_length=50, unique=True, db_index=True, 
@@ -1250,15 +1243,7 @@ class Technician(models.Model):
     def save(self, *args, **kwargs):
         """Auto-generate employee code if not exists"""
         if not self.employee_code:
-            last_tech = Technician.objects.order_by('-id').first()
-            if last_tech and last_tech.employee_code:
-                try:
-                    last_num = int(last_tech.employee_code.split('-')[-1])
-                    self.employee_code = f"TECH-{last_num + 1:05d}"
-                except (ValueError, IndexError):
-                    self.employee_code = "TECH-00001"
-            else:
-                self.employee_code = "TECH-00001"
+            self.employee_code = next_number('TECH')
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -1272,7 +1257,7 @@ class Technician(models.Model):
     @property
     def active_service_calls_count(self):
         """Count of active service calls assigned to this technician"""
-        return self.assigned_calls.filter(status__in=['NEW', 'ASSIGNED', 'SCHEDULED', 'IN_PROGRESS']).count()
+        return self.assigned_calls.filter(status__in=self.ACTIVE_CALL_STATUSES).count()
     
     class Meta:
         verbose_name = "Technician"
@@ -1324,13 +1309,7 @@ class ServiceContract(models.Model):
     def save(self, *args, **kwargs):
         if not self.contract_number:
             # Auto-generate contract number
-            last_contract = ServiceContract.objects.order_by('-id').first()
-            if last_contract and last_contract.contract_number:
-                last_num = int(last_contract.contract_number.split('-')[-1])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-            self.contract_number = f"AMC-{timezone.now().year}-{new_num:05d}"
+            self.contract_number = next_number('AMC')
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -1492,7 +1471,8 @@ class ServiceCall(models.Model):
 
     
     # Service Call Identification
-    service_number = models.CharField(max_length=50, unique=True, editable=True)
+    service_number = models.CharField(max_length=50, unique=True, editable=True, blank=True,
+                                      help_text="Leave blank to auto-generate")
     
     item_name = models.CharField(
     max_length=20,
@@ -1600,27 +1580,30 @@ class ServiceCall(models.Model):
 
     updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,related_name='updated_service_calls')
     updated_at = models.DateTimeField(auto_now=True)
-    
-def save(self, *args, **kwargs):
-    # 1️⃣ Auto-generate service number
-    if not self.service_number:
-        year = timezone.now().year
-        last_call = ServiceCall.objects.filter(
-            service_number__startswith=f"SVC-{year}"
-        ).order_by('-id').first()
-
-        last_num = int(last_call.service_number.split('-')[-1]) if last_call else 0
-        self.service_number = f"SVC-{year}-{last_num + 1:04d}"
-
-    # 2️⃣ Auto set closed_at when status is CLOSED
-    if self.status == 'CLOSED':
-        if self.closed_at is None:
-            self.closed_at = timezone.now()
-    else:
-        # Clear closed_at if reopened
-        self.closed_at = None
-
-    super().save(*args, **kwargs)
+
+    objects = ScopedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='service_call_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # 1️⃣ Auto-generate service number (SVC-YYYY-0001, resets every year)
+        if not self.service_number:
+            self.service_number = next_number('SVC')
+
+        # 2️⃣ Auto set closed_at when status is CLOSED
+        if self.status == 'CLOSED':
+            if self.closed_at is None:
+                self.closed_at = timezone.now()
+        else:
+            # Clear closed_at if reopened
+            self.closed_at = None
+
+        super().save(*args, **kwargs)
+
+
 class ServiceCallItem(models.Model):
     """Line items for parts/products used in service call"""
     service_call = models.ForeignKey(ServiceCall, on_delete=models.CASCADE, related_name='items')
@@ -1677,11 +1660,7 @@ class ServiceCallItem(models.Model):
     
     def save(self, *args, **kwargs):
         # Calculate line total: (parts + labour) + tax
-        parts_amount = self.quantity * self.unit_price
-        labour_amount = self.labour_hours * self.labour_rate
-        subtotal = parts_amount + labour_amount
-        tax_amount = subtotal * (self.tax_percentage / 100)
-        self.line_total = subtotal + tax_amount
+        apply_line(self)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -1852,18 +1831,7 @@ class ServiceInvoice(models.Model):
     def save(self, *args, **kwargs):
         if not self.invoice_number:
             # Generate invoice number: SVC-INV-YYYY-0001
-            year = timezone.now().year
-            last_invoice = ServiceInvoice.objects.filter(
-                invoice_number__startswith=f'SVC-INV-{year}'
-            ).order_by('-id').first()
-
-            if last_invoice and last_invoice.invoice_number:
-                last_num = int(last_invoice.invoice_number.split('-')[-1])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-
-            self.invoice_number = f'SVC-INV-{year}-{new_num:04d}'
+            self.invoice_number = next_number('SVC-INV')
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -1961,3 +1929,214 @@ class SLAConfig(models.Model):
         verbose_name = "SLA Configuration"
         verbose_name_plural = "SLA Configurations"
         ordering = ['service_type', 'priority']
+
+
+# ==========================
+# DOCUMENT NUMBERING
+# ==========================
+
+class DocumentSequence(models.Model):
+    """Counter row backing auto-generated document numbers (see newapp.sequences)"""
+    key = models.CharField(max_length=20, help_text="Sequence prefix, e.g. QUO or SVC")
+    period = models.CharField(max_length=20, blank=True, default='',
+                              help_text="Reset period, e.g. 2025 or FY2025-26; blank if never reset")
+    last_value = models.PositiveBigIntegerField(default=0,
+                                                help_text="Highest number reserved so far")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} {self.period}".strip() + f" @ {self.last_value}"
+
+    class Meta:
+        verbose_name = "Document Sequence"
+        verbose_name_plural = "Document Sequences"
+        ordering = ['key', 'period']
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'period'], name='unique_document_sequence'),
+        ]
+
+
+# ==========================
+# REPORTING ROLLUPS
+# ==========================
+
+class DailyRollup(models.Model):
+    """Per-day counters for reports, maintained incrementally (see newapp.rollups)"""
+    METRIC_CHOICES = [
+        ('visit_status', 'Visits by Status'),
+        ('visit_approval', 'Visits by Approval'),
+        ('visit_outcome', 'Visits by Outcome'),
+        ('prospect_status', 'Prospects by Status'),
+        ('order_status', 'Sales Orders by Status'),
+    ]
+
+    metric = models.CharField(max_length=30, choices=METRIC_CHOICES)
+    day = models.DateField()
+    # No FK constraint: rows outlive deleted employees until the next rebuild
+    sales_employee = models.ForeignKey(SalesEmployee, on_delete=models.DO_NOTHING, null=True, blank=True,
+                                       db_constraint=False, related_name='daily_rollups')
+    region = models.CharField(max_length=20, blank=True, default='')
+    status = models.CharField(max_length=30, blank=True, default='')
+    count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.metric} {self.day} {self.status}: {self.count}"
+
+    class Meta:
+        verbose_name = "Daily Rollup"
+        verbose_name_plural = "Daily Rollups"
+        ordering = ['-day', 'metric']
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'day', 'sales_employee', 'region', 'status'],
+                                    name='unique_daily_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['metric', 'day'], name='rollup_metric_day_idx'),
+            models.Index(fields=['sales_employee', 'metric', 'day'], name='rollup_employee_idx'),
+        ]
+
+
+# ==========================
+# SEARCH INDEX
+# ==========================
+
+class SearchEntry(models.Model):
+    """Searchable text of one prospect, lead, quotation or service call (see newapp.search)"""
+    KIND_CHOICES = [
+        ('prospects', 'Prospect'),
+        ('leads', 'Lead'),
+        ('quotations', 'Quotation'),
+        ('service_calls', 'Service Call'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=500, blank=True, default='',
+                             help_text="Numbers and names; ranked above the body")
+    body = models.TextField(blank=True, default='', help_text="All searchable text, title included")
+    updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(blank=True, null=True,
+                                      help_text="Set when the row was deleted; the entry is then empty")
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}: {self.title[:60]}"
+
+    class Meta:
+        verbose_name = "Search Entry"
+        verbose_name_plural = "Search Entries"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['updated_at'], name='search_entry_updated_idx'),
+        ]
+
+
+# ==========================
+# EXPORTS
+# ==========================
+
+class Export(models.Model):
+    """A CSV/XLSX export written in the background (see newapp.exports)"""
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=50, help_text="What was exported, e.g. visits")
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    total_rows = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to='exports/', blank=True)
+    error = models.TextField(blank=True, default='')
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exports')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}.{self.format} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('DONE', 'FAILED')
+
+    @property
+    def progress_percentage(self):
+        if self.status == 'DONE':
+            return 100
+        return min(99, self.rows_written * 100 // self.total_rows) if self.total_rows else 0
+
+    class Meta:
+        verbose_name = "Export"
+        verbose_name_plural = "Exports"
+        ordering = ['-created_at']
+
+
+# ==========================
+# BACKGROUND JOBS
+# ==========================
+
+class Job(models.Model):
+    """One unit of background work in the database queue (see newapp.jobs)"""
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+    PRIORITY_LOW = 0
+    PRIORITY_NORMAL = 5
+    PRIORITY_HIGH = 10
+    PRIORITY_CHOICES = [
+        (PRIORITY_LOW, 'Low'),
+        (PRIORITY_NORMAL, 'Normal'),
+        (PRIORITY_HIGH, 'High'),
+    ]
+
+    task = models.CharField(max_length=100, help_text="Registered task name, e.g. exports.write")
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(choices=PRIORITY_CHOICES, default=PRIORITY_NORMAL,
+                                        help_text="Higher runs first")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    run_at = models.DateTimeField(default=timezone.now, help_text="Not picked up before this time")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent done")
+    progress_message = models.CharField(max_length=255, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('DONE', 'FAILED')
+
+    def set_progress(self, done, total=None, message=''):
+        """Record progress from the running task: ``done`` of ``total``, or a percentage when no total is given"""
+        self.progress = min(99, done * 100 // total if total else done)
+        self.progress_message = message[:255]
+        Job.objects.filter(pk=self.pk).update(progress=self.progress, progress_message=self.progress_message)
+
+    class Meta:
+        verbose_name = "Job"
+        verbose_name_plural = "Jobs"
+        ordering = ['-created_at']
+        indexes = [
+            # The queue scan: next runnable job by priority
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_queue_idx'),
+        ]
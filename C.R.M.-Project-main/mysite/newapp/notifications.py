@@ -0,0 +1,87 @@
+"""
+Notification mails about quotation and sales order status changes.
+
+Views call ``notify(document, event, user)`` once the change is saved. That
+only queues the ``notifications.document`` job (newapp.jobs), so a slow or
+unreachable mail server never holds up the request, and a failed send is
+retried by the workers. The job reads the document again when it runs and
+mails:
+
+- the customer contact when a quotation is sent, with its PDF
+  (newapp.documents) attached,
+- the assigned sales employee when a quotation or order is approved,
+  rejected or confirmed.
+"""
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage
+
+from . import documents, jobs
+
+# (model, event) -> (subject, who gets it)
+EVENTS = {
+    ("newapp.quotation", "SENT"): ("Quotation {number} from {company}", "customer"),
+    ("newapp.quotation", "APPROVED"): ("Quotation {number} approved", "employee"),
+    ("newapp.quotation", "REJECTED"): ("Quotation {number} rejected", "employee"),
+    ("newapp.salesorder", "CONFIRMED"): ("Sales order {number} confirmed", "employee"),
+    ("newapp.salesorder", "APPROVED"): ("Sales order {number} approved", "employee"),
+    ("newapp.salesorder", "REJECTED"): ("Sales order {number} rejected", "employee"),
+}
+
+
+def notify(document, event, user=None):
+    """Queue the mail for ``event`` on ``document``; returns the Job."""
+    return jobs.enqueue(
+        "notifications.document",
+        user=user,
+        model=document._meta.label_lower,
+        pk=document.pk,
+        event=event,
+    )
+
+
+def _number(document):
+    return getattr(document, "quote_number", None) or document.order_number
+
+
+def _recipients(document, audience):
+    if audience == "customer":
+        emails = [document.contact_email or document.prospect.email]
+    else:
+        employee = document.assigned_to
+        emails = [employee.user.email] if employee else []
+    return [email for email in emails if email]
+
+
+@jobs.task("notifications.document", max_attempts=5)
+def send_document_notification(job, model, pk, event):
+    subject, audience = EVENTS[(model, event)]
+    model_class = apps.get_model(model)
+    try:
+        document = model_class._default_manager.select_related("prospect", "assigned_to__user").get(
+            pk=pk
+        )
+    except model_class.DoesNotExist:
+        raise jobs.PermanentError(f"{model} {pk} was deleted")
+
+    recipients = _recipients(document, audience)
+    if not recipients:
+        return {"message": f"No {audience} email address on {_number(document)}; nothing sent"}
+
+    number = _number(document)
+    customer = document.prospect.company_name or document.prospect.name
+    subject = subject.format(number=number, company=customer)
+    body = (
+        f"{subject}.\n\n"
+        f"Customer: {customer}\n"
+        f"Status: {document.get_status_display()}\n"
+        f"Amount: {document.currency} {document.net_amount:,.2f}\n"
+    )
+    message = EmailMessage(subject, body, None, recipients)
+    if audience == "customer":
+        path, _rendered = documents.get_pdf(document)
+        with default_storage.open(path, "rb") as pdf:
+            message.attach(f"{number}.pdf", pdf.read(), "application/pdf")
+    message.send()
+    return {"message": f"Mailed {', '.join(recipients)}"}
@@ -0,0 +1,461 @@
+"""
+Keyset (seek) pagination for the list views.
+
+OFFSET paging reads and throws away every row before the requested page and
+needs a ``COUNT(*)`` of the whole filtered list on each request, so deep pages
+and big filtered lists get slower as the tables grow. Here each page link
+carries an opaque, signed cursor holding the ordering values of the row it
+continues from, and the next page is fetched with a ``WHERE (date, pk) < (...)``
+seek that walks the ordering index from that point: page 500 costs the same as
+page 1.
+
+The ordering is taken from the queryset itself (the view's ``order_by()`` or
+the model's ``Meta.ordering``) with the primary key appended as tie-breaker.
+Querysets ordered by an expression, such as the ranked results of
+``search.search_queryset()``, cannot be seeked; they are paged by offset
+instead, which is cheap because search results are capped.
+
+The total shown as "Page N of M" is controlled by ``PAGINATION_COUNT``:
+
+- ``exact``: ``COUNT(*)`` on the first page.
+- ``cached``: the same, cached for ``PAGINATION_COUNT_TIMEOUT`` seconds per
+  distinct query.
+- ``approximate``: table statistics for unfiltered lists (SQL Server,
+  PostgreSQL), the cached count otherwise.
+- ``none``: no total at all; the Last link is hidden.
+
+Whatever the mode, the total is counted on the first page only and then
+travels in the cursors, so following Next never counts again.
+"""
+
+import datetime
+import decimal
+import hashlib
+import math
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import DatabaseError, connections
+from django.db.models import Q
+
+CURSOR_SALT = "newapp.pagination.cursor"
+COUNT_MODES = ("exact", "cached", "approximate", "none")
+
+# Cursor directions
+NEXT, PREVIOUS, LAST, OFFSET = "n", "p", "l", "o"
+
+
+def count_mode():
+    mode = getattr(settings, "PAGINATION_COUNT", "cached")
+    return mode if mode in COUNT_MODES else "cached"
+
+
+def count_timeout():
+    return getattr(settings, "PAGINATION_COUNT_TIMEOUT", 300)
+
+
+# ==========================
+# CURSORS
+# ==========================
+
+
+def _dump_value(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(payload):
+    return signing.dumps(payload, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    """The cursor's payload, or None if it is missing, tampered with or from another deployment."""
+    if not cursor:
+        return None
+    try:
+        payload = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+# ==========================
+# ORDERING
+# ==========================
+
+
+def keyset_ordering(queryset):
+    """
+    The queryset's ordering as ``[(field, descending), ...]`` ending with the pk.
+
+    Returns None when some ordering term is not a plain field of the model
+    (expressions, related lookups, random order), i.e. the queryset cannot be
+    paged by seeking.
+    """
+    query = queryset.query
+    terms = list(query.order_by) or (
+        list(queryset.model._meta.ordering) if query.default_ordering else []
+    )
+    opts = queryset.model._meta
+    pk_name = opts.pk.name
+    ordering = []
+    for term in terms:
+        if not isinstance(term, str) or term == "?":
+            return None
+        descending = term.startswith("-")
+        name = term.lstrip("-+")
+        if name == "pk":
+            name = pk_name
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.is_relation or field.null:
+            return None
+        ordering.append((field, descending))
+        if field.primary_key:
+            return ordering
+    # Ties on the ordering columns are broken by the pk, in the same direction
+    # as the last column so (date DESC, pk DESC) can use one index.
+    ordering.append((opts.pk, ordering[-1][1] if ordering else False))
+    return ordering
+
+
+def order_by_terms(ordering, reverse=False):
+    return [
+        ("-" if descending != reverse else "") + field.attname for field, descending in ordering
+    ]
+
+
+def seek_filter(ordering, values, forward=True):
+    """
+    Rows strictly after ``values`` in ``ordering`` (or before, with ``forward=False``).
+
+    Built as ``a < x OR (a = x AND b < y) OR ...`` with an extra ``a <= x``
+    bound on the leading column so the database can range-scan its index.
+    """
+    condition = Q()
+    equal = {}
+    for (field, descending), value in zip(ordering, values):
+        lookup = "lt" if descending == forward else "gt"
+        condition |= Q(**equal, **{f"{field.attname}__{lookup}": value})
+        equal[field.attname] = value
+    leading, descending = ordering[0]
+    bound = "lte" if descending == forward else "gte"
+    return Q(**{f"{leading.attname}__{bound}": values[0]}) & condition
+
+
+# ==========================
+# COUNTS
+# ==========================
+
+
+def _approximate_table_count(queryset):
+    """Row count from the database's table statistics, or None where there are none."""
+    if queryset.query.where:
+        return None
+    table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    if connection.vendor == "microsoft":
+        sql = (
+            "SELECT SUM(rows) FROM sys.partitions "
+            "WHERE object_id = OBJECT_ID(%s) AND index_id IN (0, 1)"
+        )
+    elif connection.vendor == "postgresql":
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass"
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    # reltuples is -1 for a table that was never analyzed
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def _cached_count(queryset):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha1(f"{queryset.db}:{sql}:{params!r}".encode()).hexdigest()
+    key = f"pagination:count:{digest}"
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, count_timeout())
+    return count
+
+
+def total_count(queryset, mode=None):
+    """
+    Total rows of ``queryset`` for the "Page N of M" label.
+
+    Returns:
+        tuple: (count or None, approximate)
+    """
+    mode = mode or count_mode()
+    if mode == "none":
+        return None, False
+    if queryset.query.is_empty():
+        return 0, False
+    if mode == "exact":
+        return queryset.count(), False
+    if mode == "approximate":
+        estimate = _approximate_table_count(queryset)
+        if estimate is not None:
+            return estimate, True
+    return _cached_count(queryset), False
+
+
+# ==========================
+# PAGINATOR
+# ==========================
+
+
+class KeysetPaginator:
+    """
+    Cursor paginator over ``queryset``; see the module docstring.
+
+    Exposes the parts of Django's ``Paginator`` the templates use
+    (``count``, ``num_pages``, ``per_page``); ``count`` and ``num_pages`` are
+    None when totals are switched off.
+    """
+
+    def __init__(self, queryset, per_page, count_mode=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.count_mode = count_mode
+        self.ordering = keyset_ordering(queryset)
+        self.count = None
+        self.approximate = False
+
+    @property
+    def keyed(self):
+        return self.ordering is not None
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def _values(self, obj):
+        return [_dump_value(getattr(obj, field.attname)) for field, _ in self.ordering]
+
+    def _parse(self, values):
+        return [field.to_python(value) for (field, _), value in zip(self.ordering, values)]
+
+    def page(self, cursor=None):
+        """The page ``cursor`` points at (the first page when it is missing or invalid)."""
+        payload = decode_cursor(cursor) or {}
+        direction = payload.get("d")
+        if "c" in payload:
+            self.count, self.approximate = payload["c"], payload.get("a", False)
+        else:
+            self.count, self.approximate = total_count(self.queryset, self.count_mode)
+
+        if not self.keyed:
+            number = payload.get("p", 1) if direction == OFFSET else 1
+            return self._offset_page(number)
+        if direction in (NEXT, PREVIOUS) and len(payload.get("k") or ()) == len(self.ordering):
+            try:
+                values = self._parse(payload["k"])
+            except (ValidationError, TypeError, ValueError):
+                values = None
+            if values is not None:
+                return self._seek_page(values, direction == NEXT, payload.get("p", 1))
+        if direction == LAST and self.count is not None:
+            return self._last_page()
+        return self._first_page()
+
+    def _fetch(self, queryset, size):
+        rows = list(queryset[: size + 1])
+        return rows[:size], len(rows) > size
+
+    def _first_page(self):
+        rows, more = self._fetch(
+            self.queryset.order_by(*order_by_terms(self.ordering)), self.per_page
+        )
+        return KeysetPage(rows, 1, self, has_next=more, has_previous=False)
+
+    def _seek_page(self, values, forward, number):
+        queryset = self.queryset.filter(seek_filter(self.ordering, values, forward))
+        if forward:
+            rows, more = self._fetch(
+                queryset.order_by(*order_by_terms(self.ordering)), self.per_page
+            )
+            return KeysetPage(rows, number, self, has_next=more, has_previous=True)
+        rows, more = self._fetch(
+            queryset.order_by(*order_by_terms(self.ordering, reverse=True)), self.per_page
+        )
+        rows.reverse()
+        if not more:
+            # Rows were deleted above us since the cursor was made: this is the first page now
+            return self._first_page()
+        return KeysetPage(rows, max(number, 2), self, has_next=True, has_previous=True)
+
+    def _last_page(self):
+        # Same rows as the last OFFSET page would show, so page numbers line up
+        size = self.count - (self.num_pages - 1) * self.per_page or self.per_page
+        rows, more = self._fetch(
+            self.queryset.order_by(*order_by_terms(self.ordering, reverse=True)), size
+        )
+        rows.reverse()
+        return KeysetPage(
+            rows, self.num_pages if more else 1, self, has_next=False, has_previous=more
+        )
+
+    def _offset_page(self, number):
+        number = max(1, int(number))
+        if self.num_pages is not None:
+            number = min(number, self.num_pages)
+        offset = (number - 1) * self.per_page
+        rows, more = self._fetch(self.queryset[offset:], self.per_page)
+        return KeysetPage(rows, number, self, has_next=more, has_previous=number > 1)
+
+    def cursor(self, direction, row=None, number=None):
+        payload = {"d": direction}
+        if row is not None:
+            payload["k"] = self._values(row)
+        if number is not None:
+            payload["p"] = number
+        if self.count is not None:
+            payload["c"] = self.count
+            if self.approximate:
+                payload["a"] = True
+        return encode_cursor(payload)
+
+
+class KeysetPage:
+    """
+    One page of a ``KeysetPaginator``.
+
+    Behaves like Django's ``Page`` in templates (iteration, ``number``,
+    ``has_next``, ``start_index``...) and adds the cursors and ready-made
+    ``?...`` links that keep the current filters.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.query = None
+
+    def __repr__(self):
+        return f"<Page {self.number}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1 if self.object_list else 0
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        if not self.paginator.keyed:
+            return self.paginator.cursor(OFFSET, number=self.number + 1)
+        return self.paginator.cursor(NEXT, self.object_list[-1], self.number + 1)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        if not self.paginator.keyed:
+            return self.paginator.cursor(OFFSET, number=self.number - 1)
+        return self.paginator.cursor(PREVIOUS, self.object_list[0], self.number - 1)
+
+    @property
+    def last_cursor(self):
+        if self.paginator.count is None:
+            return None
+        if not self.paginator.keyed:
+            return self.paginator.cursor(OFFSET, number=self.paginator.num_pages)
+        return self.paginator.cursor(LAST)
+
+    def url(self, cursor):
+        """``?query`` for ``cursor`` with the request's other parameters kept."""
+        query = self.query.copy() if self.query is not None else None
+        if query is None:
+            return f"?cursor={cursor}" if cursor else "?"
+        query.pop("page", None)
+        query.pop("cursor", None)
+        if cursor:
+            query["cursor"] = cursor
+        return f"?{query.urlencode()}"
+
+    @property
+    def first_url(self):
+        return self.url(None)
+
+    @property
+    def next_url(self):
+        return self.url(self.next_cursor) if self._has_next else None
+
+    @property
+    def previous_url(self):
+        if not self._has_previous:
+            return None
+        # Going back to page 1 by cursor would work too, but the plain URL is cacheable
+        return self.first_url if self.number == 2 else self.url(self.previous_cursor)
+
+    @property
+    def last_url(self):
+        cursor = self.last_cursor
+        return self.url(cursor) if cursor and self._has_next else None
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin: page ``get_queryset()`` with a ``KeysetPaginator``.
+
+    The cursor is read from ``?cursor=``; ``paginate_by`` still sets the page
+    size. ``page_obj`` offers ``first_url``, ``previous_url``, ``next_url``
+    and ``last_url`` for the template's links.
+    """
+
+    paginator_class = KeysetPaginator
+    cursor_kwarg = "cursor"
+    count_mode = None  # None -> settings.PAGINATION_COUNT
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = self.paginator_class(queryset, page_size, count_mode=self.count_mode)
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        page.query = self.request.GET
+        return paginator, page, page.object_list, page.has_other_pages()
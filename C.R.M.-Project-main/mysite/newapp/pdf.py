@@ -0,0 +1,190 @@
+"""
+Minimal PDF writer for the rendered documents (newapp.documents).
+
+Text in the standard Helvetica fonts, lines and shaded boxes on A4 pages:
+enough for a quotation or an order, without a PDF package. The standard
+fonts are built into every PDF viewer, so nothing is embedded and a page is
+a few KB. Text is encoded as WinAnsi (cp1252); other characters print as '?'.
+
+Coordinates are in points from the *top* left corner of the page, which is
+how a document is laid out; the writer flips them to PDF's bottom-left origin.
+"""
+
+import zlib
+
+A4 = (595.28, 841.89)
+
+# Advance widths (1/1000 em) of the printable ASCII characters, from the Helvetica AFM files
+# fmt: off
+_REGULAR = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+# fmt: on
+# Anything outside printable ASCII is measured as a digit
+_DEFAULT_WIDTH = 556
+
+FONTS = {False: b"/F1", True: b"/F2"}
+
+
+def text_width(text, size, bold=False):
+    widths = _BOLD if bold else _REGULAR
+    total = 0
+    for char in text:
+        code = ord(char) - 32
+        total += widths[code] if 0 <= code < len(widths) else _DEFAULT_WIDTH
+    return total * size / 1000
+
+
+def wrap(text, width, size, bold=False):
+    """Split ``text`` into lines no wider than ``width`` at spaces (or inside over-long words)."""
+    lines = []
+    for paragraph in str(text or "").splitlines() or [""]:
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if text_width(candidate, size, bold) <= width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            while text_width(word, size, bold) > width:
+                cut = len(word) - 1
+                while cut > 1 and text_width(word[:cut], size, bold) > width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+            line = word
+        lines.append(line)
+    return lines
+
+
+def _escape(text):
+    data = str(text).encode("cp1252", errors="replace")
+    data = bytes(byte for byte in data if byte >= 32)
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _number(value):
+    return f"{value:.2f}".rstrip("0").rstrip(".").encode("ascii")
+
+
+class Canvas:
+    """Pages of drawing operations, written out by ``output()``."""
+
+    def __init__(self, page_size=A4, title=""):
+        self.width, self.height = page_size
+        self.title = title
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.pages.append([])
+        return len(self.pages) - 1
+
+    def _ops(self, page):
+        return self.pages[-1 if page is None else page]
+
+    def text(self, x, y, text, size=9, bold=False, align="left", gray=0, page=None):
+        """Draw one line of ``text`` with its baseline ``y`` points below the top edge."""
+        text = str(text)
+        if align == "right":
+            x -= text_width(text, size, bold)
+        elif align == "center":
+            x -= text_width(text, size, bold) / 2
+        self._ops(page).append(
+            b"BT %s %s Tf %s g %s %s Td (%s) Tj ET"
+            % (
+                FONTS[bool(bold)],
+                _number(size),
+                _number(gray),
+                _number(x),
+                _number(self.height - y),
+                _escape(text),
+            )
+        )
+
+    def line(self, x1, y1, x2, y2, width=0.5, gray=0.6, page=None):
+        self._ops(page).append(
+            b"%s w %s G %s %s m %s %s l S"
+            % (
+                _number(width),
+                _number(gray),
+                _number(x1),
+                _number(self.height - y1),
+                _number(x2),
+                _number(self.height - y2),
+            )
+        )
+
+    def box(self, x, y, width, height, gray=0.93, page=None):
+        """Filled rectangle with its top left corner at (x, y)."""
+        self._ops(page).append(
+            b"%s g %s %s %s %s re f"
+            % (
+                _number(gray),
+                _number(x),
+                _number(self.height - y - height),
+                _number(width),
+                _number(height),
+            )
+        )
+
+    def output(self):
+        """The document as PDF bytes; the same drawing always gives the same bytes."""
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            None,  # the page tree, once the page objects are numbered
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold "
+            b"/Encoding /WinAnsiEncoding >>",
+            b"<< /Producer (CRM) /Title (%s) >>" % _escape(self.title),
+        ]
+        page_ids = []
+        for ops in self.pages:
+            stream = zlib.compress(b"\n".join(ops), 6)
+            objects.append(
+                b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream"
+                % (len(stream), stream)
+            )
+            objects.append(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %s %s] /Contents %d 0 R "
+                b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>"
+                % (
+                    _number(self.width),
+                    _number(self.height),
+                    len(objects),
+                )
+            )
+            page_ids.append(len(objects))
+        objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            b" ".join(b"%d 0 R" % number for number in page_ids),
+            len(page_ids),
+        )
+
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        for offset in offsets:
+            out += b"%010d 00000 n \n" % offset
+        out += b"trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(objects) + 1,
+            xref,
+        )
+        return bytes(out)
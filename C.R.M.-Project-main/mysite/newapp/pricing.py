@@ -0,0 +1,159 @@
+"""
+Line-item pricing for quotations, sales orders and service calls.
+
+One engine prices every kind of line (QuotationItem, SalesOrderItem,
+ServiceCallItem) and derives the document totals from those lines in memory.
+``save_lines()`` persists an edited item formset with set-based writes: lines
+are numbered and priced in Python, then written with one bulk_create, one
+bulk_update and one DELETE, followed by a single header update from
+``apply_totals()``. The per-item ``save()`` methods use the same engine, so a
+line saved on its own (admin, shell) gets identical amounts.
+"""
+
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+
+CENT = Decimal("0.01")
+HUNDRED = Decimal("100")
+ZERO = Decimal("0")
+
+LINE_AMOUNT_FIELDS = ("line_total", "tax_amount")
+HEADER_TOTAL_FIELDS = ("subtotal", "discount_amount", "tax_amount", "net_amount")
+
+
+@dataclass(frozen=True)
+class LineAmounts:
+    gross: Decimal  # quantity x unit price (+ labour)
+    discount: Decimal
+    taxable: Decimal
+    tax: Decimal
+    total: Decimal  # taxable + tax
+
+
+def _dec(value):
+    if value in (None, ""):
+        return ZERO
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _money(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _field_names(model):
+    return {field.name for field in model._meta.concrete_fields}
+
+
+def price_line(item):
+    """Amounts for one line; labour and line discount are used when the model has them."""
+    gross = _dec(item.quantity) * _dec(item.unit_price)
+    gross += _dec(getattr(item, "labour_hours", None)) * _dec(getattr(item, "labour_rate", None))
+    discount = gross * _dec(getattr(item, "discount_percentage", None)) / HUNDRED
+    taxable = gross - discount
+    tax = taxable * _dec(item.tax_percentage) / HUNDRED
+    return LineAmounts(
+        gross=_money(gross),
+        discount=_money(discount),
+        taxable=_money(taxable),
+        tax=_money(tax),
+        total=_money(taxable + tax),
+    )
+
+
+def apply_line(item):
+    """Set the calculated amount fields on ``item`` (not saved). Returns the amounts."""
+    amounts = price_line(item)
+    item.line_total = amounts.total
+    if "tax_amount" in _field_names(type(item)):
+        item.tax_amount = amounts.tax
+    return amounts
+
+
+def document_totals(document, items):
+    """
+    Header totals for a document from its lines, without touching the database.
+
+    Same formula as the original ``calculate_totals()``: the subtotal is the sum
+    of line totals, the header discount applies to it, and the header tax and
+    freight are added on top.
+    """
+    lines = [price_line(item) for item in items]
+    subtotal = sum((line.total for line in lines), ZERO)
+    discount_amount = _money(
+        subtotal * _dec(getattr(document, "discount_percentage", None)) / HUNDRED
+    )
+    tax_amount = sum((line.tax for line in lines), ZERO)
+    net_amount = (
+        subtotal - discount_amount + tax_amount + _dec(getattr(document, "freight_charges", None))
+    )
+    return {
+        "subtotal": subtotal,
+        "discount_amount": discount_amount,
+        "tax_amount": tax_amount,
+        "net_amount": net_amount,
+    }
+
+
+def apply_totals(document, items, save=True):
+    """
+    Set the header totals of ``document`` from ``items`` and save only what changed.
+
+    The header is written with ``save(update_fields=...)`` so signal handlers
+    (reporting rollups) still see the change. Documents without total columns
+    (service calls) just get the totals returned.
+    """
+    totals = document_totals(document, items)
+    fields = [name for name in HEADER_TOTAL_FIELDS if name in _field_names(type(document))]
+    changed = [name for name in fields if _dec(getattr(document, name)) != totals[name]]
+    for name in fields:
+        setattr(document, name, totals[name])
+    if save and changed and document.pk:
+        document.save(update_fields=changed + ["updated_at"])
+    return totals
+
+
+def save_lines(formset):
+    """
+    Save a validated inline item formset with set-based writes.
+
+    Kept lines are renumbered in form order and priced in memory; new lines
+    are inserted with one bulk_create, existing lines whose fields, number or
+    amounts changed are written with one bulk_update, and removed lines are
+    deleted with one query.
+
+    Returns:
+        list: The document's lines in display order, with amounts filled in
+    """
+    model = formset.model
+    amount_fields = [name for name in LINE_AMOUNT_FIELDS if name in _field_names(model)]
+    formset.save(commit=False)
+    new_objects = {id(obj) for obj in formset.new_objects}
+    changed_fields = {id(obj): fields for obj, fields in formset.changed_objects}
+    deleted = set(formset.deleted_forms)
+
+    lines, to_create, to_update = [], [], []
+    update_fields = {"line_number", *amount_fields}
+    for form in formset.forms:
+        obj = form.instance
+        if form in deleted or (obj.pk is None and id(obj) not in new_objects):
+            continue
+        before = (obj.line_number, *(getattr(obj, name) for name in amount_fields))
+        obj.line_number = len(lines) + 1
+        apply_line(obj)
+        lines.append(obj)
+
+        if id(obj) in new_objects:
+            to_create.append(obj)
+        elif id(obj) in changed_fields:
+            update_fields.update(changed_fields[id(obj)])
+            to_update.append(obj)
+        elif before != (obj.line_number, *(getattr(obj, name) for name in amount_fields)):
+            to_update.append(obj)
+
+    if formset.deleted_objects:
+        model._default_manager.filter(pk__in=[obj.pk for obj in formset.deleted_objects]).delete()
+    if to_update:
+        model._default_manager.bulk_update(to_update, sorted(update_fields))
+    if to_create:
+        model._default_manager.bulk_create(to_create)
+    return lines
@@ -0,0 +1,244 @@
+"""
+N+1 query detection and query budgets.
+
+A lazy foreign key read in a loop (``{{ visit.prospect.name }}`` in a list
+template, ``obj.employees.count()`` in an admin column, a ``__str__`` that
+walks ``sales_employee.user``) runs the same SQL once per row. Django passes
+SQL to the database with placeholders, so those queries share one *shape*;
+``QueryShapeTracker`` counts shapes and, when one repeats
+``QUERY_SHAPE_THRESHOLD`` times, records where it came from: the innermost
+frame in project code and, if the query ran while rendering, the template
+line.
+
+- ``QueryShapeMiddleware`` checks every request in development
+  (``QUERY_SHAPE_DETECTION = 'log'`` logs to ``newapp.querybudget``,
+  ``'raise'`` fails the request).
+- ``assert_max_queries()`` is the test helper: a block may run at most N
+  queries, and the failure message lists the queries and repeated shapes
+  with their call sites.
+"""
+
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger("newapp.querybudget")
+
+# "IN (%s, %s, %s)" and "VALUES (%s, %s), (%s, %s)" have the same shape whatever their length
+_PLACEHOLDER_LIST = re.compile(r"%s(?:\s*,\s*%s)+")
+_VALUES_LIST = re.compile(r"(\([^()]*\))(?:\s*,\s*\1)+")
+_SAVEPOINT = re.compile(r"^(?:SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def default_threshold():
+    return getattr(settings, "QUERY_SHAPE_THRESHOLD", 5)
+
+
+def query_shape(sql):
+    """``sql`` with placeholder lists collapsed, or None for statements never worth reporting."""
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    if _SAVEPOINT.match(sql):
+        return None
+    sql = _PLACEHOLDER_LIST.sub("%s, ...", sql)
+    return _VALUES_LIST.sub(r"\1, ...", sql)
+
+
+def _is_project_file(filename):
+    # Test modules are where a query is triggered, not where it is caused
+    filename = os.path.abspath(filename)
+    return (
+        filename.startswith(str(settings.BASE_DIR))
+        and filename != _THIS_FILE
+        and "site-packages" not in filename
+        and os.sep + "tests" not in filename
+    )
+
+
+def call_site():
+    """Where the running query comes from: ``'<file>:<line> in <function>'`` and template line."""
+    code_site = template_site = None
+    frame = sys._getframe(1)
+    while frame is not None and not (code_site and template_site):
+        code = frame.f_code
+        if code_site is None and _is_project_file(code.co_filename):
+            path = os.path.relpath(code.co_filename, settings.BASE_DIR)
+            code_site = f"{path}:{frame.f_lineno} in {code.co_name}"
+        if template_site is None and code.co_name == "render_annotated":
+            node = frame.f_locals.get("self")
+            origin = getattr(node, "origin", None)
+            token = getattr(node, "token", None)
+            if origin is not None and token is not None:
+                template_site = f"template {origin.template_name}:{token.lineno}"
+        frame = frame.f_back
+    return ", ".join(site for site in (code_site, template_site) if site) or "unknown"
+
+
+class RepeatedQuery:
+    def __init__(self, shape, count, site):
+        self.shape = shape
+        self.count = count
+        self.site = site
+
+    def __str__(self):
+        return f"{self.count}x from {self.site}: {self.shape}"
+
+
+class QueryShapeTracker:
+    """``connection.execute_wrapper`` counting query shapes; see the module docstring."""
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold or default_threshold()
+        self.counts = Counter()
+        self.sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = query_shape(sql)
+        if shape is not None:
+            self.counts[shape] += 1
+            if self.counts[shape] == self.threshold:
+                self.sites[shape] = call_site()
+        return execute(sql, params, many, context)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def repeated(self):
+        """Shapes run at least ``threshold`` times, most frequent first."""
+        return [
+            RepeatedQuery(shape, self.counts[shape], site)
+            for shape, site in sorted(self.sites.items(), key=lambda item: -self.counts[item[0]])
+        ]
+
+
+@contextmanager
+def track_query_shapes(threshold=None, using=None):
+    """Count query shapes on one database alias (every alias by default) while the block runs."""
+    tracker = QueryShapeTracker(threshold)
+    with ExitStack() as stack:
+        for connection in ([connections[using]] if using else connections.all()):
+            stack.enter_context(connection.execute_wrapper(tracker))
+        yield tracker
+
+
+class RepeatedQueriesError(Exception):
+    pass
+
+
+def report(repeated, where):
+    return f"{len(repeated)} repeated query shape(s) in {where}:\n" + "\n".join(
+        f"  {item}" for item in repeated
+    )
+
+
+# ==========================
+# MIDDLEWARE
+# ==========================
+
+
+class QueryShapeMiddleware:
+    """
+    Report N+1 query patterns per request (settings.QUERY_SHAPE_DETECTION: off / log /
+    raise). Sync and async.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.mode = getattr(settings, "QUERY_SHAPE_DETECTION", "off")
+        if self.mode not in ("log", "raise"):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with track_query_shapes() as tracker:
+            response = self.get_response(request)
+        self.check(request, tracker)
+        return response
+
+    async def __acall__(self, request):
+        stack = ExitStack()
+        try:
+            # The ORM calls of an async request all run in one thread of their own (sync_to_async)
+            tracker = await sync_to_async(stack.enter_context)(track_query_shapes())
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.check(request, tracker)
+        return response
+
+    def check(self, request, tracker):
+        repeated = tracker.repeated()
+        if repeated:
+            message = report(repeated, f"{request.method} {request.path}")
+            if self.mode == "raise":
+                raise RepeatedQueriesError(message)
+            logger.warning(message)
+
+
+# ==========================
+# TEST HELPERS
+# ==========================
+
+
+@contextmanager
+def assert_max_queries(max_queries, using=DEFAULT_DB_ALIAS, repeat_threshold=None):
+    """
+    Fail if the block runs more than ``max_queries`` queries.
+
+    Savepoints are not counted: they come from the test's own transaction.
+
+    Args:
+        max_queries (int): Query budget of the block
+        using (str): Database alias to count
+        repeat_threshold (int): Also fail when one query shape runs this many
+            times (an N+1 pattern), even within the budget
+
+    Usage::
+
+        with assert_max_queries(8):
+            self.client.get(reverse('newapp:lead_list'))
+    """
+    from django.test.utils import CaptureQueriesContext
+
+    connection = connections[using]
+    with (
+        CaptureQueriesContext(connection) as captured,
+        track_query_shapes(repeat_threshold or default_threshold(), using=using) as tracker,
+    ):
+        yield captured
+
+    queries = [
+        query["sql"] for query in captured.captured_queries if query_shape(query["sql"]) is not None
+    ]
+    executed = len(queries)
+    repeated = tracker.repeated() if repeat_threshold else []
+    if executed <= max_queries and not repeated:
+        return
+
+    lines = []
+    if executed > max_queries:
+        lines.append(f"{executed} queries executed, budget is {max_queries}.")
+    repeated = repeated or tracker.repeated()
+    if repeated:
+        lines.append(report(repeated, "this block"))
+    lines.append("Queries:")
+    lines.extend(f"  {number}. {sql}" for number, sql in enumerate(queries, 1))
+    raise AssertionError("\n".join(lines))
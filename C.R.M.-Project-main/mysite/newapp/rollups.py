@@ -0,0 +1,373 @@
+"""
+Daily rollups for visits, prospects and sales orders.
+
+``DailyRollup`` keeps one counter row per metric x day x employee x region x
+status, plus a value sum for orders. Rows are adjusted by signal handlers as
+facts are saved or deleted, so reports and dashboards aggregate a few hundred
+rollup rows instead of scanning the fact tables. An employee's rows move to
+their new region when ``SalesEmployee.region`` changes.
+
+Bulk writes (``QuerySet.update``, ``bulk_create``) bypass signals; callers
+doing bulk writes use ``update()`` or ``apply_created()``, or run
+``manage.py rebuild_rollups``.
+"""
+
+import datetime
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.apps import apps as django_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+KEY_FIELDS = ("metric", "day", "sales_employee_id", "region", "status")
+
+
+@dataclass(frozen=True)
+class Fact:
+    """A fact table and the rollup metrics it feeds."""
+
+    model: str
+    day_field: str
+    employee_field: str
+    facets: tuple
+    amount_field: str = None
+
+    def get_model(self, apps=django_apps):
+        return apps.get_model("newapp", self.model)
+
+    @property
+    def fields(self):
+        fields = [self.day_field, f"{self.employee_field}_id"] + [field for _, field in self.facets]
+        if self.amount_field:
+            fields.append(self.amount_field)
+        return fields
+
+
+FACTS = {
+    "visits": Fact(
+        "VisitLog",
+        "visit_date",
+        "sales_employee",
+        (
+            ("visit_status", "status"),
+            ("visit_approval", "approval_status"),
+            ("visit_outcome", "outcome_type"),
+        ),
+    ),
+    "prospects": Fact(
+        "ProspectCustomer", "created_at", "assigned_to", (("prospect_status", "status"),)
+    ),
+    "orders": Fact(
+        "SalesOrder",
+        "order_date",
+        "assigned_to",
+        (("order_status", "status"),),
+        amount_field="net_amount",
+    ),
+}
+
+
+# ==========================
+# INCREMENTAL MAINTENANCE
+# ==========================
+
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    return value
+
+
+def _region(employee_id):
+    if employee_id is None:
+        return ""
+    from .models import SalesEmployee
+
+    return (
+        SalesEmployee.objects.filter(pk=employee_id).values_list("region", flat=True).first() or ""
+    )
+
+
+def _cached_region(fact, instance):
+    """Region of the instance's employee if it is already loaded, else None."""
+    field = instance._meta.get_field(fact.employee_field)
+    if not field.is_cached(instance):
+        return None
+    employee = field.get_cached_value(instance)
+    return (employee.region or "") if employee else ""
+
+
+def _keys(fact, row, sign=1, region=None):
+    """Rollup deltas contributed by one fact row: {key: [count, amount]}."""
+    deltas = {}
+    day = _as_date(row[fact.day_field])
+    if day is None:
+        return deltas
+    employee_id = row[f"{fact.employee_field}_id"]
+    if region is None:
+        region = _region(employee_id)
+    amount = Decimal(row[fact.amount_field] or 0) if fact.amount_field else Decimal("0")
+    for metric, field in fact.facets:
+        key = (metric, day, employee_id, region, row[field] or "")
+        deltas[key] = [sign, sign * amount]
+    return deltas
+
+
+def _merge(*delta_sets):
+    merged = defaultdict(lambda: [0, Decimal("0")])
+    for deltas in delta_sets:
+        for key, (count, amount) in deltas.items():
+            merged[key][0] += count
+            merged[key][1] += amount
+    return {key: value for key, value in merged.items() if value[0] or value[1]}
+
+
+def apply_deltas(deltas):
+    """Add counter/amount deltas to their rollup rows, creating rows as needed."""
+    from .models import DailyRollup
+
+    for key, (count, amount) in deltas.items():
+        rows = DailyRollup.objects.filter(**dict(zip(KEY_FIELDS, key)))
+        if rows.update(count=F("count") + count, amount=F("amount") + amount):
+            continue
+        try:
+            with transaction.atomic():
+                DailyRollup.objects.create(count=count, amount=amount, **dict(zip(KEY_FIELDS, key)))
+        except IntegrityError:
+            rows.update(count=F("count") + count, amount=F("amount") + amount)
+
+
+def apply_created(fact_name, instances):
+    """Count rows inserted with bulk_create (which sends no signals)."""
+    from .models import SalesEmployee
+
+    fact = FACTS[fact_name]
+    employee_field = f"{fact.employee_field}_id"
+    rows = [{field: getattr(obj, field) for field in fact.fields} for obj in instances]
+    employee_ids = {row[employee_field] for row in rows if row[employee_field] is not None}
+    regions = dict(SalesEmployee.objects.filter(pk__in=employee_ids).values_list("pk", "region"))
+    apply_deltas(
+        _merge(*[_keys(fact, row, region=regions.get(row[employee_field]) or "") for row in rows])
+    )
+
+
+def update(queryset, batch_size=1000, **changes):
+    """
+    ``queryset.update(**changes)`` that keeps the rollups current (a bulk update sends no
+    signals). The selected rows are locked and read before and after the update, and the
+    difference is applied in the same transaction. Returns the number of rows updated.
+    """
+    from .models import SalesEmployee
+
+    fact = _fact_for(queryset.model)
+    if fact is None:
+        return queryset.update(**changes)
+    employee_field = f"{fact.employee_field}_id"
+    updated = 0
+    with transaction.atomic():
+        pks = list(queryset.values_list("pk", flat=True))
+        for start in range(0, len(pks), batch_size):
+            rows = queryset.model._default_manager.filter(pk__in=pks[start : start + batch_size])
+            before = list(rows.select_for_update().values(*fact.fields))
+            updated += rows.update(**changes)
+            after = list(rows.values(*fact.fields))
+            employee_ids = {
+                row[employee_field] for row in before + after if row[employee_field] is not None
+            }
+            regions = dict(
+                SalesEmployee.objects.filter(pk__in=employee_ids).values_list("pk", "region")
+            )
+            apply_deltas(
+                _merge(
+                    *[
+                        _keys(fact, row, sign=-1, region=regions.get(row[employee_field]) or "")
+                        for row in before
+                    ],
+                    *[
+                        _keys(fact, row, region=regions.get(row[employee_field]) or "")
+                        for row in after
+                    ],
+                )
+            )
+    return updated
+
+
+def _fact_for(sender):
+    for fact in FACTS.values():
+        if sender._meta.app_label == "newapp" and sender.__name__ == fact.model:
+            return fact
+    return None
+
+
+def _snapshot(sender, instance, **kwargs):
+    fact = _fact_for(sender)
+    if fact is None or kwargs.get("raw"):
+        return
+    old = None
+    if instance.pk:
+        old = sender._default_manager.filter(pk=instance.pk).values(*fact.fields).first()
+    if not old:
+        instance._rollup_old = {}
+        instance._rollup_old_employee_id = None
+        return
+    employee_field = f"{fact.employee_field}_id"
+    instance._rollup_old_employee_id = old[employee_field]
+    region = (
+        _cached_region(fact, instance)
+        if old[employee_field] == getattr(instance, employee_field)
+        else None
+    )
+    instance._rollup_old = _keys(fact, old, sign=-1, region=region)
+
+
+def _on_save(sender, instance, **kwargs):
+    fact = _fact_for(sender)
+    if fact is None or kwargs.get("raw"):
+        return
+    row = {field: getattr(instance, field) for field in fact.fields}
+    new = _keys(fact, row, region=_cached_region(fact, instance))
+    apply_deltas(_merge(getattr(instance, "_rollup_old", {}), new))
+    instance._rollup_old = {}
+
+
+def _on_delete(sender, instance, **kwargs):
+    fact = _fact_for(sender)
+    if fact is None:
+        return
+    row = {field: getattr(instance, field) for field in fact.fields}
+    apply_deltas(_keys(fact, row, sign=-1, region=_cached_region(fact, instance)))
+
+
+def _on_employee_save(sender, instance, created=False, update_fields=None, **kwargs):
+    """Move the employee's rollup rows to their new region when it changes."""
+    if created or kwargs.get("raw"):
+        return
+    if update_fields is not None and "region" not in update_fields:
+        return
+    from .models import DailyRollup
+
+    region = instance.region or ""
+    stale = DailyRollup.objects.filter(sales_employee_id=instance.pk).exclude(region=region)
+    with transaction.atomic():
+        rows = list(stale.select_for_update().values(*KEY_FIELDS, "count", "amount"))
+        if not rows:
+            return
+        stale.delete()
+        moved = []
+        for row in rows:
+            key = (row["metric"], row["day"], instance.pk, region, row["status"])
+            moved.append({key: [row["count"], row["amount"]]})
+        apply_deltas(_merge(*moved))
+
+
+def connect_signals():
+    from .models import SalesEmployee
+
+    post_save.connect(
+        _on_employee_save, sender=SalesEmployee, dispatch_uid="rollups_SalesEmployee_post_save"
+    )
+    for fact in FACTS.values():
+        model = fact.get_model()
+        uid = f"rollups_{fact.model}"
+        pre_save.connect(_snapshot, sender=model, dispatch_uid=f"{uid}_pre_save")
+        post_save.connect(_on_save, sender=model, dispatch_uid=f"{uid}_post_save")
+        post_delete.connect(_on_delete, sender=model, dispatch_uid=f"{uid}_post_delete")
+
+
+# ==========================
+# FULL REBUILD
+# ==========================
+
+
+def rebuild(fact_names=None, apps=django_apps, batch_size=1000):
+    """
+    Recompute rollups from the fact tables with one GROUP BY query per metric.
+
+    Args:
+        fact_names (list): Keys of FACTS to rebuild; all when omitted
+        apps: App registry (the historical one when called from a migration)
+        batch_size (int): Rows per bulk insert
+
+    Returns:
+        dict: Number of rollup rows written per metric
+    """
+    DailyRollup = apps.get_model("newapp", "DailyRollup")
+    written = {}
+
+    for name in fact_names or FACTS:
+        fact = FACTS[name]
+        model = fact.get_model(apps)
+        day = fact.day_field
+        day_expr = (
+            TruncDate(day)
+            if model._meta.get_field(day).get_internal_type() == "DateTimeField"
+            else F(day)
+        )
+        amount_expr = (
+            Coalesce(Sum(fact.amount_field), Value(Decimal("0")))
+            if fact.amount_field
+            else Value(Decimal("0"))
+        )
+
+        with transaction.atomic():
+            for metric, field in fact.facets:
+                DailyRollup.objects.filter(metric=metric).delete()
+                rows = (
+                    model._default_manager.order_by()
+                    .annotate(rollup_day=day_expr)
+                    .values(
+                        "rollup_day",
+                        f"{fact.employee_field}_id",
+                        f"{fact.employee_field}__region",
+                        field,
+                    )
+                    .annotate(rollup_count=Count("id"), rollup_amount=amount_expr)
+                )
+                batch, total = [], 0
+                for row in rows.iterator():
+                    if row["rollup_day"] is None:
+                        continue
+                    batch.append(
+                        DailyRollup(
+                            metric=metric,
+                            day=row["rollup_day"],
+                            sales_employee_id=row[f"{fact.employee_field}_id"],
+                            region=row[f"{fact.employee_field}__region"] or "",
+                            status=row[field] or "",
+                            count=row["rollup_count"],
+                            amount=row["rollup_amount"],
+                        )
+                    )
+                    if len(batch) >= batch_size:
+                        DailyRollup.objects.bulk_create(batch)
+                        total += len(batch)
+                        batch = []
+                DailyRollup.objects.bulk_create(batch)
+                written[metric] = total + len(batch)
+    return written
+
+
+# ==========================
+# QUERY HELPERS
+# ==========================
+
+
+def rollup_rows(metrics, start_date=None, end_date=None, sales_employee=None):
+    """Rollup rows for the given metrics, optionally limited to a date range and employee."""
+    from .models import DailyRollup
+
+    rows = DailyRollup.objects.filter(metric__in=metrics)
+    if start_date:
+        rows = rows.filter(day__gte=start_date)
+    if end_date:
+        rows = rows.filter(day__lte=end_date)
+    if sales_employee is not None:
+        rows = rows.filter(sales_employee=sales_employee)
+    return rows
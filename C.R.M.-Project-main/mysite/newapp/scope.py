@@ -0,0 +1,233 @@
+"""
+Who a request acts as, and which rows it may see.
+
+``RequestScopeMiddleware`` attaches a lazy ``request.scope``. On first use
+it resolves, once per request:
+
+- the effective user: an admin's ``?view_as_user=<id>`` target, otherwise
+  the signed-in user;
+- that user's ``SalesEmployee`` (and, for service calls, ``Technician``)
+  profile and role;
+- the row scope: admins see every row, employees the rows assigned to them,
+  users without a profile nothing.
+
+Views ask for rows through one API, ``Model.objects.visible_to(scope)``
+(``ScopedQuerySet``), instead of repeating the ``is_staff`` /
+``sales_profile`` / ``view_as_user`` branches, so the user and profile are
+looked up once per request no matter how many querysets or checks use them.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.utils.functional import SimpleLazyObject, cached_property
+
+# Model name -> (lookup from the model to the row's owner, RequestScope profile the owner is)
+SCOPE_FIELDS = {
+    "Lead": ("assigned_to", "employee"),
+    "LeadActivity": ("lead__assigned_to", "employee"),
+    "Quotation": ("assigned_to", "employee"),
+    "SalesOrder": ("assigned_to", "employee"),
+    "VisitLog": ("sales_employee", "employee"),
+    "ServiceCall": ("assigned_technician", "technician"),
+}
+
+APPROVER_ROLES = ("SALES_HEAD", "MANAGER", "ADMIN")
+
+
+def _is_admin(user):
+    return bool(user and (user.is_staff or user.is_superuser))
+
+
+def _profile(user, attr):
+    try:
+        return getattr(user, attr)
+    except ObjectDoesNotExist:
+        return None
+
+
+class RequestScope:
+    """
+    The identity and row scope of one request; see the module docstring.
+
+    ``user`` / ``own_employee`` / ``own_technician`` are always the signed-in
+    user and their profiles (who performs writes and permission checks);
+    ``effective_user`` / ``employee`` / ``technician`` are whom the pages show
+    data for.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.user = request.user
+        self.is_admin = self.user.is_authenticated and _is_admin(self.user)
+
+    @cached_property
+    def viewed_user(self):
+        """The user an admin is viewing as (``?view_as_user=<id>``), or None."""
+        view_as_user_id = self.request.GET.get("view_as_user", "")
+        if (
+            not self.is_admin
+            or not view_as_user_id.isdigit()
+            or int(view_as_user_id) == self.user.pk
+        ):
+            return None
+        return (
+            get_user_model()
+            .objects.select_related("sales_profile")
+            .filter(pk=view_as_user_id)
+            .first()
+        )
+
+    @property
+    def viewing_as(self):
+        """Display name of the viewed user ('' when not viewing as anyone)."""
+        user = self.viewed_user
+        return (user.get_full_name() or user.username) if user else ""
+
+    @property
+    def effective_user(self):
+        return self.viewed_user or self.user
+
+    @property
+    def is_admin_view(self):
+        """An admin looking at everyone's data (not viewing as a specific user)."""
+        return self.is_admin and self.viewed_user is None
+
+    @property
+    def sees_all(self):
+        """Row scope of the effective user covers every row."""
+        return self.user.is_authenticated and _is_admin(self.effective_user)
+
+    @cached_property
+    def own_employee(self):
+        if not self.user.is_authenticated:
+            return None
+        return _profile(self.user, "sales_profile")
+
+    @cached_property
+    def employee(self):
+        if self.viewed_user is None:
+            return self.own_employee
+        return _profile(self.viewed_user, "sales_profile")
+
+    @cached_property
+    def own_technician(self):
+        if not self.user.is_authenticated:
+            return None
+        return _profile(self.user, "technician_profile")
+
+    @cached_property
+    def technician(self):
+        if self.viewed_user is None:
+            return self.own_technician
+        return _profile(self.viewed_user, "technician_profile")
+
+    @property
+    def role(self):
+        return self.employee.role if self.employee else None
+
+    @property
+    def is_approver(self):
+        return bool(self.own_employee and self.own_employee.role in APPROVER_ROLES)
+
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def scope_fields(model):
+        """``(lookup, profile)`` of ``model``'s owner; see ``SCOPE_FIELDS``."""
+        try:
+            return SCOPE_FIELDS[model.__name__]
+        except KeyError:
+            raise ValueError(f"{model.__name__} has no row scope; add it to SCOPE_FIELDS") from None
+
+    def filter(self, queryset):
+        """Rows of ``queryset`` the effective user may see."""
+        if self.sees_all:
+            return queryset
+        return self.owned(queryset)
+
+    def owned(self, queryset):
+        """Rows belonging to the effective user's profile, even for admins (e.g. "my visits")."""
+        lookup, profile = self.scope_fields(queryset.model)
+        owner = getattr(self, profile)
+        if owner is None:
+            return queryset.none()
+        return queryset.filter(**{lookup: owner})
+
+    def can_manage(self, obj):
+        """Whether the signed-in user may act on ``obj``: admins always, employees on their rows."""
+        if self.is_admin:
+            return True
+        lookup, profile = self.scope_fields(type(obj))
+        owner = getattr(self, f"own_{profile}")
+        if owner is None:
+            return False
+        *path, last = lookup.split("__")
+        for name in path:
+            obj = getattr(obj, name)
+        return getattr(obj, f"{last}_id") == owner.pk
+
+
+def get_scope(request):
+    """``request.scope``, resolved here if the middleware did not run (e.g. RequestFactory)."""
+    scope = getattr(request, "scope", None)
+    if scope is None:
+        scope = request.scope = RequestScope(request)
+    return scope
+
+
+async def aget_scope(request):
+    """
+    get_scope() for async views.
+
+    ``login_required`` loads an async view's user with ``request.auser()``,
+    which leaves the lazy ``request.user`` the scope reads unloaded; passing it
+    on saves a second query. Profile lookups (``employee``...) still query the
+    database, so read them inside ``sync_to_async``.
+    """
+    request.user = await request.auser()
+    return get_scope(request)
+
+
+class RequestScopeMiddleware:
+    """Attach a lazy ``request.scope``; requests that never use it pay nothing. Sync and async."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.scope = SimpleLazyObject(lambda: RequestScope(request))
+        # The coroutine of an async get_response is awaited by the caller
+        return self.get_response(request)
+
+
+class ScopedQuerySet(models.QuerySet):
+    """QuerySet (and, via ``as_manager()``, manager) of a model listed in ``SCOPE_FIELDS``."""
+
+    def visible_to(self, scope):
+        return scope.filter(self)
+
+    def owned_by(self, scope):
+        return scope.owned(self)
+
+
+class ScopedQuerysetMixin:
+    """
+    CBV mixin: ``self.scope`` and a ``get_queryset()`` limited to the rows it may see.
+
+    List views that build their own queryset start from
+    ``Model.objects.visible_to(self.scope)``.
+    """
+
+    @property
+    def scope(self):
+        return get_scope(self.request)
+
+    def get_queryset(self):
+        return super().get_queryset().visible_to(self.scope)
@@ -0,0 +1,592 @@
+"""
+Full-text search for prospects, leads, quotations and service calls.
+
+Every searchable row has one ``SearchEntry`` holding its text: a short
+``title`` (numbers and names, ranked higher) and a ``body`` with everything
+searchable. Entries are written by signal handlers as rows are saved or
+deleted, so the index is updated incrementally; bulk writers call
+``index_objects()`` and ``manage.py rebuild_search_index`` rebuilds it all.
+The entry of a deleted row is emptied and stamped ``deleted_at`` rather than
+removed, and cleared out by the next rebuild once it is a day old.
+
+The entries are searched by one of three backends, picked per database:
+
+- SQLite: an FTS5 table over ``SearchEntry`` kept in sync by triggers,
+  ranked with bm25.
+- SQL Server: a full-text index on ``SearchEntry`` queried with
+  CONTAINSTABLE, ranked by RANK. Full-text population is asynchronous, so a
+  saved row shows up in results a few seconds later.
+- Anything else, or when the database has no full-text support: an inverted
+  index held in each process, loaded from ``SearchEntry`` and refreshed
+  incrementally whenever another process reports a change.
+
+Every word of the query must match the start of a word in the entry, so
+``acme 2025`` finds "Acme Traders" / "QT-2025-0012".
+"""
+
+import bisect
+import datetime
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from . import caching
+
+
+@dataclass(frozen=True)
+class SearchSpec:
+    """A searchable model and the fields its entry is built from."""
+
+    model: str
+    title_fields: tuple
+    body_fields: tuple
+    select_related: tuple = ()
+
+    def get_model(self, apps=django_apps):
+        return apps.get_model("newapp", self.model)
+
+
+SPECS = {
+    "prospects": SearchSpec(
+        "ProspectCustomer",
+        title_fields=("customer_id", "name", "company_name"),
+        body_fields=("phone", "email", "city", "industry"),
+    ),
+    "leads": SearchSpec(
+        "Lead",
+        title_fields=("lead_id", "prospect__name", "prospect__company_name", "contact_person"),
+        body_fields=("mobile", "email", "requirement_description"),
+        select_related=("prospect",),
+    ),
+    "quotations": SearchSpec(
+        "Quotation",
+        title_fields=("quote_number", "prospect__name", "prospect__company_name", "contact_person"),
+        body_fields=("reference_number",),
+        select_related=("prospect",),
+    ),
+    "service_calls": SearchSpec(
+        "ServiceCall",
+        title_fields=(
+            "service_number",
+            "customer__name",
+            "customer__company_name",
+            "contact_person",
+        ),
+        body_fields=("service_type", "get_service_type_display", "problem_description"),
+        select_related=("customer",),
+    ),
+}
+
+# Rows that embed the prospect's name: kind -> FK attname on that model
+PROSPECT_DEPENDENTS = {
+    "leads": "prospect_id",
+    "quotations": "prospect_id",
+    "service_calls": "customer_id",
+}
+
+# Same word rule as the FTS5 unicode61 tokenizer: letters and digits, split on anything else
+WORD_RE = re.compile(r"[^\W_]+")
+
+# How many times more a title match counts than a body match
+TITLE_WEIGHT = 10.0
+
+# How long the entry of a deleted row stays behind, emptied, so in-memory indexes can drop it.
+# A process that has not synced for longer reloads its whole index.
+TOMBSTONE_TTL = datetime.timedelta(days=1)
+
+
+def tokenize(text):
+    return WORD_RE.findall(text.lower()) if text else []
+
+
+def max_results():
+    return getattr(settings, "SEARCH_MAX_RESULTS", 300)
+
+
+def _value(obj, path):
+    for name in path.split("__"):
+        obj = getattr(obj, name, None)
+        if obj is None:
+            return ""
+    return obj() if callable(obj) else obj
+
+
+def document(kind, obj):
+    """``(title, body)`` text for one row."""
+    spec = SPECS[kind]
+    title = " ".join(
+        str(value) for value in (_value(obj, path) for path in spec.title_fields) if value
+    )
+    rest = " ".join(
+        str(value) for value in (_value(obj, path) for path in spec.body_fields) if value
+    )
+    title = title[:500]
+    return title, f"{title} {rest}".strip()
+
+
+# ==========================
+# BACKENDS
+# ==========================
+
+
+class SqliteBackend:
+    """FTS5 external-content table over SearchEntry, synced by triggers."""
+
+    name = "sqlite-fts5"
+    fts_table = "newapp_searchentry_fts"
+
+    @classmethod
+    def install_sql(cls, table):
+        fts = cls.fts_table
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(title, body, content='{table}', "
+            "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {table} BEGIN INSERT INTO "
+            f"{fts}({fts}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE ON {table} BEGIN INSERT INTO "
+            f"{fts}({fts}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+            f"INSERT INTO {fts}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ]
+
+    @classmethod
+    def uninstall_sql(cls, table):
+        return [f"DROP TRIGGER IF EXISTS {table}_{suffix}" for suffix in ("ai", "ad", "au")] + [
+            f"DROP TABLE IF EXISTS {cls.fts_table}",
+        ]
+
+    @classmethod
+    def available(cls, cursor):
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [cls.fts_table]
+        )
+        return cursor.fetchone() is not None
+
+    def search(self, kind, tokens, limit):
+        from .models import SearchEntry
+
+        fts = self.fts_table
+        match = " ".join(f'"{token}"*' for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT e.object_id FROM {fts} JOIN {SearchEntry._meta.db_table} e ON e.id = "
+                f"{fts}.rowid WHERE {fts} MATCH %s AND e.kind = %s ORDER BY bm25({fts}, "
+                f"{TITLE_WEIGHT}, 1.0) LIMIT %s",
+                [match, kind, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def after_rebuild(self):
+        # Re-create the triggers if a table rebuild by a later migration dropped them,
+        # then resync and compact
+        from .models import SearchEntry
+
+        with connection.cursor() as cursor:
+            for statement in self.install_sql(SearchEntry._meta.db_table):
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES ('optimize')")
+
+
+class MssqlBackend:
+    """SQL Server full-text index on SearchEntry(title, body)."""
+
+    name = "mssql-fulltext"
+    catalog = "crm_search"
+
+    @classmethod
+    def install_sql(cls, table, key_index):
+        # STOPLIST OFF: a query word like "the" must not make an AND query match nothing
+        return [
+            f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = '{cls.catalog}') "
+            f"CREATE FULLTEXT CATALOG {cls.catalog}",
+            f"CREATE FULLTEXT INDEX ON {table} (title, body) KEY INDEX {key_index} ON "
+            f"{cls.catalog} WITH (CHANGE_TRACKING = AUTO, STOPLIST = OFF)",
+        ]
+
+    @classmethod
+    def uninstall_sql(cls, table):
+        return [
+            "IF EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = "
+            f"OBJECT_ID('{table}')) DROP FULLTEXT INDEX ON {table}",
+            f"IF EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = '{cls.catalog}') "
+            f"DROP FULLTEXT CATALOG {cls.catalog}",
+        ]
+
+    @classmethod
+    def available(cls, cursor):
+        from .models import SearchEntry
+
+        cursor.execute(
+            "SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID(%s)",
+            [SearchEntry._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+    def search(self, kind, tokens, limit):
+        from .models import SearchEntry
+
+        table = SearchEntry._meta.db_table
+        # Every word must be in the body (which repeats the title); title hits only boost the rank
+        match_all = " AND ".join(f'"{token}*"' for token in tokens)
+        match_any = " OR ".join(f'"{token}*"' for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT TOP (%s) e.object_id "
+                f"FROM CONTAINSTABLE({table}, body, %s) b "
+                f"JOIN {table} e ON e.id = b.[KEY] "
+                f"LEFT JOIN CONTAINSTABLE({table}, title, %s) t ON t.[KEY] = e.id "
+                f"WHERE e.kind = %s "
+                f"ORDER BY b.RANK + {TITLE_WEIGHT} * ISNULL(t.RANK, 0) DESC, e.object_id DESC",
+                [limit, match_all, match_any, kind],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def after_rebuild(self):
+        pass
+
+
+class MemoryBackend:
+    """
+    In-process inverted index with BM25 ranking.
+
+    Loaded from SearchEntry on first use. Every index write bumps a shared
+    version in the cache; a process that sees a new version re-reads only the
+    entries updated since its last sync, dropping the rows whose entries were
+    marked deleted (``deleted_at``).
+    """
+
+    name = "memory"
+    version_scope = "search"
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.postings = defaultdict(dict)  # word -> {(kind, object_id): weighted term frequency}
+        self.entries = {}  # (kind, object_id) -> (length, words)
+        self.total_length = 0
+        self._vocabulary = None
+        self.version = None
+        self.synced_at = None
+
+    # ---- loading ----
+
+    def refresh(self):
+        from .models import SearchEntry
+
+        version = caching.get_version(self.version_scope)
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            started = timezone.now()
+            rows = SearchEntry.objects.values_list(
+                "kind", "object_id", "title", "body", "deleted_at"
+            )
+            if self.synced_at is None or started - self.synced_at > TOMBSTONE_TTL:
+                self._reset()
+                rows = rows.filter(deleted_at__isnull=True)
+            else:
+                # Overlap a little so a write committed during the last sync is not missed
+                rows = rows.filter(updated_at__gte=self.synced_at - datetime.timedelta(seconds=5))
+            for kind, object_id, title, body, deleted_at in rows.iterator(chunk_size=2000):
+                if deleted_at is None:
+                    self._add((kind, object_id), title, body)
+                else:
+                    self._remove((kind, object_id))
+            self.version = version
+            self.synced_at = started
+
+    def _add(self, key, title, body):
+        self._remove(key)
+        counts = Counter(tokenize(body))
+        for word in tokenize(title):
+            counts[word] += TITLE_WEIGHT - 1
+        for word, count in counts.items():
+            if word not in self.postings:
+                self._vocabulary = None
+            self.postings[word][key] = count
+        length = sum(counts.values())
+        self.entries[key] = (length, tuple(counts))
+        self.total_length += length
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_length -= entry[0]
+        for word in entry[1]:
+            postings = self.postings[word]
+            postings.pop(key, None)
+            if not postings:
+                del self.postings[word]
+                self._vocabulary = None
+
+    # ---- querying ----
+
+    def _expand(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        words = []
+        for word in self._vocabulary[start:]:
+            if not word.startswith(prefix):
+                break
+            words.append(word)
+        return words
+
+    def search(self, kind, tokens, limit):
+        self.refresh()
+        with self._lock:
+            total = len(self.entries)
+            if not total:
+                return []
+            average = self.total_length / total
+            scores = None
+            for token in tokens:
+                token_scores = defaultdict(float)
+                for word in self._expand(token):
+                    postings = self.postings[word]
+                    idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for key, frequency in postings.items():
+                        length = self.entries[key][0]
+                        norm = frequency + self.k1 * (1 - self.b + self.b * length / average)
+                        token_scores[key] += idf * frequency * (self.k1 + 1) / norm
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        key: score + token_scores[key]
+                        for key, score in scores.items()
+                        if key in token_scores
+                    }
+                if not scores:
+                    return []
+            matches = [(score, key[1]) for key, score in scores.items() if key[0] == kind]
+        matches.sort(key=lambda match: (-match[0], -match[1]))
+        return [object_id for _, object_id in matches[:limit]]
+
+    def after_rebuild(self):
+        pass
+
+
+BACKENDS = {"sqlite": SqliteBackend, "microsoft": MssqlBackend}
+
+_backend = None
+
+
+def get_backend():
+    """The backend for the default database; the database is probed once per process."""
+    global _backend
+    if _backend is None:
+        choice = getattr(settings, "SEARCH_BACKEND", "auto")
+        backend_class = BACKENDS.get(connection.vendor)
+        if choice != "memory" and backend_class is not None:
+            with connection.cursor() as cursor:
+                if backend_class.available(cursor):
+                    _backend = backend_class()
+        if _backend is None:
+            _backend = MemoryBackend()
+    return _backend
+
+
+# ==========================
+# QUERYING
+# ==========================
+
+
+def search(kind, query, limit=None):
+    """
+    Ids of the ``kind`` rows matching ``query``, best match first.
+
+    Args:
+        kind (str): One of SPECS ('prospects', 'leads', 'quotations', 'service_calls')
+        query (str): What the user typed
+        limit (int): Most ids to return
+
+    Returns:
+        list: Object ids, best match first; empty when the query has no words
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    return get_backend().search(kind, tokens, limit or max_results())
+
+
+def search_queryset(queryset, kind, query):
+    """
+    Narrow ``queryset`` to rows matching ``query``, ordered by relevance.
+
+    The index is asked for a few times more candidates than are kept, so the
+    queryset's own filters (owner, status, ...) still leave a full result list.
+    """
+    limit = max_results()
+    candidates = search(kind, query, limit=limit * 10)
+    allowed = set()
+    for start in range(0, len(candidates), 1000):
+        allowed.update(
+            queryset.filter(pk__in=candidates[start : start + 1000]).values_list("pk", flat=True)
+        )
+    ids = [pk for pk in candidates if pk in allowed][:limit]
+    if not ids:
+        return queryset.none()
+    rank = Case(
+        *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=ids).order_by(rank)
+
+
+# ==========================
+# INDEXING
+# ==========================
+
+
+def _changed():
+    """Tell the other processes' in-memory indexes to re-sync once the write commits."""
+    if isinstance(get_backend(), MemoryBackend):
+        transaction.on_commit(lambda: caching.bump(MemoryBackend.version_scope))
+
+
+def index_object(kind, obj):
+    """
+    Create or update the entry of one row.
+
+    Returns:
+        bool: True when the title changed (or the entry is new)
+    """
+    from .models import SearchEntry
+
+    title, body = document(kind, obj)
+    old_title = (
+        SearchEntry.objects.filter(kind=kind, object_id=obj.pk)
+        .values_list("title", flat=True)
+        .first()
+    )
+    if old_title is None:
+        SearchEntry.objects.create(kind=kind, object_id=obj.pk, title=title, body=body)
+    else:
+        SearchEntry.objects.filter(kind=kind, object_id=obj.pk).update(
+            title=title, body=body, updated_at=timezone.now(), deleted_at=None
+        )
+    _changed()
+    return old_title != title
+
+
+def index_objects(kind, objs, batch_size=500):
+    """Replace the entries of many rows with one delete and one bulk insert per batch."""
+    from .models import SearchEntry
+
+    objs = list(objs)
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start : start + batch_size]
+        entries = []
+        for obj in batch:
+            title, body = document(kind, obj)
+            entries.append(SearchEntry(kind=kind, object_id=obj.pk, title=title, body=body))
+        with transaction.atomic():
+            SearchEntry.objects.filter(kind=kind, object_id__in=[obj.pk for obj in batch]).delete()
+            SearchEntry.objects.bulk_create(entries)
+    if objs:
+        _changed()
+    return len(objs)
+
+
+def remove_object(kind, pk):
+    """Empty the entry of a deleted row and mark it deleted (see ``TOMBSTONE_TTL``)."""
+    from .models import SearchEntry
+
+    now = timezone.now()
+    SearchEntry.objects.filter(kind=kind, object_id=pk).update(
+        title="", body="", deleted_at=now, updated_at=now
+    )
+    _changed()
+
+
+def reindex_prospect_dependents(prospect_ids):
+    """Refresh the leads, quotations and service calls that show these prospects' names."""
+    for kind, attname in PROSPECT_DEPENDENTS.items():
+        spec = SPECS[kind]
+        rows = spec.get_model().objects.filter(**{f"{attname}__in": prospect_ids})
+        index_objects(kind, rows.select_related(*spec.select_related))
+
+
+def rebuild(kinds=None, batch_size=1000, apps=django_apps):
+    """
+    Rebuild the entries of ``kinds`` (all when None) from the source tables.
+
+    Returns:
+        dict: kind -> number of rows indexed
+    """
+    SearchEntry = apps.get_model("newapp", "SearchEntry")
+    written = {}
+    for kind in kinds or SPECS:
+        spec = SPECS[kind]
+        rows = spec.get_model(apps).objects.select_related(*spec.select_related).order_by("pk")
+        with transaction.atomic():
+            entries = SearchEntry.objects.filter(kind=kind)
+            if apps is django_apps:
+                # Keep recent tombstones for the in-memory indexes that have not synced since
+                entries = entries.exclude(deleted_at__gte=timezone.now() - TOMBSTONE_TTL)
+            entries.delete()
+            batch, count = [], 0
+            for obj in rows.iterator(chunk_size=batch_size):
+                title, body = document(kind, obj)
+                batch.append(SearchEntry(kind=kind, object_id=obj.pk, title=title, body=body))
+                if len(batch) >= batch_size:
+                    SearchEntry.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+            SearchEntry.objects.bulk_create(batch)
+            written[kind] = count + len(batch)
+    if apps is django_apps:
+        get_backend().after_rebuild()
+        _changed()
+    return written
+
+
+# ==========================
+# SIGNALS
+# ==========================
+
+
+def _kind_for(sender):
+    for kind, spec in SPECS.items():
+        if spec.model == sender.__name__:
+            return kind
+    return None
+
+
+def _on_save(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    kind = _kind_for(sender)
+    title_changed = index_object(kind, instance)
+    if kind == "prospects" and title_changed and not kwargs.get("created"):
+        reindex_prospect_dependents([instance.pk])
+
+
+def _on_delete(sender, instance, **kwargs):
+    remove_object(_kind_for(sender), instance.pk)
+
+
+def connect_signals():
+    for kind, spec in SPECS.items():
+        model = spec.get_model()
+        post_save.connect(_on_save, sender=model, dispatch_uid=f"search_{kind}_post_save")
+        post_delete.connect(_on_delete, sender=model, dispatch_uid=f"search_{kind}_post_delete")
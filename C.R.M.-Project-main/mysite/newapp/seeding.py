@@ -0,0 +1,1206 @@
+"""
+Synthetic CRM data at production scale.
+
+``seed(scale)`` fills the database with roughly ``scale`` rows of
+referentially consistent data: departments, designations, territories, sales
+employees, technicians and item masters, and for every prospect the visits,
+leads, lead activities, quotations with lines, sales orders with lines,
+service calls and service contracts a real account accumulates. Each document
+references rows that exist and belong together (a lead's originating visit is
+a visit to the same prospect, an order converts one of that prospect's
+quotations, a service call follows an order) and every date is later than
+the dates it depends on, spread over ``HISTORY_DAYS``.
+
+Generation is deterministic for a given seed and runs one batch of prospects
+at a time: numbers come from the document sequences in blocks, amounts from
+the pricing engine, and rows are written with bulk_create, so memory does not
+grow with the scale. Seeding tops up: a second run with a larger scale only
+adds the difference. Seeded users are named ``seed_...`` and every seeded
+document hangs off a prospect one of them created, which is how ``reset()``
+finds the rows again. Used by ``manage.py seed_crm`` and
+``manage.py benchmark_views --scales``.
+"""
+
+import random
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
+
+from . import autocomplete, caching, directory, rollups, search
+from .models import (
+    Department,
+    Designation,
+    ItemMaster,
+    Lead,
+    LeadActivity,
+    ProspectCustomer,
+    Quotation,
+    QuotationItem,
+    SalesEmployee,
+    SalesOrder,
+    SalesOrderItem,
+    ServiceCall,
+    ServiceContract,
+    Technician,
+    Territory,
+    VisitLog,
+)
+from .pricing import apply_line, document_totals
+from .sequences import allocate_numbers
+
+SEED_USER_PREFIX = "seed_"
+SEED_CODE_PREFIX = "SEED-"
+ADMIN_USERNAME = "seed_admin"
+
+# Documents are dated over the last two years
+HISTORY_DAYS = 730
+
+# (low, high) counts drawn uniformly per parent row, and per-parent probabilities
+VISITS_PER_PROSPECT = (0, 6)
+LEADS_PER_PROSPECT = (0, 2)
+ACTIVITIES_PER_LEAD = (0, 4)
+LINES_PER_DOCUMENT = (1, 5)
+SERVICE_CALLS_PER_ORDER = (0, 2)
+QUOTATION_RATE = 0.8  # leads that get a quotation
+ORDER_RATE = 0.5  # quotations converted to an order
+CONTRACT_RATE = 0.25  # orders with a service contract
+
+
+def _mean(bounds):
+    return sum(bounds) / 2
+
+
+# Rows written per prospect on average, used to turn a row count into a prospect count
+ROWS_PER_PROSPECT = (
+    1
+    + _mean(VISITS_PER_PROSPECT)
+    + _mean(LEADS_PER_PROSPECT)
+    * (
+        1
+        + _mean(ACTIVITIES_PER_LEAD)
+        + QUOTATION_RATE
+        * (
+            1
+            + _mean(LINES_PER_DOCUMENT)
+            + ORDER_RATE
+            * (1 + _mean(LINES_PER_DOCUMENT) + _mean(SERVICE_CALLS_PER_ORDER) + CONTRACT_RATE)
+        )
+    )
+)
+
+# Every model seed() writes, in dependency order
+SEEDED_MODELS = (
+    Department,
+    Designation,
+    Territory,
+    User,
+    SalesEmployee,
+    Technician,
+    ItemMaster,
+    ProspectCustomer,
+    VisitLog,
+    Lead,
+    LeadActivity,
+    Quotation,
+    QuotationItem,
+    SalesOrder,
+    SalesOrderItem,
+    ServiceCall,
+    ServiceContract,
+)
+
+# ==========================
+# VOCABULARY
+# ==========================
+
+# City -> (state, region, pincode prefix)
+CITIES = {
+    "Mumbai": ("Maharashtra", "WEST", "400"),
+    "Pune": ("Maharashtra", "WEST", "411"),
+    "Nagpur": ("Maharashtra", "CENTRAL", "440"),
+    "Ahmedabad": ("Gujarat", "WEST", "380"),
+    "Surat": ("Gujarat", "WEST", "395"),
+    "Delhi": ("Delhi", "NORTH", "110"),
+    "Jaipur": ("Rajasthan", "NORTH", "302"),
+    "Lucknow": ("Uttar Pradesh", "NORTH", "226"),
+    "Chandigarh": ("Punjab", "NORTH", "160"),
+    "Kolkata": ("West Bengal", "EAST", "700"),
+    "Bhubaneswar": ("Odisha", "EAST", "751"),
+    "Patna": ("Bihar", "EAST", "800"),
+    "Chennai": ("Tamil Nadu", "SOUTH", "600"),
+    "Bengaluru": ("Karnataka", "SOUTH", "560"),
+    "Hyderabad": ("Telangana", "SOUTH", "500"),
+    "Kochi": ("Kerala", "SOUTH", "682"),
+    "Indore": ("Madhya Pradesh", "CENTRAL", "452"),
+    "Bhopal": ("Madhya Pradesh", "CENTRAL", "462"),
+}
+FIRST_NAMES = [
+    "Aarav",
+    "Vivaan",
+    "Aditya",
+    "Arjun",
+    "Rohan",
+    "Karan",
+    "Rahul",
+    "Amit",
+    "Suresh",
+    "Vikram",
+    "Ananya",
+    "Diya",
+    "Priya",
+    "Sneha",
+    "Pooja",
+    "Kavya",
+    "Neha",
+    "Riya",
+    "Meera",
+    "Isha",
+]
+LAST_NAMES = [
+    "Sharma",
+    "Verma",
+    "Patel",
+    "Shah",
+    "Mehta",
+    "Iyer",
+    "Nair",
+    "Reddy",
+    "Rao",
+    "Gupta",
+    "Singh",
+    "Kumar",
+    "Joshi",
+    "Desai",
+    "Kulkarni",
+    "Banerjee",
+    "Das",
+    "Chopra",
+    "Malhotra",
+    "Bose",
+]
+COMPANY_WORDS = [
+    "Shree",
+    "Sai",
+    "Om",
+    "Ganesh",
+    "Laxmi",
+    "Apex",
+    "Prime",
+    "Star",
+    "Global",
+    "United",
+    "National",
+    "Royal",
+    "Classic",
+    "Modern",
+    "Supreme",
+    "Crystal",
+    "Vertex",
+    "Zenith",
+]
+SUFFIXES = [
+    "Traders",
+    "Industries",
+    "Enterprises",
+    "Engineering",
+    "Pvt Ltd",
+    "Agencies",
+    "Systems",
+    "Solutions",
+    "Corporation",
+    "Works",
+]
+INDUSTRIES = [
+    "Manufacturing",
+    "Pharma",
+    "Textiles",
+    "Food Processing",
+    "Automotive",
+    "Chemicals",
+    "Construction",
+    "Hospitality",
+    "Healthcare",
+    "Water Treatment",
+]
+CATEGORIES = [
+    "Pump",
+    "Valve",
+    "Motor",
+    "Cable",
+    "Pipe",
+    "Flange",
+    "Bearing",
+    "Seal",
+    "Filter",
+    "Gear",
+    "Sensor",
+    "Switch",
+    "Panel",
+    "Gasket",
+    "Hose",
+    "Compressor",
+]
+BRANDS = ["Kirloskar", "Crompton", "Havells", "Siemens", "ABB", "Grundfos", "Bosch", "Finolex"]
+MATERIALS = ["cast iron", "stainless steel", "PVC", "brass"]
+FAULTS = ["not starting", "leaking", "noisy", "overheating", "tripping"]
+TAX_RATES = [Decimal("5"), Decimal("12"), Decimal("18"), Decimal("18"), Decimal("28")]
+DEPARTMENTS = [("Sales", "SEED-SAL"), ("Service", "SEED-SVC"), ("Marketing", "SEED-MKT")]
+DESIGNATIONS = [
+    ("Sales Executive", "SEED-SE", 3),
+    ("Sales Manager", "SEED-SM", 2),
+    ("Regional Head", "SEED-RH", 1),
+    ("Service Engineer", "SEED-ENG", 3),
+]
+
+
+def _weighted(rng, choices):
+    """``choices`` is [(value, weight), ...]."""
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _phone(rng):
+    return f"{rng.choice('6789')}{rng.randrange(10 ** 9):09d}"
+
+
+def _between(rng, start, end):
+    if end <= start:
+        return start
+    return start + (end - start) * rng.random()
+
+
+def _serial(code):
+    return code.rsplit("-", 1)[-1]
+
+
+# ==========================
+# SIZING
+# ==========================
+
+
+def plan(scale):
+    """How many of each master row and how many prospects make ``scale`` rows in total."""
+    prospects = max(1, round(scale / ROWS_PER_PROSPECT))
+    employees = min(max(prospects // 150, 5), 5000)
+    return {
+        "prospects": prospects,
+        "employees": employees,
+        "technicians": min(max(employees // 2, 2), 2000),
+        "items": min(max(prospects // 20, 50), 50000),
+    }
+
+
+def seeded_prospects():
+    return ProspectCustomer.objects.filter(created_by__username__startswith=SEED_USER_PREFIX)
+
+
+def row_counts():
+    """Rows per seeded table (all rows, not only seeded ones), for reports."""
+    return {model._meta.label: model._default_manager.count() for model in SEEDED_MODELS}
+
+
+@contextmanager
+def _keep_timestamps(*models):
+    """Let bulk_create write the generated ``created_at`` / ``updated_at`` instead of now()."""
+    fields = [
+        field
+        for model in models
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+@contextmanager
+def _signals_muted(*signals):
+    """Disconnect every receiver of ``signals`` (rollups, search, caches are rebuilt afterwards)."""
+    saved = [(signal, signal.receivers) for signal in signals]
+    for signal in signals:
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in saved:
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
+
+
+def _insert(model, objs, key=None, batch_size=1000):
+    """bulk_create ``objs``; where the backend returns no ids, read them back by unique ``key``."""
+    model.objects.bulk_create(objs, batch_size=batch_size)
+    if key and objs and objs[0].pk is None:
+        for start in range(0, len(objs), batch_size):
+            chunk = objs[start : start + batch_size]
+            ids = dict(
+                model.objects.filter(
+                    **{f"{key}__in": [getattr(obj, key) for obj in chunk]}
+                ).values_list(key, "pk")
+            )
+            for obj in chunk:
+                obj.pk = ids[getattr(obj, key)]
+
+
+def _number_by_year(key, objs, field, moment):
+    """Number ``objs`` from sequence ``key`` with the year of each object's ``moment(obj)``."""
+    by_year = defaultdict(list)
+    for obj in objs:
+        by_year[moment(obj).year].append(obj)
+    for group in by_year.values():
+        for obj, number in zip(group, allocate_numbers(key, len(group), when=moment(group[0]))):
+            setattr(obj, field, number)
+
+
+# ==========================
+# MASTER DATA
+# ==========================
+
+
+class Masters:
+    """Seeded master rows the documents pick from, loaded as plain tuples."""
+
+    def __init__(self):
+        self.employees = list(
+            SalesEmployee.objects.filter(user__username__startswith=SEED_USER_PREFIX)
+            .order_by("pk")
+            .values_list("pk", "user_id", "region")
+        )
+        self.technicians = list(
+            Technician.objects.filter(user__username__startswith=SEED_USER_PREFIX)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        self.items = list(
+            ItemMaster.objects.filter(item_code__startswith=SEED_CODE_PREFIX)
+            .order_by("pk")
+            .values_list(
+                "pk",
+                "item_code",
+                "short_name",
+                "standard_price",
+                "default_tax_percentage",
+                "unit_of_measurement",
+            )
+        )
+        self.admin_id = (
+            User.objects.filter(username=ADMIN_USERNAME).values_list("pk", flat=True).first()
+        )
+        self.by_region = defaultdict(list)
+        for employee in self.employees:
+            self.by_region[employee[2]].append(employee)
+
+
+def _next_serial(queryset, field):
+    """1 + the highest zero-padded ``SEED-<n>`` value of ``field`` in ``queryset``."""
+    highest = queryset.aggregate(highest=Max(field))["highest"]
+    return int(_serial(highest)) + 1 if highest else 1
+
+
+def _seed_users(rng, kind, count, start, password, now):
+    users = []
+    for n in range(start, start + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        users.append(
+            User(
+                username=f"{SEED_USER_PREFIX}{kind}{n:05d}",
+                first_name=first,
+                last_name=last,
+                email=f"{first.lower()}.{last.lower()}.{kind}{n}@example.com",
+                password=password,
+                date_joined=now - timedelta(days=rng.randrange(HISTORY_DAYS + 365)),
+            )
+        )
+    _insert(User, users, key="username")
+    return users
+
+
+def seed_masters(targets, rng, password=None):
+    """Create the organisation, people and item catalogue up to ``targets`` (see ``plan()``)."""
+    now = timezone.now()
+    password = make_password(password)
+
+    if not User.objects.filter(username=ADMIN_USERNAME).exists():
+        User.objects.create_superuser(ADMIN_USERNAME, "seed.admin@example.com", None)
+        User.objects.filter(username=ADMIN_USERNAME).update(password=password)
+
+    departments = {}
+    for name, code in DEPARTMENTS:
+        departments[name], _ = Department.objects.get_or_create(name=name, defaults={"code": code})
+    designations = {}
+    for title, code, level in DESIGNATIONS:
+        designations[title], _ = Designation.objects.get_or_create(
+            title=title,
+            defaults={"code": code, "level": level, "department": departments["Sales"]},
+        )
+
+    regions = {}
+    for region in sorted({region for _, region, _ in CITIES.values()}):
+        regions[region], _ = Territory.objects.get_or_create(
+            code=f"{SEED_CODE_PREFIX}{region}",
+            defaults={"name": region.title(), "zone_type": "REGION"},
+        )
+    cities = {}
+    for city, (state, region, _) in CITIES.items():
+        cities[city], _ = Territory.objects.get_or_create(
+            code=f"{SEED_CODE_PREFIX}{city.upper()}",
+            defaults={"name": city, "zone_type": "CITY", "parent": regions[region]},
+        )
+    city_names = list(CITIES)
+
+    # Sales employees: the first one in each region heads it, the rest report to that head
+    existing = SalesEmployee.objects.filter(user__username__startswith=SEED_USER_PREFIX)
+    missing = targets["employees"] - existing.count()
+    if missing > 0:
+        start = _next_serial(existing, "employee_id")
+        heads = dict(existing.filter(role="SALES_HEAD").values_list("region", "pk"))
+        employees = []
+        for user in _seed_users(rng, "emp", missing, start, password, now):
+            city = city_names[(start + len(employees)) % len(city_names)]
+            region = CITIES[city][1]
+            role = (
+                "SALES_HEAD"
+                if region not in heads
+                else _weighted(rng, [("SALES_REP", 6), ("SALES_EXECUTIVE", 3), ("MANAGER", 1)])
+            )
+            employee = SalesEmployee(
+                user=user,
+                employee_id=f"{SEED_CODE_PREFIX}{start + len(employees):05d}",
+                role=role,
+                department=departments["Sales"],
+                designation=designations[
+                    (
+                        "Regional Head"
+                        if role == "SALES_HEAD"
+                        else "Sales Manager" if role == "MANAGER" else "Sales Executive"
+                    )
+                ],
+                territory=cities[city],
+                region=region,
+                mobile=_phone(rng),
+                joined_date=user.date_joined.date(),
+            )
+            if role == "SALES_HEAD":
+                heads[region] = employee
+            employees.append(employee)
+        _insert(SalesEmployee, employees, key="employee_id")
+        for employee in employees:
+            head = heads[employee.region]
+            head_id = head if isinstance(head, int) else head.pk
+            if head_id != employee.pk:
+                employee.reporting_to_id = head_id
+        SalesEmployee.objects.bulk_update(employees, ["reporting_to"], batch_size=1000)
+
+    existing = Technician.objects.filter(user__username__startswith=SEED_USER_PREFIX)
+    missing = targets["technicians"] - existing.count()
+    if missing > 0:
+        start = User.objects.filter(username__startswith=f"{SEED_USER_PREFIX}tech").count() + 1
+        technicians = []
+        for user, code in zip(
+            _seed_users(rng, "tech", missing, start, password, now),
+            allocate_numbers("TECH", missing),
+        ):
+            city = rng.choice(city_names)
+            state, region, pincode = CITIES[city]
+            technicians.append(
+                Technician(
+                    user=user,
+                    employee_code=code,
+                    mobile=_phone(rng),
+                    email=user.email,
+                    skill_level=_weighted(
+                        rng,
+                        [
+                            ("TRAINEE", 1),
+                            ("JUNIOR", 4),
+                            ("SENIOR", 3),
+                            ("SPECIALIST", 1),
+                            ("LEAD", 1),
+                        ],
+                    ),
+                    specialization=rng.choice(CATEGORIES) + "s",
+                    region=region,
+                    territory=cities[city],
+                    city=city,
+                    state=state,
+                    pincode=f"{pincode}{rng.randrange(1000):03d}",
+                    joining_date=user.date_joined.date(),
+                    department=departments["Service"],
+                    designation=designations["Service Engineer"],
+                    is_available=rng.random() < 0.7,
+                )
+            )
+        _insert(Technician, technicians, key="employee_code")
+
+    existing = ItemMaster.objects.filter(item_code__startswith=SEED_CODE_PREFIX)
+    missing = targets["items"] - existing.count()
+    if missing > 0:
+        start = _next_serial(existing, "item_code")
+        items = []
+        for n in range(start, start + missing):
+            category, brand = rng.choice(CATEGORIES), rng.choice(BRANDS)
+            size = rng.choice(
+                ["15mm", "25mm", "40mm", "50mm", "0.5HP", "1HP", "2HP", "5HP", "10HP"]
+            )
+            price = Decimal(rng.randrange(200, 250000)).quantize(Decimal("1"))
+            items.append(
+                ItemMaster(
+                    item_code=f"{SEED_CODE_PREFIX}{n:06d}",
+                    short_name=f"{brand} {category} {size}",
+                    description=f"{brand} {category.lower()} {size}, {rng.choice(MATERIALS)}",
+                    item_type=_weighted(rng, [("PRODUCT", 8), ("CONSUMABLE", 1), ("SERVICE", 1)]),
+                    unit_of_measurement=rng.choice(["PCS", "PCS", "SET", "MTR"]),
+                    standard_price=price,
+                    minimum_price=(price * Decimal("0.85")).quantize(Decimal("0.01")),
+                    default_tax_percentage=rng.choice(TAX_RATES),
+                    category=category,
+                    brand=brand,
+                    manufacturer=brand,
+                    is_active=rng.random() < 0.95,
+                )
+            )
+        _insert(ItemMaster, items, key="item_code")
+
+
+# ==========================
+# DOCUMENTS
+# ==========================
+
+PROSPECT_STATUSES = [
+    ("NEW", 20),
+    ("CONTACTED", 20),
+    ("QUALIFIED", 15),
+    ("PROPOSAL", 10),
+    ("NEGOTIATION", 8),
+    ("WON", 15),
+    ("LOST", 8),
+    ("INACTIVE", 4),
+]
+LEAD_STATUSES = [
+    ("NEW", 15),
+    ("CONTACTED", 15),
+    ("QUALIFIED", 15),
+    ("PROPOSAL_SENT", 12),
+    ("IN_NEGOTIATION", 8),
+    ("WON", 15),
+    ("LOST", 12),
+    ("HOLD", 4),
+    ("CLOSED", 4),
+]
+LEAD_PROGRESS = {
+    "NEW": 0,
+    "CONTACTED": 20,
+    "QUALIFIED": 40,
+    "PROPOSAL_SENT": 60,
+    "IN_NEGOTIATION": 80,
+    "WON": 100,
+    "LOST": 100,
+    "HOLD": 30,
+    "CLOSED": 100,
+}
+QUOTATION_STATUSES = [
+    ("DRAFT", 10),
+    ("PENDING", 10),
+    ("APPROVED", 10),
+    ("SENT", 25),
+    ("REJECTED", 10),
+    ("REVISED", 5),
+    ("EXPIRED", 10),
+    ("CANCELLED", 5),
+]
+ORDER_STATUSES = [
+    ("DRAFT", 5),
+    ("PENDING", 10),
+    ("APPROVED", 10),
+    ("CONFIRMED", 15),
+    ("PROCESSING", 10),
+    ("SHIPPED", 10),
+    ("DELIVERED", 15),
+    ("COMPLETED", 20),
+    ("CANCELLED", 5),
+]
+VISIT_OUTCOMES = [
+    ("POSITIVE", 4),
+    ("NEUTRAL", 3),
+    ("NEGATIVE", 1),
+    ("DEAL_CLOSED", 1),
+    ("FOLLOW_UP", 3),
+]
+
+
+class DocumentGenerator:
+    """
+    Generate and insert the documents of one batch of new prospects.
+
+    Args:
+        masters (Masters): Seeded employees, technicians and items to pick from
+        rng (random.Random): Source of every random choice
+        batch_size (int): Rows per bulk insert
+    """
+
+    def __init__(self, masters, rng, batch_size=1000):
+        self.masters = masters
+        self.rng = rng
+        self.batch_size = batch_size
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=HISTORY_DAYS)
+        self.counts = defaultdict(int)
+        self.cities_by_region = defaultdict(list)
+        for city, (_, region, _) in CITIES.items():
+            self.cities_by_region[region].append(city)
+
+    def insert(self, model, objs, key=None):
+        _insert(model, objs, key, self.batch_size)
+        self.counts[model._meta.label] += len(objs)
+
+    def run(self, count):
+        rng = self.rng
+        prospects = self.prospects(count)
+        self.insert(ProspectCustomer, prospects, key="customer_id")
+
+        visits = self.visits(prospects)
+        _number_by_year("VST", visits, "visit_id", lambda visit: visit.created_at)
+        self.insert(VisitLog, visits, key="visit_id")
+        visits_by_prospect = defaultdict(list)
+        for visit in visits:
+            visits_by_prospect[visit.prospect_id].append(visit)
+
+        leads = []
+        for prospect in prospects:
+            for _ in range(rng.randint(*LEADS_PER_PROSPECT)):
+                leads.append(self.lead(prospect, visits_by_prospect[prospect.pk]))
+        for lead, number in zip(leads, allocate_numbers("LEAD", len(leads))):
+            lead.lead_id = number
+        self.insert(Lead, leads, key="lead_id")
+
+        activities = [activity for lead in leads for activity in self.activities(lead)]
+        for activity, number in zip(activities, allocate_numbers("ACT", len(activities))):
+            activity.activity_id = number
+        self.insert(LeadActivity, activities)
+
+        quotations, orders, quotation_lines, order_lines = [], [], [], []
+        for lead in leads:
+            if rng.random() >= QUOTATION_RATE:
+                continue
+            quotation, lines = self.quotation(lead)
+            quotations.append(quotation)
+            quotation_lines.extend(lines)
+            if rng.random() < ORDER_RATE:
+                order, lines = self.order(quotation, lines)
+                orders.append(order)
+                order_lines.extend(lines)
+        for quotation, number in zip(quotations, allocate_numbers("QUO", len(quotations))):
+            quotation.quote_number = number
+        for order, number in zip(orders, allocate_numbers("SO", len(orders))):
+            order.order_number = number
+            order.reference_quotation.order_number = number
+        self.insert(Quotation, quotations, key="quote_number")
+        self.insert(QuotationItem, quotation_lines)
+        self.insert(SalesOrder, orders, key="order_number")
+        self.insert(SalesOrderItem, order_lines)
+
+        calls, contracts = [], []
+        for order in orders:
+            for _ in range(rng.randint(*SERVICE_CALLS_PER_ORDER)):
+                calls.append(self.service_call(order))
+            if rng.random() < CONTRACT_RATE:
+                contracts.append(self.contract(order))
+        _number_by_year("SVC", calls, "service_number", lambda call: call.created_at)
+        self.insert(ServiceCall, calls)
+        _number_by_year("AMC", contracts, "contract_number", lambda contract: contract.created_at)
+        self.insert(ServiceContract, contracts)
+        return self.counts
+
+    # ------------------------------------------------------------------
+
+    def prospects(self, count):
+        rng, masters = self.rng, self.masters
+        prospects = []
+        for customer_id in allocate_numbers("CUST", count):
+            employee_id, user_id, region = rng.choice(masters.employees)
+            city = rng.choice(self.cities_by_region.get(region) or list(CITIES))
+            state, _, pincode = CITIES[city]
+            company = f"{rng.choice(COMPANY_WORDS)} {rng.choice(CATEGORIES)} {rng.choice(SUFFIXES)}"
+            status = _weighted(rng, PROSPECT_STATUSES)
+            created = _between(rng, self.start, self.now)
+            updated = _between(rng, created, self.now)
+            phone = _phone(rng)
+            prospects.append(
+                ProspectCustomer(
+                    customer_id=customer_id,
+                    name=f"{company} {city} {_serial(customer_id)}",
+                    company_name=company,
+                    type=(
+                        "CUSTOMER"
+                        if status == "WON"
+                        else "PROSPECT" if status in ("NEW", "CONTACTED") else "LEAD"
+                    ),
+                    status=status,
+                    email=f"contact{_serial(customer_id)}@example.com",
+                    phone=phone,
+                    phone_digits=phone,
+                    address=(
+                        f"{rng.randint(1, 400)}, {rng.choice(LAST_NAMES)} Marg, Industrial Area"
+                    ),
+                    city=city,
+                    state=state,
+                    pincode=f"{pincode}{rng.randrange(1000):03d}",
+                    industry=rng.choice(INDUSTRIES),
+                    assigned_to_id=employee_id,
+                    created_by_id=user_id,
+                    created_at=created,
+                    updated_at=updated,
+                    closed_at=updated if status in ("WON", "LOST") else None,
+                )
+            )
+        return prospects
+
+    def visits(self, prospects):
+        rng = self.rng
+        visits = []
+        for prospect in prospects:
+            for _ in range(rng.randint(*VISITS_PER_PROSPECT)):
+                # Mostly the account owner; sometimes a colleague from the same region
+                employee_id = prospect.assigned_to_id
+                if rng.random() < 0.15:
+                    region = CITIES[prospect.city][1]
+                    employee_id = rng.choice(
+                        self.masters.by_region.get(region) or self.masters.employees
+                    )[0]
+                status = _weighted(rng, [("COMPLETED", 85), ("SCHEDULED", 10), ("CANCELLED", 5)])
+                when = (
+                    self.now + timedelta(days=rng.randint(1, 14))
+                    if status == "SCHEDULED"
+                    else _between(rng, prospect.created_at, self.now)
+                )
+                approval = (
+                    "PENDING"
+                    if status == "SCHEDULED"
+                    else _weighted(rng, [("APPROVED", 70), ("PENDING", 20), ("REJECTED", 10)])
+                )
+                outcome = _weighted(rng, VISIT_OUTCOMES) if status == "COMPLETED" else None
+                visits.append(
+                    VisitLog(
+                        sales_employee_id=employee_id,
+                        prospect_id=prospect.pk,
+                        visit_date=when.date(),
+                        visit_time=when.time().replace(microsecond=0),
+                        status=status,
+                        approval_status=approval,
+                        meeting_agenda=f"Discuss {rng.choice(CATEGORIES).lower()} requirement with "
+                        f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                        meeting_outcome=(
+                            f"{dict(VisitLog.OUTCOME_CHOICES)[outcome]} meeting"
+                            if outcome
+                            else None
+                        ),
+                        outcome_type=outcome,
+                        next_follow_up_date=(
+                            (when + timedelta(days=rng.randint(3, 30))).date()
+                            if outcome == "FOLLOW_UP"
+                            else None
+                        ),
+                        approved_by_id=self.masters.admin_id if approval != "PENDING" else None,
+                        approved_at=when + timedelta(days=1) if approval != "PENDING" else None,
+                        location=f"{prospect.address}, {prospect.city}",
+                        created_at=min(when, self.now),
+                        updated_at=min(when, self.now),
+                    )
+                )
+        return visits
+
+    def lead(self, prospect, visits):
+        rng = self.rng
+        visit = rng.choice(visits) if visits and rng.random() < 0.6 else None
+        created = _between(rng, visit.created_at if visit else prospect.created_at, self.now)
+        status = _weighted(rng, LEAD_STATUSES)
+        estimated = Decimal(rng.randrange(20000, 2500000))
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        return Lead(
+            lead_source=(
+                "VISIT"
+                if visit
+                else _weighted(
+                    rng,
+                    [
+                        ("REFERENCE", 3),
+                        ("WEB", 3),
+                        ("CAMPAIGN", 2),
+                        ("COLD_CALL", 2),
+                        ("SOCIAL_MEDIA", 1),
+                        ("DIRECT", 2),
+                        ("OTHER", 1),
+                    ],
+                )
+            ),
+            prospect_id=prospect.pk,
+            contact_person=f"{first} {last}",
+            mobile=_phone(rng),
+            email=f"{first.lower()}.{last.lower()}@example.com",
+            requirement_description=f"{rng.randint(1, 50)} x {rng.choice(CATEGORIES).lower()} for "
+            f"{prospect.industry.lower()} plant",
+            assigned_to_id=prospect.assigned_to_id,
+            status=status,
+            progress_percentage=LEAD_PROGRESS[status],
+            expected_closure_date=(created + timedelta(days=rng.randint(15, 120))).date(),
+            next_action_date=(
+                (self.now + timedelta(days=rng.randint(-10, 20))).date()
+                if status not in ("WON", "LOST", "CLOSED")
+                else None
+            ),
+            originating_visit=visit,
+            estimated_value=estimated,
+            actual_value=estimated if status == "WON" else None,
+            priority=_weighted(rng, [("LOW", 2), ("MEDIUM", 5), ("HIGH", 2), ("URGENT", 1)]),
+            lost_reason="Price" if status == "LOST" else None,
+            created_by_id=prospect.created_by_id,
+            created_at=created,
+            updated_at=_between(rng, created, self.now),
+        )
+
+    def activities(self, lead):
+        rng = self.rng
+        activities = []
+        for _ in range(rng.randint(*ACTIVITIES_PER_LEAD)):
+            scheduled = rng.random() < 0.15
+            when = (
+                self.now + timedelta(days=rng.randint(0, 14))
+                if scheduled
+                else _between(rng, lead.created_at, self.now)
+            )
+            activities.append(
+                LeadActivity(
+                    lead=lead,
+                    activity_type=_weighted(
+                        rng,
+                        [
+                            ("CALL", 5),
+                            ("EMAIL", 3),
+                            ("MEETING", 2),
+                            ("WHATSAPP", 2),
+                            ("FOLLOWUP", 3),
+                            ("DEMO", 1),
+                        ],
+                    ),
+                    activity_date=when.date(),
+                    activity_time=when.time().replace(microsecond=0),
+                    discussion_summary=(
+                        f"Discussed {lead.requirement_description} with {lead.contact_person}"
+                    ),
+                    outcome=(
+                        None
+                        if scheduled
+                        else rng.choice(
+                            [
+                                "Interested",
+                                "Asked for revised price",
+                                "Will revert",
+                                "Not reachable",
+                            ]
+                        )
+                    ),
+                    next_followup_date=(
+                        (when + timedelta(days=rng.randint(2, 20))).date()
+                        if not scheduled and rng.random() < 0.4
+                        else None
+                    ),
+                    status=(
+                        "SCHEDULED"
+                        if scheduled
+                        else _weighted(rng, [("COMPLETED", 9), ("CANCELLED", 1)])
+                    ),
+                    contact_person=lead.contact_person,
+                    contact_number=lead.mobile,
+                    created_by_id=lead.created_by_id,
+                    created_at=min(when, self.now),
+                    updated_at=min(when, self.now),
+                )
+            )
+        return activities
+
+    def quotation_lines(self, quotation):
+        rng = self.rng
+        lines = []
+        for number in range(1, rng.randint(*LINES_PER_DOCUMENT) + 1):
+            item_id, code, name, price, tax, uom = rng.choice(self.masters.items)
+            line = QuotationItem(
+                quotation=quotation,
+                item_master_id=item_id,
+                item_code=code,
+                description=name,
+                uom=uom,
+                quantity=Decimal(rng.randint(1, 20)),
+                unit_price=price,
+                tax_percentage=tax,
+                line_number=number,
+                discount_percentage=rng.choice(
+                    [Decimal("0"), Decimal("0"), Decimal("5"), Decimal("10")]
+                ),
+            )
+            apply_line(line)
+            lines.append(line)
+        return lines
+
+    def quotation(self, lead):
+        rng = self.rng
+        created = _between(rng, lead.created_at, self.now)
+        status = _weighted(rng, QUOTATION_STATUSES)
+        quotation = Quotation(
+            quote_date=created.date(),
+            valid_till=(created + timedelta(days=30)).date(),
+            prospect_id=lead.prospect_id,
+            contact_person=lead.contact_person,
+            contact_email=lead.email,
+            contact_phone=lead.mobile,
+            assigned_to_id=lead.assigned_to_id,
+            reference_lead=lead,
+            reference_visit_id=lead.originating_visit.pk if lead.originating_visit else None,
+            discount_percentage=rng.choice(
+                [Decimal("0"), Decimal("0"), Decimal("2.5"), Decimal("5")]
+            ),
+            freight_charges=Decimal(rng.choice([0, 0, 500, 1500])),
+            status=status,
+            approved_by_id=self.masters.admin_id if status in ("APPROVED", "SENT") else None,
+            approved_at=created + timedelta(days=1) if status in ("APPROVED", "SENT") else None,
+            sent_at=created + timedelta(days=2) if status == "SENT" else None,
+            created_by_id=lead.created_by_id,
+            created_at=created,
+            updated_at=created,
+        )
+        lines = self.quotation_lines(quotation)
+        for name, value in document_totals(quotation, lines).items():
+            setattr(quotation, name, value)
+        return quotation, lines
+
+    def order(self, quotation, quotation_lines):
+        rng = self.rng
+        created = _between(
+            rng, quotation.created_at, min(quotation.created_at + timedelta(days=30), self.now)
+        )
+        quotation.status, quotation.converted_to_order, quotation.order_date = (
+            "CONVERTED",
+            True,
+            created.date(),
+        )
+        status = _weighted(rng, ORDER_STATUSES)
+        order = SalesOrder(
+            order_date=created.date(),
+            valid_till=(created + timedelta(days=60)).date(),
+            prospect_id=quotation.prospect_id,
+            contact_person=quotation.contact_person,
+            contact_email=quotation.contact_email,
+            contact_phone=quotation.contact_phone,
+            assigned_to_id=quotation.assigned_to_id,
+            reference_lead=quotation.reference_lead,
+            reference_visit_id=quotation.reference_visit_id,
+            reference_quotation=quotation,
+            discount_percentage=quotation.discount_percentage,
+            freight_charges=quotation.freight_charges,
+            status=status,
+            created_by_id=quotation.created_by_id,
+            created_at=created,
+            updated_at=created,
+            approved_by_id=(
+                self.masters.admin_id if status not in ("DRAFT", "PENDING", "CANCELLED") else None
+            ),
+            confirmed_at=(
+                created + timedelta(days=1)
+                if status not in ("DRAFT", "PENDING", "APPROVED", "CANCELLED")
+                else None
+            ),
+        )
+        lines = []
+        for source in quotation_lines:
+            line = SalesOrderItem(
+                order=order,
+                item_master_id=source.item_master_id,
+                item_code=source.item_code,
+                description=source.description,
+                uom=source.uom,
+                quantity=source.quantity,
+                unit_price=source.unit_price,
+                discount_percentage=source.discount_percentage,
+                tax_percentage=source.tax_percentage,
+                line_number=source.line_number,
+            )
+            apply_line(line)
+            lines.append(line)
+        for name, value in document_totals(order, lines).items():
+            setattr(order, name, value)
+        return order, lines
+
+    def service_call(self, order):
+        rng = self.rng
+        created = _between(rng, order.created_at, self.now)
+        closed = rng.random() < 0.7 and created < self.now - timedelta(days=2)
+        return ServiceCall(
+            customer_id=order.prospect_id,
+            contact_person=order.contact_person,
+            contact_phone=order.contact_phone[-10:],
+            related_order=order,
+            related_quotation=order.reference_quotation,
+            service_request_date=created,
+            assigned_technician_id=(
+                rng.choice(self.masters.technicians) if rng.random() < 0.9 else None
+            ),
+            service_type=_weighted(
+                rng,
+                [
+                    ("BREAKDOWN", 4),
+                    ("PREVENTIVE", 3),
+                    ("INSTALLATION", 2),
+                    ("WARRANTY", 1),
+                    ("AMC", 1),
+                    ("INSPECTION", 1),
+                ],
+            ),
+            call_type=_weighted(rng, [("BREAKDOWN", 4), ("SERVICE", 5), ("INSTALLATION", 2)]),
+            origin=_weighted(rng, [("PHONE", 5), ("EMAIL", 2), ("WHATSAPP", 2), ("PORTAL", 1)]),
+            problem_type=_weighted(
+                rng, [("MECHANICAL", 4), ("ELECTRICAL", 3), ("SOFTWARE", 1), ("OTHER", 1)]
+            ),
+            priority=_weighted(rng, [("LOW", 2), ("MEDIUM", 5), ("HIGH", 2), ("CRITICAL", 1)]),
+            status="CLOSED" if closed else "OPEN",
+            closed_at=_between(rng, created, self.now) if closed else None,
+            resolution_code="RESOLVED" if closed else None,
+            problem_description=f"{rng.choice(CATEGORIES)} {rng.choice(FAULTS)}",
+            warranty_status=_weighted(
+                rng, [("UNDER_WARRANTY", 3), ("OUT_OF_WARRANTY", 2), ("AMC", 2), ("PAID", 3)]
+            ),
+            estimated_cost=Decimal(rng.randrange(0, 20000)),
+            created_by_id=order.created_by_id,
+            created_at=created,
+            updated_at=created,
+        )
+
+    def contract(self, order):
+        rng = self.rng
+        start = order.created_at + timedelta(days=rng.randint(0, 30))
+        end = start + timedelta(days=365)
+        return ServiceContract(
+            customer_id=order.prospect_id,
+            related_order=order,
+            contract_type=_weighted(rng, [("AMC", 6), ("CMC", 2), ("WARRANTY", 1), ("ONETIME", 1)]),
+            start_date=start.date(),
+            end_date=end.date(),
+            contract_value=(order.net_amount * Decimal("0.08")).quantize(Decimal("0.01")),
+            service_frequency=rng.choice(["Monthly", "Quarterly", "Half-yearly"]),
+            number_of_visits=rng.choice([2, 4, 12]),
+            status="ACTIVE" if end > self.now else "EXPIRED",
+            created_by_id=order.created_by_id,
+            created_at=start,
+            updated_at=start,
+        )
+
+
+# ==========================
+# ENTRY POINTS
+# ==========================
+
+
+def seed(scale, seed=0, batch_size=1000, password=None, progress=None):
+    """
+    Top the seeded data up to about ``scale`` rows.
+
+    Args:
+        scale (int): Total rows wanted across the seeded tables
+        seed (int): Random seed; the same seed and scale produce the same data
+        batch_size (int): Prospects generated, and rows inserted, per batch
+        password (str): Password of the seeded users (unusable when omitted)
+        progress (callable): Called with (prospects done, prospects wanted) after each batch
+
+    Returns:
+        dict: Rows inserted per model label
+    """
+    targets = plan(scale)
+    existing = seeded_prospects().count()
+    rng = random.Random(f"{seed}:masters:{existing}")
+    seed_masters(targets, rng, password)
+    masters = Masters()
+
+    inserted = defaultdict(int)
+    wanted = max(targets["prospects"] - existing, 0)
+    done = 0
+    with _keep_timestamps(*SEEDED_MODELS):
+        while done < wanted:
+            count = min(batch_size, wanted - done)
+            generator = DocumentGenerator(
+                masters, random.Random(f"{seed}:{existing + done}"), batch_size
+            )
+            with transaction.atomic():
+                for label, rows in generator.run(count).items():
+                    inserted[label] += rows
+            done += count
+            if progress:
+                progress(done, wanted)
+
+    if wanted:
+        refresh_derived(batch_size)
+    return dict(inserted)
+
+
+def refresh_derived(batch_size=1000):
+    """Rebuild what bulk writes bypass: reporting rollups, the search index and cached lookups."""
+    rollups.rebuild(batch_size=batch_size)
+    search.rebuild(batch_size=batch_size)
+    for name in autocomplete.SOURCES:
+        autocomplete.changed(name)
+    directory.invalidate()
+    caching.invalidate(*SalesEmployee.objects.values_list("pk", flat=True))
+
+
+def reset(batch_size=1000):
+    """
+    Delete every seeded row (documents of seeded prospects, seeded users, items and masters).
+
+    Signal receivers are disconnected while deleting so whole batches go
+    through the fast delete path; the derived data is rebuilt afterwards.
+    """
+    deleted = defaultdict(int)
+    with _signals_muted(pre_save, post_save, pre_delete, post_delete):
+        while True:
+            ids = list(seeded_prospects().order_by().values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                _, counts = ProspectCustomer.objects.filter(pk__in=ids).delete()
+            for label, count in counts.items():
+                deleted[label] += count
+        for queryset in (
+            User.objects.filter(username__startswith=SEED_USER_PREFIX),
+            ItemMaster.objects.filter(item_code__startswith=SEED_CODE_PREFIX),
+            Territory.objects.filter(code__startswith=SEED_CODE_PREFIX),
+            Designation.objects.filter(code__startswith=SEED_CODE_PREFIX),
+            Department.objects.filter(code__startswith=SEED_CODE_PREFIX),
+        ):
+            with transaction.atomic():
+                _, counts = queryset.delete()
+            for label, count in counts.items():
+                deleted[label] += count
+    refresh_derived(batch_size)
+    return dict(deleted)
+
+
+def busiest_employee():
+    """The seeded sales employee owning the most prospects (the worst case for scoped pages)."""
+    return (
+        SalesEmployee.objects.filter(user__username__startswith=SEED_USER_PREFIX)
+        .annotate(prospect_count=Count("prospects"))
+        .order_by("-prospect_count", "pk")
+        .select_related("user")
+        .first()
+    )
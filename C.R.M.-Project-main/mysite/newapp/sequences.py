@@ -0,0 +1,229 @@
+"""
+Document number allocation.
+
+Every auto-numbered document (CUST-00001, QUO-000001, SVC-2025-0001, ...) draws
+its number from a per-prefix counter row in ``DocumentSequence``. A worker
+process reserves a *block* of numbers with a single locked UPDATE and then hands
+them out from memory, so a ``save()`` never has to read the latest document row
+before inserting and parallel workers can never mint the same number.
+
+Numbers are unique but not gapless when ``block_size > 1``: a block reserved by
+a process that exits early, or numbers taken by a transaction that rolls back,
+are simply skipped. Documents that must be strictly consecutive (tax invoices)
+use a block size of 1.
+
+Inside a caller's transaction (admin saves, conversions, imports) a new block is
+reserved on a separate connection that commits at once, so the counter row is
+not locked for the rest of the caller's transaction. Gapless sequences, and
+SQLite (where the caller already holds the database's write lock), reserve in
+the caller's transaction instead.
+"""
+
+import threading
+from dataclasses import dataclass
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+RESET_NEVER = None
+RESET_YEARLY = "year"
+RESET_FINANCIAL_YEAR = "fy"
+
+
+@dataclass(frozen=True)
+class Sequence:
+    """Numbering scheme for one document prefix."""
+
+    key: str
+    template: str
+    model: str
+    field: str
+    reset: str = RESET_NEVER
+    block_size: int = None
+
+    def get_block_size(self):
+        if self.block_size:
+            return self.block_size
+        return getattr(settings, "DOCUMENT_SEQUENCE_BLOCK_SIZE", 20)
+
+
+# ==========================
+# REGISTERED SEQUENCES
+# ==========================
+
+SEQUENCES = {
+    seq.key: seq
+    for seq in [
+        Sequence("CUST", "CUST-{n:05d}", "newapp.ProspectCustomer", "customer_id"),
+        Sequence("LEAD", "LEAD-{n:06d}", "newapp.Lead", "lead_id"),
+        Sequence("ACT", "ACT-{n:06d}", "newapp.LeadActivity", "activity_id"),
+        Sequence("VST", "VST-{n:06d}", "newapp.VisitLog", "visit_id"),
+        Sequence("QUO", "QUO-{n:06d}", "newapp.Quotation", "quote_number"),
+        Sequence("SO", "SO-{n:06d}", "newapp.SalesOrder", "order_number"),
+        Sequence("TECH", "TECH-{n:05d}", "newapp.Technician", "employee_code"),
+        Sequence("AMC", "AMC-{year}-{n:05d}", "newapp.ServiceContract", "contract_number"),
+        Sequence(
+            "SVC", "SVC-{year}-{n:04d}", "newapp.ServiceCall", "service_number", reset=RESET_YEARLY
+        ),
+        Sequence(
+            "SVC-INV",
+            "SVC-INV-{year}-{n:04d}",
+            "newapp.ServiceInvoice",
+            "invoice_number",
+            reset=RESET_YEARLY,
+            block_size=1,
+        ),
+    ]
+}
+
+
+# Per-process cache of reserved ranges: {(key, period): [next, end]}
+_blocks = {}
+_lock = threading.Lock()
+
+
+def period_for(reset, when=None):
+    """Return the counter period label for a reset policy, e.g. '2025' or 'FY2025-26'."""
+    if reset == RESET_NEVER:
+        return ""
+    when = when or timezone.localdate()
+    if reset == RESET_YEARLY:
+        return str(when.year)
+    if reset == RESET_FINANCIAL_YEAR:
+        start_month = getattr(settings, "FINANCIAL_YEAR_START_MONTH", 4)
+        start = when.year if when.month >= start_month else when.year - 1
+        return f"FY{start}-{(start + 1) % 100:02d}"
+    raise ValueError(f"Unknown sequence reset policy: {reset}")
+
+
+def _template_context(when):
+    when = when or timezone.localdate()
+    return {"year": when.year, "fy": period_for(RESET_FINANCIAL_YEAR, when)[2:]}
+
+
+def _seed_value(seq, period, when):
+    """Highest number already used for this sequence, read once when its counter is created."""
+    if seq.reset == RESET_NEVER:
+        prefix = seq.template.split("{", 1)[0]
+    else:
+        prefix = seq.template.split("{n", 1)[0].format(**_template_context(when))
+
+    model = apps.get_model(seq.model)
+    values = model._default_manager.filter(**{f"{seq.field}__startswith": prefix})
+    highest = 0
+    for value in values.values_list(seq.field, flat=True).iterator():
+        try:
+            highest = max(highest, int(value.rsplit("-", 1)[-1]))
+        except (ValueError, AttributeError):
+            continue
+    return highest
+
+
+def _reserve(seq, period, count, when):
+    """Atomically advance the counter by ``count`` and return the reserved [start, end) range."""
+    from .models import DocumentSequence
+
+    with transaction.atomic():
+        counter = DocumentSequence.objects.filter(key=seq.key, period=period)
+        if not counter.update(last_value=F("last_value") + count, updated_at=timezone.now()):
+            try:
+                with transaction.atomic():
+                    DocumentSequence.objects.create(
+                        key=seq.key,
+                        period=period,
+                        last_value=_seed_value(seq, period, when) + count,
+                    )
+            except IntegrityError:
+                # Another worker created the counter first; take our block from it
+                counter.update(last_value=F("last_value") + count, updated_at=timezone.now())
+        end = counter.values_list("last_value", flat=True).get() + 1
+    return end - count, end
+
+
+def _reserve_apart(seq, period, count, when):
+    """
+    _reserve() on a connection of its own (a thread's), committed at once.
+
+    Called inside a caller's transaction, so the counter row is locked only
+    for the UPDATE and not until that transaction ends.
+    """
+    result = {}
+
+    def run():
+        try:
+            result["range"] = _reserve(seq, period, count, when)
+        except Exception as error:
+            result["error"] = error
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, name=f"sequence-{seq.key}")
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["range"]
+
+
+def _take(seq, count, when):
+    period = period_for(seq.reset, when)
+    cache_key = (seq.key, period)
+
+    # Numbers taken by a transaction that then rolls back are skipped, like any other gap
+    with _lock:
+        block = _blocks.get(cache_key)
+        if block and block[1] - block[0] >= count:
+            start = block[0]
+            block[0] += count
+            return range(start, start + count)
+
+    size = max(count, seq.get_block_size())
+    if connection.in_atomic_block and (seq.get_block_size() == 1 or connection.vendor == "sqlite"):
+        # Gapless sequences must roll back with the caller, and on SQLite the caller's transaction
+        # holds the write lock a second connection would wait on: reserve in that transaction,
+        # and keep the remainder only once the reservation has committed
+        start, end = _reserve(seq, period, size, when)
+        if end - start > count:
+            transaction.on_commit(lambda: _stash(cache_key, start + count, end))
+        return range(start, start + count)
+
+    if connection.in_atomic_block:
+        start, end = _reserve_apart(seq, period, size, when)
+    else:
+        start, end = _reserve(seq, period, size, when)
+    if end - start > count:
+        _stash(cache_key, start + count, end)
+    return range(start, start + count)
+
+
+def _stash(cache_key, start, end):
+    with _lock:
+        block = _blocks.get(cache_key)
+        # Whatever is left of a smaller block is skipped
+        if not block or block[1] - block[0] < end - start:
+            _blocks[cache_key] = [start, end]
+
+
+def format_number(key, n, when=None):
+    """Render number ``n`` with the sequence's template."""
+    return SEQUENCES[key].template.format(n=n, **_template_context(when))
+
+
+def next_number(key, when=None):
+    """Return the next document number for a registered sequence, e.g. ``next_number('QUO')``."""
+    return allocate_numbers(key, 1, when)[0]
+
+
+def allocate_numbers(key, count, when=None):
+    """Reserve ``count`` consecutive numbers in one round trip (used by bulk imports)."""
+    seq = SEQUENCES[key]
+    return [format_number(key, n, when) for n in _take(seq, count, when)]
+
+
+def reset_cache():
+    """Drop this process's reserved blocks (the numbers in them are skipped)."""
+    with _lock:
+        _blocks.clear()
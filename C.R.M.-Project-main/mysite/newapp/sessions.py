@@ -0,0 +1,70 @@
+"""
+Inactivity sessions without a write on every request.
+
+The CRM logs users out after SESSION_COOKIE_AGE seconds of inactivity. Django
+does that with SESSION_SAVE_EVERY_REQUEST, which saves the session (an UPDATE
+on the default database store) on every request. ``SessionMiddleware`` below
+saves it only when the last save is more than SESSION_REFRESH_INTERVAL seconds
+old, so a burst of clicks costs one write; a session then expires between
+``SESSION_COOKIE_AGE - SESSION_REFRESH_INTERVAL`` and SESSION_COOKIE_AGE
+seconds after the last request. The time of the last save is kept in the
+session itself, which works the same with every store (SESSION_ENGINE):
+database, cache, cached_db or signed cookies.
+
+Pages poll ``/session/ping/`` (``session_ping``) instead of fetching
+themselves again. The ping answers how long the session has left and only
+counts as activity when the page says the user did something since the last
+ping, so an open but idle tab still logs out.
+
+Expired rows of the database store are deleted by ``manage.py purge_sessions``.
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware as DjangoSessionMiddleware
+
+# Session key holding the epoch second of the last save
+REFRESHED_AT = "_refreshed_at"
+
+
+def refresh_interval():
+    return getattr(settings, "SESSION_REFRESH_INTERVAL", 60)
+
+
+def expires_in(session):
+    """Seconds before ``session`` expires if nothing saves it again; 0 when unknown or past."""
+    refreshed = session.get(REFRESHED_AT)
+    if refreshed is None:
+        return 0
+    return max(0, int(refreshed + settings.SESSION_COOKIE_AGE - time.time()))
+
+
+def refresh(request):
+    """Restart ``request``'s session timer if it was saved over SESSION_REFRESH_INTERVAL ago."""
+    session = request.session
+    now = int(time.time())
+    if session.modified or now - session.get(REFRESHED_AT, 0) >= refresh_interval():
+        session[REFRESHED_AT] = now
+
+
+class SessionMiddleware(DjangoSessionMiddleware):
+    """
+    Django's session middleware, saving an unchanged session once per SESSION_REFRESH_INTERVAL.
+
+    A view can set ``request.session_refresh = False`` to leave the expiry
+    alone (the session ping does, unless the user was active).
+    """
+
+    def process_response(self, request, response):
+        session = getattr(request, "session", None)
+        # A session the request never read is left unread
+        if (
+            session is not None
+            and session.accessed
+            and response.status_code != 500
+            and not session.is_empty()
+        ):
+            if session.modified or getattr(request, "session_refresh", True):
+                refresh(request)
+        return super().process_response(request, response)
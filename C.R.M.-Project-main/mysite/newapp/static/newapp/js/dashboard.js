@@ -1,46 +1,198 @@
 /**
- * Dashboard Optimization - Client-side data processing and caching
- * Preserves original visual layout while adding performance enhancements
+ * Dashboard Optimization - Live updates and client-side data export
+ * Follows /api/dashboard-stream/ (server-sent events) and redraws the numbers and
+ * lists in place, polling /api/dashboard-data/ where the stream is not available
  */
 
 class DashboardOptimizer {
     constructor() {
         this.cache = new Map();
-        this.refreshInterval = 5 * 60 * 1000; // 5 minutes
+        this.pollInterval = 60 * 1000; // fallback polling: 1 minute
+        this.maxStreamErrors = 3; // failed reconnects in a row before falling back
+        this.streamErrors = 0;
+        this.source = null;
+        this.pollTimer = null;
         this.lastUpdate = null;
     }
 
-    // Initialize dashboard with minimal impact on layout
+    // Show the data rendered with the page, then follow its changes
     async init() {
-        // Only set up background data refresh, no visual changes
-        this.setupBackgroundRefresh();
-        console.log('Dashboard optimization initialized - preserving original layout');
+        const initial = document.getElementById('dashboard-data');
+        if (initial) {
+            window.dashboardData = JSON.parse(initial.textContent);
+        }
+
+        const root = document.getElementById('dashboard-content');
+        if (!root || !root.dataset.streamUrl) {
+            return;
+        }
+        // Keeps ?view_as_user= so an admin follows the data they are looking at
+        this.streamUrl = root.dataset.streamUrl + window.location.search;
+        this.pollUrl = root.dataset.pollUrl + window.location.search;
+
+        if (window.EventSource) {
+            this.openStream();
+            // Hidden tabs drop their stream and catch up with a snapshot when shown again
+            document.addEventListener('visibilitychange', () => {
+                if (this.pollTimer) {
+                    return;
+                }
+                if (document.hidden) {
+                    this.closeStream();
+                } else if (!this.source) {
+                    this.openStream();
+                }
+            });
+        } else {
+            this.startPolling();
+        }
     }
 
-    // Setup background data refresh without visual changes
-    setupBackgroundRefresh() {
-        // Refresh data in background every 5 minutes
-        setInterval(() => {
-            this.refreshDataSilently();
-        }, this.refreshInterval);
+    // Server-sent events: a snapshot on connect, then deltas only when the data changes
+    openStream() {
+        const source = new EventSource(this.streamUrl);
+        this.source = source;
+        source.addEventListener('snapshot', event => this.applyUpdate(JSON.parse(event.data), true));
+        source.addEventListener('delta', event => this.applyUpdate(JSON.parse(event.data), false));
+        source.addEventListener('open', () => {
+            this.streamErrors = 0;
+        });
+        source.addEventListener('error', () => {
+            // The server closes each stream after a few minutes and the browser
+            // reconnects by itself; CLOSED means it refused (e.g. 204 when streaming is off)
+            this.streamErrors += 1;
+            if (source.readyState === EventSource.CLOSED || this.streamErrors >= this.maxStreamErrors) {
+                this.closeStream();
+                this.startPolling();
+            }
+        });
+    }
+
+    closeStream() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
     }
 
-    // Refresh data silently without updating UI
-    async refreshDataSilently() {
+    // Fallback when the stream is unsupported or unavailable
+    startPolling() {
+        if (this.pollTimer) {
+            return;
+        }
+        console.log('Dashboard live updates unavailable - polling instead');
+        this.pollTimer = setInterval(() => {
+            if (!document.hidden) {
+                this.refreshData();
+            }
+        }, this.pollInterval);
+    }
+
+    async refreshData() {
         try {
-            const response = await fetch('/api/dashboard-data/');
-            const data = await response.json();
-            
-            // Cache data for potential use, but don't update UI
-            this.cache.set('dashboard_data', {
-                data: data,
-                timestamp: Date.now()
+            const response = await fetch(this.pollUrl, {
+                credentials: 'same-origin',
+                headers: { 'Accept': 'application/json' }
             });
-            
-            console.log('Dashboard data refreshed in background');
+            if (!response.ok) {
+                return;
+            }
+            this.applyUpdate(await response.json(), true);
         } catch (error) {
-            console.log('Background data refresh failed:', error);
+            console.log('Dashboard data refresh failed:', error);
+        }
+    }
+
+    // Merge the changed keys into window.dashboardData and redraw only what they cover
+    applyUpdate(data, full) {
+        window.dashboardData = full ? data : Object.assign({}, window.dashboardData, data);
+        this.lastUpdate = Date.now();
+        this.cache.set('dashboard_data', {
+            data: window.dashboardData,
+            timestamp: this.lastUpdate
+        });
+
+        document.querySelectorAll('#dashboard-content [data-metric]').forEach(element => {
+            const key = element.dataset.metric;
+            if (key in data) {
+                element.textContent = `${data[key] ?? 0}${element.dataset.suffix || ''}`;
+            }
+        });
+        if ('leads_by_stage' in data) {
+            this.renderPipeline(data.leads_by_stage);
+        }
+        if ('upcoming_followups' in data) {
+            this.renderTasks(data.upcoming_followups);
+        }
+    }
+
+    // Same markup as the server-rendered lists in dashboard.html
+    renderPipeline(stages) {
+        const container = document.getElementById('dashboard-pipeline');
+        if (!container) {
+            return;
+        }
+        if (!stages.length) {
+            container.replaceChildren(this.element('p', 'color: var(--text-light);', 'No active leads found.'));
+            return;
+        }
+        container.replaceChildren(...stages.map(stage => {
+            const row = this.element('div', 'display: flex; align-items: center; margin-bottom: 15px;');
+            const bar = this.element('div', 'flex: 1; background: #f3f4f6; height: 10px; border-radius: 5px; margin: 0 15px; overflow: hidden;');
+            bar.append(this.element('div', 'height: 100%; width: 50%; background: var(--primary-color);'));
+            row.append(
+                this.element('div', 'width: 100px; font-weight: 600; font-size: 0.9em;', stage.status),
+                bar,
+                this.element('div', 'font-weight: 700;', String(stage.count))
+            );
+            return row;
+        }));
+    }
+
+    renderTasks(tasks) {
+        const container = document.getElementById('dashboard-tasks');
+        if (!container) {
+            return;
+        }
+        if (!tasks.length) {
+            container.replaceChildren(this.element('p', 'color: var(--text-light);', 'No tasks for the next 7 days.'));
+            return;
+        }
+        container.replaceChildren(...tasks.map(task => {
+            const item = this.element('div');
+            item.className = 'task-item';
+
+            const badge = this.element('div', 'background: #eff6ff; color: var(--primary-color); padding: 8px 12px; border-radius: 8px; font-weight: 700; text-align: center;');
+            if (task.next_follow_up_date) {
+                const [year, month, day] = task.next_follow_up_date.split('-').map(Number);
+                const date = new Date(year, month - 1, day);
+                badge.append(
+                    String(day).padStart(2, '0'),
+                    document.createElement('br'),
+                    this.element('span', 'font-size:0.7em; opacity:0.8;', date.toLocaleString('en', { month: 'short' }))
+                );
+            }
+
+            const details = this.element('div');
+            details.append(
+                this.element('div', 'font-weight: 600;', task.prospect__name),
+                this.element('div', 'font-size: 0.85em; color: var(--text-light);', task.prospect__company_name || '')
+            );
+            item.append(badge, details);
+            return item;
+        }));
+    }
+
+    // Element with inline style and text (never HTML, the values come from user input)
+    element(tag, style = '', text = null) {
+        const element = document.createElement(tag);
+        if (style) {
+            element.style.cssText = style;
+        }
+        if (text !== null) {
+            element.textContent = text;
         }
+        return element;
     }
 
     // Export data functionality (available but not visible)
@@ -108,7 +260,7 @@ document.addEventListener('DOMContentLoaded', () => {
     window.dashboardOptimizer = new DashboardOptimizer();
     
     // Check if we're on the dashboard page
-    if (document.querySelector('.dashboard') || document.getElementById('dashboard-content') || window.dashboardData) {
+    if (document.getElementById('dashboard-content')) {
         window.dashboardOptimizer.init();
     }
 });
@@ -12,6 +12,7 @@ class FormOptimizer {
 
     // Initialize form optimization
     init() {
+        this.setupRemoteSelects();
         this.setupItemAutocomplete();
         this.setupProspectAutocomplete();
         this.setupRealTimeCalculations();
@@ -19,6 +20,51 @@ class FormOptimizer {
         this.setupAutoSave();
     }
 
+    // Turn <select data-remote-url> (newapp.widgets.RemoteSelect) into a search box:
+    // the page only renders the chosen option, matches are fetched while typing
+    setupRemoteSelects() {
+        document.querySelectorAll('select[data-remote-url]').forEach(select => {
+            const search = document.createElement('input');
+            search.type = 'search';
+            search.className = select.className;
+            search.placeholder = select.dataset.placeholder || '';
+            search.autocomplete = 'off';
+            const chosen = select.options[select.selectedIndex];
+            search.value = chosen && chosen.value ? chosen.text.trim() : '';
+
+            // A hidden select cannot take the browser's "required" prompt; the box does
+            search.required = select.required;
+            select.required = false;
+            select.style.display = 'none';
+            select.insertAdjacentElement('beforebegin', search);
+
+            const labelField = select.dataset.labelField || 'label';
+            window.crmUtils.setupAutocomplete(
+                search,
+                select.dataset.remoteUrl,
+                parseInt(select.dataset.minChars, 10) || 2,
+                300,
+                item => {
+                    const label = item[labelField] || item.label || String(item.id);
+                    Array.from(select.options).forEach(option => {
+                        if (option.value) option.remove();
+                    });
+                    select.add(new Option(label, item.id, true, true));
+                    search.value = label;
+                    select.dispatchEvent(new Event('change', { bubbles: true }));
+                }
+            );
+
+            // Clearing the box clears the choice
+            search.addEventListener('input', () => {
+                if (!search.value.trim() && select.value) {
+                    select.value = '';
+                    select.dispatchEvent(new Event('change', { bubbles: true }));
+                }
+            });
+        });
+    }
+
     // Setup item autocomplete with caching
     setupItemAutocomplete() {
         const itemInputs = document.querySelectorAll('input[name*="item_code"]');
@@ -162,8 +162,8 @@ class CRMUtils {
         }
     }
 
-    // Autocomplete with caching
-    async setupAutocomplete(input, apiUrl, minChars = 2, delay = 300) {
+    // Autocomplete with caching; onSelect(item) replaces the default "copy the code into the input"
+    async setupAutocomplete(input, apiUrl, minChars = 2, delay = 300, onSelect = null) {
         let currentRequest = null;
         
         const debouncedSearch = this.debounce(async (query) => {
@@ -187,7 +187,7 @@ class CRMUtils {
                     { signal: currentRequest.signal }
                 );
                 
-                this.showAutocomplete(input, data.items || data);
+                this.showAutocomplete(input, data.items || data, onSelect);
             } catch (error) {
                 if (error.name !== 'AbortError') {
                     console.error('Autocomplete error:', error);
@@ -205,7 +205,7 @@ class CRMUtils {
     }
 
     // Show autocomplete dropdown
-    showAutocomplete(input, items) {
+    showAutocomplete(input, items, onSelect = null) {
         this.hideAutocomplete(input);
         
         if (!items || items.length === 0) return;
@@ -235,12 +235,16 @@ class CRMUtils {
                 border-bottom: 1px solid #f0f0f0;
             `;
             
-            const displayText = item.name || item.description || item.item_code || JSON.stringify(item);
+            const displayText = item.label || item.name || item.description || item.item_code || JSON.stringify(item);
             option.textContent = displayText;
             
             option.addEventListener('click', () => {
-                input.value = item.item_code || item.code || displayText;
-                input.dispatchEvent(new Event('change', { bubbles: true }));
+                if (onSelect) {
+                    onSelect(item);
+                } else {
+                    input.value = item.item_code || item.code || displayText;
+                    input.dispatchEvent(new Event('change', { bubbles: true }));
+                }
                 this.hideAutocomplete(input);
             });
             
@@ -1,3 +1,1537 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    autocomplete,
+    caching,
+    documents,
+    importers,
+    jobs,
+    metrics,
+    rollups,
+    search,
+    seeding,
+    sequences,
+    urls,
+)
+from .cache_backends import cache_stats, reset_cache_stats
+from .catalog import CatalogSync
+from .conversion import ConversionError, convert_quotation, convert_quotations
+from .dashboard import DashboardStream, get_dashboard_metrics
+from .forms import ServiceCallItemFormSet
+from .models import (
+    DailyRollup,
+    DocumentSequence,
+    Export,
+    ItemMaster,
+    Job,
+    Lead,
+    LeadActivity,
+    ProspectCustomer,
+    Quotation,
+    QuotationItem,
+    SalesEmployee,
+    SalesOrder,
+    SalesOrderItem,
+    ServiceCall,
+    ServiceCallItem,
+    TaxMaster,
+    Technician,
+    VisitLog,
+)
+from .pagination import KeysetPaginator, encode_cursor
+from .pricing import document_totals
+from .querybudget import assert_max_queries, query_shape, track_query_shapes
+from .sessions import REFRESHED_AT
+
+# Rows created per list, above QUERY_SHAPE_THRESHOLD so a per-row query shows up as a repeated shape
+ROWS = 6
+
+# URL name -> most queries one GET may run, as (admin, sales employee). Lower a budget when a view
+# gets cheaper; raising one needs a reason in the commit message.
+QUERY_BUDGETS = {
+    "index": (3, 2),
+    "signup": (2, 2),
+    "signin": (2, 2),
+    "logout": (4, 4),
+    "dashboard": (2, 3),
+    "prospect_list": (4, 4),
+    "prospect_create": (4, 4),
+    "prospect_detail": (7, 7),
+    "prospect_edit": (5, 5),
+    "visit_management": (3, 8),
+    "visit_list": (3, 5),
+    "visit_create": (3, 3),
+    "visit_detail": (7, 7),
+    "visit_edit": (3, 5),
+    "visit_approve": (4, 4),
+    "visit_report": (5, 5),
+    "lead_list": (5, 6),
+    "lead_create": (6, 6),
+    "lead_detail": (10, 10),
+    "lead_edit": (6, 7),
+    "activity_list": (4, 5),
+    "activity_dashboard": (11, 12),
+    "activity_create": (3, 3),
+    "activity_detail": (8, 8),
+    "activity_edit": (4, 5),
+    "quotation_list": (5, 6),
+    "quotation_create": (7, 7),
+    "quotation_detail": (11, 11),
+    "quotation_edit": (10, 11),
+    "quotation_pdf": (5, 6),
+    "quotation_send": (9, 10),
+    "quotation_approve": (9, 3),
+    "quotation_reject": (9, 3),
+    "quotation_add_activity": (3, 3),
+    "quotation_add_attachment": (3, 3),
+    "salesorder_list": (5, 6),
+    "salesorder_create": (7, 7),
+    "salesorder_detail": (10, 10),
+    "salesorder_edit": (10, 11),
+    "salesorder_pdf": (5, 6),
+    "salesorder_confirm": (13, 13),
+    "salesorder_approve": (13, 3),
+    "salesorder_reject": (13, 3),
+    "salesorder_add_activity": (3, 3),
+    "salesorder_add_attachment": (3, 3),
+    "servicecall_list": (4, 3),
+    "servicecall_create": (4, 4),
+    "servicecall_detail": (10, 10),
+    "servicecall_edit": (7, 7),
+    "get_quotation_data": (2, 2),
+    "get_item_data": (2, 2),
+    "search_items": (2, 2),
+    "search_prospects": (2, 2),
+    "get_prospect_data": (2, 2),
+    "dashboard_data_api": (2, 3),
+    "dashboard_updates_legacy": (2, 3),
+    "dashboard_stream": (2, 2),
+    "export_detail": (3, 3),
+    "export_download": (3, 3),
+    "job_detail": (3, 3),
+    "session_ping": (2, 2),
+    "metrics": (2, 2),
+}
+
+# Views that act on a document and redirect; they are requested like the rest
+ACTIONS = {
+    "visit_approve",
+    "quotation_send",
+    "quotation_approve",
+    "quotation_reject",
+    "quotation_add_activity",
+    "quotation_add_attachment",
+    "salesorder_confirm",
+    "salesorder_approve",
+    "salesorder_reject",
+    "salesorder_add_activity",
+    "salesorder_add_attachment",
+    "logout",
+}
+
+TEST_CACHES = {"default": {"BACKEND": "newapp.cache_backends.LocMemStatsCache"}}
+
+# Most queries saving a quotation or sales order edit may run, whatever its number of lines:
+# the lines are written with one DELETE, one UPDATE and one INSERT
+DOCUMENT_SAVE_BUDGETS = {"quotation": 21, "salesorder": 20}
+
+# Most queries an admin changelist may run (session, user, filter choices, count, page),
+# whatever its size
+ADMIN_CHANGELIST_BUDGET = 9
+
+
+def create_crm_data():
+    """A few rows of every document, each referencing the others, owned by one sales employee."""
+    admin = User.objects.create_superuser("admin", "admin@example.com", "x")
+    user = User.objects.create_user(
+        "rep", "rep@example.com", "x", first_name="Sales", last_name="Rep"
+    )
+    employee = SalesEmployee.objects.create(
+        user=user, employee_id="E001", mobile="9000000000", role="SALES_HEAD"
+    )
+    tech_user = User.objects.create_user("tech", "tech@example.com", "x")
+    technician = Technician.objects.create(
+        user=tech_user, employee_code="TECH-00001", mobile="9000000001", email="tech@example.com"
+    )
+    item = ItemMaster.objects.create(
+        item_code="ITM-001", description="Pump", standard_price=Decimal("100")
+    )
+
+    today = timezone.now().date()
+    data = {"admin": admin, "user": user, "employee": employee}
+    for number in range(ROWS):
+        prospect = ProspectCustomer.objects.create(
+            name=f"Prospect {number}",
+            company_name=f"Company {number}",
+            phone="9000000000",
+            address="Street 1",
+            city="Pune",
+            state="MH",
+            pincode="411001",
+            assigned_to=employee,
+            created_by=user,
+        )
+        visit = VisitLog.objects.create(
+            sales_employee=employee,
+            prospect=prospect,
+            meeting_agenda="Demo",
+            visit_date=today - timedelta(days=number),
+        )
+        lead = Lead.objects.create(
+            lead_source="VISIT",
+            prospect=prospect,
+            contact_person="Contact",
+            mobile="9000000000",
+            requirement_description="Pumps",
+            assigned_to=employee,
+            originating_visit=visit,
+            created_by=user,
+        )
+        activity = LeadActivity.objects.create(
+            lead=lead,
+            activity_type="CALL",
+            discussion_summary="Called",
+            activity_date=today + timedelta(days=number % 3 - 1),
+            created_by=user,
+        )
+        quotation = Quotation.objects.create(
+            prospect=prospect,
+            contact_person="Contact",
+            valid_till=today + timedelta(days=30),
+            assigned_to=employee,
+            reference_lead=lead,
+            created_by=user,
+        )
+        order = SalesOrder.objects.create(
+            prospect=prospect,
+            contact_person="Contact",
+            valid_till=today + timedelta(days=30),
+            assigned_to=employee,
+            reference_quotation=quotation,
+            created_by=user,
+        )
+        service_call = ServiceCall.objects.create(
+            customer=prospect,
+            contact_person="Contact",
+            contact_phone="9000000000",
+            service_type="REPAIR",
+            problem_description="Leak",
+            assigned_technician=technician,
+            related_order=order,
+            created_by=user,
+        )
+        for line in range(ROWS):
+            QuotationItem.objects.create(
+                quotation=quotation,
+                item_master=item,
+                item_code=item.item_code,
+                description="Pump",
+                quantity=1,
+                unit_price=Decimal("100"),
+                line_number=line + 1,
+            )
+            SalesOrderItem.objects.create(
+                order=order,
+                item_master=item,
+                item_code=item.item_code,
+                description="Pump",
+                quantity=1,
+                unit_price=Decimal("100"),
+                line_number=line + 1,
+            )
+            ServiceCallItem.objects.create(
+                service_call=service_call, item_master=item, description="Pump"
+            )
+        data.update(
+            prospect=prospect,
+            visit=visit,
+            lead=lead,
+            activity=activity,
+            quotation=quotation,
+            salesorder=order,
+            servicecall=service_call,
+        )
+    data["export"] = Export.objects.create(
+        name="visits", format="csv", requested_by=user, total_rows=ROWS
+    )
+    data["job"] = Job.objects.create(task="exports.write", status="DONE", created_by=user)
+    return data
+
+
+class QueryShapeTests(TestCase):
+    def test_placeholder_lists_share_a_shape(self):
+        self.assertEqual(
+            query_shape("SELECT 1 FROM t WHERE id IN (%s, %s, %s)"),
+            query_shape("SELECT 1 FROM t WHERE id IN (%s, %s)"),
+        )
+        self.assertIsNone(query_shape('SAVEPOINT "s1_x1"'))
+
+    def test_repeated_lazy_load_is_reported_with_its_call_site(self):
+        data = create_crm_data()
+        with track_query_shapes(threshold=ROWS) as tracker:
+            for lead in Lead.objects.filter(assigned_to=data["employee"]):
+                lead.prospect.name
+        repeated = tracker.repeated()
+        self.assertEqual(len(repeated), 1)
+        self.assertEqual(repeated[0].count, ROWS)
+        self.assertIn("newapp_prospectcustomer", repeated[0].shape)
+
+    def test_assert_max_queries_lists_the_queries(self):
+        with self.assertRaisesMessage(AssertionError, "2 queries executed, budget is 1."):
+            with assert_max_queries(1):
+                list(User.objects.all())
+                list(User.objects.all())
+
+
+class DashboardMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def test_metrics_query_budget(self):
+        # Visit aggregate + prospect status breakdown + upcoming follow-ups, whatever the row count
+        for sales_employee in (None, self.data["employee"]):
+            with self.assertNumQueries(3):
+                get_dashboard_metrics(sales_employee)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "newapp.cache_backends.FileBasedStatsCache",
+            "LOCATION": tempfile.mkdtemp(),
+        }
+    }
+)
+class CacheStatsTests(SimpleTestCase):
+    def test_file_cache_counts_hits_and_misses_per_namespace(self):
+        reset_cache_stats()
+        cache.set("dashboard_metrics:all", 1)
+        self.assertEqual(cache.get("dashboard_metrics:all"), 1)
+        self.assertIsNone(cache.get("dashboard_metrics:emp:1"))
+        self.assertEqual(
+            cache.get_many(["dashboard_metrics:all", "directory:x"]), {"dashboard_metrics:all": 1}
+        )
+
+        stats = cache_stats()
+        self.assertEqual(stats["total"], {"hits": 2, "misses": 2, "hit_ratio": 0.5})
+        self.assertEqual(
+            stats["namespaces"],
+            {"dashboard_metrics": {"hits": 2, "misses": 1}, "directory": {"hits": 0, "misses": 1}},
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CachingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_writes_a_version_never_used_before(self):
+        key = caching.VERSION_KEY.format(scope="emp:1")
+        # A version from a clock running ahead still moves forward
+        ahead = caching._new_version() + 60000
+        cache.set(key, ahead, None)
+        caching.bump("emp:1")
+        self.assertEqual(caching.get_version("emp:1"), ahead + 1)
+
+        # An old counter jumps to the clock, past any number handed out since
+        cache.set(key, 5, None)
+        before = caching._new_version()
+        caching.bump("emp:1")
+        self.assertGreaterEqual(caching.get_version("emp:1"), before)
+
+        cache.delete(key)
+        caching.bump("emp:1")
+        self.assertGreaterEqual(caching.get_version("emp:1"), before)
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def rollup_counts(self):
+        return {
+            tuple(getattr(row, field) for field in rollups.KEY_FIELDS): (row.count, row.amount)
+            for row in DailyRollup.objects.exclude(count=0, amount=0)
+        }
+
+    def test_incremental_maintenance_matches_a_rebuild(self):
+        employee = self.data["employee"]
+        other = SalesEmployee.objects.create(
+            user=User.objects.create_user("north", "north@example.com", "x"),
+            employee_id="E002",
+            mobile="9000000002",
+            region="NORTH",
+        )
+        visit, prospect, order = self.data["visit"], self.data["prospect"], self.data["salesorder"]
+        order.net_amount = Decimal("250.00")
+        order.save()
+
+        visit.status = "COMPLETED"
+        visit.sales_employee = other
+        visit.save()
+        prospect.assigned_to = other
+        prospect.save()
+        order.assigned_to = other
+        order.status = "CONFIRMED"
+        order.save()
+        rollups.update(VisitLog.objects.filter(sales_employee=employee), approval_status="APPROVED")
+        VisitLog.objects.exclude(pk=visit.pk).first().delete()
+        SalesOrder.objects.exclude(pk=order.pk).first().delete()
+
+        # Both employees change region; their rows follow them
+        employee.region = "SOUTH"
+        employee.save()
+        other.region = "WEST"
+        other.save(update_fields=["region"])
+        self.assertEqual(
+            set(DailyRollup.objects.values_list("sales_employee_id", "region")),
+            {(employee.pk, "SOUTH"), (other.pk, "WEST")},
+        )
+
+        incremental = self.rollup_counts()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.rollup_counts())
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    METRICS_SAMPLE_RATE=0,
+    PAGINATION_COUNT="exact",
+    SEARCH_BACKEND="memory",
+    QUERY_SHAPE_DETECTION="off",
+)
+class QueryBudgetTests(TestCase):
+    """Every URL in newapp/urls.py, as an admin and as a sales employee, within its budget."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def setUp(self):
+        cache.clear()
+
+    def url(self, pattern):
+        kwargs = {}
+        if "<int:pk>" in str(pattern.pattern):
+            kwargs["pk"] = self.data[pattern.name.split("_", 1)[0]].pk
+        return reverse(f"newapp:{pattern.name}", kwargs=kwargs)
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(sorted(names - set(QUERY_BUDGETS)), [])
+
+    def assert_budgets(self, user, column):
+        for pattern in urls.urlpatterns:
+            with self.subTest(url=pattern.name):
+                url = self.url(pattern)
+                self.client.force_login(user)
+                # Warm the per-process caches (directory, autocomplete index) first
+                if pattern.name not in ACTIONS:
+                    self.client.get(url)
+                budget = QUERY_BUDGETS[pattern.name][column]
+                with assert_max_queries(budget, repeat_threshold=ROWS):
+                    response = self.client.get(url)
+                self.assertLess(response.status_code, 500)
+
+    def test_admin_query_budgets(self):
+        self.assert_budgets(self.data["admin"], 0)
+
+    def test_sales_employee_query_budgets(self):
+        self.assert_budgets(self.data["user"], 1)
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    PAGINATION_COUNT="exact",
+    SEARCH_BACKEND="memory",
+    QUERY_SHAPE_DETECTION="off",
+)
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def test_changelists_run_no_per_row_queries(self):
+        self.client.force_login(self.data["admin"])
+        for model in admin.site._registry:
+            url = reverse(f"admin:{model._meta.app_label}_{model._meta.model_name}_changelist")
+            with self.subTest(model=model.__name__):
+                # Warm the cached filter choices first
+                self.client.get(url)
+                with assert_max_queries(ADMIN_CHANGELIST_BUDGET, repeat_threshold=ROWS):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_count_columns_are_annotated(self):
+        self.client.force_login(self.data["admin"])
+        response = self.client.get(reverse("admin:newapp_prospectcustomer_changelist"), {"o": "9"})
+        self.assertEqual(
+            [prospect.visit_count for prospect in response.context["cl"].result_list], [1] * ROWS
+        )
+
+    def test_bulk_actions_update_the_dashboard(self):
+        employee = self.data["employee"]
+        self.assertEqual(get_dashboard_metrics(employee)["pending_approvals"], ROWS)
+        self.client.force_login(self.data["admin"])
+        for model, action in ((VisitLog, "approve_visits"), (ProspectCustomer, "mark_as_won")):
+            pks = list(model.objects.values_list("pk", flat=True)[:2])
+            response = self.client.post(
+                reverse(f"admin:newapp_{model._meta.model_name}_changelist"),
+                {"action": action, admin.helpers.ACTION_CHECKBOX_NAME: pks},
+            )
+            self.assertEqual(response.status_code, 302)
+        metrics = get_dashboard_metrics(employee)
+        self.assertEqual(metrics["pending_approvals"], ROWS - 2)
+        self.assertEqual(metrics["converted_count"], 2)
+        self.assertEqual(metrics["total_leads"], ROWS)
+
+    def test_bulk_actions_bump_cache_versions(self):
+        scope = caching.scope_for(self.data["employee"])
+        self.client.force_login(self.data["admin"])
+        for model, action, row in (
+            (VisitLog, "mark_as_completed", "visit"),
+            (ProspectCustomer, "mark_as_lost", "prospect"),
+            (Lead, "mark_as_contacted", "lead"),
+        ):
+            with self.subTest(action=action):
+                before = caching.get_version(scope)
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.post(
+                        reverse(f"admin:newapp_{model._meta.model_name}_changelist"),
+                        {"action": action, admin.helpers.ACTION_CHECKBOX_NAME: [self.data[row].pk]},
+                    )
+                self.assertNotEqual(caching.get_version(scope), before)
+
+
+def form_data(*forms):
+    """POST data reproducing what ``forms`` (forms, formsets) render, for editing before a post."""
+    data = {}
+    for form in forms:
+        if hasattr(form, "management_form"):
+            data.update(form_data(form.management_form, *form.forms))
+            continue
+        for field in form:
+            value = field.value()
+            if value is True:
+                data[field.html_name] = "on"
+            elif value is not None and value is not False:
+                data[field.html_name] = value
+    return data
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    METRICS_SAMPLE_RATE=0,
+    SEARCH_BACKEND="memory",
+    QUERY_SHAPE_DETECTION="off",
+)
+class DocumentLineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def assert_lines_saved(self, name, document):
+        self.client.force_login(self.data["user"])
+        url = reverse(f"newapp:{name}_edit", args=[document.pk])
+        response = self.client.get(url)
+        formset = response.context["item_formset"]
+        data = form_data(response.context["form"], formset)
+        prefix = formset.prefix
+        # Remove the third line, reprice the first and fill in the blank extra form
+        data[f"{prefix}-2-DELETE"] = "on"
+        data.update(
+            {
+                f"{prefix}-0-quantity": "3",
+                f"{prefix}-0-unit_price": "10",
+                f"{prefix}-0-discount_percentage": "10",
+                f"{prefix}-0-tax_percentage": "18",
+                f"{prefix}-{ROWS}-item_code": "VLV-1",
+                f"{prefix}-{ROWS}-description": "Valve",
+                f"{prefix}-{ROWS}-quantity": "2",
+                f"{prefix}-{ROWS}-uom": "Nos",
+                f"{prefix}-{ROWS}-unit_price": "50",
+                f"{prefix}-{ROWS}-discount_percentage": "0",
+                f"{prefix}-{ROWS}-tax_percentage": "5",
+            }
+        )
+        # The same number of queries whatever the number of lines
+        with assert_max_queries(DOCUMENT_SAVE_BUDGETS[name], repeat_threshold=ROWS):
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+
+        lines = list(document.items.order_by("line_number", "pk"))
+        self.assertEqual([line.line_number for line in lines], list(range(1, ROWS + 1)))
+        self.assertEqual(
+            [(line.description, line.line_total, line.tax_amount) for line in lines],
+            [("Pump", Decimal("31.86"), Decimal("4.86"))]
+            + [("Pump", Decimal("100.00"), Decimal("0.00"))] * (ROWS - 2)
+            + [("Valve", Decimal("105.00"), Decimal("5.00"))],
+        )
+        document.refresh_from_db()
+        # Line totals include their tax; the header adds the tax again, as it always has
+        subtotal = Decimal("31.86") + 100 * (ROWS - 2) + Decimal("105.00")
+        self.assertEqual(
+            (document.subtotal, document.tax_amount, document.net_amount),
+            (subtotal, Decimal("9.86"), subtotal + Decimal("9.86")),
+        )
+
+    def test_quotation_lines_are_renumbered_and_priced(self):
+        self.assert_lines_saved("quotation", self.data["quotation"])
+
+    def test_sales_order_lines_are_renumbered_and_priced(self):
+        self.assert_lines_saved("salesorder", self.data["salesorder"])
+
+
+@override_settings(CACHES=TEST_CACHES, SEARCH_BACKEND="memory")
+class ConversionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+        QuotationItem.objects.filter(line_number=1).update(tax_percentage=18)
+
+    def assert_converted(self, quotation, order):
+        quotation.refresh_from_db()
+        self.assertEqual((quotation.status, quotation.converted_to_order), ("CONVERTED", True))
+        self.assertEqual(
+            (quotation.order_number, quotation.order_date), (order.order_number, order.order_date)
+        )
+        self.assertEqual(
+            (order.prospect_id, order.assigned_to_id, order.contact_person),
+            (quotation.prospect_id, quotation.assigned_to_id, quotation.contact_person),
+        )
+        self.assertEqual(
+            list(order.items.order_by("line_number").values_list("line_number", "line_total")),
+            [(1, Decimal("118.00"))]
+            + [(number, Decimal("100.00")) for number in range(2, ROWS + 1)],
+        )
+        # Line totals include their tax; the header adds the tax again
+        subtotal = 100 * ROWS + Decimal("18.00")
+        self.assertEqual(
+            (order.subtotal, order.tax_amount, order.net_amount),
+            (subtotal, Decimal("18.00"), subtotal + 18),
+        )
+
+    def test_quotation_is_converted_once(self):
+        quotation = self.data["quotation"]
+        order = convert_quotation(quotation, created_by=self.data["user"])
+        self.assert_converted(quotation, SalesOrder.objects.get(pk=order.pk))
+        with self.assertRaisesMessage(ConversionError, "was already converted"):
+            convert_quotation(quotation)
+
+    def test_batch_skips_converted_and_empty_quotations(self):
+        quotations = list(Quotation.objects.order_by("pk"))
+        convert_quotation(quotations[0])
+        quotations[1].items.all().delete()
+
+        result = convert_quotations(Quotation.objects.all(), batch_size=2)
+        self.assertEqual(
+            (result.converted, result.skipped, result.lines), (ROWS - 2, 2, (ROWS - 2) * ROWS)
+        )
+        self.assertEqual(result.errors, [f"{quotations[1].quote_number}: no line items"])
+        self.assertFalse(Quotation.objects.get(pk=quotations[1].pk).converted_to_order)
+        for quotation in quotations[2:]:
+            self.assert_converted(
+                quotation,
+                SalesOrder.objects.get(
+                    reference_quotation=quotation, order_number__in=result.order_numbers
+                ),
+            )
+
+        # The bulk-inserted orders are counted in the order rollups
+        self.assertEqual(
+            DailyRollup.objects.filter(metric="order_status").aggregate(
+                count=Sum("count"), amount=Sum("amount")
+            ),
+            SalesOrder.objects.aggregate(count=Count("pk"), amount=Sum("net_amount")),
+        )
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    METRICS_SAMPLE_RATE=0,
+    SEARCH_BACKEND="memory",
+    QUERY_SHAPE_DETECTION="off",
+)
+class RemoteSelectTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def render(self, name):
+        url = reverse(f"newapp:{name}_edit", args=[self.data[name].pk])
+        # Warm the per-process caches (directory) first
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return len(queries), response.content.decode()
+
+    def options(self, html, field):
+        """The options of every ``<select>`` named ``field`` or ``<prefix>-<n>-field``."""
+        selects = re.findall(
+            rf'<select name="(?:[\w-]+-)?{field}"[^>]*data-remote-url[^>]*>(.*?)</select>',
+            html,
+            re.S,
+        )
+        self.assertTrue(selects, f"no remote select for {field}")
+        return [re.findall(r"<option[^>]*>", select) for select in selects]
+
+    def test_forms_render_only_the_chosen_rows(self):
+        self.client.force_login(self.data["admin"])
+        pages = ("quotation", "salesorder", "servicecall")
+        before = {name: self.render(name) for name in pages}
+
+        item = ItemMaster.objects.get()
+        ItemMaster.objects.bulk_create(
+            ItemMaster(item_code=f"BULK-{number:04d}", description="Bulk item")
+            for number in range(500)
+        )
+        ProspectCustomer.objects.bulk_create(
+            ProspectCustomer(
+                customer_id=f"BULK-{number:04d}",
+                name=f"Bulk prospect {number}",
+                phone="9000000000",
+                address="Street 1",
+                city="Pune",
+                state="MH",
+                pincode="411001",
+            )
+            for number in range(500)
+        )
+
+        for name in pages:
+            with self.subTest(page=name):
+                queries, html = self.render(name)
+                self.assertEqual(queries, before[name][0])
+                self.assertLess(abs(len(html) - len(before[name][1])), 200)
+                self.assertNotIn("BULK-", html)
+                field = "customer" if name == "servicecall" else "prospect"
+                [prospect_options] = self.options(html, field)
+                self.assertEqual(len(prospect_options), 2)
+                self.assertIn("selected", prospect_options[1])
+
+        # Service call lines (the item formset): each shows its own item, the blank extra
+        # line none, and the chosen items come with the lines rather than a query per line
+        with CaptureQueriesContext(connection) as queries:
+            html = str(ServiceCallItemFormSet(instance=self.data["servicecall"]))
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("BULK-", html)
+        item_options = self.options(html, "item_master")
+        self.assertEqual([len(options) for options in item_options], [2] * ROWS + [1])
+        self.assertIn(f'value="{item.pk}" selected', item_options[0][1])
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    METRICS_SAMPLE_RATE=0,
+    SEARCH_BACKEND="memory",
+    EXPORT_CHUNK_SIZE=4,
+    QUERY_SHAPE_DETECTION="off",
+)
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def test_list_view_streams_its_filtered_rows(self):
+        self.client.force_login(self.data["user"])
+        response = self.client.get(
+            reverse("newapp:visit_list"), {"status": "COMPLETED", "export": "csv"}
+        )
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode("utf-8-sig").splitlines()
+        self.assertEqual(lines[0].split(",")[:2], ["Visit ID", "Date"])
+        self.assertEqual(len(lines), ROWS + 1)
+        self.assertIn("Completed", lines[1])
+
+        response = self.client.get(reverse("newapp:visit_list"), {"export": "xlsx"})
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as workbook:
+            self.assertIsNone(workbook.testzip())
+            sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(sheet.count("<row>"), ROWS + 1)
+        self.assertIn(self.data["visit"].visit_id, sheet)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_large_export_is_written_in_the_background(self):
+        self.client.force_login(self.data["user"])
+        with override_settings(EXPORT_SYNC_ROWS=ROWS - 1):
+            response = self.client.get(
+                reverse("newapp:lead_list"), {"export": "csv", "status": "NEW"}
+            )
+        export = Export.objects.get(name="leads")
+        self.assertRedirects(response, reverse("newapp:export_detail", args=[export.pk]))
+        self.assertEqual((export.status, export.total_rows), ("PENDING", ROWS))
+
+        # The worker rebuilds the view's filtered queryset from the job
+        with self.assertLogs("newapp.jobs", "INFO"):
+            self.assertEqual(jobs.work("test", burst=True), 1)
+        export.refresh_from_db()
+        self.assertEqual((export.status, export.rows_written), ("DONE", ROWS))
+        response = self.client.get(reverse("newapp:export_download", args=[export.pk]))
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), ROWS + 1)
+
+        self.client.force_login(User.objects.create_user("other", "other@example.com", "x"))
+        self.assertEqual(
+            self.client.get(reverse("newapp:export_download", args=[export.pk])).status_code, 404
+        )
+
+
+@override_settings(CACHES=TEST_CACHES, SEARCH_BACKEND="memory")
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def test_memory_index_drops_deleted_rows_from_the_changes_alone(self):
+        backend = search.MemoryBackend()
+        prospects = backend.search("prospects", ["prospect"], 100)
+        self.assertEqual(len(prospects), ROWS)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.data["prospect"].delete()
+        # The version check and the entries changed since the last sync; no scan of every entry
+        with self.assertNumQueries(1):
+            prospects = backend.search("prospects", ["prospect"], 100)
+        self.assertEqual(len(prospects), ROWS - 1)
+        self.assertNotIn(self.data["prospect"].pk, prospects)
+        self.assertEqual(backend.search("leads", [self.data["lead"].lead_id.lower()], 100), [])
+
+
+@override_settings(CACHES=TEST_CACHES, SEARCH_BACKEND="memory")
+class PaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("rep", "rep@example.com", "x")
+        for number in range(23):
+            ProspectCustomer.objects.create(
+                name=f"Acme {number:02d}",
+                phone=f"90000000{number:02d}",
+                address="Street 1",
+                city="Pune",
+                state="MH",
+                pincode="411001",
+                created_by=user,
+            )
+        # Three prospects a day, so the pk breaks the ties
+        today = timezone.now()
+        for prospect in ProspectCustomer.objects.all():
+            ProspectCustomer.objects.filter(pk=prospect.pk).update(
+                created_at=today - timedelta(days=prospect.pk // 3)
+            )
+        cls.queryset = ProspectCustomer.objects.order_by("-created_at")
+        cls.expected = list(cls.queryset.order_by("-created_at", "-pk"))
+
+    def setUp(self):
+        cache.clear()
+
+    def page(self, cursor=None, queryset=None, count_mode="exact"):
+        """A page as a request would get it: a new paginator for every cursor."""
+        queryset = self.queryset if queryset is None else queryset
+        return KeysetPaginator(queryset, 5, count_mode).page(cursor)
+
+    def walk(self, queryset=None):
+        pages = [self.page(queryset=queryset)]
+        while pages[-1].has_next():
+            pages.append(self.page(pages[-1].next_cursor, queryset))
+        return pages
+
+    def test_next_walks_every_row_once(self):
+        pages = self.walk()
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4, 5])
+        self.assertEqual([row for page in pages for row in page], self.expected)
+        self.assertEqual((pages[0].paginator.count, pages[0].paginator.num_pages), (23, 5))
+        # The total travels in the cursor: later pages are one query
+        with self.assertNumQueries(1):
+            self.assertEqual(self.page(pages[1].next_cursor).number, 3)
+
+    def test_previous_goes_back_and_falls_back_to_the_first_page(self):
+        third = self.walk()[2]
+        second = self.page(third.previous_cursor)
+        self.assertEqual((second.number, list(second)), (2, self.expected[5:10]))
+        self.assertTrue(second.has_previous())
+        self.assertEqual(second.previous_url, second.first_url)
+
+        # Fewer than a page of rows left above the cursor: page 1 instead
+        ProspectCustomer.objects.filter(pk__in=[row.pk for row in self.expected[:3]]).delete()
+        first = self.page(second.previous_cursor)
+        self.assertEqual((first.number, first.has_previous()), (1, False))
+        self.assertEqual(list(first), self.expected[3:8])
+
+    def test_last_page_matches_the_last_offset_page(self):
+        last = self.page(self.page().last_cursor)
+        self.assertEqual((last.number, list(last)), (5, self.expected[20:]))
+        self.assertEqual((last.has_next(), last.has_previous()), (False, True))
+        self.assertEqual(last.start_index(), 21)
+        self.assertIsNone(last.last_url)
+
+    def test_bad_cursors_show_the_first_page(self):
+        cursor = self.page().next_cursor
+        for bad in (
+            "garbage",
+            cursor[:-2] + ("aa" if not cursor.endswith("aa") else "bb"),
+            encode_cursor({"d": "n", "k": ["not a date", "x"], "p": 7}),
+            encode_cursor({"d": "n", "k": [1]}),
+        ):
+            with self.subTest(cursor=bad):
+                page = self.page(bad)
+                self.assertEqual((page.number, list(page)), (1, self.expected[:5]))
+
+    def test_ranked_search_results_are_paged_by_offset(self):
+        ranked = search.search_queryset(ProspectCustomer.objects.all(), "prospects", "acme")
+        self.assertFalse(KeysetPaginator(ranked, 5).keyed)
+        pages = self.walk(ranked)
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4, 5])
+        self.assertEqual([row for page in pages for row in page], list(ranked))
+        last = self.page(pages[0].last_cursor, ranked)
+        self.assertEqual((last.number, len(last)), (5, 3))
+
+    def test_count_modes(self):
+        filtered = self.queryset.filter(name__lt="Acme 10")
+        for mode, count in (("exact", 10), ("cached", 10), ("approximate", 10), ("none", None)):
+            with self.subTest(mode=mode):
+                page = self.page(queryset=filtered, count_mode=mode)
+                self.assertEqual(page.paginator.count, count)
+                self.assertFalse(page.paginator.approximate)
+                self.assertEqual(page.last_cursor is None, count is None)
+                self.assertEqual(len(self.walk(filtered)), 2)
+        # A cached count is reused by the next request for the same list
+        with self.assertNumQueries(1):
+            self.assertEqual(self.page(queryset=filtered, count_mode="cached").paginator.count, 10)
+        with self.assertNumQueries(2):
+            self.page(queryset=filtered, count_mode="exact")
+
+
+class AutocompleteTests(SimpleTestCase):
+    def test_scope_applies_before_the_scan_limit(self):
+        index = autocomplete.AutocompleteIndex(autocomplete.SOURCES["prospects"])
+        columns = dict.fromkeys(("customer_id", "company_name", "email", "phone", "address"), "")
+        rows = [
+            dict(columns, id=pk, name=f"acme {pk:05d}", assigned_to_id=1, created_by_id=None)
+            for pk in range(1, autocomplete.SCAN_LIMIT * 3 + 1)
+        ]
+        rows.append(
+            dict(
+                columns,
+                id=len(rows) + 1,
+                name="acme zzz mine",
+                assigned_to_id=2,
+                created_by_id=None,
+            )
+        )
+        index.load(rows)
+
+        def own(scope):
+            return 2 in scope
+
+        self.assertEqual(
+            [row["name"] for row in index.search("acme", scope=own)], ["acme zzz mine"]
+        )
+        self.assertEqual(
+            [row["name"] for row in index.search("acme mine", scope=own)], ["acme zzz mine"]
+        )
+        self.assertEqual(len(index.search("acme")), 20)
+
+
+@override_settings(
+    CACHES=TEST_CACHES, SEARCH_BACKEND="memory", JOBS_EAGER=False, MEDIA_ROOT=tempfile.mkdtemp()
+)
+class ImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def test_duplicates_match_phone_digits_not_names(self):
+        upload = SimpleUploadedFile(
+            "prospects.csv",
+            (
+                "name,phone,email,address,city,state,pincode\n"
+                "Spaced Phone,90000 00000,,Street 2,Pune,MH,411001\n"
+                "Prospect 0,9111111111,,Street 3,Pune,MH,411001\n"
+                "New Prospect,9222222222,new@example.com,Street 4,Pune,MH,411001\n"
+            ).encode(),
+        )
+        job = importers.queue_import(upload, self.data["admin"])
+        with self.assertLogs("newapp.jobs", "INFO"):
+            self.assertEqual(jobs.work("test", burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.status, job.result["imported"], job.result["duplicates"], job.result["invalid"]),
+            ("DONE", 1, 1, 1),
+        )
+        self.assertEqual(
+            ProspectCustomer.objects.get(name="New Prospect").phone_digits, "9222222222"
+        )
+
+        error_file = job.result["url"].removeprefix(settings.MEDIA_URL)
+        with default_storage.open(error_file) as handle:
+            lines = handle.read().decode().splitlines()
+        self.assertEqual([line.split(",")[0] for line in lines], ["line", "2", "3"])
+        self.assertTrue(lines[1].endswith("duplicate phone"))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogSyncTests(TestCase):
+    FILE = (
+        "item_code,description,price,hsn,gst\n"
+        "ITM-A,Pump,94.50000000000001,,\n"
+        "ITM-B,Valve,50,,\n"
+        "ITM-D,Motor,200,,\n"
+        "ITM-E,Fan,75.005,8413,\n"
+        ",Nameless,10,,\n"
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        TaxMaster.objects.create(
+            tax_code="GST18",
+            tax_name="GST 18%",
+            tax_type="GST",
+            tax_percentage=18,
+            hsn_sac_code="8413",
+        )
+        for code, description, price, active in (
+            ("ITM-A", "Pump", "100", True),
+            ("ITM-B", "Valve", "50", True),
+            ("ITM-C", "Hose", "20", True),
+            ("ITM-D", "Motor", "200", False),
+        ):
+            ItemMaster.objects.create(
+                item_code=code, description=description, standard_price=price, is_active=active
+            )
+        cls.synced_before = timezone.now() - timedelta(days=1)
+        ItemMaster.objects.update(updated_at=cls.synced_before)
+
+    def sync(self, **kwargs):
+        return CatalogSync("items", **kwargs).run(io.BytesIO(self.FILE.encode()), "items.csv")
+
+    def items(self):
+        return {item.item_code: item for item in ItemMaster.objects.all()}
+
+    def test_sync_writes_only_the_differences(self):
+        result = self.sync(batch_size=2)
+        self.assertEqual(
+            (result.rows_read, result.created, result.updated, result.unchanged),
+            (5, 1, 2, 1),
+        )
+        self.assertEqual((result.deactivated, result.invalid), (1, 1))
+        self.assertEqual(result.errors, [(6, "item_code is required")])
+        self.assertEqual(result.field_changes, {"standard_price": 1, "is_active": 1})
+
+        items = self.items()
+        # Spreadsheet floats are rounded to the column's decimal places
+        self.assertEqual(items["ITM-A"].standard_price, Decimal("94.50"))
+        self.assertEqual(items["ITM-E"].standard_price, Decimal("75.01"))
+        # No rate in the file: taken from the tax master row for the HSN code
+        self.assertEqual(items["ITM-E"].default_tax_percentage, Decimal("18.00"))
+        self.assertEqual(
+            {code: item.is_active for code, item in items.items()},
+            {"ITM-A": True, "ITM-B": True, "ITM-C": False, "ITM-D": True, "ITM-E": True},
+        )
+        # The autocomplete index picks up catalog changes by updated_at
+        self.assertEqual(items["ITM-B"].updated_at, self.synced_before)
+        for code in ("ITM-A", "ITM-C", "ITM-D"):
+            self.assertGreater(items[code].updated_at, self.synced_before)
+
+        result = self.sync()
+        self.assertEqual((result.created, result.updated, result.unchanged), (0, 0, 4))
+
+    def test_dry_run_writes_nothing(self):
+        before = list(ItemMaster.objects.order_by("pk").values())
+        result = self.sync(dry_run=True)
+        self.assertEqual((result.created, result.updated, result.deactivated), (1, 2, 1))
+        self.assertEqual(list(ItemMaster.objects.order_by("pk").values()), before)
+
+
+calls = []
+
+
+@jobs.task("tests.flaky", max_attempts=2)
+def flaky_task(job, fail=0, permanent=False):
+    calls.append(job.pk)
+    if permanent:
+        raise jobs.PermanentError("bad input")
+    if job.attempts <= fail:
+        raise RuntimeError(f"attempt {job.attempts} failed")
+    job.set_progress(1, 2, "half way")
+    return {"message": "ok"}
+
+
+@override_settings(JOBS_RETRY_BACKOFF=60, JOBS_EAGER=False)
+class JobTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_run_by_priority_and_retry_with_backoff(self):
+        low = jobs.enqueue("tests.flaky", priority=Job.PRIORITY_LOW)
+        flaky = jobs.enqueue("tests.flaky", fail=1)
+        later = jobs.enqueue("tests.flaky", delay=3600)
+
+        with self.assertLogs("newapp.jobs", "INFO") as logs:
+            self.assertEqual(jobs.work("test", burst=True), 2)
+        self.assertEqual(calls, [flaky.pk, low.pk])
+        self.assertIn(f"Job {flaky.pk} (tests.flaky) attempt 1 failed, retrying in", logs.output[1])
+        flaky.refresh_from_db()
+        self.assertEqual((flaky.status, flaky.attempts), ("QUEUED", 1))
+        self.assertIn("attempt 1 failed", flaky.error)
+        self.assertGreaterEqual(flaky.run_at - timezone.now(), timedelta(seconds=59))
+
+        Job.objects.filter(pk=flaky.pk).update(run_at=timezone.now())
+        with self.assertLogs("newapp.jobs", "INFO"):
+            jobs.work("test", burst=True)
+        flaky.refresh_from_db()
+        self.assertEqual((flaky.status, flaky.attempts, flaky.progress), ("DONE", 2, 100))
+        self.assertEqual(flaky.result, {"message": "ok"})
+        self.assertEqual(Job.objects.get(pk=later.pk).status, "QUEUED")
+
+    def test_out_of_attempts_and_permanent_errors_fail(self):
+        failing = jobs.enqueue("tests.flaky", fail=5)
+        permanent = jobs.enqueue("tests.flaky", permanent=True)
+        with self.assertLogs("newapp.jobs", "INFO") as logs:
+            jobs.run_job(permanent.pk)
+            jobs.run_job(failing.pk)
+            Job.objects.filter(pk=failing.pk).update(run_at=timezone.now())
+            jobs.run_job(failing.pk)
+        self.assertEqual(logs.records[-1].levelname, "ERROR")
+        self.assertEqual(
+            list(Job.objects.filter(status="FAILED").values_list("pk", "attempts").order_by("pk")),
+            [(failing.pk, 2), (permanent.pk, 1)],
+        )
+        # A claimed job is not run twice
+        self.assertIsNone(jobs.run_job(failing.pk))
+
+    def test_stale_running_jobs_are_queued_again(self):
+        job = jobs.enqueue("tests.flaky")
+        Job.objects.filter(pk=job.pk).update(
+            status="RUNNING", attempts=1, started_at=timezone.now() - timedelta(hours=2)
+        )
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, "QUEUED")
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    METRICS_SAMPLE_RATE=0,
+    SEARCH_BACKEND="memory",
+    QUERY_SHAPE_DETECTION="off",
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    JOBS_EAGER=False,
+)
+class DocumentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def test_pdf_is_rendered_in_the_background_then_served_from_storage(self):
+        self.client.force_login(self.data["user"])
+        url = reverse("newapp:quotation_pdf", args=[self.data["quotation"].pk])
+        response = self.client.get(url)
+        job = Job.objects.get(task="documents.render")
+        self.assertRedirects(response, reverse("newapp:job_detail", args=[job.pk]))
+
+        with self.assertLogs("newapp.jobs", "INFO"):
+            self.assertEqual(jobs.work("test", burst=True), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).result["url"], url)
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF-1.4"))
+        self.assertFalse(Job.objects.filter(status="QUEUED").exists())
+
+    def test_unchanged_documents_are_not_rendered_again(self):
+        order = self.data["salesorder"]
+        path, rendered = documents.get_pdf(order)
+        self.assertTrue(rendered)
+        # Status changes are not printed, so the stored copy still holds
+        SalesOrder.objects.filter(pk=order.pk).update(status="CONFIRMED")
+        self.assertEqual(documents.get_pdf(SalesOrder.objects.get(pk=order.pk)), (path, False))
+
+        order.items.filter(line_number=1).update(quantity=3)
+        changed, rendered = documents.get_pdf(order)
+        self.assertTrue(rendered)
+        self.assertNotEqual(changed, path)
+
+    def test_sent_quotation_is_mailed_with_its_pdf(self):
+        quotation = self.data["quotation"]
+        Quotation.objects.filter(pk=quotation.pk).update(contact_email="buyer@example.com")
+        self.client.force_login(self.data["user"])
+        self.client.get(reverse("newapp:quotation_send", args=[quotation.pk]))
+        with self.assertLogs("newapp.jobs", "INFO"):
+            jobs.work("test", burst=True)
+
+        self.assertEqual(len(mail.outbox), 1)
+        ((name, content, mimetype),) = mail.outbox[0].attachments
+        self.assertEqual((name, mimetype), (f"{quotation.quote_number}.pdf", "application/pdf"))
+        self.assertTrue(content.startswith(b"%PDF"))
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    METRICS_SAMPLE_RATE=0,
+    SEARCH_BACKEND="memory",
+    QUERY_SHAPE_DETECTION="off",
+    DASHBOARD_STREAM_INTERVAL=0,
+    DASHBOARD_STREAM_MAX_AGE=0.05,
+)
+class DashboardStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+
+    def setUp(self):
+        cache.clear()
+
+    def events(self, chunks):
+        return [
+            dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+            for chunk in chunks
+            if "event: " in chunk
+        ]
+
+    def test_stream_sends_changed_keys_only_after_a_change(self):
+        stream = DashboardStream(self.data["employee"])
+        [snapshot] = self.events(stream.poll())
+        self.assertEqual(snapshot["event"], "snapshot")
+
+        # Watching an unchanged scope is a cache read
+        with self.assertNumQueries(0):
+            self.assertEqual(stream.poll(), [])
+
+        prospect = ProspectCustomer.objects.filter(assigned_to=self.data["employee"]).first()
+        prospect.status = "WON"
+        with self.captureOnCommitCallbacks(execute=True):
+            prospect.save()
+        [delta] = self.events(stream.poll())
+        self.assertEqual(delta["event"], "delta")
+        self.assertNotEqual(delta["id"], snapshot["id"])
+        changed = json.loads(delta["data"])
+        self.assertEqual(changed["converted_count"], 1)
+        self.assertNotIn("total_leads", changed)
+
+    async def read(self, response):
+        return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_stream_view(self):
+        await self.async_client.aforce_login(self.data["user"])
+        response = await self.async_client.get(reverse("newapp:dashboard_stream"))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = await self.read(response)
+        self.assertTrue(body.startswith("retry: "))
+        [snapshot] = self.events(body.split("\n\n"))
+
+        # A reconnect that already shows the current data gets no snapshot
+        response = await self.async_client.get(
+            reverse("newapp:dashboard_stream"), headers={"last-event-id": snapshot["id"]}
+        )
+        self.assertEqual(self.events((await self.read(response)).split("\n\n")), [])
+
+        with override_settings(DASHBOARD_STREAM=False):
+            response = await self.async_client.get(reverse("newapp:dashboard_stream"))
+            self.assertEqual(response.status_code, 204)
+
+    def test_stream_view_under_wsgi_tells_the_browser_to_poll(self):
+        self.client.force_login(self.data["user"])
+        self.assertEqual(self.client.get(reverse("newapp:dashboard_stream")).status_code, 204)
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    METRICS_SAMPLE_RATE=1,
+    SEARCH_BACKEND="memory",
+    QUERY_SHAPE_DETECTION="raise",
+)
+class AsyncApiTests(TestCase):
+    """The async JSON views through ASGI (AsyncClient), with every middleware in async mode."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_crm_data()
+        cls.other = ProspectCustomer.objects.create(
+            name="Other",
+            phone="9000000001",
+            address="Street 2",
+            city="Pune",
+            state="MH",
+            pincode="411001",
+            created_by=cls.data["admin"],
+        )
+
+    async def test_lookups(self):
+        await self.async_client.aforce_login(self.data["user"])
+        quotation = self.data["quotation"]
+        response = await self.async_client.get(
+            reverse("newapp:get_quotation_data"), {"quote_number": quotation.quote_number}
+        )
+        body = response.json()
+        self.assertEqual(
+            (body["quotation"]["prospect_id"], len(body["items"])), (quotation.prospect_id, ROWS)
+        )
+
+        response = await self.async_client.get(
+            reverse("newapp:get_prospect_data"), {"id": quotation.prospect_id}
+        )
+        self.assertEqual(response.json()["prospect"]["id"], quotation.prospect_id)
+        # Neither assigned to nor created by the employee
+        response = await self.async_client.get(
+            reverse("newapp:get_prospect_data"), {"id": self.other.pk}
+        )
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.get(reverse("newapp:search_items"), {"q": "pump"})
+        self.assertEqual([item["item_code"] for item in response.json()["items"]], ["ITM-001"])
+        response = await self.async_client.get(reverse("newapp:dashboard_data_api"))
+        self.assertEqual(response.json()["total_leads"], ROWS)
+
+        await self.async_client.aforce_login(self.data["admin"])
+        response = await self.async_client.get(
+            reverse("newapp:get_prospect_data"), {"id": self.other.pk}
+        )
+        self.assertEqual(response.json()["prospect"]["name"], "Other")
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    METRICS_SAMPLE_RATE=0,
+    METRICS_TOKEN="scrape-token",
+    SEARCH_BACKEND="memory",
+    QUERY_SHAPE_DETECTION="off",
+)
+class MetricsTests(TestCase):
+    """/metrics access, the Prometheus text format and the per-process JSON log."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", "staff@example.com", "x", is_staff=True)
+        cls.user = User.objects.create_user("rep", "rep@example.com", "x")
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_staff_only(self):
+        url = reverse("newapp:metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        self.assertIn(
+            'crm_http_requests_total{view="newapp:metrics",method="GET",status="403"} 2',
+            response.content.decode(),
+        )
+
+    def test_bearer_token(self):
+        url = reverse("newapp:metrics")
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer scrape-token")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE crm_http_requests_total counter", response.content.decode())
+
+        for header in ("Bearer wrong-token", "scrape-token", "Bearer scrape-token2", "Bearer "):
+            with self.subTest(header=header):
+                self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=header).status_code, 403)
+        # No token configured: the header alone never grants access
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+    def test_text_format(self):
+        view = 'newapp:"lead_list"'
+        latency = [1, 2] + [0] * (len(metrics.LATENCY_BUCKETS) - 2) + [1, 12.5]
+        data = {
+            "requests": {(view, "GET", 200): 3, (view, "POST", 302): 1},
+            "latency": {view: latency},
+            "sampled": {view: [2, 7, 0.0125, 0.25, 3, 1]},
+            "processes": 2,
+        }
+        with self.settings(METRICS_SAMPLE_RATE=0.5):
+            lines = metrics.render_prometheus(data).splitlines()
+
+        labels = 'view="newapp:\\"lead_list\\""'
+        self.assertEqual(
+            [line for line in lines if line.startswith("crm_http_requests_total")],
+            [
+                f'crm_http_requests_total{{{labels},method="GET",status="200"}} 3',
+                f'crm_http_requests_total{{{labels},method="POST",status="302"}} 1',
+            ],
+        )
+        histogram = [line for line in lines if line.startswith("crm_http_request_duration")]
+        self.assertEqual(
+            histogram,
+            [
+                f'crm_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}'
+                for bound, count in zip(
+                    (*metrics.LATENCY_BUCKETS, "+Inf"), [1] + [3] * (len(latency) - 3) + [4]
+                )
+            ]
+            + [
+                f"crm_http_request_duration_seconds_sum{{{labels}}} 12.5",
+                f"crm_http_request_duration_seconds_count{{{labels}}} 4",
+            ],
+        )
+        for line in (
+            "# HELP crm_http_request_duration_seconds Request latency by URL name.",
+            "# TYPE crm_http_request_duration_seconds histogram",
+            f"crm_sampled_requests_total{{{labels}}} 2",
+            f"crm_db_queries_total{{{labels}}} 7",
+            f"crm_db_query_seconds_total{{{labels}}} 0.0125",
+            f"crm_template_render_seconds_total{{{labels}}} 0.25",
+            f"crm_cache_hits_total{{{labels}}} 3",
+            f"crm_cache_misses_total{{{labels}}} 1",
+            "crm_metrics_processes 2",
+            "crm_metrics_sample_rate 0.5",
+        ):
+            self.assertIn(line, lines)
+
+    def test_log_file_per_process(self):
+        with tempfile.TemporaryDirectory() as directory:
+            handler = metrics.JsonLogHandler(
+                f"{directory}/logs/metrics.log", maxBytes=1024, backupCount=1, delay=True
+            )
+            self.addCleanup(handler.close)
+            handler.emit(logging.makeLogRecord({"msg": '{"view": "newapp:index"}'}))
+            handler.close()
+            path = f"{directory}/logs/metrics.{os.getpid()}.log"
+            with open(path) as log:
+                self.assertEqual(log.read(), '{"view": "newapp:index"}\n')
+
+            # A stream inherited through fork() is swapped for the new process's own file
+            handler.pid = -1
+            handler.stream = open(f"{directory}/logs/parent.log", "a")
+            handler.emit(logging.makeLogRecord({"msg": "second"}))
+            handler.close()
+            with open(path) as log:
+                self.assertEqual(log.read().splitlines()[-1], "second")
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    METRICS_SAMPLE_RATE=0,
+    SEARCH_BACKEND="memory",
+    QUERY_SHAPE_DETECTION="off",
+    SESSION_ENGINE="django.contrib.sessions.backends.db",
+    SESSION_REFRESH_INTERVAL=60,
+)
+class SessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("rep", "rep@example.com", "x")
+        self.client.force_login(self.user)
+        self.client.get(reverse("newapp:session_ping"), {"active": "1"})
+
+    def session_row(self):
+        return Session.objects.get(session_key=self.client.session.session_key)
+
+    def age_session(self, seconds):
+        session = self.client.session
+        session[REFRESHED_AT] -= seconds
+        session.save()
+
+    def test_session_is_saved_once_per_refresh_interval(self):
+        saved = self.session_row().expire_date
+        self.client.get(reverse("newapp:dashboard"))
+        self.assertEqual(self.session_row().expire_date, saved)
+
+        self.age_session(61)
+        Session.objects.update(expire_date=saved)
+        self.client.get(reverse("newapp:dashboard"))
+        self.assertGreater(self.session_row().expire_date, saved)
+
+    def test_ping_extends_the_session_only_for_active_users(self):
+        self.age_session(300)
+        # An idle tab's ping leaves the timer running
+        for _ in range(2):
+            response = self.client.get(reverse("newapp:session_ping"))
+            self.assertTrue(response.json()["authenticated"])
+            self.assertAlmostEqual(response.json()["expires_in"], 300, delta=2)
+        response = self.client.get(reverse("newapp:session_ping"), {"active": "1"})
+        self.assertAlmostEqual(response.json()["expires_in"], 600, delta=2)
+
+        self.client.logout()
+        response = self.client.get(reverse("newapp:session_ping"))
+        self.assertEqual((response.status_code, response.json()["authenticated"]), (401, False))
+
+    def test_purge_sessions_deletes_expired_rows(self):
+        Session.objects.create(
+            session_key="expired", session_data="", expire_date=timezone.now() - timedelta(days=1)
+        )
+        call_command("purge_sessions", batch_size=1, stdout=io.StringIO())
+        self.assertEqual(
+            list(Session.objects.values_list("session_key", flat=True)),
+            [self.client.session.session_key],
+        )
+
+
+@override_settings(DOCUMENT_SEQUENCE_BLOCK_SIZE=20)
+class SequenceTests(TestCase):
+    def setUp(self):
+        sequences.reset_cache()
+
+    def test_transactions_take_numbers_from_the_cached_block(self):
+        numbers = []
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+                numbers.append(sequences.next_number("QUO"))
+        self.assertEqual(numbers, ["QUO-000001", "QUO-000002", "QUO-000003"])
+        self.assertEqual(DocumentSequence.objects.get(key="QUO").last_value, 20)
+
+
+@override_settings(CACHES=TEST_CACHES, SEARCH_BACKEND="memory")
+class SeedingTests(TestCase):
+    def test_seeded_documents_reference_each_other_consistently(self):
+        inserted = seeding.seed(2000, seed=1, batch_size=50)
+        self.assertAlmostEqual(sum(inserted.values()), 2000, delta=400)
+
+        for lead in Lead.objects.exclude(originating_visit=None).select_related(
+            "originating_visit"
+        ):
+            self.assertEqual(lead.originating_visit.prospect_id, lead.prospect_id)
+            self.assertGreaterEqual(lead.created_at, lead.originating_visit.created_at)
+        for order in SalesOrder.objects.select_related("reference_quotation").prefetch_related(
+            "items"
+        ):
+            self.assertEqual(order.reference_quotation.prospect_id, order.prospect_id)
+            self.assertEqual(
+                order.net_amount, document_totals(order, order.items.all())["net_amount"]
+            )
+        self.assertFalse(
+            ServiceCall.objects.exclude(customer_id=F("related_order__prospect_id")).exists()
+        )
+
+    def test_seeding_tops_up_and_reset_removes_everything(self):
+        seeding.seed(1000, batch_size=100)
+        prospects = seeding.seeded_prospects().count()
+        self.assertEqual(seeding.seed(1000), {})
+        seeding.seed(2000, batch_size=100)
+        self.assertGreater(seeding.seeded_prospects().count(), prospects)
+
+        seeding.reset()
+        self.assertFalse(seeding.seeded_prospects().exists())
+        self.assertFalse(
+            User.objects.filter(username__startswith=seeding.SEED_USER_PREFIX).exists()
+        )
+        self.assertFalse(Quotation.objects.exists())
@@ -48,6 +48,7 @@ urlpatterns = [
     path('quotations/create/', views.QuotationCreateView.as_view(), name='quotation_create'),
     path('quotations/<int:pk>/', views.QuotationDetailView.as_view(), name='quotation_detail'),
     path('quotations/<int:pk>/edit/', views.QuotationUpdateView.as_view(), name='quotation_edit'),
+    path('quotations/<int:pk>/pdf/', views.quotation_pdf, name='quotation_pdf'),
     path('quotations/<int:pk>/send/', views.quotation_send, name='quotation_send'),
     path('quotations/<int:pk>/approve/', views.quotation_approve, name='quotation_approve'),
     path('quotations/<int:pk>/reject/', views.quotation_reject, name='quotation_reject'),
@@ -59,6 +60,7 @@ urlpatterns = [
     path('orders/create/', views.SalesOrderCreateView.as_view(), name='salesorder_create'),
     path('orders/<int:pk>/', views.SalesOrderDetailView.as_view(), name='salesorder_detail'),
     path('orders/<int:pk>/edit/', views.SalesOrderUpdateView.as_view(), name='salesorder_edit'),
+    path('orders/<int:pk>/pdf/', views.salesorder_pdf, name='salesorder_pdf'),
     path('orders/<int:pk>/confirm/', views.salesorder_confirm, name='salesorder_confirm'),
     path('orders/<int:pk>/approve/', views.salesorder_approve, name='salesorder_approve'),
     path('orders/<int:pk>/reject/', views.salesorder_reject, name='salesorder_reject'),
@@ -79,4 +81,16 @@ urlpatterns = [
     path('api/get-prospect/', views.get_prospect_data, name='get_prospect_data'),
     path('api/dashboard-data/', views.dashboard_data_api, name='dashboard_data_api'),
     path('api/dashboard-updates/', views.dashboard_data_api, name='dashboard_updates_legacy'),
+    path('api/dashboard-stream/', views.dashboard_stream, name='dashboard_stream'),
+    
+    # Exports & background jobs
+    path('exports/<int:pk>/', views.export_detail, name='export_detail'),
+    path('exports/<int:pk>/download/', views.export_download, name='export_download'),
+    path('jobs/<int:pk>/', views.job_detail, name='job_detail'),
+
+    # Session keepalive
+    path('session/ping/', views.session_ping, name='session_ping'),
+    
+    # Monitoring
+    path('metrics', views.metrics_endpoint, name='metrics'),
 ]
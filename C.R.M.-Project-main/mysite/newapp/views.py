@@ -1,13 +1,19 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.generic import TemplateView, CreateView, ListView, UpdateView, DeleteView, DetailView
 from django.contrib.auth.views import LoginView
 from django.contrib.auth import login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse_lazy
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Sum
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
 from datetime import datetime, timedelta
 from .forms import (CustomSignUpForm, CustomSignInForm, ProspectCustomerForm, VisitLogForm, 
                     VisitApprovalForm, LeadForm, LeadActivityForm, QuotationForm, QuotationItemFormSet,
@@ -17,7 +23,18 @@ from .forms import (CustomSignUpForm, CustomSignInForm, ProspectCustomerForm, Vi
 from .models import (ProspectCustomer, VisitLog, SalesEmployee, Lead, LeadHistory, LeadActivity,
                      Quotation, QuotationItem, QuotationAttachment, QuotationActivity,
                      SalesOrder, SalesOrderItem, SalesOrderAttachment, SalesOrderActivity,
-                     ServiceCall, ServiceCallItem, ServiceCallAttachment, ServiceActivity)
+                     ServiceCall, ServiceCallItem, ServiceCallAttachment, ServiceActivity, Export, Job)
+from . import documents, sessions
+from .conversion import ConversionError, convert_quotation
+from .dashboard import DashboardStream, get_cached_dashboard_metrics, dashboard_payload, empty_metrics
+from .exports import FORMATS, ExportMixin, export_or_start, export_urls, file_name
+from .metrics import render_prometheus
+from .notifications import notify
+from .pagination import KeysetPaginationMixin
+from .pricing import apply_totals, document_totals, save_lines
+from .rollups import rollup_rows
+from .scope import ScopedQuerysetMixin, aget_scope, get_scope
+from .search import search_queryset
 
 # Create your views here.
 class IndexView(TemplateView):
@@ -52,102 +69,25 @@ def logout_view(request):
 
 
 # CRM Dashboard
-class DashboardView(LoginRequiredMixin, TemplateView):
+class DashboardView(LoginRequiredMixin, ScopedQuerysetMixin, TemplateView):
     template_name = 'newapp/dashboard.html'
     login_url = 'newapp:signin'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Get effective user (admin viewing as another user or current user)
-        view_as_user_id = self.request.GET.get('view_as_user')
-        if view_as_user_id and view_as_user_id != 'self' and (self.request.user.is_staff or self.request.user.is_superuser):
-            try:
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                user = User.objects.get(id=view_as_user_id)
-                context['viewing_as'] = user.get_full_name() or user.username
-            except (ValueError, User.DoesNotExist):
-                user = self.request.user
-        else:
-            user = self.request.user
-        
-        # Date calculations
-        today = timezone.now().date()
-        month_start = today.replace(day=1)
-        week_ago = today - timedelta(days=7)
+        # Admin viewing as another user, or the signed-in user (resolved once per request)
+        if self.scope.viewed_user:
+            context['viewing_as'] = self.scope.viewing_as
         
         # Check if admin (and not viewing as specific user)
-        is_admin_view = (self.request.user.is_staff or self.request.user.is_superuser) and (not view_as_user_id or view_as_user_id == 'self')
+        is_admin_view = self.scope.is_admin_view
         context['is_admin'] = is_admin_view
         
-        # Prepare dashboard data for JavaScript
-        dashboard_data = {}
-        
         if is_admin_view:
             # ADMIN DASHBOARD - Aggregate data across all users
-            
-            # Total Visits (Today / Month)
-            visits_today = VisitLog.objects.filter(visit_date=today).count()
-            visits_month = VisitLog.objects.filter(visit_date__gte=month_start).count()
-            
-            # Total Leads (By Stage)
-            leads_by_stage = list(ProspectCustomer.objects.values('status').annotate(count=Count('id')).order_by('status'))
-            total_leads = ProspectCustomer.objects.count()
-            context['visits_today'] = visits_today
-            context['visits_month'] = visits_month
-            context['total_visits'] = VisitLog.objects.count()
-            
-            # Total Leads (By Stage)
-            context['leads_by_stage'] = ProspectCustomer.objects.values('status').annotate(count=Count('id')).order_by('status')
-            context['total_leads'] = total_leads
-            context['active_leads'] = ProspectCustomer.objects.filter(status__in=['NEW', 'CONTACTED', 'QUALIFIED', 'PROPOSAL', 'NEGOTIATION']).count()
-            
-            # Conversion %
-            total_prospects = ProspectCustomer.objects.count()
-            converted_prospects = ProspectCustomer.objects.filter(status='WON').count()
-            conversion_rate = round((converted_prospects / total_prospects * 100), 1) if total_prospects > 0 else 0
-            
-            # Upcoming follow-ups
-            upcoming_followups_raw = VisitLog.objects.filter(
-                next_follow_up_date__gte=today,
-                next_follow_up_date__lte=today + timedelta(days=7)
-            ).select_related('prospect', 'sales_employee__user').values(
-                'prospect__name', 'prospect__company_name', 'next_follow_up_date', 
-                'visit_date', 'sales_employee__user__first_name', 'sales_employee__user__last_name'
-            )
-            
-            # Convert date objects to strings for JSON serialization
-            upcoming_followups = []
-            for followup in upcoming_followups_raw:
-                upcoming_followups.append({
-                    'prospect__name': followup['prospect__name'],
-                    'prospect__company_name': followup['prospect__company_name'],
-                    'next_follow_up_date': followup['next_follow_up_date'].strftime('%Y-%m-%d') if followup['next_follow_up_date'] else None,
-                    'visit_date': followup['visit_date'].strftime('%Y-%m-%d') if followup['visit_date'] else None,
-                    'sales_employee__user__first_name': followup['sales_employee__user__first_name'] or '',
-                    'sales_employee__user__last_name': followup['sales_employee__user__last_name'] or ''
-                })
-            
-            dashboard_data = {
-                'visits_today': visits_today,
-                'visits_month': visits_month,
-                'total_leads': total_leads,
-                'conversion_rate': conversion_rate,
-                'converted_count': converted_prospects,
-                'leads_by_stage': leads_by_stage,
-                'upcoming_followups': upcoming_followups
-            }
-            
-            # Set context variables for template rendering
-            context['visits_today'] = visits_today
-            context['visits_month'] = visits_month
-            context['total_visits'] = VisitLog.objects.count()
-            context['leads_by_stage'] = leads_by_stage
-            context['total_leads'] = total_leads
-            context['active_leads'] = ProspectCustomer.objects.filter(status__in=['NEW', 'CONTACTED', 'QUALIFIED', 'PROPOSAL', 'NEGOTIATION']).count()
-            context['conversion_rate'] = conversion_rate
-            context['converted_count'] = converted_prospects
+            metrics = get_cached_dashboard_metrics()
+            context.update(metrics)
             
             # Employee-wise performance
             context['employee_performance'] = SalesEmployee.objects.annotate(
@@ -156,148 +96,44 @@ class DashboardView(LoginRequiredMixin, TemplateView):
                 completed_visits=Count('visits', filter=Q(visits__status='COMPLETED'))
             ).select_related('user').order_by('-visit_count')[:10]
             
-            # Upcoming Follow-ups (All employees)
-            context['upcoming_followups'] = VisitLog.objects.filter(
-                next_follow_up_date__gte=today,
-                next_follow_up_date__lte=today + timedelta(days=7)
-            ).select_related('prospect', 'sales_employee__user').order_by('next_follow_up_date')[:10]
-            
-            # Pending Approvals
-            context['pending_approvals'] = VisitLog.objects.filter(approval_status='PENDING').count()
-            
             context['is_sales_employee'] = True
             
         else:
             # SALES EXECUTIVE/REP DASHBOARD - Individual data
-            try:
-                sales_employee = user.sales_profile
-                
-                # Today's Visits
-                context['visits_today'] = VisitLog.objects.filter(
-                    sales_employee=sales_employee,
-                    visit_date=today
-                ).count()
-                
-                # Monthly Visit Count
-                visits_month = VisitLog.objects.filter(
-                    sales_employee=sales_employee,
-                    visit_date__gte=month_start
-                ).count()
-                context['visits_month'] = visits_month
-                context['total_visits'] = VisitLog.objects.filter(sales_employee=sales_employee).count()
-                
-                # Pending Follow-ups
-                upcoming_followups_raw = VisitLog.objects.filter(
-                    sales_employee=sales_employee,
-                    next_follow_up_date__gte=today,
-                    next_follow_up_date__lte=today + timedelta(days=7)
-                ).select_related('prospect').values(
-                    'prospect__name', 'prospect__company_name', 'next_follow_up_date', 'visit_date',
-                    'sales_employee__user__first_name', 'sales_employee__user__last_name'
-                )
-                
-                # Convert date objects to strings for JSON serialization
-                upcoming_followups = []
-                for followup in upcoming_followups_raw:
-                    upcoming_followups.append({
-                        'prospect__name': followup['prospect__name'],
-                        'prospect__company_name': followup['prospect__company_name'],
-                        'next_follow_up_date': followup['next_follow_up_date'].strftime('%Y-%m-%d') if followup['next_follow_up_date'] else None,
-                        'visit_date': followup['visit_date'].strftime('%Y-%m-%d') if followup['visit_date'] else None,
-                        'sales_employee__user__first_name': followup['sales_employee__user__first_name'] or '',
-                        'sales_employee__user__last_name': followup['sales_employee__user__last_name'] or ''
-                    })
-                
-                # Active Leads
-                active_leads = ProspectCustomer.objects.filter(
-                    assigned_to=sales_employee,
-                    status__in=['NEW', 'CONTACTED', 'QUALIFIED', 'PROPOSAL', 'NEGOTIATION']
-                ).count()
-                total_leads = ProspectCustomer.objects.filter(assigned_to=sales_employee).count()
-                
-                # Conversion Status
-                my_prospects = total_leads
-                my_converted = ProspectCustomer.objects.filter(assigned_to=sales_employee, status='WON').count()
-                conversion_rate = round((my_converted / my_prospects * 100), 1) if my_prospects > 0 else 0
-                
-                # Leads by Stage
-                leads_by_stage = list(ProspectCustomer.objects.filter(assigned_to=sales_employee).values('status').annotate(count=Count('id')).order_by('status'))
-                
-                dashboard_data = {
-                    'visits_today': visits_today,
-                    'visits_month': visits_month,
-                    'total_leads': total_leads,
-                    'active_leads': active_leads,
-                    'conversion_rate': conversion_rate,
-                    'converted_count': my_converted,
-                    'leads_by_stage': leads_by_stage,
-                    'upcoming_followups': upcoming_followups
-                }
-                
-                # Set context variables for template rendering
-                context['visits_today'] = visits_today
-                context['visits_month'] = visits_month
-                context['total_visits'] = VisitLog.objects.filter(sales_employee=sales_employee).count()
-                context['upcoming_followups'] = VisitLog.objects.filter(
-                    sales_employee=sales_employee,
-                    next_follow_up_date__gte=today,
-                    next_follow_up_date__lte=today + timedelta(days=7)
-                ).select_related('prospect').order_by('next_follow_up_date')[:10]
-                context['pending_followups_count'] = context['upcoming_followups'].count()
-                context['active_leads'] = active_leads
-                context['total_leads'] = total_leads
-                context['conversion_rate'] = conversion_rate
-                context['converted_count'] = my_converted
-                context['leads_by_stage'] = leads_by_stage
-                
-                # Pending Approvals (own)
-                context['pending_approvals'] = VisitLog.objects.filter(
-                    sales_employee=sales_employee,
-                    approval_status='PENDING'
-                ).count()
+            sales_employee = self.scope.employee
+            if sales_employee is not None:
+                metrics = get_cached_dashboard_metrics(sales_employee)
+                context.update(metrics)
+                context['pending_followups_count'] = len(metrics['upcoming_followups'])
                 
                 # Recent visits
-                context['recent_visits'] = VisitLog.objects.filter(
-                    sales_employee=sales_employee
-                ).select_related('prospect').order_by('-visit_date', '-visit_time')[:5]
+                context['recent_visits'] = VisitLog.objects.owned_by(self.scope).select_related(
+                    'prospect'
+                ).order_by('-visit_date', '-visit_time')[:5]
                 
                 context['is_sales_employee'] = True
                 context['sales_employee'] = sales_employee
                 
-            except SalesEmployee.DoesNotExist:
+            else:
+                metrics = empty_metrics()
+                context.update(metrics)
                 context['is_sales_employee'] = False
-                context['visits_today'] = 0
-                context['visits_month'] = 0
-                context['total_visits'] = 0
                 context['pending_followups_count'] = 0
-                context['active_leads'] = 0
-                context['total_leads'] = 0
-                context['conversion_rate'] = 0
-                context['converted_count'] = 0
-                context['pending_approvals'] = 0
                 context['recent_visits'] = []
-                context['upcoming_followups'] = []
-                context['leads_by_stage'] = []
-                
-                dashboard_data = {
-                    'visits_today': 0,
-                    'visits_month': 0,
-                    'total_leads': 0,
-                    'conversion_rate': 0,
-                    'converted_count': 0,
-                    'leads_by_stage': [],
-                    'upcoming_followups': []
-                }
+        
+        dashboard_data = dashboard_payload(metrics)
         
         # Convert dashboard data to JSON for JavaScript
         import json
         context['dashboard_json'] = json.dumps(dashboard_data)
+        # Starting point for the live updates of dashboard.js (json_script in the template)
+        context['dashboard_data'] = dashboard_data
         
         return context
 
 
 # Prospect Management Views
-class ProspectListView(LoginRequiredMixin, ListView):
+class ProspectListView(LoginRequiredMixin, ExportMixin, KeysetPaginationMixin, ListView):
     model = ProspectCustomer
     template_name = 'newapp/prospect_list.html'
     context_object_name = 'prospects'
@@ -307,16 +143,6 @@ class ProspectListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         queryset = ProspectCustomer.objects.all().select_related('assigned_to__user')
         
-        # Filter by search query
-        search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(company_name__icontains=search) |
-                Q(phone__icontains=search) |
-                Q(email__icontains=search)
-            )
-        
         # Filter by type
         prospect_type = self.request.GET.get('type')
         if prospect_type:
@@ -327,6 +153,11 @@ class ProspectListView(LoginRequiredMixin, ListView):
         if status:
             queryset = queryset.filter(status=status)
         
+        # Search the full-text index, best match first
+        search = self.request.GET.get('search')
+        if search:
+            return search_queryset(queryset, 'prospects', search)
+        
         return queryset.order_by('-created_at')
 
 
@@ -365,7 +196,7 @@ class ProspectDetailView(LoginRequiredMixin, DetailView):
 
 
 # Visit Management Views
-class VisitListView(LoginRequiredMixin, ListView):
+class VisitListView(LoginRequiredMixin, ExportMixin, ScopedQuerysetMixin, KeysetPaginationMixin, ListView):
     model = VisitLog
     template_name = 'newapp/visit_list.html'
     context_object_name = 'visits'
@@ -373,15 +204,8 @@ class VisitListView(LoginRequiredMixin, ListView):
     login_url = 'newapp:signin'
     
     def get_queryset(self):
-        user = self.request.user
-        
-        try:
-            sales_employee = user.sales_profile
-            queryset = VisitLog.objects.filter(
-                sales_employee=sales_employee
-            ).select_related('prospect', 'sales_employee__user')
-        except SalesEmployee.DoesNotExist:
-            queryset = VisitLog.objects.none()
+        # Only the user's own visits, admins included
+        queryset = VisitLog.objects.owned_by(self.scope).select_related('prospect', 'sales_employee__user')
         
         # Filter by date range
         start_date = self.request.GET.get('start_date')
@@ -404,7 +228,7 @@ class VisitListView(LoginRequiredMixin, ListView):
         return queryset.order_by('-visit_date', '-visit_time')
 
 
-class VisitCreateView(LoginRequiredMixin, CreateView):
+class VisitCreateView(LoginRequiredMixin, ScopedQuerysetMixin, CreateView):
     model = VisitLog
     form_class = VisitLogForm
     template_name = 'newapp/visit_form.html'
@@ -420,16 +244,15 @@ class VisitCreateView(LoginRequiredMixin, CreateView):
         return form
     
     def form_valid(self, form):
-        try:
-            sales_employee = self.request.user.sales_profile
-            form.instance.sales_employee = sales_employee
-            return super().form_valid(form)
-        except SalesEmployee.DoesNotExist:
+        sales_employee = self.scope.own_employee
+        if sales_employee is None:
             form.add_error(None, "You must be registered as a sales employee to create visits.")
             return self.form_invalid(form)
+        form.instance.sales_employee = sales_employee
+        return super().form_valid(form)
 
 
-class VisitUpdateView(LoginRequiredMixin, UpdateView):
+class VisitUpdateView(LoginRequiredMixin, ScopedQuerysetMixin, UpdateView):
     model = VisitLog
     form_class = VisitLogForm
     template_name = 'newapp/visit_form.html'
@@ -438,11 +261,7 @@ class VisitUpdateView(LoginRequiredMixin, UpdateView):
     
     def get_queryset(self):
         # Only allow users to edit their own visits
-        try:
-            sales_employee = self.request.user.sales_profile
-            return VisitLog.objects.filter(sales_employee=sales_employee)
-        except SalesEmployee.DoesNotExist:
-            return VisitLog.objects.none()
+        return VisitLog.objects.owned_by(self.scope)
 
 
 class VisitDetailView(LoginRequiredMixin, DetailView):
@@ -458,12 +277,11 @@ def approve_visit(request, pk):
     visit = get_object_or_404(VisitLog, pk=pk)
     
     # Check if user has permission to approve
-    try:
-        sales_employee = request.user.sales_profile
-        if sales_employee.role not in ['SALES_HEAD', 'MANAGER', 'ADMIN']:
-            return JsonResponse({'error': 'You do not have permission to approve visits'}, status=403)
-    except SalesEmployee.DoesNotExist:
+    scope = get_scope(request)
+    if scope.own_employee is None:
         return JsonResponse({'error': 'Sales employee profile not found'}, status=403)
+    if not scope.is_approver:
+        return JsonResponse({'error': 'You do not have permission to approve visits'}, status=403)
     
     if request.method == 'POST':
         approval_status = request.POST.get('approval_status')
@@ -478,55 +296,39 @@ def approve_visit(request, pk):
 
 
 # Single Page Visit Management
-class VisitManagementView(LoginRequiredMixin, TemplateView):
+class VisitManagementView(LoginRequiredMixin, ScopedQuerysetMixin, TemplateView):
     template_name = 'newapp/visit_management.html'
     login_url = 'newapp:signin'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Get effective user (admin viewing as another user or current user)
-        view_as_user_id = self.request.GET.get('view_as_user')
-        if view_as_user_id and view_as_user_id != 'self' and (self.request.user.is_staff or self.request.user.is_superuser):
-            try:
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                user = User.objects.get(id=view_as_user_id)
-                context['viewing_as'] = user.get_full_name() or user.username
-            except (ValueError, User.DoesNotExist):
-                user = self.request.user
-        else:
-            user = self.request.user
+        # Admin viewing as another user, or the signed-in user (resolved once per request)
+        if self.scope.viewed_user:
+            context['viewing_as'] = self.scope.viewing_as
         
-        try:
-            sales_employee = user.sales_profile
+        sales_employee = self.scope.employee
+        if sales_employee is not None:
             today = timezone.now().date()
             week_ago = today - timedelta(days=7)
             
             # My visits
-            context['my_visits'] = VisitLog.objects.filter(
-                sales_employee=sales_employee
-            ).select_related('prospect', 'sales_employee__user').order_by('-visit_date', '-visit_time')[:20]
-            
-            # Statistics
-            context['todays_visits'] = VisitLog.objects.filter(
-                sales_employee=sales_employee,
-                visit_date=today
-            ).count()
-            
-            context['week_visits'] = VisitLog.objects.filter(
-                sales_employee=sales_employee,
-                visit_date__gte=week_ago
-            ).count()
-            
-            context['pending_visits'] = VisitLog.objects.filter(
-                sales_employee=sales_employee,
-                approval_status='PENDING'
-            ).count()
+            context['my_visits'] = VisitLog.objects.owned_by(self.scope).select_related(
+                'prospect', 'sales_employee__user'
+            ).order_by('-visit_date', '-visit_time')[:20]
             
-            context['total_visits'] = VisitLog.objects.filter(
-                sales_employee=sales_employee
-            ).count()
+            # Statistics (from the daily rollups)
+            mine = Q(sales_employee=sales_employee, metric='visit_status')
+            stats = rollup_rows(['visit_status', 'visit_approval']).aggregate(
+                todays_visits=Sum('count', filter=mine & Q(day=today)),
+                week_visits=Sum('count', filter=mine & Q(day__gte=week_ago)),
+                total_visits=Sum('count', filter=mine),
+                pending_visits=Sum('count', filter=Q(sales_employee=sales_employee, metric='visit_approval',
+                                                     status='PENDING')),
+                completed_visits=Sum('count', filter=Q(metric='visit_status', status='COMPLETED')),
+                approved_visits=Sum('count', filter=Q(metric='visit_approval', status='APPROVED')),
+            )
+            context.update({key: value or 0 for key, value in stats.items()})
             
             # Check if user is approver
             context['is_approver'] = sales_employee.role in ['ADMIN', 'MANAGER', 'SALES_HEAD']
@@ -544,11 +346,6 @@ class VisitManagementView(LoginRequiredMixin, TemplateView):
                 'prospect', 'sales_employee__user'
             ).order_by('-visit_date', '-visit_time')[:50]
             
-            # Report stats
-            all_visits_query = VisitLog.objects.all()
-            context['completed_visits'] = all_visits_query.filter(status='COMPLETED').count()
-            context['approved_visits'] = all_visits_query.filter(approval_status='APPROVED').count()
-            
             # Prospects for dropdown
             context['prospects'] = ProspectCustomer.objects.all().order_by('name')[:100]
             
@@ -556,7 +353,7 @@ class VisitManagementView(LoginRequiredMixin, TemplateView):
             context['today'] = today
             context['current_time'] = timezone.now().time().strftime('%H:%M')
             
-        except SalesEmployee.DoesNotExist:
+        else:
             context['my_visits'] = []
             context['is_approver'] = False
             context['pending_approval_visits'] = []
@@ -575,74 +372,138 @@ class VisitManagementView(LoginRequiredMixin, TemplateView):
 
 
 # Reports
-class VisitReportView(LoginRequiredMixin, TemplateView):
+class VisitReportView(LoginRequiredMixin, ScopedQuerysetMixin, TemplateView):
     template_name = 'newapp/visit_report.html'
     login_url = 'newapp:signin'
     
+    def report_visits(self):
+        """Every visit in the report's date range; the page shows the latest 50, exports take them all."""
+        visits = VisitLog.objects.select_related('sales_employee__user', 'prospect')
+        sales_employee = self.scope.employee if self.scope.viewed_user else None
+        if sales_employee is not None:
+            visits = visits.filter(sales_employee=sales_employee)
+        start_date = self.request.GET.get('start_date')
+        end_date = self.request.GET.get('end_date')
+        if start_date:
+            visits = visits.filter(visit_date__gte=start_date)
+        if end_date:
+            visits = visits.filter(visit_date__lte=end_date)
+        return visits.order_by('-visit_date', '-visit_time')
+    
+    def get(self, request, *args, **kwargs):
+        file_format = request.GET.get('export')
+        if file_format in FORMATS:
+            return export_or_start(request, self.report_visits(), file_format, 'visits')
+        return super().get(request, *args, **kwargs)
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Get effective user for filtering (admin viewing as another user or current user)
-        view_as_user_id = self.request.GET.get('view_as_user')
-        filter_user = None
-        if view_as_user_id and view_as_user_id != 'self' and (self.request.user.is_staff or self.request.user.is_superuser):
-            try:
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                filter_user = User.objects.get(id=view_as_user_id)
-                context['viewing_as'] = filter_user.get_full_name() or filter_user.username
-            except (ValueError, User.DoesNotExist):
-                pass
+        # Admin viewing as another user (resolved once per request)
+        if self.scope.viewed_user:
+            context['viewing_as'] = self.scope.viewing_as
         
         # Date filters
         start_date = self.request.GET.get('start_date')
         end_date = self.request.GET.get('end_date')
         
-        # Base queryset
-        visits = VisitLog.objects.all().select_related('sales_employee__user', 'prospect')
-        
-        # Filter by user if viewing as specific user
-        if filter_user:
-            try:
-                sales_employee = filter_user.sales_profile
-                visits = visits.filter(sales_employee=sales_employee)
-            except:
-                pass
+        # Restrict to the viewed user's visits
+        sales_employee = self.scope.employee if self.scope.viewed_user else None
         
         if start_date:
-            visits = visits.filter(visit_date__gte=start_date)
             context['start_date'] = start_date
         if end_date:
-            visits = visits.filter(visit_date__lte=end_date)
             context['end_date'] = end_date
         
-        # Statistics
-        context['total_visits'] = visits.count()
-        context['completed_visits'] = visits.filter(status='COMPLETED').count()
-        context['pending_approvals'] = visits.filter(approval_status='PENDING').count()
-        context['approved_visits'] = visits.filter(approval_status='APPROVED').count()
+        # Statistics from the daily rollups (one query for every breakdown)
+        rows = rollup_rows(
+            ['visit_status', 'visit_approval', 'visit_outcome'],
+            start_date=start_date, end_date=end_date, sales_employee=sales_employee
+        ).values('metric', 'status', 'sales_employee_id', 'region').annotate(total=Sum('count'))
+        
+        by_metric = {'visit_status': {}, 'visit_approval': {}, 'visit_outcome': {}}
+        by_region = {}
+        by_employee = {}
+        for row in rows:
+            if not row['total']:
+                continue
+            counts = by_metric[row['metric']]
+            counts[row['status']] = counts.get(row['status'], 0) + row['total']
+            if row['metric'] == 'visit_status':
+                by_region[row['region']] = by_region.get(row['region'], 0) + row['total']
+            employee = by_employee.setdefault(row['sales_employee_id'], {'total': 0, 'completed': 0, 'pending': 0})
+            if row['metric'] == 'visit_status':
+                employee['total'] += row['total']
+                if row['status'] == 'COMPLETED':
+                    employee['completed'] += row['total']
+            elif row['metric'] == 'visit_approval' and row['status'] == 'PENDING':
+                employee['pending'] += row['total']
+        
+        status_counts = by_metric['visit_status']
+        outcome_counts = by_metric['visit_outcome']
+        total_visits = sum(status_counts.values())
+        context['total_visits'] = total_visits
+        context['completed_visits'] = status_counts.get('COMPLETED', 0)
+        context['scheduled_visits'] = status_counts.get('SCHEDULED', 0)
+        context['cancelled_visits'] = status_counts.get('CANCELLED', 0)
+        context['pending_approvals'] = by_metric['visit_approval'].get('PENDING', 0)
+        context['approved_visits'] = by_metric['visit_approval'].get('APPROVED', 0)
+        context['success_rate'] = round(context['completed_visits'] / total_visits * 100, 1) if total_visits else 0
         
         # Outcome breakdown
-        context['outcome_stats'] = visits.values('outcome_type').annotate(count=Count('id'))
+        context['outcome_stats'] = [
+            {'outcome_type': outcome or None, 'count': count} for outcome, count in outcome_counts.items()
+        ]
+        context['positive_outcomes'] = outcome_counts.get('POSITIVE', 0)
+        context['neutral_outcomes'] = outcome_counts.get('NEUTRAL', 0)
+        context['negative_outcomes'] = outcome_counts.get('NEGATIVE', 0)
+        context['deals_closed'] = outcome_counts.get('DEAL_CLOSED', 0)
+        context['follow_ups'] = outcome_counts.get('FOLLOW_UP', 0)
         
         # Region-wise breakdown (if available)
-        context['region_stats'] = visits.values(
-            'sales_employee__region'
-        ).annotate(count=Count('id')).order_by('-count')
-        
-        # Top performers
-        context['top_performers'] = visits.values(
-            'sales_employee__user__username',
-            'sales_employee__employee_id'
-        ).annotate(visit_count=Count('id')).order_by('-visit_count')[:10]
+        context['region_stats'] = sorted(
+            ({'sales_employee__region': region or None, 'count': count} for region, count in by_region.items()),
+            key=lambda row: -row['count']
+        )
         
-        context['visits'] = visits.order_by('-visit_date', '-visit_time')[:50]
+        # Employee performance / top performers
+        employees = SalesEmployee.objects.select_related('user').in_bulk(
+            [pk for pk, stats in by_employee.items() if pk and stats['total']]
+        )
+        performance = []
+        for pk, stats in by_employee.items():
+            employee = employees.get(pk)
+            if employee is None:
+                continue
+            performance.append({
+                'employee__user__username': employee.user.username,
+                'employee__user__first_name': employee.user.first_name,
+                'employee__user__last_name': employee.user.last_name,
+                'employee__employee_id': employee.employee_id,
+                'total': stats['total'],
+                'completed': stats['completed'],
+                'pending': stats['pending'],
+                'success_rate': round(stats['completed'] / stats['total'] * 100, 1),
+            })
+        performance.sort(key=lambda row: -row['total'])
+        context['employee_performance'] = performance
+        context['top_performers'] = [{
+            'sales_employee__user__username': row['employee__user__username'],
+            'sales_employee__employee_id': row['employee__employee_id'],
+            'visit_count': row['total'],
+        } for row in performance[:10]]
+        
+        # Recent visits (rows, not aggregates, so these still come from the visit log)
+        context['recent_visits'] = self.report_visits()[:50]
+        context['visits'] = context['recent_visits']
+        context['export_urls'] = export_urls(self.request)
+        context['now'] = timezone.now()
         
         return context
 
 
 # Lead Management Views
-class LeadListView(LoginRequiredMixin, ListView):
+class LeadListView(LoginRequiredMixin, ExportMixin, ScopedQuerysetMixin, KeysetPaginationMixin, ListView):
     model = Lead
     template_name = 'newapp/lead_list.html'
     context_object_name = 'leads'
@@ -650,42 +511,10 @@ class LeadListView(LoginRequiredMixin, ListView):
     login_url = 'newapp:signin'
     
     def get_queryset(self):
-        user = self.request.user
-        
-        # Check if viewing as another user (admin feature)
-        view_as_user_id = self.request.GET.get('view_as_user')
-        if view_as_user_id and view_as_user_id != 'self' and (user.is_staff or user.is_superuser):
-            try:
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                user = User.objects.get(id=view_as_user_id)
-            except:
-                pass
-        
         # Admin sees all leads, sales reps see only their assigned leads
-        if user.is_staff or user.is_superuser:
-            queryset = Lead.objects.all()
-        else:
-            try:
-                sales_employee = user.sales_profile
-                queryset = Lead.objects.filter(assigned_to=sales_employee)
-            except SalesEmployee.DoesNotExist:
-                queryset = Lead.objects.none()
-        
-        queryset = queryset.select_related('prospect', 'assigned_to__user', 'originating_visit')
-        
-        # Filter by search query
-        search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(lead_id__icontains=search) |
-                Q(prospect__name__icontains=search) |
-                Q(prospect__company_name__icontains=search) |
-                Q(contact_person__icontains=search) |
-                Q(mobile__icontains=search) |
-                Q(email__icontains=search) |
-                Q(requirement_description__icontains=search)
-            )
+        queryset = Lead.objects.visible_to(self.scope).select_related(
+            'prospect', 'assigned_to__user', 'originating_visit'
+        )
         
         # Filter by source
         lead_source = self.request.GET.get('source')
@@ -707,6 +536,11 @@ class LeadListView(LoginRequiredMixin, ListView):
         if assigned_to:
             queryset = queryset.filter(assigned_to__id=assigned_to)
         
+        # Search the full-text index, best match first
+        search = self.request.GET.get('search')
+        if search:
+            return search_queryset(queryset, 'leads', search)
+        
         return queryset.order_by('-created_at')
     
     def get_context_data(self, **kwargs):
@@ -731,7 +565,7 @@ class LeadListView(LoginRequiredMixin, ListView):
         return context
 
 
-class LeadCreateView(LoginRequiredMixin, CreateView):
+class LeadCreateView(LoginRequiredMixin, ScopedQuerysetMixin, CreateView):
     model = Lead
     form_class = LeadForm
     template_name = 'newapp/lead_form.html'
@@ -759,12 +593,8 @@ class LeadCreateView(LoginRequiredMixin, CreateView):
                 pass
         
         # Auto-assign to current user if they are a sales employee
-        if not form.initial.get('assigned_to'):
-            try:
-                sales_employee = self.request.user.sales_profile
-                form.initial['assigned_to'] = sales_employee
-            except SalesEmployee.DoesNotExist:
-                pass
+        if not form.initial.get('assigned_to') and self.scope.own_employee:
+            form.initial['assigned_to'] = self.scope.own_employee
         
         return form
     
@@ -784,25 +614,13 @@ class LeadCreateView(LoginRequiredMixin, CreateView):
         return response
 
 
-class LeadUpdateView(LoginRequiredMixin, UpdateView):
+class LeadUpdateView(LoginRequiredMixin, ScopedQuerysetMixin, UpdateView):
     model = Lead
     form_class = LeadForm
     template_name = 'newapp/lead_form.html'
     success_url = reverse_lazy('newapp:lead_list')
     login_url = 'newapp:signin'
     
-    def get_queryset(self):
-        user = self.request.user
-        # Admin can edit all leads, sales reps can only edit their assigned leads
-        if user.is_staff or user.is_superuser:
-            return Lead.objects.all()
-        else:
-            try:
-                sales_employee = user.sales_profile
-                return Lead.objects.filter(assigned_to=sales_employee)
-            except SalesEmployee.DoesNotExist:
-                return Lead.objects.none()
-    
     def form_valid(self, form):
         # Track what changed
         if form.has_changed():
@@ -853,7 +671,7 @@ class LeadDetailView(LoginRequiredMixin, DetailView):
 
 
 # Lead Activity Management Views
-class ActivityListView(LoginRequiredMixin, ListView):
+class ActivityListView(LoginRequiredMixin, ExportMixin, ScopedQuerysetMixin, KeysetPaginationMixin, ListView):
     model = LeadActivity
     template_name = 'newapp/activity_list.html'
     context_object_name = 'activities'
@@ -861,19 +679,8 @@ class ActivityListView(LoginRequiredMixin, ListView):
     login_url = 'newapp:signin'
     
     def get_queryset(self):
-        user = self.request.user
-        
         # Admin sees all activities, sales reps see only their leads' activities
-        if user.is_staff or user.is_superuser:
-            queryset = LeadActivity.objects.all()
-        else:
-            try:
-                sales_employee = user.sales_profile
-                queryset = LeadActivity.objects.filter(lead__assigned_to=sales_employee)
-            except SalesEmployee.DoesNotExist:
-                queryset = LeadActivity.objects.none()
-        
-        queryset = queryset.select_related('lead', 'lead__prospect', 'lead__assigned_to__user', 'created_by')
+        queryset = LeadActivity.objects.visible_to(self.scope).select_related('lead', 'lead__prospect', 'lead__assigned_to__user', 'created_by')
         
         # Filter by lead
         lead_id = self.request.GET.get('lead')
@@ -979,25 +786,13 @@ class ActivityCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy('newapp:activity_list')
 
 
-class ActivityUpdateView(LoginRequiredMixin, UpdateView):
+class ActivityUpdateView(LoginRequiredMixin, ScopedQuerysetMixin, UpdateView):
     model = LeadActivity
     form_class = LeadActivityForm
     template_name = 'newapp/activity_form.html'
     success_url = reverse_lazy('newapp:activity_list')
     login_url = 'newapp:signin'
     
-    def get_queryset(self):
-        user = self.request.user
-        # Admin can edit all activities, sales reps can only edit their leads' activities
-        if user.is_staff or user.is_superuser:
-            return LeadActivity.objects.all()
-        else:
-            try:
-                sales_employee = user.sales_profile
-                return LeadActivity.objects.filter(lead__assigned_to=sales_employee)
-            except SalesEmployee.DoesNotExist:
-                return LeadActivity.objects.none()
-    
     def get_success_url(self):
         return reverse_lazy('newapp:lead_detail', kwargs={'pk': self.object.lead.pk})
 
@@ -1010,27 +805,17 @@ class ActivityDetailView(LoginRequiredMixin, DetailView):
 
 
 # Activity Dashboard - Follow-up Tracker
-class ActivityDashboardView(LoginRequiredMixin, TemplateView):
+class ActivityDashboardView(LoginRequiredMixin, ScopedQuerysetMixin, TemplateView):
     template_name = 'newapp/activity_dashboard.html'
     login_url = 'newapp:signin'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
         today = timezone.now().date()
         
         # Determine if admin view
-        if user.is_staff or user.is_superuser:
-            base_queryset = LeadActivity.objects.all()
-            context['is_admin'] = True
-        else:
-            try:
-                sales_employee = user.sales_profile
-                base_queryset = LeadActivity.objects.filter(lead__assigned_to=sales_employee)
-                context['is_admin'] = False
-            except SalesEmployee.DoesNotExist:
-                base_queryset = LeadActivity.objects.none()
-                context['is_admin'] = False
+        base_queryset = LeadActivity.objects.visible_to(self.scope)
+        context['is_admin'] = self.scope.sees_all
         
         # Overdue follow-ups (scheduled activities in the past)
         context['overdue_followups'] = base_queryset.filter(
@@ -1073,7 +858,14 @@ class ActivityDashboardView(LoginRequiredMixin, TemplateView):
 # QUOTATION MANAGEMENT VIEWS
 # ==========================
 
-class QuotationListView(LoginRequiredMixin, ListView):
+def selected_prospect(customer_id):
+    """The prospect a list is filtered by (rendered as the typeahead's only option), or None."""
+    if not customer_id or not customer_id.isdigit():
+        return None
+    return ProspectCustomer.objects.filter(pk=customer_id).only('id', 'name').first()
+
+
+class QuotationListView(LoginRequiredMixin, ExportMixin, ScopedQuerysetMixin, KeysetPaginationMixin, ListView):
     model = Quotation
     template_name = 'newapp/quotation_list.html'
     context_object_name = 'quotations'
@@ -1081,19 +873,8 @@ class QuotationListView(LoginRequiredMixin, ListView):
     login_url = 'newapp:signin'
     
     def get_queryset(self):
-        user = self.request.user
-        
         # Admin sees all quotations, sales reps see only their assigned quotations
-        if user.is_staff or user.is_superuser:
-            queryset = Quotation.objects.all()
-        else:
-            try:
-                sales_employee = user.sales_profile
-                queryset = Quotation.objects.filter(assigned_to=sales_employee)
-            except SalesEmployee.DoesNotExist:
-                queryset = Quotation.objects.none()
-        
-        queryset = queryset.select_related('prospect', 'assigned_to__user', 'created_by')
+        queryset = Quotation.objects.visible_to(self.scope).select_related('prospect', 'assigned_to__user', 'created_by')
         
         # Filter by date range
         start_date = self.request.GET.get('start_date')
@@ -1126,14 +907,10 @@ class QuotationListView(LoginRequiredMixin, ListView):
         if max_amount:
             queryset = queryset.filter(net_amount__lte=max_amount)
         
-        # Search
+        # Search the full-text index, best match first
         search = self.request.GET.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(quote_number__icontains=search) |
-                Q(prospect__name__icontains=search) |
-                Q(prospect__company_name__icontains=search)
-            )
+            return search_queryset(queryset, 'quotations', search)
         
         return queryset.order_by('-quote_date', '-created_at')
     
@@ -1143,7 +920,8 @@ class QuotationListView(LoginRequiredMixin, ListView):
         # Add filter options
         context['status_choices'] = Quotation.STATUS_CHOICES
         context['sales_employees'] = SalesEmployee.objects.filter(is_active=True).select_related('user')
-        context['prospects'] = ProspectCustomer.objects.all().order_by('name')
+        # Customer filter is a typeahead: only the chosen customer is rendered
+        context['selected_customer'] = selected_prospect(self.request.GET.get('customer'))
         
         # Preserve filter values
         context['current_salesperson'] = self.request.GET.get('salesperson', '')
@@ -1158,7 +936,7 @@ class QuotationListView(LoginRequiredMixin, ListView):
         return context
 
 
-class QuotationCreateView(LoginRequiredMixin, CreateView):
+class QuotationCreateView(LoginRequiredMixin, ScopedQuerysetMixin, CreateView):
     model = Quotation
     form_class = QuotationForm
     template_name = 'newapp/quotation_form.html'
@@ -1181,23 +959,15 @@ class QuotationCreateView(LoginRequiredMixin, CreateView):
         
         # Set assigned_to to current user's sales profile if not set
         if not form.instance.assigned_to:
-            try:
-                form.instance.assigned_to = self.request.user.sales_profile
-            except SalesEmployee.DoesNotExist:
-                pass
+            form.instance.assigned_to = self.scope.own_employee
         
         if form.is_valid() and item_formset.is_valid():
             self.object = form.save()
             item_formset.instance = self.object
-            item_formset.save()
-            
-            # Update line numbers
-            for idx, item in enumerate(self.object.items.all(), start=1):
-                item.line_number = idx
-                item.save()
             
-            # Calculate totals
-            self.object.calculate_totals()
+            # Number, price and save all lines, then update the header totals
+            lines = save_lines(item_formset)
+            apply_totals(self.object, lines)
             
             # Log activity
             QuotationActivity.objects.create(
@@ -1215,23 +985,12 @@ class QuotationCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy('newapp:quotation_detail', kwargs={'pk': self.object.pk})
 
 
-class QuotationUpdateView(LoginRequiredMixin, UpdateView):
+class QuotationUpdateView(LoginRequiredMixin, ScopedQuerysetMixin, UpdateView):
     model = Quotation
     form_class = QuotationForm
     template_name = 'newapp/quotation_form.html'
     login_url = 'newapp:signin'
     
-    def get_queryset(self):
-        user = self.request.user
-        if user.is_staff or user.is_superuser:
-            return Quotation.objects.all()
-        else:
-            try:
-                sales_employee = user.sales_profile
-                return Quotation.objects.filter(assigned_to=sales_employee)
-            except SalesEmployee.DoesNotExist:
-                return Quotation.objects.none()
-    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         if self.request.POST:
@@ -1247,15 +1006,10 @@ class QuotationUpdateView(LoginRequiredMixin, UpdateView):
         if form.is_valid() and item_formset.is_valid():
             self.object = form.save()
             item_formset.instance = self.object
-            item_formset.save()
-            
-            # Update line numbers
-            for idx, item in enumerate(self.object.items.all(), start=1):
-                item.line_number = idx
-                item.save()
             
-            # Calculate totals
-            self.object.calculate_totals()
+            # Number, price and save all lines, then update the header totals
+            lines = save_lines(item_formset)
+            apply_totals(self.object, lines)
             
             # Log activity
             QuotationActivity.objects.create(
@@ -1307,7 +1061,7 @@ def quotation_send(request, pk):
     quotation = get_object_or_404(Quotation, pk=pk)
     
     # Check permission
-    if not (request.user.is_staff or request.user.sales_profile == quotation.assigned_to):
+    if not get_scope(request).can_manage(quotation):
         return HttpResponse("Unauthorized", status=403)
     
     quotation.status = 'SENT'
@@ -1322,6 +1076,9 @@ def quotation_send(request, pk):
         created_by=request.user
     )
     
+    # Mail the customer from a background job
+    notify(quotation, 'SENT', request.user)
+    
     return redirect('newapp:quotation_detail', pk=pk)
 
 
@@ -1347,6 +1104,9 @@ def quotation_approve(request, pk):
         created_by=request.user
     )
     
+    # Mail the assigned employee from a background job
+    notify(quotation, 'APPROVED', request.user)
+    
     return redirect('newapp:quotation_detail', pk=pk)
 
 
@@ -1370,6 +1130,9 @@ def quotation_reject(request, pk):
         created_by=request.user
     )
     
+    # Mail the assigned employee from a background job
+    notify(quotation, 'REJECTED', request.user)
+    
     return redirect('newapp:quotation_detail', pk=pk)
 
 
@@ -1409,7 +1172,7 @@ def quotation_add_attachment(request, pk):
 # SALES ORDER MANAGEMENT VIEWS
 # ==========================
 
-class SalesOrderListView(LoginRequiredMixin, ListView):
+class SalesOrderListView(LoginRequiredMixin, ExportMixin, ScopedQuerysetMixin, KeysetPaginationMixin, ListView):
     model = SalesOrder
     template_name = 'newapp/salesorder_list.html'
     context_object_name = 'orders'
@@ -1417,19 +1180,8 @@ class SalesOrderListView(LoginRequiredMixin, ListView):
     login_url = 'newapp:signin'
     
     def get_queryset(self):
-        user = self.request.user
-        
         # Admin sees all orders, sales reps see only their assigned orders
-        if user.is_staff or user.is_superuser:
-            queryset = SalesOrder.objects.all()
-        else:
-            try:
-                sales_employee = user.sales_profile
-                queryset = SalesOrder.objects.filter(assigned_to=sales_employee)
-            except SalesEmployee.DoesNotExist:
-                queryset = SalesOrder.objects.none()
-        
-        queryset = queryset.select_related('prospect', 'assigned_to__user', 'created_by')
+        queryset = SalesOrder.objects.visible_to(self.scope).select_related('prospect', 'assigned_to__user', 'created_by')
         
         # Filter by date range
         start_date = self.request.GET.get('start_date')
@@ -1479,7 +1231,8 @@ class SalesOrderListView(LoginRequiredMixin, ListView):
         # Add filter options
         context['status_choices'] = SalesOrder.STATUS_CHOICES
         context['sales_employees'] = SalesEmployee.objects.filter(is_active=True).select_related('user')
-        context['prospects'] = ProspectCustomer.objects.all().order_by('name')
+        # Customer filter is a typeahead: only the chosen customer is rendered
+        context['selected_customer'] = selected_prospect(self.request.GET.get('customer'))
         
         # Preserve filter values
         context['current_salesperson'] = self.request.GET.get('salesperson', '')
@@ -1494,7 +1247,7 @@ class SalesOrderListView(LoginRequiredMixin, ListView):
         return context
 
 
-class SalesOrderCreateView(LoginRequiredMixin, CreateView):
+class SalesOrderCreateView(LoginRequiredMixin, ScopedQuerysetMixin, CreateView):
     model = SalesOrder
     form_class = SalesOrderForm
     template_name = 'newapp/salesorder_form.html'
@@ -1539,7 +1292,11 @@ class SalesOrderCreateView(LoginRequiredMixin, CreateView):
         context = super().get_context_data(**kwargs)
         quotation_id = self.request.GET.get('from_quotation') or self.request.session.get('source_quotation_id')
         
-        if self.request.POST:
+        # When copying from a quotation the page shows a read-only preview and
+        # posts no item formset; the items are copied in form_valid instead
+        copying = quotation_id and f"{SalesOrderItemFormSet.get_default_prefix()}-TOTAL_FORMS" not in self.request.POST
+        
+        if self.request.POST and not copying:
             context['item_formset'] = SalesOrderItemFormSet(self.request.POST, instance=self.object)
         else:
             # If creating from quotation, pre-populate items
@@ -1564,10 +1321,7 @@ class SalesOrderCreateView(LoginRequiredMixin, CreateView):
         
         # Set assigned_to to current user's sales profile if not set
         if not form.instance.assigned_to:
-            try:
-                form.instance.assigned_to = self.request.user.sales_profile
-            except SalesEmployee.DoesNotExist:
-                pass
+            form.instance.assigned_to = self.scope.own_employee
         
         # Check if creating from quotation
         quotation_id = self.request.session.get('source_quotation_id')
@@ -1577,45 +1331,28 @@ class SalesOrderCreateView(LoginRequiredMixin, CreateView):
         if item_formset and form.is_valid() and item_formset.is_valid():
             self.object = form.save()
             item_formset.instance = self.object
-            item_formset.save()
             
-            # Update line numbers
-            for idx, item in enumerate(self.object.items.all(), start=1):
-                item.line_number = idx
-                item.save()
-        # If creating from quotation, copy items from quotation
+            # Number, price and save all lines, then update the header totals
+            lines = save_lines(item_formset)
+            apply_totals(self.object, lines)
+        # If creating from quotation, copy the header and all items in one transaction
         elif from_quotation and quotation_id and form.is_valid():
-            self.object = form.save()
-            
             try:
                 quotation = Quotation.objects.get(pk=quotation_id)
-                # Copy all items from quotation
-                for q_item in quotation.items.all().order_by('line_number'):
-                    SalesOrderItem.objects.create(
-                        order=self.object,
-                        item_code=q_item.item_code,
-                        description=q_item.description,
-                        quantity=q_item.quantity,
-                        uom=q_item.uom,
-                        unit_price=q_item.unit_price,
-                        discount_percentage=q_item.discount_percentage,
-                        tax_percentage=q_item.tax_percentage,
-                        line_number=q_item.line_number,
-                        remarks=q_item.remarks
-                    )
-                
-                # Clear session
-                if 'source_quotation_id' in self.request.session:
-                    del self.request.session['source_quotation_id']
-                    
+                self.object = convert_quotation(quotation, order=form.save(commit=False),
+                                                created_by=self.request.user)
             except Quotation.DoesNotExist:
-                pass
+                self.object = form.save()
+            except ConversionError as exc:
+                form.add_error(None, str(exc))
+                return self.render_to_response(self.get_context_data(form=form))
+            
+            # Clear session
+            if 'source_quotation_id' in self.request.session:
+                del self.request.session['source_quotation_id']
         else:
             return self.render_to_response(self.get_context_data(form=form))
         
-        # Calculate totals
-        self.object.calculate_totals()
-        
         # Log activity
         activity_desc = 'Sales Order created'
         if quotation_id:
@@ -1634,23 +1371,12 @@ class SalesOrderCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy('newapp:salesorder_detail', kwargs={'pk': self.object.pk})
 
 
-class SalesOrderUpdateView(LoginRequiredMixin, UpdateView):
+class SalesOrderUpdateView(LoginRequiredMixin, ScopedQuerysetMixin, UpdateView):
     model = SalesOrder
     form_class = SalesOrderForm
     template_name = 'newapp/salesorder_form.html'
     login_url = 'newapp:signin'
     
-    def get_queryset(self):
-        user = self.request.user
-        if user.is_staff or user.is_superuser:
-            return SalesOrder.objects.all()
-        else:
-            try:
-                sales_employee = user.sales_profile
-                return SalesOrder.objects.filter(assigned_to=sales_employee)
-            except SalesEmployee.DoesNotExist:
-                return SalesOrder.objects.none()
-    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         if self.request.POST:
@@ -1666,15 +1392,10 @@ class SalesOrderUpdateView(LoginRequiredMixin, UpdateView):
         if form.is_valid() and item_formset.is_valid():
             self.object = form.save()
             item_formset.instance = self.object
-            item_formset.save()
             
-            # Update line numbers
-            for idx, item in enumerate(self.object.items.all(), start=1):
-                item.line_number = idx
-                item.save()
-            
-            # Calculate totals
-            self.object.calculate_totals()
+            # Number, price and save all lines, then update the header totals
+            lines = save_lines(item_formset)
+            apply_totals(self.object, lines)
             
             # Log activity
             SalesOrderActivity.objects.create(
@@ -1726,7 +1447,7 @@ def salesorder_confirm(request, pk):
     order = get_object_or_404(SalesOrder, pk=pk)
     
     # Check permission
-    if not (request.user.is_staff or request.user.sales_profile == order.assigned_to):
+    if not get_scope(request).can_manage(order):
         return HttpResponse("Unauthorized", status=403)
     
     order.status = 'CONFIRMED'
@@ -1741,6 +1462,9 @@ def salesorder_confirm(request, pk):
         created_by=request.user
     )
     
+    # Mail the assigned employee from a background job
+    notify(order, 'CONFIRMED', request.user)
+    
     return redirect('newapp:salesorder_detail', pk=pk)
 
 
@@ -1766,6 +1490,9 @@ def salesorder_approve(request, pk):
         created_by=request.user
     )
     
+    # Mail the assigned employee from a background job
+    notify(order, 'APPROVED', request.user)
+    
     return redirect('newapp:salesorder_detail', pk=pk)
 
 
@@ -1789,6 +1516,9 @@ def salesorder_reject(request, pk):
         created_by=request.user
     )
     
+    # Mail the assigned employee from a background job
+    notify(order, 'REJECTED', request.user)
+    
     return redirect('newapp:salesorder_detail', pk=pk)
 
 
@@ -1825,8 +1555,8 @@ def salesorder_add_attachment(request, pk):
 
 
 @login_required(login_url='newapp:signin')
-def get_quotation_data(request):
-    """API endpoint to fetch quotation data by quote number"""
+async def get_quotation_data(request):
+    """API endpoint to fetch quotation data by quote number (async ORM)"""
     from django.http import JsonResponse
     
     quote_number = request.GET.get('quote_number', '').strip()
@@ -1835,7 +1565,7 @@ def get_quotation_data(request):
         return JsonResponse({'error': 'Quotation number is required'}, status=400)
     
     try:
-        quotation = Quotation.objects.get(quote_number__iexact=quote_number)
+        quotation = await Quotation.objects.select_related('prospect').aget(quote_number__iexact=quote_number)
         
         # Prepare quotation data
         data = {
@@ -1843,18 +1573,18 @@ def get_quotation_data(request):
             'quotation': {
                 'id': quotation.id,
                 'quote_number': quotation.quote_number,
-                'prospect_id': quotation.prospect.id,
+                'prospect_id': quotation.prospect_id,
                 'prospect_name': quotation.prospect.name,
                 'contact_person': quotation.contact_person,
                 'contact_email': quotation.contact_email or '',
                 'contact_phone': quotation.contact_phone or '',
-                'assigned_to_id': quotation.assigned_to.id if quotation.assigned_to else None,
+                'assigned_to_id': quotation.assigned_to_id,
                 'currency': quotation.currency,
                 'exchange_rate': str(quotation.exchange_rate),
                 'payment_terms': quotation.payment_terms or '',
                 'delivery_terms': quotation.delivery_terms or '',
-                'reference_lead_id': quotation.reference_lead.id if quotation.reference_lead else None,
-                'reference_visit_id': quotation.reference_visit.id if quotation.reference_visit else None,
+                'reference_lead_id': quotation.reference_lead_id,
+                'reference_visit_id': quotation.reference_visit_id,
                 'reference_number': quotation.reference_number or '',
                 'customer_remarks': quotation.customer_remarks or '',
                 'internal_notes': quotation.internal_notes or '',
@@ -1865,7 +1595,7 @@ def get_quotation_data(request):
         }
         
         # Add items
-        for item in quotation.items.all().order_by('line_number'):
+        async for item in quotation.items.order_by('line_number'):
             data['items'].append({
                 'line_number': item.line_number,
                 'item_code': item.item_code or '',
@@ -1890,8 +1620,8 @@ def get_quotation_data(request):
 
 
 @login_required(login_url='newapp:signin')
-def get_item_data(request):
-    """API endpoint to fetch item data from Item Master by item code or ID"""
+async def get_item_data(request):
+    """API endpoint to fetch item data from Item Master by item code or ID (async ORM)"""
     from django.http import JsonResponse
     from .models import ItemMaster
     
@@ -1903,9 +1633,9 @@ def get_item_data(request):
     
     try:
         if item_id:
-            item = ItemMaster.objects.get(id=item_id, is_active=True)
+            item = await ItemMaster.objects.aget(id=item_id, is_active=True)
         else:
-            item = ItemMaster.objects.get(item_code__iexact=item_code, is_active=True)
+            item = await ItemMaster.objects.aget(item_code__iexact=item_code, is_active=True)
         
         data = {
             'success': True,
@@ -1938,33 +1668,32 @@ def get_item_data(request):
 
 
 @login_required(login_url='newapp:signin')
-def search_items(request):
-    """API endpoint to search items for autocomplete"""
+async def search_items(request):
+    """API endpoint to search items for autocomplete (in-memory index, see newapp.autocomplete)"""
     from django.http import JsonResponse
-    from .models import ItemMaster
-    from django.db.models import Q
+    from . import autocomplete
     
     query = request.GET.get('q', '').strip()
     
     if not query or len(query) < 2:
         return JsonResponse({'items': []})
     
+    def lookup():
+        return autocomplete.get_index('items').search(query, limit=20)
+    
     try:
-        items = ItemMaster.objects.filter(
-            Q(item_code__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(short_name__icontains=query),
-            is_active=True
-        ).order_by('item_code')[:20]  # Limit to 20 results
+        # Syncing the index reads the cache (and the database after a change): not in the event loop
+        items = await sync_to_async(lookup)()
         
         data = {
             'items': [{
-                'id': item.id,
-                'item_code': item.item_code,
-                'description': item.description[:100],  # Truncate long descriptions
-                'unit_price': str(item.standard_price),
-                'uom': item.unit_of_measurement,
-                'tax_percentage': str(item.default_tax_percentage),
+                'id': item['id'],
+                'label': f"{item['item_code']} - {item['description'][:50]}",
+                'item_code': item['item_code'],
+                'description': item['description'][:100],  # Truncate long descriptions
+                'unit_price': str(item['standard_price']),
+                'uom': item['unit_of_measurement'],
+                'tax_percentage': str(item['default_tax_percentage']),
             } for item in items]
         }
         
@@ -1976,34 +1705,38 @@ def search_items(request):
 
 # Additional API endpoints for client-side optimization
 @login_required
-def search_prospects(request):
-    """API endpoint to search prospects for autocomplete"""
+async def search_prospects(request):
+    """API endpoint to search prospects for autocomplete (in-memory index, see newapp.autocomplete)"""
     from django.http import JsonResponse
-    from .models import ProspectCustomer
-    from django.db.models import Q
+    from . import autocomplete
     
     query = request.GET.get('q', '').strip()
     
     if not query or len(query) < 2:
         return JsonResponse({'items': []})
     
+    request_scope = await aget_scope(request)
+    
+    def lookup():
+        # Admins pick from every prospect, others from the ones assigned to or created by them
+        scope = None
+        if not request_scope.is_admin:
+            scope = autocomplete.prospect_scope(request_scope.own_employee, request.user)
+        return autocomplete.get_index('prospects').search(query, limit=20, scope=scope)
+    
     try:
-        prospects = ProspectCustomer.objects.filter(
-            Q(name__icontains=query) | 
-            Q(company_name__icontains=query) |
-            Q(email__icontains=query),
-            user=request.user
-        ).order_by('name')[:20]  # Limit to 20 results
+        # The profile lookup and the index sync query: not in the event loop
+        prospects = await sync_to_async(lookup)()
         
         data = {
             'items': [{
-                'id': prospect.id,
-                'name': prospect.name,
-                'company_name': prospect.company_name or '',
-                'email': prospect.email or '',
-                'phone': prospect.phone or '',
-                'contact_person': prospect.contact_person or '',
-                'address': prospect.address or '',
+                'id': prospect['id'],
+                'label': f"{prospect['customer_id']} - {prospect['name']} ({prospect['company_name'] or 'Individual'})",
+                'name': prospect['name'],
+                'company_name': prospect['company_name'] or '',
+                'email': prospect['email'] or '',
+                'phone': prospect['phone'] or '',
+                'address': prospect['address'] or '',
             } for prospect in prospects]
         }
         
@@ -2014,8 +1747,8 @@ def search_prospects(request):
 
 
 @login_required
-def get_prospect_data(request):
-    """API endpoint to fetch prospect data by name or ID"""
+async def get_prospect_data(request):
+    """API endpoint to fetch prospect data by name or ID (async ORM)"""
     from django.http import JsonResponse
     from .models import ProspectCustomer
     
@@ -2025,11 +1758,17 @@ def get_prospect_data(request):
     if not prospect_name and not prospect_id:
         return JsonResponse({'error': 'Prospect name or ID is required'}, status=400)
     
+    request_scope = await aget_scope(request)
+    prospects = ProspectCustomer.objects.all()
+    if not request_scope.is_admin:
+        # Same rows as the search_prospects picker: assigned to or created by the user
+        prospects = prospects.filter(Q(assigned_to__user=request.user) | Q(created_by=request.user))
+    
     try:
         if prospect_id:
-            prospect = ProspectCustomer.objects.get(id=prospect_id, user=request.user)
+            prospect = await prospects.aget(id=prospect_id)
         else:
-            prospect = ProspectCustomer.objects.get(name__iexact=prospect_name, user=request.user)
+            prospect = await prospects.aget(name__iexact=prospect_name)
         
         data = {
             'success': True,
@@ -2039,7 +1778,8 @@ def get_prospect_data(request):
                 'company_name': prospect.company_name or '',
                 'email': prospect.email or '',
                 'phone': prospect.phone or '',
-                'contact_person': prospect.contact_person or '',
+                # Prospects have no separate contact field: the name is the person to address
+                'contact_person': prospect.name,
                 'address': prospect.address or '',
                 'status': prospect.status,
             }
@@ -2053,129 +1793,64 @@ def get_prospect_data(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _dashboard_scope(request):
+    # Effective user, profile and admin view (admin viewing as another user or current user)
+    scope = get_scope(request)
+    if scope.is_admin_view:
+        return True, None
+    return False, scope.employee
+
+
 @login_required
-def dashboard_data_api(request):
-    """API endpoint for dashboard data with caching headers"""
+async def dashboard_data_api(request):
+    """API endpoint for dashboard data (metrics cached per scope, see newapp.caching)"""
     from django.http import JsonResponse
-    from django.views.decorators.cache import cache_page
-    from django.core.cache import cache
-    from django.utils import timezone
-    from datetime import timedelta
-    
-    # Check if user has cached data
-    cache_key = f"dashboard_data_{request.user.id}"
-    cached_data = cache.get(cache_key)
-    
-    if cached_data:
-        return JsonResponse(cached_data)
-    
-    # Get effective user (admin viewing as another user or current user)
-    view_as_user_id = request.GET.get('view_as_user')
-    if view_as_user_id and view_as_user_id != 'self' and (request.user.is_staff or request.user.is_superuser):
-        try:
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            user = User.objects.get(id=view_as_user_id)
-        except (ValueError, User.DoesNotExist):
-            user = request.user
-    else:
-        user = request.user
-    
-    # Date calculations
-    today = timezone.now().date()
-    month_start = today.replace(day=1)
-    week_ago = today - timedelta(days=7)
-    
-    # Check if admin (and not viewing as specific user)
-    is_admin_view = (request.user.is_staff or request.user.is_superuser) and (not view_as_user_id or view_as_user_id == 'self')
-    
-    if is_admin_view:
-        # ADMIN DASHBOARD - Aggregate data across all users
-        from .models import VisitLog, ProspectCustomer
-        
-        # Total Visits (Today / Month)
-        visits_today = VisitLog.objects.filter(visit_date=today).count()
-        visits_month = VisitLog.objects.filter(visit_date__gte=month_start).count()
-        
-        # Total Leads (By Stage)
-        leads_by_stage = list(ProspectCustomer.objects.values('status').annotate(count=Count('id')).order_by('status'))
-        total_leads = ProspectCustomer.objects.count()
-        
-        # Conversion %
-        total_prospects = ProspectCustomer.objects.count()
-        converted_prospects = ProspectCustomer.objects.filter(status='WON').count()
-        conversion_rate = round((converted_prospects / total_prospects * 100), 1) if total_prospects > 0 else 0
-        
-        # Upcoming follow-ups
-        upcoming_followups = list(VisitLog.objects.filter(
-            next_follow_up_date__gte=today,
-            next_follow_up_date__lte=today + timedelta(days=7)
-        ).select_related('prospect', 'sales_employee__user').values(
-            'prospect__name', 'prospect__company_name', 'next_follow_up_date', 
-            'visit_date', 'sales_employee__user__first_name', 'sales_employee__user__last_name'
-        ))
-        
-        data = {
-            'visits_today': visits_today,
-            'visits_month': visits_month,
-            'total_leads': total_leads,
-            'conversion_rate': conversion_rate,
-            'converted_count': converted_prospects,
-            'leads_by_stage': leads_by_stage,
-            'upcoming_followups': upcoming_followups,
-            'timestamp': timezone.now().isoformat()
-        }
-    else:
-        # SALES EXECUTIVE DASHBOARD - User-specific data
-        from .models import VisitLog, ProspectCustomer, SalesEmployee
-        
-        try:
-            sales_employee = SalesEmployee.objects.get(user=user)
-        except SalesEmployee.DoesNotExist:
-            return JsonResponse({'error': 'Sales employee profile not found'}, status=404)
-        
-        # User's visits
-        visits_today = VisitLog.objects.filter(sales_employee=sales_employee, visit_date=today).count()
-        visits_month = VisitLog.objects.filter(sales_employee=sales_employee, visit_date__gte=month_start).count()
-        
-        # User's leads
-        leads_by_stage = list(ProspectCustomer.objects.filter(user=user).values('status').annotate(count=Count('id')).order_by('status'))
-        total_leads = ProspectCustomer.objects.filter(user=user).count()
-        active_leads = ProspectCustomer.objects.filter(user=user, status__in=['NEW', 'CONTACTED', 'QUALIFIED', 'PROPOSAL', 'NEGOTIATION']).count()
-        
-        # Conversion rate for user
-        converted_prospects = ProspectCustomer.objects.filter(user=user, status='WON').count()
-        conversion_rate = round((converted_prospects / total_leads * 100), 1) if total_leads > 0 else 0
-        
-        # User's upcoming follow-ups
-        upcoming_followups = list(VisitLog.objects.filter(
-            sales_employee=sales_employee,
-            next_follow_up_date__gte=today,
-            next_follow_up_date__lte=today + timedelta(days=7)
-        ).select_related('prospect').values(
-            'prospect__name', 'prospect__company_name', 'next_follow_up_date', 'visit_date'
-        ))
-        
-        data = {
-            'visits_today': visits_today,
-            'visits_month': visits_month,
-            'total_leads': total_leads,
-            'active_leads': active_leads,
-            'conversion_rate': conversion_rate,
-            'converted_count': converted_prospects,
-            'leads_by_stage': leads_by_stage,
-            'upcoming_followups': upcoming_followups,
-            'timestamp': timezone.now().isoformat()
-        }
     
-    # Cache for 5 minutes
-    cache.set(cache_key, data, 300)
+    await aget_scope(request)
+    # The profile lookup queries: not in the event loop
+    admin_view, sales_employee = await sync_to_async(_dashboard_scope)(request)
+    if not admin_view and sales_employee is None:
+        return JsonResponse({'error': 'Sales employee profile not found'}, status=404)
+    
+    # ADMIN DASHBOARD (sales_employee None) aggregates across all users; the cache read,
+    # and the queries on a miss, take one trip to the request's database thread
+    metrics = await sync_to_async(get_cached_dashboard_metrics)(sales_employee)
+    
+    data = dashboard_payload(metrics)
+    data['timestamp'] = timezone.now().isoformat()
     
     return JsonResponse(data)
 
 
+@login_required
+async def dashboard_stream(request):
+    """
+    Server-sent events with the dashboard data, pushed when it changes (see DashboardStream).
+
+    Only served under ASGI: under WSGI an open stream would hold a worker thread
+    for minutes. Answers 204 there, or when DASHBOARD_STREAM is off, which tells
+    EventSource not to reconnect, and dashboard.js then polls dashboard_data_api.
+    """
+    # Streams stay open for minutes: they must not count as user activity
+    request.session_refresh = False
+    if not getattr(settings, 'DASHBOARD_STREAM', True) or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    await aget_scope(request)
+    # The scope reads profiles from the database: not allowed in the event loop
+    admin_view, sales_employee = await sync_to_async(_dashboard_scope)(request)
+    if not admin_view and sales_employee is None:
+        return JsonResponse({'error': 'Sales employee profile not found'}, status=404)
+
+    stream = DashboardStream(sales_employee, request.headers.get('Last-Event-ID', ''))
+    response = StreamingHttpResponse(aiter(stream), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # Service Call Views
-class ServiceCallListView(LoginRequiredMixin, ListView):
+class ServiceCallListView(LoginRequiredMixin, ExportMixin, ScopedQuerysetMixin, KeysetPaginationMixin, ListView):
     """List view for service calls with filtering and search"""
     model = ServiceCall
     template_name = 'newapp/servicecall_list.html'
@@ -2183,27 +1858,10 @@ class ServiceCallListView(LoginRequiredMixin, ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        queryset = ServiceCall.objects.select_related(
-            'customer', 'assigned_technician', 'created_by'
-        ).order_by('-created_at')
-        
         # Filter by user if not admin
-        if not self.request.user.is_staff:
-            try:
-                sales_employee = SalesEmployee.objects.get(user=self.request.user)
-                queryset = queryset.filter(assigned_technician=sales_employee)
-            except SalesEmployee.DoesNotExist:
-                queryset = queryset.none()
-        
-        # Search functionality
-        search_query = self.request.GET.get('search', '')
-        if search_query:
-            queryset = queryset.filter(
-                Q(customer__name__icontains=search_query) |
-                Q(contact_person__icontains=search_query) |
-                Q(service_type__icontains=search_query) |
-                Q(problem_description__icontains=search_query)
-            )
+        queryset = ServiceCall.objects.visible_to(self.scope).select_related(
+            'customer', 'assigned_technician__user', 'created_by'
+        ).order_by('-created_at')
         
         # Filter by status
         status_filter = self.request.GET.get('status', '')
@@ -2215,6 +1873,11 @@ class ServiceCallListView(LoginRequiredMixin, ListView):
         if priority_filter:
             queryset = queryset.filter(priority=priority_filter)
         
+        # Search the full-text index, best match first
+        search_query = self.request.GET.get('search', '')
+        if search_query:
+            return search_queryset(queryset, 'service_calls', search_query)
+        
         return queryset
     
     def get_context_data(self, **kwargs):
@@ -2264,7 +1927,7 @@ class ServiceCallCreateView(LoginRequiredMixin, CreateView):
         if items_formset.is_valid():
             self.object = form.save()
             items_formset.instance = self.object
-            items_formset.save()
+            save_lines(items_formset)
             return super().form_valid(form)
         else:
             return self.form_invalid(form)
@@ -2278,7 +1941,8 @@ class ServiceCallDetailView(LoginRequiredMixin, DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['items'] = self.object.items.select_related('item_master')
+        context['items'] = list(self.object.items.select_related('item_master'))
+        context['items_total'] = document_totals(self.object, context['items'])['subtotal']
         context['attachments'] = self.object.attachments.order_by('-uploaded_at')
         context['activities'] = self.object.activities.order_by('-activity_date', '-start_time')
         return context
@@ -2316,7 +1980,93 @@ class ServiceCallUpdateView(LoginRequiredMixin, UpdateView):
         if items_formset.is_valid():
             self.object = form.save()
             items_formset.instance = self.object
-            items_formset.save()
+            save_lines(items_formset)
             return super().form_valid(form)
         else:
             return self.form_invalid(form)
+
+
+# ==========================
+# EXPORTS, DOCUMENT PDFS & BACKGROUND JOBS
+# ==========================
+
+def _requested_export(request, pk):
+    export = get_object_or_404(Export, pk=pk)
+    if export.requested_by_id != request.user.id and not request.user.is_superuser:
+        raise Http404("No export found")
+    return export
+
+
+@login_required(login_url='newapp:signin')
+def export_detail(request, pk):
+    """Progress of a background export (newapp.exports), refreshing until its file can be downloaded"""
+    return render(request, 'newapp/export_detail.html', {'export': _requested_export(request, pk)})
+
+
+@login_required(login_url='newapp:signin')
+def export_download(request, pk):
+    export = _requested_export(request, pk)
+    if export.status != 'DONE' or not export.file:
+        return redirect('newapp:export_detail', pk=export.pk)
+    return FileResponse(export.file.open('rb'), as_attachment=True,
+                        filename=file_name(export.name, export.format))
+
+
+@login_required(login_url='newapp:signin')
+def job_detail(request, pk):
+    """Progress and outcome of a background job (newapp.jobs) the user started"""
+    job = get_object_or_404(Job, pk=pk)
+    if job.created_by_id != request.user.id and not request.user.is_superuser:
+        raise Http404("No job found")
+    return render(request, 'newapp/job_detail.html', {'job': job})
+
+
+def _document_pdf(request, model, pk):
+    """The stored PDF of a quotation or order (newapp.documents), or the job rendering it"""
+    document = get_object_or_404(documents.with_items(model.objects.visible_to(get_scope(request))), pk=pk)
+    data, path = documents.cached_pdf(document)
+    if path is None:
+        job = documents.queue_render(document, request.user)
+        return redirect('newapp:job_detail', pk=job.pk)
+    return FileResponse(default_storage.open(path, 'rb'), content_type='application/pdf',
+                        filename=documents.file_name(data))
+
+
+@login_required(login_url='newapp:signin')
+def quotation_pdf(request, pk):
+    return _document_pdf(request, Quotation, pk)
+
+
+@login_required(login_url='newapp:signin')
+def salesorder_pdf(request, pk):
+    return _document_pdf(request, SalesOrder, pk)
+
+
+# ==========================
+# SESSION KEEPALIVE
+# ==========================
+
+@never_cache
+def session_ping(request):
+    """Seconds left in the session (newapp.sessions) for the page poller; ``?active=1`` restarts the timer"""
+    request.session_refresh = False
+    if not request.user.is_authenticated:
+        return JsonResponse({'authenticated': False, 'expires_in': 0}, status=401)
+    if request.GET.get('active') == '1':
+        sessions.refresh(request)
+    return JsonResponse({'authenticated': True, 'expires_in': sessions.expires_in(request.session)})
+
+
+# ==========================
+# MONITORING
+# ==========================
+
+def metrics_endpoint(request):
+    """Prometheus metrics (newapp.metrics) for staff users or a scraper holding METRICS_TOKEN"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    scraper = bool(token) and constant_time_compare(authorization, f'Bearer {token}')
+    if not (scraper or (request.user.is_authenticated and request.user.is_staff)):
+        return HttpResponse("Unauthorized", status=403)
+    
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,93 @@
+"""
+Form widgets.
+
+``RemoteSelect`` replaces a ``<select>`` over a big table (customers, items)
+with a typeahead: only the currently chosen option is rendered, and the
+browser fetches matches from one of the autocomplete endpoints as the user
+types (``forms.js`` turns every ``select[data-remote-url]`` into a search
+box). Page size and query count no longer grow with the table: at most one
+query, for the chosen row's label, and none when the row was loaded already
+(``known_rows``, filled by the line-item formsets from their select_related
+lines).
+"""
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse_lazy
+
+
+class RemoteSelect(forms.Select):
+    """
+    Select widget whose options are loaded on demand from ``url``.
+
+    Args:
+        url (str): Endpoint answering ``?q=`` with ``{"items": [{"id", "label", ...}]}``
+        min_chars (int): Characters typed before the first lookup
+        placeholder (str): Shown in the search box while nothing is chosen
+
+    ``known_rows`` maps values to rows already in memory; a chosen value found
+    there is rendered without a query.
+    """
+
+    def __init__(self, url, attrs=None, min_chars=2, placeholder="Type to search..."):
+        super().__init__(attrs)
+        self.url = url
+        self.min_chars = min_chars
+        self.placeholder = placeholder
+        self.known_rows = {}
+
+    def get_context(self, name, value, attrs):
+        attrs = {
+            **(attrs or {}),
+            "data-remote-url": str(self.url),
+            "data-min-chars": self.min_chars,
+            "data-placeholder": self.placeholder,
+        }
+        return super().get_context(name, value, attrs)
+
+    def _selected_choices(self, value):
+        """The blank choice plus the chosen rows, looked up with one query."""
+        values = [v for v in value if v not in ("", None)]
+        iterator = self.choices
+        field = getattr(iterator, "field", None)
+        if field is None:
+            # Plain choices: keep the chosen ones only
+            return [
+                choice for choice in iterator if choice[0] in ("", None) or str(choice[0]) in values
+            ]
+
+        choices = [("", field.empty_label)] if field.empty_label is not None else []
+        if values:
+            key = field.to_field_name or "pk"
+            rows = [self.known_rows[v] for v in values if v in self.known_rows]
+            if len(rows) < len(values):
+                try:
+                    rows = list(iterator.queryset.filter(**{f"{key}__in": values}))
+                except (ValueError, TypeError, ValidationError):
+                    rows = []
+            choices.extend(iterator.choice(obj) for obj in rows)
+        return choices
+
+    def optgroups(self, name, value, attrs=None):
+        all_choices = self.choices
+        self.choices = self._selected_choices(value)
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = all_choices
+
+
+def prospect_select(**attrs):
+    return RemoteSelect(
+        reverse_lazy("newapp:search_prospects"),
+        attrs={"class": "form-input", **attrs},
+        placeholder="Search customers by name, company or email",
+    )
+
+
+def item_select(**attrs):
+    return RemoteSelect(
+        reverse_lazy("newapp:search_items"),
+        attrs={"class": "form-input", **attrs},
+        placeholder="Search items by code or description",
+    )